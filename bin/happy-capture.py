@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+
+#
+#    Copyright (c) 2021 Google LLC.
+#    All rights reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+#
+
+##
+#    @file
+#       A Happy command line utility that captures the traffic of virtual links.
+#
+#       The command is executed by instantiating and running HappyCapture class.
+#
+
+from __future__ import absolute_import
+from __future__ import print_function
+import getopt
+import sys
+
+import happy.HappyCapture
+from happy.Utils import *
+
+if __name__ == "__main__":
+    options = happy.HappyCapture.option()
+
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], "hqi:l:s:o:",
+                                   ["help", "quiet", "id=", "link=", "seconds=", "output=",
+                                    "segment-size=", "segments=", "snaplen=", "filter="])
+
+    except getopt.GetoptError as err:
+        print(happy.HappyCapture.HappyCapture.__doc__)
+        print(hred(str(err)))
+        sys.exit(hred("%s: Failed to parse arguments." % (__file__)))
+
+    for o, a in opts:
+        if o in ("-h", "--help"):
+            print(happy.HappyCapture.HappyCapture.__doc__)
+            sys.exit(0)
+
+        elif o in ("-q", "--quiet"):
+            options["quiet"] = True
+
+        elif o in ("-i", "--id"):
+            options["network_id"] = a
+
+        elif o in ("-l", "--link"):
+            options["link_id"] = a
+
+        elif o in ("-s", "--seconds"):
+            options["seconds"] = float(a)
+
+        elif o in ("-o", "--output"):
+            options["output"] = a
+
+        elif o == "--segment-size":
+            options["segment_size"] = a
+
+        elif o == "--segments":
+            options["segments"] = int(a)
+
+        elif o == "--snaplen":
+            options["snaplen"] = int(a)
+
+        elif o == "--filter":
+            options["filter"] = a
+
+        else:
+            assert False, "unhandled option"
+
+    if len(args) == 1:
+        options["action"] = args[0]
+
+    cmd = happy.HappyCapture.HappyCapture(options)
+    cmd.start()
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+
+#
+#    Copyright (c) 2021 Google LLC.
+#    All rights reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+#
+
+##
+#    @file
+#       A Happy command line utility that checks which virtual nodes reach which.
+#
+#       The command is executed by instantiating and running HappyConnectivity class.
+#
+
+from __future__ import absolute_import
+from __future__ import print_function
+import getopt
+import sys
+
+import happy.HappyConnectivity
+from happy.Utils import *
+
+if __name__ == "__main__":
+    options = happy.HappyConnectivity.option()
+
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], "hqn:p:c:e:o:",
+                                   ["help", "quiet", "nodes=", "prefix=", "count=", "interval=",
+                                    "timeout=", "expected=", "output=", "grow-neighbor-tables"])
+
+    except getopt.GetoptError as err:
+        print(happy.HappyConnectivity.HappyConnectivity.__doc__)
+        print(hred(str(err)))
+        sys.exit(hred("%s: Failed to parse arguments." % (__file__)))
+
+    for o, a in opts:
+        if o in ("-h", "--help"):
+            print(happy.HappyConnectivity.HappyConnectivity.__doc__)
+            sys.exit(0)
+
+        elif o in ("-q", "--quiet"):
+            options["quiet"] = True
+
+        elif o in ("-n", "--nodes"):
+            options["nodes"] = a
+
+        elif o in ("-p", "--prefix"):
+            options["prefix"] = a
+
+        elif o in ("-c", "--count"):
+            options["count"] = int(a)
+
+        elif o == "--interval":
+            options["interval"] = float(a)
+
+        elif o == "--timeout":
+            options["timeout"] = float(a)
+
+        elif o in ("-e", "--expected"):
+            options["expected"] = a
+
+        elif o in ("-o", "--output"):
+            options["output"] = a
+
+        elif o == "--grow-neighbor-tables":
+            options["grow_neighbor_tables"] = True
+
+        else:
+            assert False, "unhandled option"
+
+    if len(args) > 0:
+        options["nodes"] = ",".join(args)
+
+    cmd = happy.HappyConnectivity.HappyConnectivity(options)
+    cmd.start()
@@ -36,8 +36,8 @@ if __name__ == "__main__":
     options = happy.HappyDNS.option()
 
     try:
-        opts, args = getopt.getopt(sys.argv[1:], "hi:qad",
-                                   ["help", "id=", "quiet", "add", "delete"])
+        opts, args = getopt.getopt(sys.argv[1:], "hi:qads:",
+                                   ["help", "id=", "quiet", "add", "delete", "stub="])
 
     except getopt.GetoptError as err:
         print(happy.HappyDNS.HappyDNS.__doc__)
@@ -61,6 +61,9 @@ if __name__ == "__main__":
         elif o in ("-d", "--delete"):
             options["delete"] = True
 
+        elif o in ("-s", "--stub"):
+            options["stub"] = a
+
         else:
             assert False, "unhandled option"
 
@@ -36,8 +36,9 @@ if __name__ == "__main__":
     options = happy.HappyInternet.option()
 
     try:
-        opts, args = getopt.getopt(sys.argv[1:], "hn:qadf:s:e:",
-                                   ["help", "node=", "quiet", "add", "delete", "interface=", "isp=", "seed="])
+        opts, args = getopt.getopt(sys.argv[1:], "hn:qadf:s:e:m:",
+                                   ["help", "node=", "quiet", "add", "delete", "interface=", "isp=", "seed=",
+                                    "mask="])
 
     except getopt.GetoptError as err:
         print(happy.HappyInternet.HappyInternet.__doc__)
@@ -67,6 +68,9 @@ if __name__ == "__main__":
         elif o in ("-e", "--seed"):
             options["seed"] = a
 
+        elif o in ("-m", "--mask"):
+            options["mask"] = a
+
         elif o in ("-n", "--node"):
             options["node_id"] = a
 
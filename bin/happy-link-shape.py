@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+
+#
+#    Copyright (c) 2021 Google LLC.
+#    All rights reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+#
+
+##
+#    @file
+#       A Happy command line utility that limits the bandwidth and adds
+#       latency and loss to virtual links.
+#
+#       The command is executed by instantiating and running HappyLinkShape class.
+#
+
+from __future__ import absolute_import
+from __future__ import print_function
+import getopt
+import sys
+
+import happy.HappyLinkShape
+from happy.Utils import *
+
+if __name__ == "__main__":
+    options = happy.HappyLinkShape.option()
+
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], "hql:n:p:c",
+                                   ["help", "quiet", "link=", "network=", "profile=", "rate=", "delay=",
+                                    "jitter=", "loss=", "clear"])
+
+    except getopt.GetoptError as err:
+        print(happy.HappyLinkShape.HappyLinkShape.__doc__)
+        print(hred(str(err)))
+        sys.exit(hred("%s: Failed to parse arguments." % (__file__)))
+
+    for o, a in opts:
+        if o in ("-h", "--help"):
+            print(happy.HappyLinkShape.HappyLinkShape.__doc__)
+            sys.exit(0)
+
+        elif o in ("-q", "--quiet"):
+            options["quiet"] = True
+
+        elif o in ("-l", "--link"):
+            options["link_id"] = a
+
+        elif o in ("-n", "--network"):
+            options["network_id"] = a
+
+        elif o in ("-p", "--profile"):
+            options["profile"] = a
+
+        elif o == "--rate":
+            options["rate"] = a
+
+        elif o == "--delay":
+            options["delay"] = float(a)
+
+        elif o == "--jitter":
+            options["jitter"] = float(a)
+
+        elif o == "--loss":
+            options["loss"] = float(a)
+
+        elif o in ("-c", "--clear"):
+            options["clear"] = True
+
+        else:
+            assert False, "unhandled option"
+
+    cmd = happy.HappyLinkShape.HappyLinkShape(options)
+    cmd.start()
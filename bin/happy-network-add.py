@@ -36,8 +36,8 @@ if __name__ == "__main__":
     options = happy.HappyNetworkAdd.option()
 
     try:
-        opts, args = getopt.getopt(sys.argv[1:], "hi:qt:",
-                                   ["help", "id=", "quiet", "type="])
+        opts, args = getopt.getopt(sys.argv[1:], "hi:qt:m:",
+                                   ["help", "id=", "quiet", "type=", "mode="])
 
     except getopt.GetoptError as err:
         print(happy.HappyNetworkAdd.HappyNetworkAdd.__doc__)
@@ -58,6 +58,9 @@ if __name__ == "__main__":
         elif o in ("-t", "--type"):
             options["type"] = a
 
+        elif o in ("-m", "--mode"):
+            options["mode"] = a
+
         else:
             assert False, "unhandled option"
 
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+
+#
+#    Copyright (c) 2021 Google LLC.
+#    All rights reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+#
+
+##
+#    @file
+#       A Happy command line utility that benchmarks the forwarding cost of
+#       the network modes.
+#
+#       The command is executed by instantiating and running HappyNetworkBenchmark class.
+#
+
+from __future__ import absolute_import
+from __future__ import print_function
+import getopt
+import sys
+
+import happy.HappyNetworkBenchmark
+from happy.Utils import *
+
+if __name__ == "__main__":
+    options = happy.HappyNetworkBenchmark.option()
+
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], "hqm:n:d:P:ko:",
+                                   ["help", "quiet", "modes=", "members=", "duration=", "protocol=", "keep",
+                                    "output="])
+
+    except getopt.GetoptError as err:
+        print(happy.HappyNetworkBenchmark.HappyNetworkBenchmark.__doc__)
+        print(hred(str(err)))
+        sys.exit(hred("%s: Failed to parse arguments." % (__file__)))
+
+    for o, a in opts:
+        if o in ("-h", "--help"):
+            print(happy.HappyNetworkBenchmark.HappyNetworkBenchmark.__doc__)
+            sys.exit(0)
+
+        elif o in ("-q", "--quiet"):
+            options["quiet"] = True
+
+        elif o in ("-m", "--modes"):
+            options["modes"] = a
+
+        elif o in ("-n", "--members"):
+            options["members"] = int(a)
+
+        elif o in ("-d", "--duration"):
+            options["duration"] = float(a)
+
+        elif o in ("-P", "--protocol"):
+            options["protocol"] = a
+
+        elif o in ("-k", "--keep"):
+            options["keep"] = True
+
+        elif o in ("-o", "--output"):
+            options["output"] = a
+
+        else:
+            assert False, "unhandled option"
+
+    cmd = happy.HappyNetworkBenchmark.HappyNetworkBenchmark(options)
+    cmd.start()
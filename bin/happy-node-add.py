@@ -36,8 +36,9 @@ if __name__ == "__main__":
     options = happy.HappyNodeAdd.option()
 
     try:
-        opts, args = getopt.getopt(sys.argv[1:], "hi:qasl",
-                                   ["help", "id=", "quiet", "ap", "service", "local"])
+        opts, args = getopt.getopt(sys.argv[1:], "hi:qaslg",
+                                   ["help", "id=", "quiet", "ap", "service", "local", "cgroup",
+                                    "cpu=", "memory=", "cpuset="])
 
     except getopt.GetoptError as err:
         print(happy.HappyNodeAdd.HappyNodeAdd.__doc__)
@@ -64,6 +65,18 @@ if __name__ == "__main__":
         elif o in ("-l", "--local"):
             options["type"] = "local"
 
+        elif o in ("-g", "--cgroup"):
+            options["cgroup"] = True
+
+        elif o == "--cpu":
+            options["cpu_limit"] = a
+
+        elif o == "--memory":
+            options["memory_limit"] = a
+
+        elif o == "--cpuset":
+            options["cpuset"] = a
+
         else:
             assert False, "unhandled option"
 
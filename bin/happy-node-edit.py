@@ -37,7 +37,7 @@ if __name__ == "__main__":
 
     try:
         opts, args = getopt.getopt(sys.argv[1:], "hi:n:qasl",
-                                   ["help", "id=", "new=", "quiet"])
+                                   ["help", "id=", "new=", "quiet", "cpu=", "memory=", "cpuset="])
 
     except getopt.GetoptError as err:
         print(happy.HappyNodeEdit.HappyNodeEdit.__doc__)
@@ -58,6 +58,15 @@ if __name__ == "__main__":
         elif o in ("-n", "--new"):
             options["new_node_id"] = a
 
+        elif o == "--cpu":
+            options["cpu_limit"] = a
+
+        elif o == "--memory":
+            options["memory_limit"] = a
+
+        elif o == "--cpuset":
+            options["cpuset"] = a
+
         else:
             assert False, "unhandled option"
 
@@ -36,8 +36,9 @@ if __name__ == "__main__":
     options = happy.HappyNodeJoin.option()
 
     try:
-        opts, args = getopt.getopt(sys.argv[1:], "hi:qn:m:p:c:",
-                                   ["help", "id=", "quiet", "network=", "mac=", "tap", "customizedeui64="])
+        opts, args = getopt.getopt(sys.argv[1:], "hi:qn:m:p:c:s:",
+                                   ["help", "id=", "quiet", "network=", "mac=", "tap", "customizedeui64=",
+                                    "shape="])
 
     except getopt.GetoptError as err:
         print(happy.HappyNodeJoin.HappyNodeJoin.__doc__)
@@ -67,6 +68,9 @@ if __name__ == "__main__":
         elif o in ("-c", "--customizedeui64"):
             options["customized_eui64"] = a
 
+        elif o in ("-s", "--shape"):
+            options["shape"] = a
+
         else:
             assert False, "unhandled option"
 
@@ -37,7 +37,8 @@ if __name__ == "__main__":
 
     try:
         opts, args = getopt.getopt(sys.argv[1:], "hi:qfp:P:s:d:",
-                                   ["help", "id=", "quiet", "interface=", "isp=", "dstPort=", "start=", "duration="])
+                                   ["help", "id=", "quiet", "interface=", "isp=", "dstPort=", "start=", "duration=",
+                                    "rules="])
 
     except getopt.GetoptError as err:
         print(happy.HappyNodeTcpReset.HappyNodeTcpReset.__doc__)
@@ -70,6 +71,9 @@ if __name__ == "__main__":
         elif o in ("-d", "--duration"):
             options["duration"] = int(a)
 
+        elif o == "--rules":
+            options["rules"] = a
+
         else:
             assert False, "unhandled option"
 
@@ -0,0 +1,90 @@
+#!/usr/bin/env python3
+
+#
+#    Copyright (c) 2021 Google LLC.
+#    All rights reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+#
+
+##
+#    @file
+#       A Happy command line utility that benchmarks HappyPacketProcess.
+#
+#       The command is executed by instantiating and running HappyPacketBenchmark class.
+#
+
+from __future__ import absolute_import
+from __future__ import print_function
+import getopt
+import sys
+
+import happy.HappyPacketBenchmark
+from happy.Utils import *
+
+if __name__ == "__main__":
+    options = happy.HappyPacketBenchmark.option()
+
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], "hqr:c:f:p:6ko:",
+                                   ["help", "quiet", "rate=", "count=", "flows=", "pcap=", "ipv6", "ring",
+                                    "no-bpf", "rules=", "keep", "output="])
+
+    except getopt.GetoptError as err:
+        print(happy.HappyPacketBenchmark.HappyPacketBenchmark.__doc__)
+        print(hred(str(err)))
+        sys.exit(hred("%s: Failed to parse arguments." % (__file__)))
+
+    for o, a in opts:
+        if o in ("-h", "--help"):
+            print(happy.HappyPacketBenchmark.HappyPacketBenchmark.__doc__)
+            sys.exit(0)
+
+        elif o in ("-q", "--quiet"):
+            options["quiet"] = True
+
+        elif o in ("-r", "--rate"):
+            options["rate"] = int(a)
+
+        elif o in ("-c", "--count"):
+            options["count"] = int(a)
+
+        elif o in ("-f", "--flows"):
+            options["flows"] = int(a)
+
+        elif o in ("-p", "--pcap"):
+            options["pcap"] = a
+
+        elif o in ("-6", "--ipv6"):
+            options["ipv6"] = True
+
+        elif o == "--ring":
+            options["ring"] = True
+
+        elif o == "--no-bpf":
+            options["bpf"] = False
+
+        elif o == "--rules":
+            options["rules"] = a
+
+        elif o in ("-k", "--keep"):
+            options["keep"] = True
+
+        elif o in ("-o", "--output"):
+            options["output"] = a
+
+        else:
+            assert False, "unhandled option"
+
+    cmd = happy.HappyPacketBenchmark.HappyPacketBenchmark(options)
+    cmd.start()
@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+
+#
+#    Copyright (c) 2021 Google LLC.
+#    All rights reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+#
+
+##
+#    @file
+#       A Happy command line utility that measures the throughput and latency
+#       between virtual nodes.
+#
+#       The command is executed by instantiating and running HappyPerf class.
+#
+
+from __future__ import absolute_import
+from __future__ import print_function
+import getopt
+import sys
+
+import happy.HappyPerf
+from happy.Utils import *
+
+if __name__ == "__main__":
+    options = happy.HappyPerf.option()
+
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], "hqs:d:P:t:p:6o:",
+                                   ["help", "quiet", "source=", "destination=", "pairs=", "protocol=",
+                                    "test=", "duration=", "size=", "rate=", "port=", "ipv6", "output="])
+
+    except getopt.GetoptError as err:
+        print(happy.HappyPerf.HappyPerf.__doc__)
+        print(hred(str(err)))
+        sys.exit(hred("%s: Failed to parse arguments." % (__file__)))
+
+    for o, a in opts:
+        if o in ("-h", "--help"):
+            print(happy.HappyPerf.HappyPerf.__doc__)
+            sys.exit(0)
+
+        elif o in ("-q", "--quiet"):
+            options["quiet"] = True
+
+        elif o in ("-s", "--source"):
+            options["source"] = a
+
+        elif o in ("-d", "--destination"):
+            options["destination"] = a
+
+        elif o == "--pairs":
+            options["pairs"] = a
+
+        elif o in ("-P", "--protocol"):
+            options["protocol"] = a
+
+        elif o in ("-t", "--test"):
+            options["test"] = a
+
+        elif o == "--duration":
+            options["duration"] = float(a)
+
+        elif o == "--size":
+            options["size"] = int(a)
+
+        elif o == "--rate":
+            options["rate"] = int(a)
+
+        elif o in ("-p", "--port"):
+            options["port"] = int(a)
+
+        elif o in ("-6", "--ipv6"):
+            options["ipv6"] = True
+
+        elif o in ("-o", "--output"):
+            options["output"] = a
+
+        else:
+            assert False, "unhandled option"
+
+    if len(args) == 1:
+        options["source"] = args[0]
+
+    elif len(args) == 2:
+        options["source"] = args[0]
+        options["destination"] = args[1]
+
+    cmd = happy.HappyPerf.HappyPerf(options)
+    cmd.start()
@@ -38,7 +38,8 @@ if __name__ == "__main__":
 
     try:
         opts, args = getopt.getopt(sys.argv[1:], "hi:qd:s:c:",
-                                   ["help", "id=", "quiet", "destination=", "size=", "count="])
+                                   ["help", "id=", "quiet", "destination=", "size=", "count=", "interval=",
+                                    "timeout="])
 
     except getopt.GetoptError as err:
         print(happy.Ping.Ping.__doc__)
@@ -59,12 +60,18 @@ if __name__ == "__main__":
         elif o in ("-d", "--destination"):
             options["destination"] = a
 
-        elif o in ("-a", "--size"):
+        elif o in ("-s", "--size"):
             options["size"] = a
 
         elif o in ("-c", "--count"):
             options["count"] = a
 
+        elif o == "--interval":
+            options["interval"] = float(a)
+
+        elif o == "--timeout":
+            options["timeout"] = float(a)
+
         else:
             assert False, "unhandled option"
 
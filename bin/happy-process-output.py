@@ -68,5 +68,8 @@ if __name__ == "__main__":
         options["node_id"] = args[0]
         options["tag"] = args[1]
 
+    if not options["quiet"]:
+        options["stream"] = sys.stdout
+
     cmd = happy.HappyProcessOutput.HappyProcessOutput(options)
     cmd.start()
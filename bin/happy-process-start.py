@@ -36,8 +36,9 @@ if __name__ == "__main__":
     options = happy.HappyProcessStart.option()
 
     try:
-        opts, args = getopt.getopt(sys.argv[1:], "hi:qt:se:",
-                                   ["help", "id=", "quiet", "tag=", "strace", "env="])
+        opts, args = getopt.getopt(sys.argv[1:], "hi:qt:se:d",
+                                   ["help", "id=", "quiet", "tag=", "strace", "env=", "direct",
+                                    "strace-mode=", "rotate-size=", "rotate-age=", "compress=", "keep="])
 
     except getopt.GetoptError as err:
         print(happy.HappyProcessStart.HappyProcessStart.__doc__)
@@ -64,6 +65,25 @@ if __name__ == "__main__":
         elif o in ("-e", "--env"):
             options["env"] = a
 
+        elif o in ("-d", "--direct"):
+            options["direct_spawn"] = True
+
+        elif o == "--strace-mode":
+            options["strace"] = True
+            options["strace_mode"] = a
+
+        elif o == "--rotate-size":
+            options["rotate_size"] = a
+
+        elif o == "--rotate-age":
+            options["rotate_age"] = a
+
+        elif o == "--compress":
+            options["rotate_compress"] = a
+
+        elif o == "--keep":
+            options["rotate_keep"] = a
+
         else:
             assert False, "unhandled option"
 
@@ -36,8 +36,8 @@ if __name__ == "__main__":
     options = happy.HappyProcessStrace.option()
 
     try:
-        opts, args = getopt.getopt(sys.argv[1:], "hi:qt:",
-                                   ["help", "id=", "quiet", "tag="])
+        opts, args = getopt.getopt(sys.argv[1:], "hi:qt:s",
+                                   ["help", "id=", "quiet", "tag=", "summary", "slowest="])
 
     except getopt.GetoptError as err:
         print(happy.HappyProcessStrace.HappyProcessStrace.__doc__)
@@ -58,6 +58,12 @@ if __name__ == "__main__":
         elif o in ("-t", "--tag"):
             options["tag"] = a
 
+        elif o in ("-s", "--summary"):
+            options["summary"] = True
+
+        elif o == "--slowest":
+            options["slowest"] = int(a)
+
         else:
             assert False, "unhandled option"
 
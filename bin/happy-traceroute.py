@@ -37,8 +37,9 @@ if __name__ == "__main__":
     options["quiet"] = "UNDEFINED"
 
     try:
-        opts, args = getopt.getopt(sys.argv[1:], "hi:qd:",
-                                   ["help", "id=", "quiet", "destination="])
+        opts, args = getopt.getopt(sys.argv[1:], "hi:qd:m:",
+                                   ["help", "id=", "quiet", "destination=", "max-hops=", "queries=",
+                                    "timeout="])
 
     except getopt.GetoptError as err:
         print(happy.Traceroute.Traceroute.__doc__)
@@ -59,6 +60,15 @@ if __name__ == "__main__":
         elif o in ("-d", "--destination"):
             options["destination"] = a
 
+        elif o in ("-m", "--max-hops"):
+            options["max_hops"] = int(a)
+
+        elif o == "--queries":
+            options["queries"] = int(a)
+
+        elif o == "--timeout":
+            options["timeout"] = float(a)
+
         else:
             assert False, "unhandled option"
 
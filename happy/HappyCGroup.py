@@ -0,0 +1,372 @@
+#!/usr/bin/env python3
+
+#
+#    Copyright (c) 2021 Google LLC.
+#    All rights reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+#
+
+##
+#    @file
+#       Implements HappyCGroup class that manages per-node cgroup v2
+#       resource accounting and limits.
+#
+#       Every node that opts in gets its own cgroup under
+#       <cgroup_fs>/happy/<state_id>/<node netns name>. Processes started
+#       with HappyProcessStart are placed in that cgroup before they exec,
+#       so every descendant is accounted to the node as well.
+#
+
+from __future__ import absolute_import
+import os
+import re
+import subprocess
+import time
+
+from happy.HappyHost import HappyHost
+
+
+class HappyCGroup(HappyHost):
+    def __init__(self):
+        HappyHost.__init__(self)
+
+        self.cgroup_fs = self.main_conf.get("cgroup_fs", "/sys/fs/cgroup")
+        self.cgroup_controllers = ["cpu", "cpuset", "memory", "io"]
+        self.cgroup_cpu_period = 100000
+        # the smallest quota cpu.max takes, in microseconds
+        self.cgroup_cpu_min_quota = 1000
+        # how long killed node processes get to leave the cgroup, in seconds
+        self.cgroup_kill_timeout = 2.0
+
+    def cgroupAvailable(self):
+        """
+        cgroup v2 is available when the unified hierarchy root exposes
+        cgroup.controllers.
+        """
+        return os.path.isfile(os.path.join(self.cgroup_fs, "cgroup.controllers"))
+
+    def isCGroupEnabled(self, requested=None):
+        """
+        A node gets a cgroup when requested explicitly, or by default when
+        the user configuration sets node_cgroup.
+        """
+        if requested is None:
+            requested = str(self.configuration.get("node_cgroup", "false")).lower() in ["1", "true", "yes"]
+        return bool(requested)
+
+    def getCGroupRoot(self):
+        return os.path.join(self.cgroup_fs, "happy", self.getStateId())
+
+    def __writeCGroupFile(self, path, value):
+        # cgroupfs files are owned by root unless the subtree was delegated;
+        # write directly when possible and fall back to a root tee otherwise.
+        value = str(value)
+        self.logger.debug("Happy [%s]: cgroup %s < %s" % (self.state_id, path, value))
+
+        if os.access(path, os.W_OK):
+            try:
+                with open(path, "w") as cfile:
+                    cfile.write(value)
+                return True
+            except (IOError, OSError) as e:
+                self.logger.debug("Happy [%s]: cgroup write to %s failed: %s" % (self.state_id, path, str(e)))
+                return False
+
+        cmd_list = self.getRunAsRootPrefixList() + ["tee", path]
+        try:
+            proc = subprocess.Popen(cmd_list, stdin=subprocess.PIPE,
+                                    stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+            _, err = proc.communicate(value.encode("utf-8"))
+        except Exception as e:
+            self.logger.debug("Happy [%s]: cgroup write to %s failed: %s" % (self.state_id, path, str(e)))
+            return False
+
+        if proc.returncode != 0:
+            self.logger.debug("Happy [%s]: cgroup write to %s failed: %s" %
+                              (self.state_id, path, err.decode("utf-8").strip()))
+            return False
+
+        return True
+
+    def __readCGroupFile(self, path, name):
+        try:
+            with open(os.path.join(path, name), "r") as cfile:
+                return cfile.read()
+        except (IOError, OSError):
+            return None
+
+    def __enableControllers(self, path):
+        available = self.__readCGroupFile(path, "cgroup.controllers")
+        if available is None:
+            return
+
+        available = available.split()
+        wanted = ["+" + c for c in self.cgroup_controllers if c in available]
+        if len(wanted) > 0:
+            self.__writeCGroupFile(os.path.join(path, "cgroup.subtree_control"), " ".join(wanted))
+
+    def __prepareCGroupRoot(self):
+        root = self.getCGroupRoot()
+
+        if not os.path.isdir(root):
+            cmd = "mkdir -p " + root
+            cmd = self.runAsRoot(cmd)
+            self.CallAtHost(cmd)
+
+        # Controllers must be enabled on every level between the cgroupfs root
+        # and the node cgroups for the node limits to take effect.
+        path = self.cgroup_fs
+        self.__enableControllers(path)
+        for part in os.path.relpath(root, self.cgroup_fs).split(os.sep):
+            path = os.path.join(path, part)
+            self.__enableControllers(path)
+
+        return os.path.isdir(root)
+
+    def createNodeCGroup(self, node_id=None, cpu_limit=None, memory_limit=None, cpuset=None):
+        if node_id is None:
+            node_id = self.node_id
+
+        if not self.cgroupAvailable():
+            emsg = "cgroup v2 is not mounted at %s, skipping node cgroup." % (self.cgroup_fs)
+            self.logger.warning("[%s] HappyCGroup: %s" % (node_id, emsg))
+            return None
+
+        if not self.__prepareCGroupRoot():
+            emsg = "Failed to create cgroup root %s." % (self.getCGroupRoot())
+            self.logger.warning("[%s] HappyCGroup: %s" % (node_id, emsg))
+            return None
+
+        path = os.path.join(self.getCGroupRoot(), self.uniquePrefix(node_id))
+
+        if not os.path.isdir(path):
+            cmd = "mkdir " + path
+            cmd = self.runAsRoot(cmd)
+            self.CallAtHost(cmd)
+
+        if not os.path.isdir(path):
+            emsg = "Failed to create cgroup %s." % (path)
+            self.logger.warning("[%s] HappyCGroup: %s" % (node_id, emsg))
+            return None
+
+        record = {}
+        record["path"] = path
+        record["cpu_limit"] = None
+        record["memory_limit"] = None
+        record["cpuset"] = None
+        self.setNodeCGroup(node_id, record)
+
+        self.setNodeCGroupLimits(node_id, cpu_limit, memory_limit, cpuset)
+
+        return path
+
+    def getCGroupLimitsError(self, cpu_limit=None, memory_limit=None, cpuset=None):
+        """
+        Returns why the cgroup limits cannot be applied, or None if they can.
+        """
+        if cpu_limit is not None and str(cpu_limit) != "max":
+            try:
+                quota = float(cpu_limit) * self.cgroup_cpu_period
+            except ValueError:
+                quota = None
+            if quota is None or not quota >= self.cgroup_cpu_min_quota or quota == float("inf"):
+                return "Invalid CPU limit %s, expected a number of CPUs of at least %g, or max." % \
+                    (cpu_limit, float(self.cgroup_cpu_min_quota) / self.cgroup_cpu_period)
+
+        if memory_limit is not None and str(memory_limit) != "max":
+            if re.match(r"^[0-9]+[KMGT]?$", str(memory_limit), re.IGNORECASE) is None or \
+               int(re.sub(r"[^0-9]", "", str(memory_limit))) == 0:
+                return "Invalid memory limit %s, expected a size such as 256M, or max." % (memory_limit)
+
+        if cpuset is not None:
+            if re.match(r"^[0-9]+(-[0-9]+)?(,[0-9]+(-[0-9]+)?)*$", str(cpuset)) is None:
+                return "Invalid cpuset %s, expected a list of CPUs such as 0-3,6." % (cpuset)
+
+        return None
+
+    def setNodeCGroupLimits(self, node_id=None, cpu_limit=None, memory_limit=None, cpuset=None):
+        """
+        cpu_limit is a number of CPUs (e.g. 0.5), memory_limit is anything
+        memory.max accepts (e.g. 256M) and cpuset a cpu list (e.g. 0-3).
+        The string "max" removes a cpu or memory limit.
+        """
+        if node_id is None:
+            node_id = self.node_id
+
+        record = self.getNodeCGroup(node_id)
+        path = self.getNodeCGroupPath(node_id)
+        if path is None:
+            return False
+
+        ret = True
+
+        if cpu_limit is not None:
+            if str(cpu_limit) == "max":
+                value = "max %d" % (self.cgroup_cpu_period)
+            else:
+                quota = int(float(cpu_limit) * self.cgroup_cpu_period)
+                value = "%d %d" % (quota, self.cgroup_cpu_period)
+            if self.__writeCGroupFile(os.path.join(path, "cpu.max"), value):
+                record["cpu_limit"] = cpu_limit
+            else:
+                ret = False
+
+        if memory_limit is not None:
+            if self.__writeCGroupFile(os.path.join(path, "memory.max"), memory_limit):
+                record["memory_limit"] = memory_limit
+            else:
+                ret = False
+
+        if cpuset is not None:
+            if self.__writeCGroupFile(os.path.join(path, "cpuset.cpus"), cpuset):
+                record["cpuset"] = cpuset
+            else:
+                ret = False
+
+        if not ret:
+            emsg = "Failed to apply some of the cgroup limits on %s." % (path)
+            self.logger.warning("[%s] HappyCGroup: %s" % (node_id, emsg))
+
+        return ret
+
+    def deleteNodeCGroup(self, node_id=None):
+        if node_id is None:
+            node_id = self.node_id
+
+        path = self.getNodeCGroupPath(node_id)
+        if path is None:
+            return
+
+        if os.path.isdir(path):
+            procs = self.__readCGroupFile(path, "cgroup.procs")
+            if procs is not None and len(procs.split()) > 0:
+                # Anything left behind by the node processes has to go
+                # before the cgroup can be removed, and rmdir fails with
+                # EBUSY until the killed processes have exited.
+                self.__writeCGroupFile(os.path.join(path, "cgroup.kill"), "1")
+                deadline = time.monotonic() + self.cgroup_kill_timeout
+                while time.monotonic() < deadline:
+                    procs = self.__readCGroupFile(path, "cgroup.procs")
+                    if procs is None or len(procs.split()) == 0:
+                        break
+                    time.sleep(0.01)
+
+            cmd = "rmdir " + path
+            cmd = self.runAsRoot(cmd)
+            self.CallAtHost(cmd)
+
+        if os.path.isdir(path):
+            emsg = "Failed to delete cgroup %s." % (path)
+            self.logger.warning("[%s] HappyCGroup: %s" % (node_id, emsg))
+
+        self.removeNodeCGroup(node_id)
+
+    def getCGroupExecPrefixList(self, node_id=None):
+        """
+        Returns a command prefix that moves itself into the node cgroup and
+        then execs the rest of the command line. It must run as root, ahead
+        of the namespace switch, so that all descendants inherit the cgroup.
+        """
+        if node_id is None:
+            node_id = self.node_id
+
+        path = self.getNodeCGroupPath(node_id)
+        if path is None or not os.path.isdir(path):
+            return []
+
+        procs = os.path.join(path, "cgroup.procs")
+        return ["sh", "-c", 'echo $$ > %s && exec "$@"' % (procs), "happy-cgroup"]
+
+    def getOwnCGroupPath(self):
+        """
+        Returns the cgroup v2 directory of the Happy process itself, or None
+        if it is not known.
+        """
+        try:
+            with open("/proc/self/cgroup", "r") as cfile:
+                for line in cfile:
+                    if line.startswith("0::"):
+                        path = os.path.join(self.cgroup_fs, line[3:].strip().lstrip("/"))
+                        if os.path.isfile(os.path.join(path, "cgroup.procs")):
+                            return path
+        except (IOError, OSError):
+            pass
+        return None
+
+    def joinCGroup(self, path):
+        """
+        Moves the Happy process into the cgroup at path, so the processes it
+        forks from now on start in it. Requires root.
+        """
+        with open(os.path.join(path, "cgroup.procs"), "w") as cfile:
+            cfile.write("0")
+
+    def __parseKeyedFile(self, content):
+        stats = {}
+        if content is None:
+            return stats
+        for line in content.split("\n"):
+            l = line.split()
+            if len(l) != 2:
+                continue
+            try:
+                stats[l[0]] = int(l[1])
+            except ValueError:
+                continue
+        return stats
+
+    def getNodeCGroupStats(self, node_id=None):
+        """
+        Returns CPU time, memory and I/O accounting of the node cgroup, or
+        an empty dictionary if the node has no cgroup.
+        """
+        if node_id is None:
+            node_id = self.node_id
+
+        path = self.getNodeCGroupPath(node_id)
+        if path is None or not os.path.isdir(path):
+            return {}
+
+        stats = {}
+
+        cpu = self.__parseKeyedFile(self.__readCGroupFile(path, "cpu.stat"))
+        stats["cpu_usage_usec"] = cpu.get("usage_usec")
+        stats["cpu_user_usec"] = cpu.get("user_usec")
+        stats["cpu_system_usec"] = cpu.get("system_usec")
+        stats["cpu_throttled_usec"] = cpu.get("throttled_usec")
+
+        for key, name in [("memory_current", "memory.current"), ("memory_peak", "memory.peak")]:
+            value = self.__readCGroupFile(path, name)
+            try:
+                stats[key] = int(value)
+            except (TypeError, ValueError):
+                stats[key] = None
+
+        io = {"rbytes": 0, "wbytes": 0, "rios": 0, "wios": 0}
+        content = self.__readCGroupFile(path, "io.stat")
+        if content is not None:
+            for line in content.split("\n"):
+                for field in line.split()[1:]:
+                    if "=" not in field:
+                        continue
+                    key, value = field.split("=", 1)
+                    if key in io:
+                        io[key] += int(value)
+        for key in io.keys():
+            stats["io_" + key] = io[key]
+
+        procs = self.__readCGroupFile(path, "cgroup.procs")
+        stats["processes"] = len(procs.split()) if procs is not None else 0
+
+        return stats
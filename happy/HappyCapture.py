@@ -0,0 +1,344 @@
+#!/usr/bin/env python3
+
+#
+#    Copyright (c) 2021 Google LLC.
+#    All rights reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+#
+
+##
+#    @file
+#       Implements HappyCapture class that captures the traffic of the
+#       network ends of links into bounded per-link pcapng rings and dumps
+#       the last seconds of them.
+#
+
+from __future__ import absolute_import
+from __future__ import print_function
+import os
+import signal
+import sys
+import time
+
+import psutil
+
+from happy.ReturnMsg import ReturnMsg
+from happy.Utils import *
+from happy.HappyNetwork import HappyNetwork
+from happy.HappyProcess import HappyProcess
+import happy.HappyCaptureRing
+
+options = {}
+options["quiet"] = False
+options["action"] = None
+options["network_id"] = None
+options["link_id"] = None
+options["seconds"] = None
+options["output"] = None
+options["segment_size"] = None
+options["segments"] = None
+options["snaplen"] = None
+options["filter"] = None
+
+actions = ["start", "stop", "dump", "status"]
+
+
+def option():
+    return options.copy()
+
+
+class HappyCapture(HappyNetwork, HappyProcess):
+    """
+    Captures the traffic of every link on a network, at the link's network
+    end, into a ring of pcapng segments of bounded size per link, and dumps
+    the last seconds of it.
+
+    happy-capture [-h --help] [-q --quiet] [-i --id <NETWORK_NAME>] [-l --link <LINK_NAME>]
+                  [-s --seconds <SECONDS>] [-o --output <FILE>] [--segment-size <BYTES>]
+                  [--segments <COUNT>] [--snaplen <BYTES>] [--filter <EXPRESSION>]
+                  <start|stop|dump|status>
+
+        start           Start capturing on the links of the network, or of
+                        all networks. Restarting a capture picks up links
+                        added since.
+        stop            Stop capturing. The rings stay on disk.
+        dump            Write what the rings hold, from the last <SECONDS>
+                        if given, to one pcapng file with an interface per
+                        link.
+        status          Show packets, bytes and kernel drops per link.
+        -i --id         Optional. Network to capture on. Find using
+                        happy-network-list or happy-state. All networks by
+                        default.
+        -l --link       Optional. Link to dump, all links by default.
+        -s --seconds    Optional. Dump only the last <SECONDS>.
+        -o --output     Optional. File to dump to.
+           --segment-size Optional. Size of one segment, with an optional
+                        K, M or G suffix; 1M by default.
+           --segments   Optional. Segments kept per link, 4 by default.
+           --snaplen    Optional. Bytes kept of every frame, 256 by default.
+           --filter     Optional. tcpdump expression of the frames to
+                        capture; needs tcpdump.
+
+    Frames are filtered and cut to <snaplen> in the kernel and read from a
+    TPACKET_V3 ring, by one capture process per network.
+
+    Examples:
+    $ happy-capture -i HomeWiFi start
+        Captures the links of the HomeWiFi network into 4M per link.
+
+    $ happy-capture -s 10 -o /tmp/failure.pcapng dump
+        Writes the last 10 seconds captured on any link to /tmp/failure.pcapng.
+
+    return:
+        0    success
+        1    fail
+    """
+
+    def __init__(self, opts=options):
+        HappyNetwork.__init__(self)
+        HappyProcess.__init__(self)
+
+        self.quiet = opts["quiet"]
+        self.action = opts["action"]
+        self.network_id = opts["network_id"]
+        self.link_id = opts["link_id"]
+        self.seconds = opts["seconds"]
+        self.output = opts["output"]
+        self.segment_size = opts["segment_size"]
+        self.segments = opts["segments"]
+        self.snaplen = opts["snaplen"]
+        self.filter = opts["filter"]
+
+        if self.segment_size is None:
+            self.segment_size = happy.HappyCaptureRing.options["segment_size"]
+        if self.segments is None:
+            self.segments = happy.HappyCaptureRing.options["segments"]
+        if self.snaplen is None:
+            self.snaplen = happy.HappyCaptureRing.options["snaplen"]
+
+    def getCaptureDir(self, network_id):
+        return self.process_log_prefix + "capture/" + network_id
+
+    def __pre_check(self):
+        if self.action not in actions:
+            emsg = "Missing or unknown action, one of %s." % (", ".join(actions))
+            self.logger.error("[localhost] HappyCapture: %s" % (emsg))
+            self.exit()
+
+        if self.network_id is not None and not self._networkExists():
+            emsg = "virtual network %s does not exist." % (self.network_id)
+            self.logger.error("[%s] HappyCapture: %s" % (self.network_id, emsg))
+            self.exit()
+
+        try:
+            self.segment_size = parseSize(self.segment_size)
+        except ValueError:
+            emsg = "Invalid segment size %s." % (self.segment_size)
+            self.logger.error("[localhost] HappyCapture: %s" % (emsg))
+            self.exit()
+
+        if self.segment_size <= 0 or self.segments <= 0 or self.snaplen <= 0:
+            emsg = "segment size, segments and snaplen must be positive."
+            self.logger.error("[localhost] HappyCapture: %s" % (emsg))
+            self.exit()
+
+        if self.network_id is not None:
+            self.network_ids = [self.network_id]
+        else:
+            self.network_ids = self.getNetworkIds()
+
+    def __capture_process(self, network_id):
+        record = self.getNetworkCapture(network_id)
+        if "pid" not in record:
+            return None
+
+        try:
+            return self.GetProcessByPID(record["pid"], record["create_time"])
+        except psutil.NoSuchProcess:
+            return None
+
+    def __start(self, network_id):
+        if self.__capture_process(network_id) is not None:
+            self.__stop(network_id)
+
+        links = {}
+        for link_id in self.getNetworkLinkIds(network_id):
+            interface = self.getLinkNetworkEnd(link_id)
+            # a point-to-point link has no end in the network namespace
+            if interface is not None and self.getLinkPeer(link_id) is None:
+                links[link_id] = interface
+
+        if len(links) == 0:
+            emsg = "no links to capture."
+            self.logger.warning("[%s] HappyCapture: %s" % (network_id, emsg))
+            return
+
+        capture_dir = self.getCaptureDir(network_id)
+        if not os.path.isdir(capture_dir):
+            os.makedirs(capture_dir)
+
+        path = os.path.dirname(os.path.abspath(__file__))
+        cmd_list = [sys.executable, path + "/HappyCaptureRing.py", "--dir", capture_dir,
+                    "--segment-size", str(self.segment_size), "--segments", str(self.segments),
+                    "--snaplen", str(self.snaplen)]
+        if self.filter is not None:
+            cmd_list += ["--filter", self.filter]
+        for link_id in sorted(links):
+            cmd_list += ["--link", "%s=%s" % (links[link_id], link_id)]
+
+        self.logger.debug("[%s] HappyCapture: %s" % (network_id, cmd_list))
+
+        log = open(os.path.join(capture_dir, "capture.log"), "a")
+        try:
+            popen = self.SpawnAtNode(network_id, cmd_list, stdout=log, stderr=log, start_new_session=True)
+            create_time = psutil.Process(popen.pid).create_time()
+        except Exception as e:
+            emsg = "Failed to start capture: %s" % (str(e))
+            self.logger.error("[%s] HappyCapture: %s" % (network_id, emsg))
+            self.exit()
+        finally:
+            log.close()
+
+        record = {}
+        record["pid"] = popen.pid
+        record["create_time"] = create_time
+        record["dir"] = capture_dir
+        record["links"] = links
+        record["segment_size"] = self.segment_size
+        record["segments"] = self.segments
+        record["snaplen"] = self.snaplen
+        record["filter"] = self.filter
+        self.setNetworkCapture(network_id, record)
+
+        emsg = "capturing %d links into %s." % (len(links), capture_dir)
+        self.logger.debug("[%s] HappyCapture: %s" % (network_id, emsg))
+
+    def __stop(self, network_id):
+        record = self.getNetworkCapture(network_id)
+        if "pid" not in record:
+            return
+
+        if self.__capture_process(network_id) is not None:
+            self.TerminateProcessTree(record["pid"], record["create_time"])
+
+        self.removeNetworkCapture(network_id)
+
+    def __flush(self, network_id):
+        """
+        Asks a running capture to write out what it holds and waits until
+        it did, for at most a few seconds.
+        """
+        process = self.__capture_process(network_id)
+        if process is None:
+            return
+
+        requested = time.time()
+        for proc in [process] + process.children(recursive=True):
+            try:
+                os.kill(proc.pid, signal.SIGUSR2)
+            except OSError:
+                pass
+
+        capture_dir = self.getCaptureDir(network_id)
+        deadline = time.monotonic() + 3
+        while time.monotonic() < deadline:
+            if happy.HappyCaptureRing.ReadStatus(capture_dir).get("flushed", 0) >= requested:
+                return
+            time.sleep(0.05)
+
+        emsg = "capture did not flush, dumping what is on disk."
+        self.logger.warning("[%s] HappyCapture: %s" % (network_id, emsg))
+
+    def __dump(self):
+        links = []
+        for network_id in self.network_ids:
+            self.__flush(network_id)
+
+            capture_dir = self.getCaptureDir(network_id)
+            if not os.path.isdir(capture_dir):
+                continue
+            for link_id in sorted(os.listdir(capture_dir)):
+                link_dir = os.path.join(capture_dir, link_id)
+                if not os.path.isdir(link_dir):
+                    continue
+                if self.link_id is not None and link_id != self.link_id:
+                    continue
+                links.append((network_id + "/" + link_id, link_dir))
+
+        if len(links) == 0:
+            emsg = "nothing captured."
+            self.logger.error("[localhost] HappyCapture: %s" % (emsg))
+            self.exit()
+
+        if self.output is None:
+            self.output = self.process_log_prefix + "capture.pcapng"
+
+        since = 0
+        if self.seconds is not None:
+            since = int((time.time() - self.seconds) * 1000000000)
+
+        count = happy.HappyCaptureRing.DumpCapture(links, since, self.output)
+
+        if not self.quiet:
+            print("%d packets from %d links written to %s" % (count, len(links), self.output))
+
+        return {"output": self.output, "packets": count}
+
+    def __status(self):
+        status = {}
+        for network_id in self.network_ids:
+            running = self.__capture_process(network_id) is not None
+            links = happy.HappyCaptureRing.ReadStatus(self.getCaptureDir(network_id)).get("links", {})
+            if not running and len(links) == 0:
+                continue
+            status[network_id] = {"running": running, "links": links}
+
+            if self.quiet:
+                continue
+
+            print("%s: %s" % (network_id, "capturing" if running else "stopped"))
+            print("    {0: <16} {1: >12} {2: >14} {3: >10}".format("link", "packets", "bytes", "drops"))
+            for link_id in sorted(links):
+                link = links[link_id]
+                print("    {0: <16} {1: >12} {2: >14} {3: >10}".format(
+                      link_id, link["packets"], link["bytes"], link["drops"]))
+
+        return status
+
+    def run(self):
+        data = None
+
+        with self.getStateLockManager():
+
+            self.readState()
+
+            self.__pre_check()
+
+            if self.action == "start":
+                for network_id in self.network_ids:
+                    self.__start(network_id)
+                self.writeState()
+
+            elif self.action == "stop":
+                for network_id in self.network_ids:
+                    self.__stop(network_id)
+                self.writeState()
+
+            elif self.action == "dump":
+                data = self.__dump()
+
+            elif self.action == "status":
+                data = self.__status()
+
+        return ReturnMsg(0, data)
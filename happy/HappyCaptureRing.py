@@ -0,0 +1,478 @@
+#!/usr/bin/env python3
+
+#
+#    Copyright (c) 2021 Google LLC.
+#    All rights reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+#
+
+##
+#    @file
+#       Implements the capture daemon HappyCapture runs in a network
+#       namespace, and the pcapng helpers to read its rings back.
+#
+#       Every --link <interface>=<name> is captured into <dir>/<name>/ as
+#       pcapng segments of up to --segment-size bytes; only the newest
+#       --segments are kept, so a link never takes more than their product.
+#       Frames are cut to --snaplen bytes, and optionally filtered with the
+#       tcpdump expression --filter, by a classic BPF program in the
+#       kernel, and read in place from a TPACKET_V3 ring per link, so
+#       neither the uncaptured traffic nor the cut bytes are ever copied.
+#
+#       SIGUSR2 flushes the segments to disk and rewrites <dir>/status.json,
+#       whose flushed time is the time up to which every frame is on disk;
+#       SIGUSR1 and SIGTERM stop the daemon.
+#
+#       python HappyCaptureRing.py --dir /tmp/happy_capture/HomeWiFi --link happy003=wifi0 --segment-size 1048576
+#
+
+from __future__ import absolute_import
+from __future__ import print_function
+import getopt
+import heapq
+import json
+import os
+import select
+import signal
+import socket
+from struct import *
+import subprocess
+import sys
+import time
+
+try:
+    from happy.HappyPacketProcess import AttachFilter, PacketRing, BPF_RET_K, ETH_P_ALL, SOL_PACKET, \
+        PACKET_STATISTICS
+except ImportError:
+    # started as a script, next to HappyPacketProcess.py
+    from HappyPacketProcess import AttachFilter, PacketRing, BPF_RET_K, ETH_P_ALL, SOL_PACKET, \
+        PACKET_STATISTICS
+
+options = {}
+options["dir"] = None
+options["links"] = []
+options["segment_size"] = 1 << 20
+options["segments"] = 4
+options["snaplen"] = 256
+options["filter"] = None
+options["block_size"] = 1 << 16
+options["blocks"] = 4
+options["block_timeout"] = 100
+
+status_file = "status.json"
+segment_suffix = ".pcapng"
+
+PCAPNG_SHB = 0x0A0D0D0A
+PCAPNG_IDB = 0x00000001
+PCAPNG_EPB = 0x00000006
+PCAPNG_MAGIC = 0x1A2B3C4D
+LINKTYPE_ETHERNET = 1
+# if_name and if_tsresol options of the IDB
+IDB_NAME = 2
+IDB_TSRESOL = 9
+
+flush_interval = 1.0
+
+_blockHeader = Struct('=II')
+_epbHeader = Struct('=IIIIIII')
+
+
+def _option(code, value):
+    padding = -len(value) % 4
+    return pack('=HH', code, len(value)) + value + b'\x00' * padding
+
+
+def SectionHeader():
+    """
+    Returns a pcapng Section Header Block of unknown section length.
+    """
+    return pack('=IIIHHqI', PCAPNG_SHB, 28, PCAPNG_MAGIC, 1, 0, -1, 28)
+
+
+def InterfaceDescription(name, snaplen):
+    """
+    Returns a pcapng Interface Description Block for an Ethernet interface
+    with nanosecond timestamps.
+    """
+    body = pack('=HHI', LINKTYPE_ETHERNET, 0, snaplen)
+    body += _option(IDB_NAME, name.encode()) + _option(IDB_TSRESOL, b'\x09') + _option(0, b'')
+    length = 12 + len(body)
+    return pack('=II', PCAPNG_IDB, length) + body + pack('=I', length)
+
+
+def CompileCaptureFilter(expression, snaplen):
+    """
+    Returns a classic BPF program that accepts the frames matching the
+    tcpdump expression, if any, cut to snaplen bytes.
+    """
+    if expression is None:
+        return [(BPF_RET_K, 0, 0, snaplen)]
+
+    try:
+        out = subprocess.check_output(["tcpdump", "-ddd", "-y", "EN10MB", expression],
+                                      stderr=subprocess.STDOUT, universal_newlines=True)
+    except OSError:
+        raise ValueError("compiling a capture filter needs tcpdump")
+    except subprocess.CalledProcessError as e:
+        raise ValueError("invalid capture filter %s: %s" % (expression, e.output.strip()))
+
+    program = []
+    for line in out.splitlines()[1:]:
+        code, jt, jf, k = [int(word) for word in line.split()]
+        if code == BPF_RET_K and k > snaplen:
+            k = snaplen
+        program.append((code, jt, jf, k))
+    return program
+
+
+class SegmentWriter(object):
+    """
+    Writes the frames of one link to numbered pcapng segments in
+    directory, starting a new segment every segment_size bytes and
+    keeping only the newest segments of them.
+    """
+
+    def __init__(self, directory, name, snaplen, segment_size, segments):
+        self.directory = directory
+        self.name = name
+        self.snaplen = snaplen
+        self.segment_size = segment_size
+        self.segments = segments
+        self.file = None
+        self.size = 0
+        self.packets = 0
+        self.bytes = 0
+
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        # a restarted capture continues after the segments already there
+        existing = ListSegments(directory)
+        self.seq = existing[-1][0] + 1 if existing else 0
+        self.__open()
+
+    def __open(self):
+        path = os.path.join(self.directory, "%08d%s" % (self.seq, segment_suffix))
+        self.file = open(path, "wb", buffering=1 << 16)
+        header = SectionHeader() + InterfaceDescription(self.name, self.snaplen)
+        self.file.write(header)
+        self.size = len(header)
+
+        for seq, old in ListSegments(self.directory)[:-self.segments]:
+            try:
+                os.unlink(old)
+            except OSError:
+                pass
+
+    def Write(self, buf, offset, snaplen, length, sec, nsec):
+        padding = -snaplen % 4
+        total = 32 + snaplen + padding
+        timestamp = sec * 1000000000 + nsec
+
+        f = self.file
+        f.write(_epbHeader.pack(PCAPNG_EPB, total, 0, timestamp >> 32, timestamp & 0xffffffff,
+                                snaplen, length))
+        # a view, so the frame is copied once, from the ring into the file buffer
+        f.write(memoryview(buf)[offset:offset + snaplen])
+        f.write(b'\x00' * padding + pack('=I', total))
+
+        self.size += total
+        self.packets += 1
+        self.bytes += length
+
+        if self.size >= self.segment_size:
+            self.file.close()
+            self.seq += 1
+            self.__open()
+
+    def Flush(self):
+        self.file.flush()
+
+    def Close(self):
+        self.file.close()
+
+
+class LinkCapture(object):
+    """
+    An AF_PACKET socket on one interface with the capture filter attached
+    and a PacketRing, feeding a SegmentWriter.
+    """
+
+    def __init__(self, interface, writer, program, block_size, blocks, block_timeout):
+        self.interface = interface
+        self.writer = writer
+        self.drops = 0
+        self.sock = socket.socket(socket.AF_PACKET, socket.SOCK_RAW, 0)
+        try:
+            AttachFilter(self.sock, program)
+            self.ring = PacketRing(self.sock, block_size, blocks, block_timeout)
+            self.sock.bind((interface, ETH_P_ALL))
+        except Exception:
+            self.sock.close()
+            raise
+
+    def fileno(self):
+        return self.sock.fileno()
+
+    def Drain(self):
+        """
+        Writes out every frame the kernel handed over. Raises OSError once
+        the interface is gone.
+        """
+        write = self.writer.Write
+        for packet in self.ring.Packets(0):
+            if packet[0] is None:
+                break
+            write(*packet)
+
+    def Statistics(self):
+        packets, drops = unpack('II', self.sock.getsockopt(SOL_PACKET, PACKET_STATISTICS, 8))
+        self.drops += drops
+        return self.drops
+
+    def Close(self):
+        self.ring.Close()
+        self.sock.close()
+        self.writer.Close()
+
+
+def ListSegments(directory):
+    """
+    Returns the (sequence number, path) of the segments in directory,
+    oldest first.
+    """
+    segments = []
+    try:
+        names = os.listdir(directory)
+    except OSError:
+        return segments
+    for name in names:
+        if name.endswith(segment_suffix) and name[:-len(segment_suffix)].isdigit():
+            segments.append((int(name[:-len(segment_suffix)]), os.path.join(directory, name)))
+    segments.sort()
+    return segments
+
+
+def ReadPackets(path):
+    """
+    Yields (timestamp in ns, captured bytes, length on the wire) for every
+    Enhanced Packet Block of a pcapng file written by SegmentWriter. A
+    block cut short at the end of a segment still being written ends the
+    file.
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+
+    offset = 0
+    while offset + 12 <= len(data):
+        block_type, length = _blockHeader.unpack_from(data, offset)
+        if length < 12 or offset + length > len(data):
+            break
+        if block_type == PCAPNG_EPB:
+            i, high, low, snaplen, wirelen = unpack_from('=IIIII', data, offset + 8)
+            start = offset + 28
+            yield (high << 32) | low, data[start:start + snaplen], wirelen
+        offset += length
+
+
+def DumpCapture(links, since, output):
+    """
+    Merges the packets captured on links, a list of (name, directory),
+    at or after since, in ns since the epoch, into the pcapng file output,
+    one interface per link, in time order. Returns the number of packets.
+    """
+
+    def packets(index, directory):
+        for seq, path in ListSegments(directory):
+            try:
+                for timestamp, data, wirelen in ReadPackets(path):
+                    if timestamp >= since:
+                        yield timestamp, index, data, wirelen
+            except (IOError, OSError):
+                # rotated out since it was listed
+                continue
+
+    count = 0
+    with open(output, "wb") as f:
+        f.write(SectionHeader())
+        for name, directory in links:
+            f.write(InterfaceDescription(name, 0))
+
+        streams = [packets(index, directory) for index, (name, directory) in enumerate(links)]
+        for timestamp, index, data, wirelen in heapq.merge(*streams):
+            padding = -len(data) % 4
+            total = 32 + len(data) + padding
+            f.write(_epbHeader.pack(PCAPNG_EPB, total, index, timestamp >> 32, timestamp & 0xffffffff,
+                                    len(data), wirelen))
+            f.write(data + b'\x00' * padding + pack('=I', total))
+            count += 1
+
+    return count
+
+
+def ReadStatus(directory):
+    try:
+        with open(os.path.join(directory, status_file)) as f:
+            return json.load(f)
+    except (IOError, ValueError):
+        return {}
+
+
+def Capture(options):
+    """
+    Captures options["links"], a list of (interface, name), until stopped.
+    """
+    program = CompileCaptureFilter(options["filter"], options["snaplen"])
+
+    captures = {}
+    for interface, name in options["links"]:
+        writer = SegmentWriter(os.path.join(options["dir"], name), name, options["snaplen"],
+                               options["segment_size"], options["segments"])
+        try:
+            capture = LinkCapture(interface, writer, program, options["block_size"], options["blocks"],
+                                  options["block_timeout"])
+        except (OSError, ValueError) as e:
+            writer.Close()
+            print("%s: not capturing %s: %s" % (__file__, interface, str(e)), file=sys.stderr)
+            continue
+        captures[capture.fileno()] = (name, capture)
+
+    requests = {"stop": False, "flush": False}
+
+    def stop(signum, frame):
+        requests["stop"] = True
+
+    def flush(signum, frame):
+        requests["flush"] = True
+
+    signal.signal(signal.SIGUSR1, stop)
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGUSR2, flush)
+
+    poller = select.poll()
+    for fd in captures:
+        poller.register(fd, select.POLLIN | select.POLLERR)
+
+    def close(fd):
+        poller.unregister(fd)
+        captures.pop(fd)[1].Close()
+
+    last_flush = 0
+    flush_due = None
+    # frames in a block the kernel has not handed over yet are seen at the
+    # latest one block timeout later
+    block_timeout = options["block_timeout"] / 1000.0
+
+    while not requests["stop"] and len(captures) > 0:
+        try:
+            events = poller.poll(int(min(flush_interval, block_timeout) * 1000))
+        except InterruptedError:
+            events = []
+
+        for fd, event in events:
+            if event & select.POLLERR:
+                # the interface went away with its link
+                close(fd)
+                continue
+            try:
+                captures[fd][1].Drain()
+            except OSError:
+                close(fd)
+
+        now = time.time()
+        if requests["flush"]:
+            requests["flush"] = False
+            flush_due = now + block_timeout
+
+        if (flush_due is None or now < flush_due) and now - last_flush < flush_interval:
+            continue
+        flush_due = None
+        last_flush = now
+
+        # everything received before flushed is on disk
+        status = {"pid": os.getpid(), "flushed": now - block_timeout, "links": {}}
+        for fd, (name, capture) in list(captures.items()):
+            try:
+                capture.Drain()
+            except OSError:
+                close(fd)
+                continue
+            capture.writer.Flush()
+            status["links"][name] = {"interface": capture.interface,
+                                     "packets": capture.writer.packets,
+                                     "bytes": capture.writer.bytes,
+                                     "drops": capture.Statistics()}
+
+        tmp = os.path.join(options["dir"], status_file + ".tmp")
+        with open(tmp, "w") as f:
+            json.dump(status, f, sort_keys=True)
+        os.rename(tmp, os.path.join(options["dir"], status_file))
+
+    for name, capture in captures.values():
+        capture.Close()
+
+
+if __name__ == "__main__":
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], "h",
+                                   ["help", "dir=", "link=", "segment-size=", "segments=", "snaplen=",
+                                    "filter=", "block-size=", "blocks=", "block-timeout="])
+
+    except getopt.GetoptError as err:
+        sys.exit("%s: Failed to parse arguments." % (__file__))
+
+    for o, a in opts:
+        if o in ("-h", "--help"):
+            print("python HappyCaptureRing.py --dir <DIR> --link <INTERFACE>=<NAME> [--link ...] "
+                  "[--segment-size <BYTES>] [--segments <COUNT>] [--snaplen <BYTES>] [--filter <EXPRESSION>]")
+            sys.exit(0)
+
+        elif o == "--dir":
+            options["dir"] = a
+
+        elif o == "--link":
+            interface, name = a.split("=", 1)
+            options["links"].append((interface, name))
+
+        elif o == "--segment-size":
+            options["segment_size"] = int(a)
+
+        elif o == "--segments":
+            options["segments"] = int(a)
+
+        elif o == "--snaplen":
+            options["snaplen"] = int(a)
+
+        elif o == "--filter":
+            options["filter"] = a
+
+        elif o == "--block-size":
+            options["block_size"] = int(a)
+
+        elif o == "--blocks":
+            options["blocks"] = int(a)
+
+        elif o == "--block-timeout":
+            options["block_timeout"] = int(a)
+
+        else:
+            assert False, "unhandled option"
+
+    if options["dir"] is None or len(options["links"]) == 0:
+        sys.exit("%s: Missing capture directory or links." % (__file__))
+
+    try:
+        Capture(options)
+    except ValueError as e:
+        sys.exit("%s: %s" % (__file__, str(e)))
@@ -0,0 +1,393 @@
+#!/usr/bin/env python3
+
+#
+#    Copyright (c) 2021 Google LLC.
+#    All rights reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+#
+
+##
+#    @file
+#       Implements HappyConnectivity class that checks which virtual nodes
+#       reach which.
+#
+
+from __future__ import absolute_import
+from __future__ import print_function
+import json
+import os
+import socket
+import subprocess
+import sys
+
+from happy.ReturnMsg import ReturnMsg
+from happy.Utils import *
+from happy.utils.IP import IP
+from happy.HappyNode import HappyNode
+from happy.HappyProcess import HappyProcess
+import happy.HappyICMPProbe
+
+options = {}
+options["quiet"] = False
+options["nodes"] = None
+options["prefix"] = None
+options["count"] = 3
+options["interval"] = None
+options["timeout"] = None
+options["expected"] = None
+options["output"] = None
+options["grow_neighbor_tables"] = False
+
+
+def option():
+    return options.copy()
+
+
+def IsExpected(expected, source, destination):
+    """
+    Returns whether source is expected to reach destination according to
+    an expected-reachability spec:
+
+        {"default": true, "<SOURCE>": {"<DESTINATION>": false, "*": true}}
+
+    The entry of the destination wins over "*" of the source, which wins
+    over "default". Without a spec every node is expected to reach every
+    other one.
+    """
+    if expected is None:
+        return True
+
+    record = expected.get(source, {})
+    if destination in record:
+        return bool(record[destination])
+    if "*" in record:
+        return bool(record["*"])
+    return bool(expected.get("default", True))
+
+
+def Diff(matrix, expected):
+    """
+    Returns the (source, destination, expected, reachable) of every pair of
+    the matrix whose reachability is not the expected one.
+    """
+    diff = []
+    for source in sorted(matrix.keys()):
+        for destination in sorted(matrix[source].keys()):
+            result = matrix[source][destination]
+            if result is None:
+                continue
+            want = IsExpected(expected, source, destination)
+            if want != result["reachable"]:
+                diff.append((source, destination, want, result["reachable"]))
+    return diff
+
+
+def Best(results, addresses):
+    """
+    Returns the result of the address of addresses with the lowest loss and
+    then the lowest average round trip time.
+    """
+    best = None
+    for addr in addresses:
+        stats = results.get(addr, happy.HappyICMPProbe.Statistics(0, []))
+        key = (stats["loss"], stats["avg"] if stats["avg"] is not None else float("inf"))
+        if best is None or key < best[0]:
+            best = (key, addr, stats)
+
+    key, addr, stats = best
+    return {"address": addr, "loss": stats["loss"], "avg": stats["avg"], "max": stats["max"],
+            "reachable": stats["loss"] < 100}
+
+
+class HappyConnectivity(HappyNode, HappyProcess):
+    """
+    Pings between every pair of virtual nodes, or of the given nodes, and
+    displays a matrix of the loss and average round trip time of the best
+    address of every destination. All sources ping at the same time, every
+    one from ICMP sockets in its own namespace, so the whole matrix takes
+    about count intervals.
+
+    happy-connectivity [-h --help] [-q --quiet] [-n --nodes <NODE_NAME>,...]
+                       [-p --prefix <PREFIX>] [-c --count <PING_COUNT>]
+                       [--interval <SECONDS>] [--timeout <SECONDS>]
+                       [-e --expected <FILE>] [-o --output <FILE>]
+                       [--grow-neighbor-tables]
+
+        -n --nodes      Optional. Comma separated nodes to check, all by default.
+        -p --prefix     Optional. Only ping addresses on this prefix.
+        -c --count      Optional. Number of pings to send to every address, 3
+                        by default.
+           --interval   Optional. Seconds between pings, 1 by default.
+           --timeout    Optional. Seconds to wait for replies after the last
+                        ping, 1 by default.
+        -e --expected   Optional. JSON file of the expected reachability, as
+                        {"default": true, "<SOURCE>": {"<DESTINATION>": false,
+                        "*": true}}, all reachable by default. A pair is
+                        reachable if any ping was answered.
+        -o --output     Optional. Writes the matrix and the difference to the
+                        expected reachability to this JSON file.
+           --grow-neighbor-tables
+                        Optional. Raises the gc_thresh2 and gc_thresh3 neighbor
+                        table sysctls of the host when the mesh needs more
+                        entries than they allow. They are shared by all
+                        namespaces and never lowered again, as other runs may
+                        still rely on them.
+
+    Example:
+    $ happy-connectivity --prefix 10.0.1.0/24 --expected isolated.json
+        Checks that the nodes reach each other on 10.0.1.0/24 as isolated.json
+        expects.
+
+    return:
+        0    every pair is as expected
+        1    fail, or some pair is not
+    """
+
+    def __init__(self, opts=options):
+        HappyNode.__init__(self)
+        HappyProcess.__init__(self)
+
+        self.quiet = opts["quiet"]
+        self.nodes = opts["nodes"]
+        self.prefix = opts["prefix"]
+        self.count = opts["count"]
+        self.interval = opts["interval"]
+        self.timeout = opts["timeout"]
+        self.expected = opts["expected"]
+        self.output = opts["output"]
+        self.grow_neighbor_tables = opts["grow_neighbor_tables"]
+
+    def __pre_check(self):
+        if self.nodes is None:
+            self.nodes = self.getNodeIds()
+        elif isinstance(self.nodes, str):
+            self.nodes = [node_id for node_id in self.nodes.split(",") if node_id]
+        self.nodes = sorted(self.nodes)
+
+        for node_id in self.nodes:
+            if not self._nodeExists(node_id):
+                emsg = "virtual node %s does not exist." % (node_id)
+                self.logger.error("[%s] HappyConnectivity: %s" % (node_id, emsg))
+                self.exit()
+
+        if self.prefix is not None and not IP.isIpAddress(IP.splitAddressMask(self.prefix)[0]):
+            emsg = "Invalid prefix %s." % (self.prefix)
+            self.logger.error("[localhost] HappyConnectivity: %s" % (emsg))
+            self.exit()
+
+        self.count = int(self.count)
+        if self.count < 1:
+            emsg = "Need to send at least one ping to every address, not %d." % (self.count)
+            self.logger.error("[localhost] HappyConnectivity: %s" % (emsg))
+            self.exit()
+
+        if self.interval is None:
+            self.interval = happy.HappyICMPProbe.options["interval"]
+        if self.timeout is None:
+            self.timeout = happy.HappyICMPProbe.options["timeout"]
+
+        if isinstance(self.expected, str):
+            try:
+                with open(self.expected) as f:
+                    self.expected = json.load(f)
+            except (IOError, ValueError) as e:
+                emsg = "Failed to read the expected reachability %s: %s" % (self.expected, str(e))
+                self.logger.error("[localhost] HappyConnectivity: %s" % (emsg))
+                self.exit()
+
+    def __get_addresses(self):
+        self.addresses = {}
+        for node_id in self.nodes:
+            if self.prefix is not None:
+                addresses = self.getNodeAddressesOnPrefix(self.prefix, node_id)
+            else:
+                addresses = self.getNodeAddresses(node_id)
+            self.addresses[node_id] = sorted(set(addresses))
+
+    def __destinations(self, source):
+        addresses = []
+        for node_id in self.nodes:
+            if node_id != source:
+                addresses += self.addresses[node_id]
+        return sorted(set(addresses))
+
+    def __grow_neighbor_tables(self, sources):
+        """
+        The neighbor tables are shared by all namespaces, and entries past
+        gc_thresh3 are not created, so a large mesh would lose the pings of
+        the last pairs to resolve.
+        """
+        for family, version in [("ipv4", 4), ("ipv6", 6)]:
+            needed = 0
+            for node_id in sources:
+                needed += len([addr for addr in self.__destinations(node_id)
+                               if IP.isIpv6(addr) == (version == 6)])
+
+            thresh3 = "net.%s.neigh.default.gc_thresh3" % (family)
+            out, err = self.CallAtHostForOutput("sysctl -n " + thresh3)
+            try:
+                if int(out) >= 2 * needed:
+                    continue
+            except (TypeError, ValueError):
+                continue
+
+            if not self.grow_neighbor_tables:
+                emsg = "%s is below the %d entries of the mesh, some pings may be lost. " \
+                       "Use --grow-neighbor-tables to raise it." % (thresh3, 2 * needed)
+                self.logger.warning("[localhost] HappyConnectivity: %s" % (emsg))
+                continue
+
+            # room for the entries of the rest of the host too; the tables
+            # are never lowered, another run may still be probing
+            cmd = "sysctl -q -w net.%s.neigh.default.gc_thresh2=%d %s=%d" % (family, 2 * needed, thresh3, 4 * needed)
+            self.logger.debug("[localhost] HappyConnectivity: growing the %s neighbor table to %d entries" %
+                              (family, 4 * needed))
+            self.CallAtHost(self.runAsRoot(cmd))
+
+    def __probe_in_process(self, sources):
+        """
+        One Prober per source, with sockets in the namespace of the source,
+        all run from one loop.
+        """
+        results = {}
+        probers = {}
+
+        try:
+            for node_id in sources:
+                create = socket.socket
+                if not self.isNodeLocal(node_id):
+                    netns_path = self.getNetNSPath(node_id)
+
+                    def create(family, type, proto, netns_path=netns_path):
+                        return self.SocketInNamespace(netns_path, family, type, proto)
+
+                try:
+                    probers[node_id] = happy.HappyICMPProbe.Prober(self.__destinations(node_id), create)
+                except OSError as e:
+                    emsg = "Failed to ping from node %s: %s" % (node_id, str(e))
+                    self.logger.warning("[%s] HappyConnectivity: %s" % (node_id, emsg))
+                    results[node_id] = {}
+
+            happy.HappyICMPProbe.RunProbers(list(probers.values()), self.count, self.interval,
+                                            happy.HappyICMPProbe.options["size"], self.timeout)
+        finally:
+            for prober in probers.values():
+                prober.Close()
+
+        for node_id, prober in probers.items():
+            results[node_id] = prober.Results()
+        return results
+
+    def __probe_as_scripts(self, sources):
+        """
+        The sockets need root, which the prober gets as a script; one per
+        source, all started before any is waited for.
+        """
+        path = os.path.dirname(os.path.abspath(happy.HappyICMPProbe.__file__))
+        probes = {}
+        for node_id in sources:
+            cmd = [sys.executable, path + "/HappyICMPProbe.py", "--count", str(self.count),
+                   "--interval", str(self.interval), "--timeout", str(self.timeout)]
+            cmd += self.__destinations(node_id)
+            if not self.isNodeLocal(node_id):
+                cmd = self.getRunAsRootPrefixList() + ["ip", "netns", "exec", self.uniquePrefix(node_id)] + cmd
+            probes[node_id] = subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                               universal_newlines=True)
+
+        results = {}
+        for node_id, probe in probes.items():
+            out, err = probe.communicate()
+            try:
+                results[node_id] = json.loads(out)
+            except ValueError:
+                emsg = "Failed to ping from node %s: %s" % (node_id, err.strip())
+                self.logger.warning("[%s] HappyConnectivity: %s" % (node_id, emsg))
+                results[node_id] = {}
+        return results
+
+    def __probe(self):
+        sources = [node_id for node_id in self.nodes if len(self.__destinations(node_id)) > 0]
+
+        self.__grow_neighbor_tables(sources)
+
+        if os.geteuid() == 0 or all([self.isNodeLocal(node_id) for node_id in sources]):
+            results = self.__probe_in_process(sources)
+        else:
+            results = self.__probe_as_scripts(sources)
+
+        self.matrix = {}
+        for source in self.nodes:
+            self.matrix[source] = {}
+            for destination in self.nodes:
+                if destination == source:
+                    continue
+                if len(self.addresses[destination]) == 0:
+                    # nothing to ping on the prefix
+                    self.matrix[source][destination] = None
+                    continue
+                self.matrix[source][destination] = Best(results.get(source, {}), self.addresses[destination])
+
+    def __print_matrix(self):
+        width = max([14] + [len(node_id) + 1 for node_id in self.nodes])
+        print("loss % / avg rtt ms, from row to column")
+        print(" ".join(["{0: >{1}}".format(h, width) for h in ["from \\ to"] + self.nodes]))
+
+        for source in self.nodes:
+            row = [source]
+            for destination in self.nodes:
+                result = self.matrix[source].get(destination)
+                if result is None:
+                    row.append("-")
+                elif result["avg"] is None:
+                    row.append("%d/-" % (result["loss"]))
+                else:
+                    row.append("%d/%.2f" % (result["loss"], result["avg"]))
+            print(" ".join(["{0: >{1}}".format(r, width) for r in row]))
+
+    def __print_diff(self):
+        pairs = sum([len([r for r in self.matrix[s].values() if r is not None]) for s in self.nodes])
+        reachable = sum([len([r for r in self.matrix[s].values() if r is not None and r["reachable"]])
+                         for s in self.nodes])
+        print("%d of %d pairs reachable, %d not as expected" % (reachable, pairs, len(self.diff)))
+
+        for source, destination, want, reachable in self.diff:
+            if want:
+                print(hred("%s does not reach %s" % (source, destination)))
+            else:
+                print(hred("%s reaches %s" % (source, destination)))
+
+    def __write_output(self):
+        record = {"matrix": self.matrix,
+                  "diff": [{"source": s, "destination": d, "expected": e, "reachable": r}
+                           for s, d, e, r in self.diff]}
+        with open(self.output, "w") as f:
+            json.dump(record, f, indent=4, sort_keys=True)
+
+    def run(self):
+        self.__pre_check()
+
+        self.__get_addresses()
+
+        self.__probe()
+
+        self.diff = Diff(self.matrix, self.expected)
+
+        if not self.quiet:
+            self.__print_matrix()
+            self.__print_diff()
+
+        if self.output is not None:
+            self.__write_output()
+
+        return ReturnMsg(0 if len(self.diff) == 0 else 1, {"matrix": self.matrix, "diff": self.diff})
@@ -21,16 +21,23 @@
 #    @file
 #       Implements HappyDNS class through which nodes get DNS name servers.
 #
+#       The resolv.conf of all the nodes are written by one privileged
+#       process, or by Happy itself when it runs as root.
 #
 
 from __future__ import absolute_import
 import os
+import shlex
+import subprocess
 import sys
 
 from happy.ReturnMsg import ReturnMsg
 from happy.Utils import *
 from happy.utils.IP import IP
 from happy.HappyNode import HappyNode
+import happy.HappyDNSStub
+import happy.HappyProcessStart
+import happy.HappyProcessStop
 
 options = {}
 options["quiet"] = False
@@ -38,6 +45,9 @@ options["add"] = False
 options["delete"] = False
 options["dns"] = None
 options["node_id"] = None
+options["stub"] = None
+
+STUB_TAG = "happy-dns-stub"
 
 
 def option():
@@ -46,13 +56,18 @@ def option():
 
 class HappyDNS(HappyNode):
     """
-    Assigns DNS servers to virtual nodes.
+    Assigns DNS servers to virtual nodes, or a DNS stub resolver running on
+    a virtual node that answers for <NODE_NAME>.<STATE_NAME>.happy with the
+    addresses of the node and forwards every other query to the DNS
+    servers.
 
     happy-dns [-h --help] [-q --quiet] [-a --add] [-d --delete]
-              [-i --id <NODE_NAME>] <DNS_LIST>
+              [-i --id <NODE_NAME>] [-s --stub <NODE_NAME>] <DNS_LIST>
 
         -i --id     Optional. Node to assign a DNS server to. Find
                     using happy-link-list.
+        -s --stub   Optional. Node to run the DNS stub resolver on, the
+                    DNS server of the nodes instead of those listed.
 
     Examples:
     $ happy-dns 8.8.8.8
@@ -61,6 +76,11 @@ class HappyDNS(HappyNode):
     $ happy-dns -d onhub 8.8.8.8
         Removes DNS server 8.8.8.8 from the onhub node.
 
+    $ happy-dns --stub onhub 8.8.8.8
+        Runs a DNS stub resolver on onhub, forwarding to 8.8.8.8, and makes
+        it the DNS server of all virtual nodes, which resolve each other
+        as <NODE_NAME>.happy.happy or <NODE_NAME> alone.
+
     return:
         0    success
         1    fail
@@ -74,6 +94,8 @@ class HappyDNS(HappyNode):
         self.delete = opts["delete"]
         self.dns = opts["dns"]
         self.node_id = opts["node_id"]
+        self.stub = opts["stub"]
+        self.stub_record = None
 
     def __pre_check(self):
         if not self.delete:
@@ -83,72 +105,156 @@ class HappyDNS(HappyNode):
             if "happy_dns" in list(os.environ.keys()):
                 self.dns = os.environ['happy_dns'].split()
 
-        if self.add and self.dns is None:
+        if self.add and self.dns is None and self.stub is None:
             emsg = "No DNS servers listed."
             self.logger.error("[localhost] HappyDNS: %s" % (emsg))
             self.exit()
 
-        for dns_addr in self.dns:
+        for dns_addr in self.dns or []:
             if not IP.isIpv4(dns_addr):
                 emsg = "DNS %s is not a valid IPv4 address." % (dns_addr)
                 self.logger.error("[localhost] HappyDNS: %s" % (emsg))
                 self.exit()
 
-    def __add_node_dns(self, node_id):
-        nspath = self.nsroot + "/" + self.uniquePrefix(node_id)
-        resolv_path = nspath + "/" + "resolv.conf"
+        self.stub_record = self.getDNSStub()
+
+        if self.add and self.stub is not None:
+            if not self._nodeExists(self.stub):
+                emsg = "virtual node %s does not exist." % (self.stub)
+                self.logger.error("[%s] HappyDNS: %s" % (self.stub, emsg))
+                self.exit()
 
-        if not os.path.isdir(nspath):
-            cmd = "mkdir -p " + nspath
-            cmd = self.runAsRoot(cmd)
-            ret = self.CallAtHost(cmd)
+            self.stub_addr = None
+            for addr in self.getNodeAddresses(self.stub):
+                if IP.isIpv4(addr):
+                    self.stub_addr = addr
+                    break
 
-        if not os.path.exists(resolv_path):
-            cmd = "touch " + resolv_path
-            cmd = self.runAsRoot(cmd)
-            ret = self.CallAtHost(cmd)
+            if self.stub_addr is None:
+                emsg = "virtual node %s has no IPv4 address to serve DNS on." % (self.stub)
+                self.logger.error("[%s] HappyDNS: %s" % (self.stub, emsg))
+                self.exit()
 
-        cmd = "chmod 666 " + resolv_path
+    def __stop_stub(self):
+        if self.stub_record is None:
+            return
+
+        if self.getNodeProcess(STUB_TAG, self.stub_record["node_id"]) == {}:
+            return
+
+        options = happy.HappyProcessStop.option()
+        options["quiet"] = True
+        options["node_id"] = self.stub_record["node_id"]
+        options["tag"] = STUB_TAG
+        happy.HappyProcessStop.HappyProcessStop(options).run()
+
+    def __start_stub(self):
+        self.__stop_stub()
+
+        zone = "%s.happy" % (self.state_id)
+        cmd = "%s %s --state %s --zone %s" % \
+            (sys.executable, os.path.abspath(happy.HappyDNSStub.__file__), self.state_file, zone)
+        if self.dns:
+            cmd += " --upstream %s" % (",".join(self.dns))
+
+        options = happy.HappyProcessStart.option()
+        options["quiet"] = True
+        options["node_id"] = self.stub
+        options["tag"] = STUB_TAG
+        options["command"] = cmd
+        options["sync_on_output"] = "ready"
+        # port 53 needs root, and the stub reads the state with happy.State
+        options["rootMode"] = True
+        options["env"] = {"PYTHONPATH": os.path.dirname(os.path.dirname(os.path.abspath(happy.__file__)))}
+        happy.HappyProcessStart.HappyProcessStart(options).run()
+
+        self.stub_record = {"node_id": self.stub, "address": self.stub_addr, "zone": zone,
+                            "upstream": self.dns or []}
+        # the nodes ask the stub, which asks the DNS servers
+        self.dns = [self.stub_addr]
+
+    def __resolv_conf(self):
+        lines = ["nameserver " + dns_addr for dns_addr in self.dns]
+        if self.stub_record is not None and self.stub_record["address"] in self.dns:
+            lines.append("search " + self.stub_record["zone"])
+        return "\n".join(lines) + "\n"
+
+    def __add_nodes_dns(self, nodes):
+        nspaths = [self.nsroot + "/" + self.uniquePrefix(node_id) for node_id in nodes]
+        resolv_paths = [nspath + "/" + "resolv.conf" for nspath in nspaths]
+        resolv_conf = self.__resolv_conf()
+
+        if len(self.getRunAsRootPrefixList()) == 0:
+            for nspath, resolv_path in zip(nspaths, resolv_paths):
+                if not os.path.isdir(nspath):
+                    os.makedirs(nspath)
+                with open(resolv_path, 'w') as res:
+                    res.write(resolv_conf)
+            return
+
+        # one privileged process for all the nodes
+        script = 'mkdir -p "$@" && exec tee %s > /dev/null' % (" ".join([shlex.quote(p) for p in resolv_paths]))
+        cmd_list = self.getRunAsRootPrefixList() + ["sh", "-c", script, "sh"] + nspaths
+        self.logger.debug("[localhost] HappyDNS: %s" % (cmd_list))
+        proc = subprocess.Popen(cmd_list, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL,
+                                stderr=subprocess.PIPE, universal_newlines=True)
+        out, err = proc.communicate(resolv_conf)
+        if proc.returncode != 0:
+            emsg = "Failed to write resolv.conf of %s: %s" % (", ".join(nodes), (err or "").strip())
+            self.logger.warning("[localhost] HappyDNS: %s" % (emsg))
+
+    def __remove_nodes_dns(self, nodes):
+        resolv_paths = [self.nsroot + "/" + self.uniquePrefix(node_id) + "/" + "resolv.conf" for node_id in nodes]
+        resolv_paths = [resolv_path for resolv_path in resolv_paths if os.path.exists(resolv_path)]
+        if len(resolv_paths) == 0:
+            return
+
+        if len(self.getRunAsRootPrefixList()) == 0:
+            for resolv_path in resolv_paths:
+                os.remove(resolv_path)
+            return
+
+        cmd = "rm -f " + " ".join(resolv_paths)
         cmd = self.runAsRoot(cmd)
         ret = self.CallAtHost(cmd)
 
-        with open(resolv_path, 'w') as res:
-            for dns_addr in self.dns:
-                line = "nameserver " + dns_addr + "\n"
-                res.write(line)
-
-    def __remove_node_dns(self, node_id):
-        nspath = self.nsroot + "/" + self.uniquePrefix(node_id)
-        resolv_path = nspath + "/" + "resolv.conf"
-        if os.path.exists(resolv_path):
-            cmd = "rm " + resolv_path
-            cmd = self.runAsRoot(cmd)
-            ret = self.CallAtHost(cmd)
-
     def __update_nodes_dns(self):
         if self.node_id:
             nodes = [self.node_id]
         else:
             nodes = self.getNodeIds()
 
-        for node_id in nodes:
-            if self.add:
-                self.__add_node_dns(node_id)
-            else:
-                self.__remove_node_dns(node_id)
+        if self.add:
+            self.__add_nodes_dns(nodes)
+        else:
+            self.__remove_nodes_dns(nodes)
 
     def __dns_state(self):
+        if self.add and self.stub is not None:
+            self.setGlobalDNSStub(self.stub_record)
+
         if not self.node_id:
             if self.add:
                 self.setGlobalDNS(self.dns)
             else:
                 self.removeGlobalDNS()
+                self.removeGlobalDNSStub()
 
     def run(self):
         with self.getStateLockManager():
 
             self.__pre_check()
 
+        # the stub is a happy process, recorded in the state by itself
+        if self.add and self.stub is not None:
+            self.__start_stub()
+        elif self.delete and not self.node_id:
+            self.__stop_stub()
+
+        with self.getStateLockManager():
+
+            self.readState()
+
             self.__update_nodes_dns()
 
             self.__dns_state()
@@ -0,0 +1,333 @@
+#!/usr/bin/env python3
+
+#
+#    Copyright (c) 2021 Google LLC.
+#    All rights reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+#
+
+##
+#    @file
+#       Implements the DNS stub resolver of happy-dns --stub, run as a happy
+#       process on a virtual node. It answers A and AAAA queries for
+#       <node>.<zone> from the addresses of the nodes in a Happy state file,
+#       read again whenever the file changes, and forwards every other query
+#       to all the upstream servers, relaying the first answer. It prints
+#       "ready" once it listens:
+#
+#       python HappyDNSStub.py --state ~/.happy_state.json --zone happy.happy --upstream 8.8.8.8
+#
+
+from __future__ import absolute_import
+from __future__ import print_function
+import asyncio
+import collections
+import getopt
+import json
+import os
+import random
+import socket
+from struct import *
+import sys
+import time
+
+from happy.State import State
+
+options = {}
+options["listen"] = "0.0.0.0"
+options["port"] = 53
+options["state"] = None
+options["zone"] = "happy.happy"
+options["upstream"] = []
+options["ttl"] = 5
+
+TYPE_A = 1
+TYPE_AAAA = 28
+CLASS_IN = 1
+
+RCODE_NOERROR = 0
+RCODE_SERVFAIL = 2
+RCODE_NXDOMAIN = 3
+
+FLAG_QR = 0x8000
+FLAG_AA = 0x0400
+FLAG_RD = 0x0100
+FLAG_RA = 0x0080
+
+_header = Struct('!HHHHHH')
+_question = Struct('!HH')
+_answer = Struct('!HHHIH')
+
+# seconds an upstream server has to answer a forwarded query
+FORWARD_TIMEOUT = 5.0
+
+
+def ParseQuery(data):
+    """
+    Returns the (id, flags, name, type, end) of the question of a query,
+    with end the offset right after the question, or None if it is not a
+    query of one question.
+    """
+    if len(data) < _header.size:
+        return None
+
+    txid, flags, qdcount, ancount, nscount, arcount = _header.unpack_from(data)
+    if flags & FLAG_QR or qdcount != 1:
+        return None
+
+    labels = []
+    offset = _header.size
+    while True:
+        if offset >= len(data):
+            return None
+        length = data[offset]
+        offset += 1
+        if length == 0:
+            break
+        # queries do not compress names
+        if length > 63 or offset + length > len(data):
+            return None
+        labels.append(data[offset:offset + length].decode("ascii", "replace"))
+        offset += length
+
+    if offset + _question.size > len(data):
+        return None
+    qtype, qclass = _question.unpack_from(data, offset)
+    return txid, flags, ".".join(labels), qtype, offset + _question.size
+
+
+def Response(data, query, rcode, addresses=None, ttl=0):
+    """
+    Returns the answer to the query parsed from data, with the addresses of
+    the type of its question.
+    """
+    txid, flags, name, qtype, end = query
+
+    records = []
+    for addr in addresses or []:
+        family = socket.AF_INET6 if ":" in addr else socket.AF_INET
+        if (qtype == TYPE_A) != (family == socket.AF_INET) or qtype not in [TYPE_A, TYPE_AAAA]:
+            continue
+        rdata = socket.inet_pton(family, addr)
+        # the name is the one of the question, at offset 12
+        records.append(_answer.pack(0xc000 | _header.size, qtype, CLASS_IN, ttl, len(rdata)) + rdata)
+
+    flags = FLAG_QR | FLAG_AA | FLAG_RA | (flags & FLAG_RD) | rcode
+    return _header.pack(txid, flags, 1, len(records), 0, 0) + data[_header.size:end] + b"".join(records)
+
+
+def Names(state, zone, happy_state=None):
+    """
+    Returns the addresses of every node of a Happy state by its name in the
+    zone, in lower case, from the address index of the state.
+    """
+    if happy_state is None:
+        happy_state = State()
+
+    names = {}
+    for node_id in happy_state.getNodeIds(state):
+        names[node_id] = []
+    for addr, node_id in sorted(happy_state.getAddressIndex(state).items()):
+        if not addr.startswith("fe80:"):
+            names[node_id].append(addr)
+
+    zone = zone.strip(".")
+    return dict([(("%s.%s" % (node_id, zone)).lower(), addresses) for node_id, addresses in names.items()])
+
+
+class Index(object):
+    """
+    The names of the nodes of a Happy state file, read again once the file
+    changes.
+    """
+
+    def __init__(self, path, zone):
+        self.path = path
+        self.zone = zone.strip(".").lower()
+        self.happy_state = State()
+        self.names = {}
+        self.modified = None
+
+    def InZone(self, name):
+        name = name.strip(".").lower()
+        return name == self.zone or name.endswith("." + self.zone)
+
+    def Lookup(self, name):
+        """
+        Returns the addresses of the node called name, or None if there is
+        no such node.
+        """
+        try:
+            modified = os.stat(self.path).st_mtime
+            if modified != self.modified:
+                with open(self.path) as f:
+                    self.names = Names(json.load(f), self.zone, self.happy_state)
+                self.modified = modified
+        except (OSError, ValueError):
+            # being rewritten, the last names hold until the next query
+            pass
+
+        return self.names.get(name.strip(".").lower())
+
+
+class Stub(asyncio.DatagramProtocol):
+    """
+    Answers the queries of the zone and forwards the others.
+    """
+
+    def __init__(self, index, ttl):
+        self.index = index
+        self.ttl = ttl
+        self.transport = None
+        # (transport, address) of every upstream server
+        self.upstreams = []
+        # forwarded id: (id, client, time), oldest first
+        self.pending = collections.OrderedDict()
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, address):
+        query = ParseQuery(data)
+        if query is None:
+            return
+
+        txid, flags, name, qtype, end = query
+        if self.index.InZone(name):
+            addresses = self.index.Lookup(name)
+            rcode = RCODE_NXDOMAIN if addresses is None else RCODE_NOERROR
+            self.transport.sendto(Response(data, query, rcode, addresses, self.ttl), address)
+            return
+
+        if len(self.upstreams) == 0:
+            self.transport.sendto(Response(data, query, RCODE_SERVFAIL), address)
+            return
+
+        self.__forward(data, txid, address)
+
+    def __forward(self, data, txid, address):
+        now = time.monotonic()
+        while len(self.pending) > 0:
+            oldest = next(iter(self.pending.values()))
+            if now - oldest[2] < FORWARD_TIMEOUT:
+                break
+            self.pending.popitem(last=False)
+
+        if len(self.pending) >= 0x10000:
+            return
+
+        forwarded = random.randrange(0x10000)
+        while forwarded in self.pending:
+            forwarded = random.randrange(0x10000)
+        self.pending[forwarded] = (txid, address, now)
+
+        data = pack('!H', forwarded) + data[2:]
+        for transport, server in self.upstreams:
+            transport.sendto(data, server)
+
+    def Relay(self, data):
+        if len(data) < _header.size:
+            return
+
+        forwarded = unpack_from('!H', data)[0]
+        # the first upstream to answer wins
+        pending = self.pending.pop(forwarded, None)
+        if pending is None:
+            return
+
+        txid, address, sent = pending
+        self.transport.sendto(pack('!H', txid) + data[2:], address)
+
+
+class Upstream(asyncio.DatagramProtocol):
+    def __init__(self, stub):
+        self.stub = stub
+
+    def datagram_received(self, data, address):
+        self.stub.Relay(data)
+
+    def error_received(self, exc):
+        # e.g. an upstream server out of reach, the others may answer
+        pass
+
+
+def Serve(listen, port, state, zone, upstream, ttl):
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+
+    stub = Stub(Index(state, zone), ttl)
+    loop.run_until_complete(loop.create_datagram_endpoint(lambda: stub, local_addr=(listen, port)))
+
+    # not connected, so servers out of reach yet do not stop the stub
+    transports = {}
+    for server in upstream:
+        family = socket.AF_INET6 if ":" in server else socket.AF_INET
+        if family not in transports:
+            transports[family], protocol = loop.run_until_complete(
+                loop.create_datagram_endpoint(lambda: Upstream(stub), family=family))
+        stub.upstreams.append((transports[family], (server, 53)))
+
+    print("ready")
+    sys.stdout.flush()
+
+    try:
+        loop.run_forever()
+    finally:
+        loop.close()
+
+
+if __name__ == "__main__":
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], "hl:p:s:z:u:t:",
+                                   ["help", "listen=", "port=", "state=", "zone=", "upstream=", "ttl="])
+
+    except getopt.GetoptError as err:
+        sys.exit("%s: Failed to parse arguments." % (__file__))
+
+    for o, a in opts:
+        if o in ("-h", "--help"):
+            print("python HappyDNSStub.py --state <STATE_FILE> [--zone <ZONE>] [--upstream <DNS>,...] "
+                  "[--listen <ADDRESS>] [--port <PORT>] [--ttl <SECONDS>]")
+            sys.exit(0)
+
+        elif o in ("-l", "--listen"):
+            options["listen"] = a
+
+        elif o in ("-p", "--port"):
+            options["port"] = int(a)
+
+        elif o in ("-s", "--state"):
+            options["state"] = a
+
+        elif o in ("-z", "--zone"):
+            options["zone"] = a
+
+        elif o in ("-u", "--upstream"):
+            options["upstream"] = [server for server in a.split(",") if server]
+
+        elif o in ("-t", "--ttl"):
+            options["ttl"] = int(a)
+
+        else:
+            assert False, "unhandled option"
+
+    if options["state"] is None:
+        sys.exit("%s: Missing state file." % (__file__))
+
+    try:
+        Serve(options["listen"], options["port"], os.path.expanduser(options["state"]), options["zone"],
+              options["upstream"], options["ttl"])
+    except KeyboardInterrupt:
+        pass
+    sys.exit(0)
@@ -47,8 +47,11 @@ class HappyHost(State):
         self.ethernet_bridge_suffix = "bridge"
         self.ethernet_bridge_link = "tap"
 
+    def getNetNSPath(self, name):
+        return "/var/run/netns/%s" % (self.uniquePrefix(name))
+
     def _namespaceExists(self, name):
-        result = os.path.isfile("/var/run/netns/%s" % (self.uniquePrefix(name)))
+        result = os.path.isfile(self.getNetNSPath(name))
         msg = "Happy: namespace " + self.uniquePrefix(name)
         if result:
             msg = msg + " exists"
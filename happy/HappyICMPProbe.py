@@ -0,0 +1,353 @@
+#!/usr/bin/env python3
+
+#
+#    Copyright (c) 2021 Google LLC.
+#    All rights reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+#
+
+##
+#    @file
+#       Implements the ICMP echo prober of happy-ping: pings any number of
+#       IPv4 and IPv6 addresses at once from one socket per address family,
+#       and returns the loss and round trip times per address. Probers of
+#       several namespaces run from one loop for happy-connectivity.
+#
+#       Echo requests go out of ICMP datagram sockets, or of raw sockets
+#       where net.ipv4.ping_group_range does not allow datagram ones, as in
+#       a new network namespace. Ping creates the sockets in the namespace
+#       of the source node; started as a script, the prober pings from the
+#       namespace it runs in and prints its results as JSON:
+#
+#       python HappyICMPProbe.py --count 10 --interval 0.2 10.0.1.3 fd00:0:1:1::3
+#
+
+from __future__ import absolute_import
+from __future__ import print_function
+import errno
+import getopt
+import json
+import math
+import os
+import random
+import select
+import socket
+from struct import *
+import sys
+import time
+
+try:
+    from happy.HappyPacketProcess import CheckSumCalculation
+except ImportError:
+    # started as a script, next to HappyPacketProcess.py
+    from HappyPacketProcess import CheckSumCalculation
+
+options = {}
+options["count"] = 1
+options["interval"] = 1.0
+options["size"] = 56
+options["timeout"] = 1.0
+
+ICMP_ECHO_REPLY = 0
+ICMP_ECHO = 8
+ICMPV6_ECHO = 128
+ICMPV6_ECHO_REPLY = 129
+
+_echoHeader = Struct('!BBHHH')
+
+# room for the replies to a round of requests to many addresses
+RECEIVE_BUFFER = 4 * 1024 * 1024
+SO_RCVBUFFORCE = 33
+
+
+def OpenEchoSocket(family, create=socket.socket):
+    """
+    Returns (socket, datagram) for echo requests of family, created with
+    create(family, type, proto). An ICMP datagram socket if the group of
+    the process may open one, otherwise a raw socket, which needs root.
+    """
+    proto = socket.IPPROTO_ICMPV6 if family == socket.AF_INET6 else socket.IPPROTO_ICMP
+    try:
+        return create(family, socket.SOCK_DGRAM, proto), True
+    except OSError as e:
+        if e.errno not in [errno.EACCES, errno.EPERM, errno.EPROTONOSUPPORT]:
+            raise
+    return create(family, socket.SOCK_RAW, proto), False
+
+
+class EchoSocket(object):
+    """
+    Sends echo requests of one address family and receives the replies to
+    them. The kernel picks the identifier of a datagram socket; on a raw
+    one, which sees every ICMP packet of the namespace, replies are told
+    apart by a random identifier.
+    """
+
+    def __init__(self, family, create=socket.socket):
+        self.family = family
+        self.sock, self.datagram = OpenEchoSocket(family, create)
+        self.sock.setblocking(False)
+        try:
+            self.sock.setsockopt(socket.SOL_SOCKET, SO_RCVBUFFORCE, RECEIVE_BUFFER)
+        except OSError:
+            # capped at net.core.rmem_max without CAP_NET_ADMIN
+            self.sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, RECEIVE_BUFFER)
+        self.ident = random.randint(0, 0xffff)
+        if family == socket.AF_INET6:
+            self.request, self.reply = ICMPV6_ECHO, ICMPV6_ECHO_REPLY
+        else:
+            self.request, self.reply = ICMP_ECHO, ICMP_ECHO_REPLY
+
+    def fileno(self):
+        return self.sock.fileno()
+
+    def Send(self, addr, seq, payload):
+        packet = _echoHeader.pack(self.request, 0, 0, self.ident, seq) + payload
+        # the kernel fills in the checksum of datagram and ICMPv6 packets
+        if self.family == socket.AF_INET and not self.datagram:
+            packet = packet[:2] + pack('!H', CheckSumCalculation(packet)) + packet[4:]
+        if self.family == socket.AF_INET6:
+            self.sock.sendto(packet, (addr, 0, 0, 0))
+        else:
+            self.sock.sendto(packet, (addr, 0))
+
+    def Receive(self):
+        """
+        Yields the (source address, sequence number) of every echo reply
+        queued on the socket.
+        """
+        while True:
+            try:
+                packet, address = self.sock.recvfrom(65535)
+            except (BlockingIOError, InterruptedError):
+                return
+
+            offset = 0
+            if self.family == socket.AF_INET and not self.datagram:
+                offset = (packet[0] & 0x0f) * 4
+            if len(packet) < offset + _echoHeader.size:
+                continue
+            kind, code, checkSum, ident, seq = _echoHeader.unpack_from(packet, offset)
+            if kind != self.reply or (not self.datagram and ident != self.ident):
+                continue
+            yield address[0], seq
+
+    def Close(self):
+        self.sock.close()
+
+
+def Statistics(transmitted, rtts, error=None):
+    """
+    Returns the loss in percent and the min, avg, max and stddev of rtts,
+    in ms, as ping reports them.
+    """
+    stats = {}
+    stats["transmitted"] = transmitted
+    stats["received"] = len(rtts)
+    stats["loss"] = 100
+    if transmitted > 0:
+        stats["loss"] = int(100 * (transmitted - len(rtts)) / transmitted)
+
+    for key in ["min", "avg", "max", "stddev"]:
+        stats[key] = None
+    if len(rtts) > 0:
+        avg = sum(rtts) / len(rtts)
+        stats["min"] = min(rtts)
+        stats["avg"] = avg
+        stats["max"] = max(rtts)
+        stats["stddev"] = math.sqrt(max(0.0, sum([rtt * rtt for rtt in rtts]) / len(rtts) - avg * avg))
+
+    if error is not None:
+        stats["error"] = error
+    return stats
+
+
+class Prober(object):
+    """
+    Pings addresses from the sockets of one namespace, created with create
+    when the Prober is. Requests carry a sequence number unique over all
+    addresses, so a reply is matched without looking at its source, and
+    the replies of multicast addresses count too; only the first reply to
+    a request counts.
+    """
+
+    def __init__(self, addresses, create=socket.socket):
+        self.addresses = addresses
+        self.sockets = {}
+        self.sent = {}
+        self.seq = 0
+        self.rtts = dict([(addr, []) for addr in addresses])
+        self.transmitted = dict([(addr, 0) for addr in addresses])
+        self.errors = {}
+
+        try:
+            for addr in addresses:
+                family = socket.AF_INET6 if ":" in addr else socket.AF_INET
+                if family not in self.sockets:
+                    self.sockets[family] = EchoSocket(family, create)
+        except OSError:
+            self.Close()
+            raise
+
+    def Sockets(self):
+        return list(self.sockets.values())
+
+    def Send(self, payload):
+        """
+        Sends one request to every address.
+        """
+        for addr in self.addresses:
+            if addr in self.errors:
+                continue
+            family = socket.AF_INET6 if ":" in addr else socket.AF_INET
+            self.seq = (self.seq + 1) & 0xffff
+            try:
+                self.sockets[family].Send(addr, self.seq, payload)
+            except OSError as e:
+                self.errors[addr] = os.strerror(e.errno)
+                continue
+            self.sent[self.seq] = (addr, time.monotonic())
+            self.transmitted[addr] += 1
+
+    def Receive(self, echo):
+        received = time.monotonic()
+        for source, seq in echo.Receive():
+            if seq not in self.sent:
+                continue
+            addr, when = self.sent.pop(seq)
+            self.rtts[addr].append((received - when) * 1000.0)
+
+    def Pending(self):
+        return len(self.sent)
+
+    def Results(self):
+        """
+        Returns the Statistics of every address.
+        """
+        results = {}
+        for addr in self.addresses:
+            results[addr] = Statistics(self.transmitted[addr], self.rtts[addr], self.errors.get(addr))
+        return results
+
+    def Close(self):
+        for echo in self.sockets.values():
+            echo.Close()
+        self.sockets = {}
+
+
+def RunProbers(probers, count=1, interval=1.0, size=56, timeout=1.0):
+    """
+    Has every Prober of probers send count requests to its addresses,
+    interval seconds apart, all at the same time from one loop, and waits
+    up to timeout seconds after the last request for the replies. Replies
+    are read after each Prober sent, so a round of many probers does not
+    overflow the socket buffers.
+    """
+    if count < 1:
+        raise ValueError("count must be at least 1, not %d" % (count))
+
+    payload = (b'happy' * (size // 5 + 1))[:size]
+
+    poller = select.poll()
+    owners = {}
+    for prober in probers:
+        for echo in prober.Sockets():
+            poller.register(echo.fileno(), select.POLLIN)
+            owners[echo.fileno()] = (prober, echo)
+
+    def receive(wait):
+        for fd, event in poller.poll(wait):
+            prober, echo = owners[fd]
+            prober.Receive(echo)
+
+    rounds = 0
+    start = time.monotonic()
+    nextRound = start
+    deadline = None
+
+    while True:
+        now = time.monotonic()
+        if rounds < count and now >= nextRound:
+            for prober in probers:
+                prober.Send(payload)
+                receive(0)
+            rounds += 1
+            nextRound = start + rounds * interval
+            if rounds == count:
+                deadline = time.monotonic() + timeout
+
+        if deadline is not None and (now >= deadline or sum([prober.Pending() for prober in probers]) == 0):
+            break
+
+        wake = nextRound if rounds < count else deadline
+        receive(max(0, int((wake - time.monotonic()) * 1000)) + 1)
+
+
+def Probe(addresses, count=1, interval=1.0, size=56, timeout=1.0, create=socket.socket):
+    """
+    Pings every address of addresses count times, interval seconds apart,
+    all addresses at the same time, from sockets created with create, so
+    they can be created in another namespace. Returns the Statistics of
+    every address.
+    """
+    prober = Prober(addresses, create)
+    try:
+        RunProbers([prober], count, interval, size, timeout)
+    finally:
+        prober.Close()
+    return prober.Results()
+
+
+if __name__ == "__main__":
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], "hc:i:s:W:",
+                                   ["help", "count=", "interval=", "size=", "timeout="])
+
+    except getopt.GetoptError as err:
+        sys.exit("%s: Failed to parse arguments." % (__file__))
+
+    for o, a in opts:
+        if o in ("-h", "--help"):
+            print("python HappyICMPProbe.py [--count <COUNT>] [--interval <SECONDS>] [--size <BYTES>] "
+                  "[--timeout <SECONDS>] <ADDRESS> [<ADDRESS> ...]")
+            sys.exit(0)
+
+        elif o in ("-c", "--count"):
+            options["count"] = int(a)
+
+        elif o in ("-i", "--interval"):
+            options["interval"] = float(a)
+
+        elif o in ("-s", "--size"):
+            options["size"] = int(a)
+
+        elif o in ("-W", "--timeout"):
+            options["timeout"] = float(a)
+
+        else:
+            assert False, "unhandled option"
+
+    if len(args) == 0:
+        sys.exit("%s: Missing addresses to ping." % (__file__))
+
+    if options["count"] < 1:
+        sys.exit("%s: Need to send at least one ping." % (__file__))
+
+    try:
+        results = Probe(args, options["count"], options["interval"], options["size"], options["timeout"])
+    except OSError as e:
+        sys.exit("%s: %s" % (__file__, str(e)))
+
+    json.dump(results, sys.stdout)
+    print()
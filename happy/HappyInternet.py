@@ -26,14 +26,16 @@
 
 from __future__ import absolute_import
 import os
+import socket
 import sys
 import time
+from struct import *
 
 from happy.ReturnMsg import ReturnMsg
 from happy.Utils import *
+from happy.HappyIptables import MasqueradeRules
 from happy.HappyNode import HappyNode
 from happy.HappyNodeRoute import HappyNodeRoute
-from six.moves import range
 
 options = {}
 options["quiet"] = False
@@ -43,19 +45,44 @@ options["add"] = False
 options["delete"] = False
 options["isp"] = None
 options["seed"] = None
+options["mask"] = 24
+
+# the host end of the ISP link takes the first address of the pool, the
+# nodes the following ones
+ISP_HOST_INDEX = 1
+MIN_ISP_MASK = 16
+MAX_ISP_MASK = 30
 
 
 def option():
     return options.copy()
 
 
+def IspPool(seed, mask):
+    """
+    Returns an empty pool of the addresses of 172.16.<seed>.0/mask.
+    """
+    mask = int(mask)
+    network = (172 << 24 | 16 << 16 | int(seed) << 8) & ((0xffffffff << (32 - mask)) & 0xffffffff)
+    return {"network": socket.inet_ntoa(pack('>I', network)), "mask": mask, "size": 2 ** (32 - mask),
+            "next": ISP_HOST_INDEX + 1, "free": [], "used": 0}
+
+
+def IspAddress(pool, index):
+    """
+    Returns the address at index in the prefix of pool.
+    """
+    network = unpack('>I', socket.inet_aton(pool["network"]))[0]
+    return socket.inet_ntoa(pack('>I', network + int(index)))
+
+
 class HappyInternet(HappyNodeRoute):
     """
     Connects a virtual node to the internet through a virtual ISP.
 
     happy-internet [-h --help] [-q --quiet] [-a --add] [-d --delete]
                    [-n --node <NODE_NAME>] [-f --interface <IFACE>] [-s --isp <ISP>]
-                   [-e --seed <SEED>]
+                   [-e --seed <SEED>] [-m --mask <MASK>]
 
         -d --delete     Disconnect the topology from the internet. Use the same
                         configuration (interface, isp, seed) as when it was connected.
@@ -63,6 +90,10 @@ class HappyInternet(HappyNodeRoute):
         -s --isp        User-defined string to be used for the ISP name.
         -e --seed       Seed value used in the host IP prefix of 172.16.<seed>.1
                         Range: 1-252
+        -m --mask       Optional. Length of the prefix of the virtual ISP, 24 by
+                        default. Range: 16-30. A shorter prefix connects more than
+                        253 nodes, e.g. 20 connects up to 4093 nodes on 172.16.240.0/20
+                        with seed 249.
 
     Examples:
     $ happy-internet --node onhub --interface eth0 --isp eth --seed 249
@@ -86,9 +117,8 @@ class HappyInternet(HappyNodeRoute):
         self.iface = opts["iface"]
         self.isp_id = opts["isp"]
         self.seed = int(opts["seed"])
-        self.prefix = '172.16.' + opts["seed"] + '.'
-        self.mask = "24"
-        self.host_addr = self.prefix + "1"
+        self.mask = opts["mask"]
+        self.host_addr = None
         self.isp_internet_id = self.isp_id + "1"
         self.bridge = self.isp_id + 'Bridge'
         self.isp_pool = None
@@ -100,6 +130,11 @@ class HappyInternet(HappyNodeRoute):
             self.logger.error("HappyInternet: %s" % emsg)
             sys.exit(1)
 
+        if not (MIN_ISP_MASK <= int(self.mask) <= MAX_ISP_MASK):
+            emsg = "mask %s is not in range[%d, %d]" % (self.mask, MIN_ISP_MASK, MAX_ISP_MASK)
+            self.logger.error("HappyInternet: %s" % emsg)
+            sys.exit(1)
+
         if not self.delete:
             self.add = True
 
@@ -168,26 +203,30 @@ class HappyInternet(HappyNodeRoute):
 
     def __initialize_isp_pool(self):
         # initialize isp pool
-        isp_seed = list(range(1, 256))
-        self.isp_pool = [{"isp_addr": self.prefix + str(i),
-                          "isp_index": str(i),
-                          "occupy": False,
-                          "isp_host_end": self.isp_id + str(i) + "_host",
-                          "isp_node_end": self.isp_id + str(i) + "_node"} for i in isp_seed]
+        self.isp_pool = IspPool(self.seed, self.mask)
         self.setGlobalIsp(self.isp_pool)
 
+    def __use_isp_pool(self):
+        # nodes joining an existing isp get its prefix
+        self.mask = str(self.isp_pool["mask"])
+        self.host_addr = IspAddress(self.isp_pool, ISP_HOST_INDEX)
+
     def __get_isp_from_pool(self):
         # get isp from pool
-        index = self.getIspAvailableIndex()
-        self.isp_host_end = self.getIspHostLinkId(index=index)
-        self.isp_node_end = self.getIspNodeLinkId(index=index)
-        self.isp_addr = self.getIspAddr(index=index)
-        self.isp_index = self.getIspIndex(index=index)
-        self.setIspOccupancy(index=index, value=True)
+        index = self.allocateIspIndex()
+        if index is None:
+            emsg = "no address left in virtual ISP %s/%s." % (self.isp_pool["network"], self.mask)
+            self.logger.error("[%s] HappyInternet: %s" % (self.node_id, emsg))
+            self.exit()
+
+        self.isp_host_end = self.isp_id + str(index) + "_host"
+        self.isp_node_end = self.isp_id + str(index) + "_node"
+        self.isp_addr = IspAddress(self.isp_pool, index)
+        self.isp_index = str(index)
 
     def __release_isp_to_pool(self):
         # release isp to pool
-        self.setIspOccupancy(index=int(self.isp_index) - 1, value=False)
+        self.releaseIspIndex(index=self.isp_index)
 
     def __create_isp_internet_link(self):
         # init machine's isp internet link
@@ -233,7 +272,6 @@ class HappyInternet(HappyNodeRoute):
         cmd = "ip netns exec %s brctl addif %s " % (self.bridge, self.bridge) + self.internet_host_end
         cmd = self.runAsRoot(cmd)
         ret = self.CallAtHost(cmd)
-        self.setIspOccupancy(index=0, value=True)
 
     def __connect_node_to_isp(self):
         # link node's internet link to happy_isp
@@ -320,6 +358,8 @@ class HappyInternet(HappyNodeRoute):
             isp_dic["isp_index"] = self.isp_index
             isp_dic["isp"] = self.isp_id
             isp_dic["iface"] = self.iface
+            isp_dic["seed"] = self.seed
+            isp_dic["mask"] = self.mask
             internet[self.isp_id] = isp_dic
             self.setGlobalInternet(internet)
         else:
@@ -389,36 +429,34 @@ class HappyInternet(HappyNodeRoute):
         if self.delete:
             return
 
-        # Post routing on host
+        # Post routing on host, kept with the isp to be deleted with it
+        rules = MasqueradeRules(self.iface, [self.internet_node_end])
+        err = self.iptablesRestore(rules)
+        if err is not None:
+            emsg = "Failed to configure NAT on the host: %s" % (err)
+            self.logger.warning("[localhost] HappyInternet: %s" % (emsg))
+            return
 
-        cmd = "iptables -t nat -A POSTROUTING -o " + self.iface + " -j MASQUERADE"
-        cmd = self.runAsRoot(cmd)
-        ret = self.CallAtHost(cmd)
+        self.isp_pool["iptables"] = rules
 
-        cmd = "iptables -A FORWARD -i " + self.iface + " -o " + self.internet_node_end + \
-              " -m state --state RELATED,ESTABLISHED -j ACCEPT"
-        cmd = self.runAsRoot(cmd)
-        ret = self.CallAtHost(cmd)
+    def __delete_nat_host(self):
+        rules = self.isp_pool.get("iptables", [])
+        if len(rules) == 0:
+            return
 
-        cmd = "iptables -A FORWARD -i " + self.internet_node_end + " -o " + self.iface + " -j ACCEPT"
-        cmd = self.runAsRoot(cmd)
-        ret = self.CallAtHost(cmd)
+        err = self.iptablesRestore(rules, delete=True)
+        if err is not None:
+            emsg = "Failed to delete NAT on the host: %s" % (err)
+            self.logger.warning("[localhost] HappyInternet: %s" % (emsg))
 
     def __nat_isp_node(self):
         # configure nat on node
         # Post routing on node
-
-        cmd = "iptables -t nat -A POSTROUTING -o " + self.isp_node_end + " -j MASQUERADE"
-        cmd = self.runAsRoot(cmd)
-        ret = self.CallAtNode(self.node_id, cmd)
-
-        cmd = "iptables -A FORWARD -o " + self.isp_node_end + " -m state --state RELATED,ESTABLISHED -j ACCEPT"
-        cmd = self.runAsRoot(cmd)
-        ret = self.CallAtNode(self.node_id, cmd)
-
-        cmd = "iptables -A FORWARD -i " + self.isp_node_end + " -j ACCEPT"
-        cmd = self.runAsRoot(cmd)
-        ret = self.CallAtNode(self.node_id, cmd)
+        rules = MasqueradeRules(self.isp_node_end)
+        if self.add:
+            self.addNodeIptablesRules(rules, self.node_id)
+        else:
+            self.removeNodeIptablesRules(rules, self.node_id)
 
     def __delete_isp(self):
         # delete isp network namespace
@@ -437,6 +475,7 @@ class HappyInternet(HappyNodeRoute):
                 self.isp_pool = self.getIsp()
                 if not bool(self.isp_pool):
                     self.__initialize_isp_pool()
+                    self.__use_isp_pool()
                     self.__create_isp_internet_link()
                     self.__create_isp()
                     self.__connect_internet_to_isp()
@@ -444,23 +483,27 @@ class HappyInternet(HappyNodeRoute):
                     self.__nmconf()
                     self.__assign_isp_internet_address()
                     self.__nat_host()
+                else:
+                    self.__use_isp_pool()
                 self.__get_isp_from_pool()
                 self.writeIspState()
             self.__create_isp_link()
             self.__connect_node_to_isp()
             self.__assign_isp_address()
             self.__ctrl_isp_node_interface()
-            with self.getStateLockManager(lock_id="rt"):
-                self.__route()
-            self.__nat_isp_node()
-
+            # the numbers of the tables and the iptables rules are kept in
+            # the state
             with self.getStateLockManager():
+                self.readState()
+                self.__route()
+                self.__nat_isp_node()
                 self.__internet_state()
                 self.writeState()
 
         if self.delete:
             with self.getStateLockManager():
                 self.__route()
+                self.__nat_isp_node()
                 self.__internet_state()
                 self.writeState()
 
@@ -468,8 +511,10 @@ class HappyInternet(HappyNodeRoute):
             with self.getStateLockManager(lock_id="isp"):
                 self.readIspState()
 
+                self.isp_pool = self.getIsp()
                 self.__release_isp_to_pool()
-                if len(self.getIspAvailable()) == 254:
+                if self.getIspUsed() == 0:
+                    self.__delete_nat_host()
                     self.__ctrl_isp_internet_interface()
                     self.__delete_isp_internet_link()
                     self.__delete_isp()
@@ -0,0 +1,76 @@
+#!/usr/bin/env python3
+
+#
+#    Copyright (c) 2021 Google LLC.
+#    All rights reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+#
+
+##
+#    @file
+#       Implements the iptables rulesets Happy applies to virtual nodes and
+#       to the host with iptables-restore --noflush, every table of a
+#       ruleset in one transaction.
+#
+#       A rule is a [table, rule] pair such as:
+#
+#       ["nat", "POSTROUTING -o wlan0 -j MASQUERADE"]
+#
+#       with the rule written as iptables takes it after -A or -D.
+#
+
+from __future__ import absolute_import
+
+# the order in which iptables-restore gets the tables
+TABLES = ["raw", "mangle", "nat", "filter"]
+
+
+def MasqueradeRules(interface, inside=None):
+    """
+    Returns the rules that masquerade the traffic leaving interface, and
+    forward the traffic from each interface of inside to it and the
+    replies back, or the traffic from and to any interface where inside
+    is None.
+    """
+    rules = [["nat", "POSTROUTING -o %s -j MASQUERADE" % (interface)]]
+
+    if inside is None:
+        rules.append(["filter", "FORWARD -i %s -m state --state RELATED,ESTABLISHED -j ACCEPT" % (interface)])
+        rules.append(["filter", "FORWARD -o %s -j ACCEPT" % (interface)])
+        return rules
+
+    for other in inside:
+        if other == interface:
+            continue
+        rules.append(["filter", "FORWARD -i %s -o %s -m state --state RELATED,ESTABLISHED -j ACCEPT" %
+                      (interface, other)])
+        rules.append(["filter", "FORWARD -i %s -o %s -j ACCEPT" % (other, interface)])
+    return rules
+
+
+def RestoreInput(rules, delete=False):
+    """
+    Returns the input of iptables-restore --noflush that appends the rules,
+    or deletes them.
+    """
+    action = "-D" if delete else "-A"
+    lines = []
+    for table in TABLES + sorted(set([t for t, rule in rules if t not in TABLES])):
+        table_rules = [rule for t, rule in rules if t == table]
+        if len(table_rules) == 0:
+            continue
+        lines.append("*%s" % (table))
+        lines += ["%s %s" % (action, rule) for rule in table_rules]
+        lines.append("COMMIT")
+    return "\n".join(lines) + "\n"
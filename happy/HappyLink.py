@@ -142,9 +142,11 @@ class HappyLink(HappyHost):
         cmd = self.runAsRoot(cmd)
         r = self.CallAtNode(node_id, cmd)
 
-        cmd = "ifconfig " + link_network_end + " up"
-        cmd = self.runAsRoot(cmd)
-        r = self.CallAtNetwork(network_id, cmd)
+        # the far end of a point-to-point link is another node's interface
+        if self.getLinkPeer(link_id) is None:
+            cmd = "ifconfig " + link_network_end + " up"
+            cmd = self.runAsRoot(cmd)
+            r = self.CallAtNetwork(network_id, cmd)
 
         # We have disabled DAD, but under high load we can still see the
         # address in "tentative" for a few milliseconds.
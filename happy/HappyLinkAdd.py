@@ -38,6 +38,7 @@ options = {}
 options["quiet"] = False
 options["type"] = None
 options["tap"] = False
+options["peer"] = None
 
 
 def option():
@@ -75,6 +76,7 @@ class HappyLinkAdd(HappyLink):
         self.quiet = opts["quiet"]
         self.type = opts["type"]
         self.tap = opts["tap"]
+        self.peer = opts["peer"]
 
         self.link_number = None
         self.link_id = None
@@ -239,6 +241,7 @@ class HappyLinkAdd(HappyLink):
         new_link["node_end"] = self.link_node_end
         new_link["network_end"] = self.link_network_end
         new_link["tap"] = self.tap
+        new_link["peer"] = self.peer
 
         self.setLink(self.link_id, new_link)
 
@@ -255,11 +258,14 @@ class HappyLinkAdd(HappyLink):
 
             self.__check_if_link_exists()
 
-            self.__create_link()
+            # the link of the second member of a point-to-point network is
+            # the far end of the link of the first one, nothing to create
+            if self.peer is None:
+                self.__create_link()
 
-            self.__turn_down_link_ends()
+                self.__turn_down_link_ends()
 
-            self.__post_check()
+                self.__post_check()
 
             self.__add_new_link_state()
 
@@ -74,12 +74,45 @@ class HappyLinkDelete(HappyLink):
             self.logger.error("[%s] HappyLinkDelete: %s" % (self.link_id, emsg))
             self.exit()
 
-        if not self._linkExists():
+        # a point-to-point link joined to its peer has no ends of its own
+        if not self._linkExists() and self.getLinkPeer(self.link_id) is None:
             emsg = "virtual link %s does not exist." % (self.link_id)
             self.logger.warning("[%s] HappyLinkDelete: %s" % (self.link_id, emsg))
             self.done = True
 
+    def __park_link(self):
+        """
+        The interface of a member leaving a point-to-point network is the
+        far end of the link of the other member, which keeps it: it waits
+        in the network namespace, in place of the network end, for the next
+        member.
+        """
+        network_id = self.getLinkNetwork(self.link_id)
+        node_id = self.getLinkNode(self.link_id)
+        peer = self.getLinkPeer(self.link_id)
+        interface_id = self.getNodeInterfaceFromLink(self.link_id, node_id)
+        network_end = self.getLinkNetworkEnd(peer)
+
+        cmd = "ip link set " + interface_id + " netns " + self.uniquePrefix(network_id)
+        cmd = self.runAsRoot(cmd)
+        ret = self.CallAtNode(node_id, cmd)
+
+        cmd = "ip link set " + interface_id + " name " + network_end
+        cmd = self.runAsRoot(cmd)
+        ret = self.CallAtNetwork(network_id, cmd)
+
+        cmd = "ip link set " + network_end + " up"
+        cmd = self.runAsRoot(cmd)
+        ret = self.CallAtNetwork(network_id, cmd)
+
+        self.setLinkPeer(peer, None)
+
+        return ret
+
     def __delete_link(self):
+        if self.getLinkPeer(self.link_id) is not None:
+            return self.__park_link()
+
         if self.link_id in self.getLinkIds():
             network_id = self.getLinkNetwork(self.link_id)
             node_id = self.getLinkNode(self.link_id)
@@ -0,0 +1,286 @@
+#!/usr/bin/env python3
+
+#
+#    Copyright (c) 2021 Google LLC.
+#    All rights reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+#
+
+##
+#    @file
+#       Implements HappyLinkShape class that limits the bandwidth and adds
+#       latency and loss to virtual links.
+#
+#       A link is shaped by the egress qdiscs of both of its ends, so every
+#       direction gets the whole profile: a tbf for the rate, and a netem
+#       beneath it for the delay, jitter and loss.
+#
+
+from __future__ import absolute_import
+import re
+
+from happy.ReturnMsg import ReturnMsg
+from happy.Utils import *
+from happy.HappyLink import HappyLink
+from happy.HappyNetwork import HappyNetwork
+from happy.HappyNode import HappyNode
+
+options = {}
+options["quiet"] = False
+options["link_id"] = None
+options["network_id"] = None
+options["profile"] = None
+options["rate"] = None
+options["delay"] = None
+options["jitter"] = None
+options["loss"] = None
+options["clear"] = False
+
+# one way, in every direction: rate in tc units, delay and jitter in ms,
+# loss in %
+profiles = {}
+profiles["thread"] = {"rate": "250kbit", "delay": 10, "jitter": 5, "loss": 1}
+profiles["wifi"] = {"rate": "100mbit", "delay": 2, "jitter": 1, "loss": 0.1}
+profiles["cellular"] = {"rate": "20mbit", "delay": 30, "jitter": 10, "loss": 0.5}
+profiles["wan"] = {"rate": "100mbit", "delay": 5, "jitter": 0, "loss": 0}
+profiles["none"] = {}
+
+# how long a full tbf queue takes to drain
+QUEUE_LATENCY_MS = 200
+
+_rate_units = {"bit": 1, "kbit": 1000, "mbit": 1000 ** 2, "gbit": 1000 ** 3}
+
+
+def option():
+    return options.copy()
+
+
+def RateBits(rate):
+    """
+    Returns the bits per second of a rate, a number or a tc rate such as
+    250kbit.
+    """
+    if isinstance(rate, (int, float)):
+        return int(rate)
+
+    match = re.match(r"^([0-9.]+)\s*([a-z]*)$", str(rate).lower())
+    if match is None or match.group(2) not in list(_rate_units.keys()) + [""]:
+        raise ValueError("invalid rate %s, expected e.g. 250kbit" % (rate))
+    return int(float(match.group(1)) * _rate_units.get(match.group(2), 1))
+
+
+def Resolve(profile=None, rate=None, delay=None, jitter=None, loss=None, base=None):
+    """
+    Returns the shape of a profile, a name of profiles or a shape itself,
+    or of base without one, with the given parameters overriding its own.
+    """
+    if profile is None:
+        shape = dict(base or {})
+    elif isinstance(profile, dict):
+        shape = dict(profile)
+    elif profile in profiles:
+        shape = dict(profiles[profile])
+    else:
+        raise ValueError("unknown link profile %s, expected one of %s" %
+                         (profile, ", ".join(sorted(profiles.keys()))))
+
+    for key, value in [("rate", rate), ("delay", delay), ("jitter", jitter), ("loss", loss)]:
+        if value is not None:
+            shape[key] = value
+
+    if shape.get("rate") is not None:
+        RateBits(shape["rate"])
+    for key in ["delay", "jitter", "loss"]:
+        if shape.get(key) is not None:
+            shape[key] = float(shape[key])
+
+    # nothing left to shape
+    if shape.get("rate") is None and not any([shape.get(key) for key in ["delay", "jitter", "loss"]]):
+        return {}
+    return shape
+
+
+def ShapeCommands(interface, shape):
+    """
+    Returns the tc commands that shape the egress of an interface, after
+    the existing root qdisc is deleted.
+    """
+    netem = []
+    if shape.get("delay") or shape.get("jitter"):
+        netem.append("delay %gms" % (shape.get("delay") or 0))
+        if shape.get("jitter"):
+            netem.append("%gms" % (shape["jitter"]))
+    if shape.get("loss"):
+        netem.append("loss %g%%" % (shape["loss"]))
+
+    cmds = []
+    if shape.get("rate") is not None:
+        bits = RateBits(shape["rate"])
+        # a tick worth of bytes, and at least a full frame
+        burst = max(1600, bits // 8 // 100)
+        cmds.append("tc qdisc add dev %s root handle 1: tbf rate %dbit burst %d latency %dms" %
+                    (interface, bits, burst, QUEUE_LATENCY_MS))
+        if len(netem) > 0:
+            cmds.append("tc qdisc add dev %s parent 1:1 handle 10: netem %s" % (interface, " ".join(netem)))
+
+    elif len(netem) > 0:
+        cmds.append("tc qdisc add dev %s root handle 1: netem %s" % (interface, " ".join(netem)))
+
+    return cmds
+
+
+class HappyLinkShape(HappyLink, HappyNode, HappyNetwork):
+    """
+    Limits the rate and adds delay, jitter and loss to a virtual link, or to
+    every link of a virtual network, in both directions. The links a network
+    gets later are shaped alike. Parameters given with a profile override
+    those of the profile; given alone, those of the current shape.
+
+    happy-link-shape [-h --help] [-q --quiet] [-l --link <LINK_NAME>]
+                     [-n --network <NETWORK_NAME>] [-p --profile <PROFILE>]
+                     [--rate <RATE>] [--delay <MS>] [--jitter <MS>]
+                     [--loss <PERCENT>] [-c --clear]
+
+        -l --link       Link to shape. Find using happy-link-list or
+                        happy-state.
+        -n --network    Network whose links to shape. Find using
+                        happy-network-list or happy-state.
+        -p --profile    Optional. thread, wifi, cellular, wan or none.
+           --rate       Optional. Rate limit, e.g. 250kbit.
+           --delay      Optional. One way delay in milliseconds.
+           --jitter     Optional. Jitter of the delay in milliseconds.
+           --loss       Optional. Loss in percent.
+        -c --clear      Optional. Removes the shaping.
+
+    Examples:
+    $ happy-link-shape --network HomeThread --profile thread
+        Shapes every link of the HomeThread network as a Thread radio.
+
+    $ happy-link-shape --link wifi0 --loss 5
+        Raises the loss of link wifi0 to 5%, keeping its rate and delay.
+
+    return:
+        0    success
+        1    fail
+    """
+
+    def __init__(self, opts=options):
+        HappyNetwork.__init__(self)
+        HappyNode.__init__(self)
+        HappyLink.__init__(self)
+
+        self.quiet = opts["quiet"]
+        self.link_id = opts["link_id"]
+        self.network_id = opts["network_id"]
+        self.profile = opts["profile"]
+        self.rate = opts["rate"]
+        self.delay = opts["delay"]
+        self.jitter = opts["jitter"]
+        self.loss = opts["loss"]
+        self.clear = opts["clear"]
+
+    def __pre_check(self):
+        if not self.link_id and not self.network_id:
+            emsg = "Missing name of the virtual link or network to shape."
+            self.logger.error("[localhost] HappyLinkShape: %s" % (emsg))
+            self.exit()
+
+        if self.link_id and self.link_id not in self.getLinkIds():
+            emsg = "virtual link %s does not exist." % (self.link_id)
+            self.logger.error("[%s] HappyLinkShape: %s" % (self.link_id, emsg))
+            self.exit()
+
+        if self.network_id and not self._networkExists():
+            emsg = "virtual network %s does not exist." % (self.network_id)
+            self.logger.error("[%s] HappyLinkShape: %s" % (self.network_id, emsg))
+            self.exit()
+
+        if self.clear:
+            self.shape = {}
+            return
+
+        if self.profile is None and all([value is None for value in
+                                         [self.rate, self.delay, self.jitter, self.loss]]):
+            emsg = "Missing profile or shaping parameters."
+            self.logger.error("[localhost] HappyLinkShape: %s" % (emsg))
+            self.exit()
+
+        if self.network_id:
+            base = self.getNetworkShape(self.network_id)
+        else:
+            base = self.getLinkShape(self.link_id)
+
+        try:
+            self.shape = Resolve(self.profile, self.rate, self.delay, self.jitter, self.loss, base)
+        except ValueError as e:
+            self.logger.error("[localhost] HappyLinkShape: %s" % (str(e)))
+            self.exit()
+
+    def __get_links(self):
+        if self.network_id:
+            return self.getNetworkLinkIds(self.network_id)
+        return [self.link_id]
+
+    def __shape_link(self, link_id):
+        node_id = self.getLinkNode(link_id)
+        network_id = self.getLinkNetwork(link_id)
+        if node_id is None or network_id is None:
+            # shaped once it joins a network
+            return
+
+        ends = [(node_id, self.getNodeInterfaceFromLink(link_id, node_id))]
+        # the far end of a point-to-point link is shaped with the link of
+        # the other member
+        if self.getLinkPeer(link_id) is None:
+            ends.append((network_id, self.getLinkNetworkEnd(link_id)))
+
+        for namespace_id, interface in ends:
+            # there is no root qdisc yet on a link never shaped
+            cmd = self.runAsRoot("tc qdisc del dev %s root" % (interface))
+            self.CallAtNode(namespace_id, cmd, quiet=True)
+
+            for cmd in ShapeCommands(interface, self.shape):
+                out, err = self.CallAtNodeForOutput(namespace_id, self.runAsRoot(cmd))
+                if err:
+                    # e.g. a kernel without netem
+                    emsg = "Failed to shape %s with '%s': %s" % (interface, cmd, err.strip())
+                    self.logger.error("[%s] HappyLinkShape: %s" % (link_id, emsg))
+                    self.exit()
+
+    def __update_state(self):
+        if self.network_id:
+            if self.shape:
+                self.setNetworkShape(self.network_id, self.shape)
+            else:
+                self.removeNetworkShape(self.network_id)
+
+        for link_id in self.__get_links():
+            if self.shape:
+                self.setLinkShape(link_id, self.shape)
+            else:
+                self.removeLinkShape(link_id)
+
+    def run(self):
+        with self.getStateLockManager():
+
+            self.__pre_check()
+
+            for link_id in self.__get_links():
+                self.__shape_link(link_id)
+
+            self.__update_state()
+
+            self.writeState()
+
+        return ReturnMsg(0, self.shape)
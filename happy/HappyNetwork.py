@@ -46,6 +46,9 @@ class HappyNetwork(HappyHost):
             network_id = self.network_id
 
         if self._namespaceExists(network_id):
+            # a point-to-point network has no bridge
+            if self.getNetworkMode(network_id) == "p2p":
+                return True
             return self.uniquePrefix(network_id) in self._getNetworkBridges(network_id)
 
         return False
@@ -22,7 +22,8 @@
 #       Implements HappyNetworkAdd class that creates virtual networks.
 #
 #       A virtual network is logical representation of a virtual ethernet
-#       bridge that acts like a hub.
+#       bridge that acts like a hub, or like a learning switch, or of a
+#       single veth pair between its two members.
 #
 
 from __future__ import absolute_import
@@ -41,6 +42,9 @@ options = {}
 options["quiet"] = False
 options["network_id"] = None
 options["type"] = None
+options["mode"] = "hub"
+
+modes = ["hub", "bridge", "p2p"]
 
 
 def option():
@@ -53,15 +57,24 @@ class HappyNetworkAdd(HappyNetwork):
 
     happy-network-add [-h --help] [-q --quiet] [-i --id <NETWORK_NAME>]
                       [-t --type (cellular|out-of-band|thread|wan|wifi)]
+                      [-m --mode (hub|bridge|p2p)]
 
         -i --id     Required. Name of the network to create. Find using
                     happy-network-list or happy-state.
         -t --type   Required. Type of network to create.
+        -m --mode   Optional. hub (default) floods every frame to every
+                    member, so any member sees all the traffic; bridge
+                    learns where the members are and forwards a frame to
+                    its destination only; p2p joins its two members with
+                    a single veth pair and no bridge at all.
 
     Example:
     $ happy-network-add HomeThread thread
         Creates a Thread network called HomeThread
 
+    $ happy-network-add --mode bridge HomeWiFi wifi
+        Creates a Wi-Fi network called HomeWiFi that forwards like a switch.
+
     return:
         0    success
         1    fail
@@ -73,6 +86,7 @@ class HappyNetworkAdd(HappyNetwork):
         self.quiet = opts["quiet"]
         self.network_id = opts["network_id"]
         self.type = opts["type"]
+        self.mode = opts["mode"]
 
     def __deleteExistingNetwork(self):
         options = happy.HappyNetworkDelete.option()
@@ -110,6 +124,11 @@ class HappyNetworkAdd(HappyNetwork):
 
         self.type = self.type.lower()
 
+        if self.mode not in modes:
+            emsg = "Invalid virtual network mode: %s, expected one of %s." % (self.mode, ", ".join(modes))
+            self.logger.error("[%s] HappyNetworkAdd: %s" % (self.network_id, emsg))
+            self.exit()
+
         # Check if bridge name won't be too long
         if len(self.uniquePrefix(self.network_id)) > 15:
             emsg = "network name or state ID too long (%s, %s)." % (self.network_id, self.getStateId())
@@ -128,6 +147,10 @@ class HappyNetworkAdd(HappyNetwork):
         cmd = self.runAsRoot(cmd)
         ret = self.CallAtHost(cmd)
 
+        # the members of a point-to-point network are joined directly
+        if self.mode == "p2p":
+            return
+
         cmd = "brctl addbr " + self.uniquePrefix(self.network_id)
         cmd = self.runAsRoot(cmd)
         ret = self.CallAtNetwork(self.network_id, cmd)
@@ -139,6 +162,9 @@ class HappyNetworkAdd(HappyNetwork):
             self.exit()
 
     def __setup_hub(self):
+        if self.mode != "hub":
+            return
+
         cmd = "brctl setageing " + self.uniquePrefix(self.network_id) + " 0"
         cmd = self.runAsRoot(cmd)
         r = self.CallAtNetwork(self.network_id, cmd)
@@ -150,6 +176,7 @@ class HappyNetworkAdd(HappyNetwork):
         new_network["state"] = "DOWN"
         new_network["prefix"] = {}
         new_network["gateway"] = None
+        new_network["mode"] = self.mode
 
         self.setNetwork(self.network_id, new_network)
 
@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+
+#
+#    Copyright (c) 2021 Google LLC.
+#    All rights reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+#
+
+##
+#    @file
+#       Implements HappyNetworkBenchmark class that measures how much CPU
+#       a virtual network spends forwarding the traffic of two of its
+#       members in each network mode.
+#
+
+from __future__ import absolute_import
+from __future__ import print_function
+import json
+import os
+import subprocess
+import sys
+
+from happy.ReturnMsg import ReturnMsg
+from happy.Utils import *
+from happy.utils.IP import IP
+from happy.HappyNetwork import HappyNetwork
+from happy.HappyNode import HappyNode
+from happy.HappyProcess import HappyProcess
+import happy.HappyNetworkAdd
+import happy.HappyNetworkAddress
+import happy.HappyNetworkDelete
+import happy.HappyNodeAdd
+import happy.HappyNodeDelete
+import happy.HappyNodeJoin
+import happy.HappyPerfProbe
+
+options = {}
+options["quiet"] = False
+options["modes"] = None
+options["members"] = 16
+options["duration"] = 3.0
+options["protocol"] = "tcp"
+options["keep"] = False
+options["output"] = None
+
+network_id = "NetBench"
+network_type = "wifi"
+node_prefix = "NetBench"
+prefix = "10.0.251.0/24"
+port = 11096
+
+
+def option():
+    return options.copy()
+
+
+def CpuSeconds():
+    """
+    Returns the CPU time the host spent out of idle, in seconds, over all
+    its CPUs.
+    """
+    with open("/proc/stat") as f:
+        fields = [int(field) for field in f.readline().split()[1:]]
+    # idle and iowait
+    busy = sum(fields) - fields[3] - fields[4]
+    return busy / float(os.sysconf("SC_CLK_TCK"))
+
+
+class HappyNetworkBenchmark(HappyNetwork, HappyNode, HappyProcess):
+    """
+    Measures the forwarding cost of each network mode: creates the NetBench
+    network with a number of members, sends bulk traffic from the first
+    member to the second one and reports the throughput and the CPU time
+    the host spent per GB. Every other member gets a copy of every frame
+    on a hub, none on a learning bridge; a p2p network has two members and
+    no bridge.
+
+    happy-network-benchmark [-h --help] [-q --quiet] [-m --modes <MODE>,...]
+                            [-n --members <MEMBERS>] [-d --duration <SECONDS>]
+                            [-P --protocol tcp|udp] [-k --keep] [-o --output <FILE>]
+
+        -m --modes      Optional. Comma separated network modes to measure,
+                        hub,bridge,p2p by default.
+        -n --members    Optional. Members of the hub and bridge networks,
+                        16 by default.
+        -d --duration   Optional. Seconds of traffic in each mode, 3 by
+                        default.
+        -P --protocol   Optional. tcp (default) or udp.
+        -k --keep       Optional. Keep the NetBench nodes for the next run.
+        -o --output     Optional. File to write the results to as JSON.
+
+    Example:
+    $ happy-network-benchmark --members 100 --modes hub,bridge
+        Compares the CPU a 100 member hub and learning bridge spend on the
+        traffic of two of their members.
+
+    return:
+        0    success
+        1    fail
+    """
+
+    def __init__(self, opts=options):
+        HappyNetwork.__init__(self)
+        HappyNode.__init__(self)
+        HappyProcess.__init__(self)
+
+        self.quiet = opts["quiet"]
+        self.modes = opts["modes"]
+        self.members = opts["members"]
+        self.duration = opts["duration"]
+        self.protocol = opts["protocol"]
+        self.keep = opts["keep"]
+        self.output = opts["output"]
+
+    def __pre_check(self):
+        if self.modes is None:
+            self.modes = happy.HappyNetworkAdd.modes
+        elif isinstance(self.modes, str):
+            self.modes = [mode for mode in self.modes.split(",") if mode]
+
+        for mode in self.modes:
+            if mode not in happy.HappyNetworkAdd.modes:
+                emsg = "Invalid network mode %s, expected one of %s." % \
+                    (mode, ", ".join(happy.HappyNetworkAdd.modes))
+                self.logger.error("[localhost] HappyNetworkBenchmark: %s" % (emsg))
+                self.exit()
+
+        self.members = int(self.members)
+        if self.members < 2:
+            emsg = "a network needs at least 2 members."
+            self.logger.error("[localhost] HappyNetworkBenchmark: %s" % (emsg))
+            self.exit()
+
+        if self.protocol not in ["tcp", "udp"]:
+            emsg = "Unknown protocol %s, expected tcp or udp." % (self.protocol)
+            self.logger.error("[localhost] HappyNetworkBenchmark: %s" % (emsg))
+            self.exit()
+
+    def __node_ids(self, members):
+        return ["%s%02d" % (node_prefix, i) for i in range(members)]
+
+    def __setup(self, mode, members):
+        for node_id in self.__node_ids(members):
+            if not self._nodeExists(node_id):
+                options = happy.HappyNodeAdd.option()
+                options["quiet"] = True
+                options["node_id"] = node_id
+                happy.HappyNodeAdd.HappyNodeAdd(options).run()
+                self.readState()
+
+        options = happy.HappyNetworkAdd.option()
+        options["quiet"] = True
+        options["network_id"] = network_id
+        options["type"] = network_type
+        options["mode"] = mode
+        happy.HappyNetworkAdd.HappyNetworkAdd(options).run()
+        self.readState()
+
+        options = happy.HappyNetworkAddress.option()
+        options["quiet"] = True
+        options["network_id"] = network_id
+        options["add"] = True
+        options["address"] = prefix
+        happy.HappyNetworkAddress.HappyNetworkAddress(options).run()
+        self.readState()
+
+        for node_id in self.__node_ids(members):
+            options = happy.HappyNodeJoin.option()
+            options["quiet"] = True
+            options["node_id"] = node_id
+            options["network_id"] = network_id
+            happy.HappyNodeJoin.HappyNodeJoin(options).run()
+            self.readState()
+
+    def __delete_network(self):
+        options = happy.HappyNetworkDelete.option()
+        options["quiet"] = True
+        options["network_id"] = network_id
+        happy.HappyNetworkDelete.HappyNetworkDelete(options).run()
+        self.readState()
+
+    def __delete_nodes(self):
+        for node_id in self.getNodeIds():
+            if node_id.startswith(node_prefix):
+                options = happy.HappyNodeDelete.option()
+                options["quiet"] = True
+                options["node_id"] = node_id
+                happy.HappyNodeDelete.HappyNodeDelete(options).run()
+        self.readState()
+
+    def __address(self, node_id):
+        for addr in self.getNodeAddressesOnNetwork(network_id, node_id):
+            if IP.isIpv4(addr):
+                return addr
+
+        emsg = "node %s has no address to benchmark on." % (node_id)
+        self.logger.error("[%s] HappyNetworkBenchmark: %s" % (node_id, emsg))
+        self.exit()
+
+    def __benchmark(self, members):
+        probe = os.path.abspath(happy.HappyPerfProbe.__file__)
+        sender_id, receiver_id = self.__node_ids(2)
+
+        receiver = self.SpawnAtNode(receiver_id, [sys.executable, probe, "--server", "--port", str(port)],
+                                    stdout=subprocess.PIPE, universal_newlines=True)
+        try:
+            receiver.stdout.readline()
+
+            begin = CpuSeconds()
+            sender = self.SpawnAtNode(sender_id, [sys.executable, probe, "--client", self.__address(receiver_id),
+                                                  "--port", str(port), "--protocol", self.protocol, "--test", "bulk",
+                                                  "--duration", str(self.duration)],
+                                      stdout=subprocess.PIPE, universal_newlines=True)
+            out, err = sender.communicate()
+            cpu = CpuSeconds() - begin
+        finally:
+            receiver.terminate()
+            receiver.wait()
+
+        try:
+            bulk = json.loads(out)["bulk"]
+        except (KeyError, ValueError):
+            emsg = "no results from HappyPerfProbe."
+            self.logger.error("[localhost] HappyNetworkBenchmark: %s" % (emsg))
+            self.exit()
+
+        results = {"members": members, "bits_per_second": bulk["bits_per_second"], "cpu_seconds": cpu,
+                   "received": bulk["received"]}
+        results["cpu_seconds_per_gb"] = None
+        if bulk["received"]:
+            results["cpu_seconds_per_gb"] = cpu / (bulk["received"] / 1e9)
+        return results
+
+    def __report(self, results):
+        if self.output is not None:
+            with open(self.output, "w") as f:
+                json.dump(results, f, indent=4, sort_keys=True)
+
+        if self.quiet:
+            return
+
+        print("{0: <8} {1: >8} {2: >12} {3: >10} {4: >12}".format("mode", "members", "Mbit/s", "cpu s",
+                                                                  "cpu s/GB"))
+        for mode in self.modes:
+            result = results[mode]
+            print("{0: <8} {1: >8} {2: >12.1f} {3: >10.2f} {4: >12}".format(
+                  mode, result["members"], (result["bits_per_second"] or 0) / 1e6, result["cpu_seconds"],
+                  "-" if result["cpu_seconds_per_gb"] is None else "%.2f" % (result["cpu_seconds_per_gb"])))
+
+    def run(self):
+        self.__pre_check()
+
+        results = {}
+        try:
+            for mode in self.modes:
+                # a point-to-point network has two members only
+                members = 2 if mode == "p2p" else self.members
+
+                with self.getStateLockManager():
+                    self.readState()
+                    if self._networkExists(network_id):
+                        self.__delete_network()
+                    self.__setup(mode, members)
+
+                try:
+                    results[mode] = self.__benchmark(members)
+                finally:
+                    with self.getStateLockManager():
+                        self.__delete_network()
+        finally:
+            if not self.keep:
+                with self.getStateLockManager():
+                    self.__delete_nodes()
+
+        self.__report(results)
+
+        return ReturnMsg(0, results)
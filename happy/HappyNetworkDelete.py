@@ -32,6 +32,7 @@ import sys
 from happy.ReturnMsg import ReturnMsg
 from happy.Utils import *
 from happy.HappyNetwork import HappyNetwork
+import happy.HappyCapture
 import happy.HappyLinkDelete
 import happy.HappyNetworkState
 
@@ -85,9 +86,10 @@ class HappyNetworkDelete(HappyNetwork):
             self.done = True
 
     def __delete_network(self):
-        cmd = "brctl delbr " + self.uniquePrefix(self.network_id)
-        cmd = self.runAsRoot(cmd)
-        ret = self.CallAtNetwork(self.network_id, cmd)
+        if self.getNetworkMode() != "p2p":
+            cmd = "brctl delbr " + self.uniquePrefix(self.network_id)
+            cmd = self.runAsRoot(cmd)
+            ret = self.CallAtNetwork(self.network_id, cmd)
 
         cmd = "ip netns del " + self.uniquePrefix(self.network_id)
         cmd = self.runAsRoot(cmd)
@@ -110,6 +112,21 @@ class HappyNetworkDelete(HappyNetwork):
 
         self.readState()
 
+    def __stop_capture(self):
+        # the capture process would keep the namespace alive
+        if not self.getNetworkCapture(self.network_id):
+            return
+
+        options = happy.HappyCapture.option()
+        options["network_id"] = self.network_id
+        options["quiet"] = self.quiet
+        options["action"] = "stop"
+
+        stop_capture = happy.HappyCapture.HappyCapture(options)
+        stop_capture.run()
+
+        self.readState()
+
     def __delete_network_state(self):
         self.removeNetwork(self.network_id)
 
@@ -119,6 +136,7 @@ class HappyNetworkDelete(HappyNetwork):
             self.__pre_check()
 
             if not self.done:
+                self.__stop_capture()
                 self.__network_down()
 
                 self._delete_network_interfaces()
@@ -24,14 +24,20 @@
 #       A virtual network is logical representation of a virtual ethernet
 #       bridge that acts like a hub.
 #
+#       The routes of all members are applied at once, with one ip -batch
+#       per member, all running concurrently.
+#
 
 from __future__ import absolute_import
 import os
+import re
+import subprocess
 import sys
 
 from happy.ReturnMsg import ReturnMsg
 from happy.Utils import *
 from happy.utils.IP import IP
+from happy.HappyIptables import MasqueradeRules
 from happy.HappyNetwork import HappyNetwork
 from happy.HappyNode import HappyNode
 import happy.HappyNodeRoute
@@ -53,6 +59,24 @@ def option():
     return options.copy()
 
 
+def BatchErrors(err):
+    """
+    Returns the error of every failed line of an ip -force -batch, by line
+    number, from its standard error.
+    """
+    errors = {}
+    messages = []
+    for line in (err or "").split("\n"):
+        line = line.strip()
+        match = re.match(r"^Command failed .*:(\d+)$", line)
+        if match:
+            errors[int(match.group(1))] = " ".join(messages)
+            messages = []
+        elif line:
+            messages.append(line)
+    return errors
+
+
 class HappyNetworkRoute(HappyNetwork, HappyNode):
     """
     Manages virtual network IP routes.
@@ -109,6 +133,7 @@ class HappyNetworkRoute(HappyNetwork, HappyNode):
         self.isp = opts["isp"]
         self.seed = opts["seed"]
         self.via_node = None
+        self.results = {}
 
     def __pre_check(self):
         # Check if the name of the new network is given
@@ -174,7 +199,8 @@ class HappyNetworkRoute(HappyNetwork, HappyNode):
         if self._nodeExists(self.via):
             self.via_node = self.via
 
-    def __configure_nodes_routes(self):
+    def __configure_nodes_table_routes(self):
+        # routes of an ISP table come with rules and rt_tables entries
         for node_id in self.getNetworkNodesIds(self.network_id):
             if self.via_node is not None and node_id == self.via_node:
                 continue
@@ -199,6 +225,76 @@ class HappyNetworkRoute(HappyNetwork, HappyNode):
 
             self.readState()
 
+    def __node_commands(self, via_address, via_device):
+        if self.to == "default" and via_device:
+            # both the IPv4 and the IPv6 default route
+            destinations = ["default", "::/0"]
+        else:
+            destinations = [self.to]
+
+        cmds = []
+        for to in destinations:
+            cmd = "route %s %s" % ("add" if self.add else "del", to)
+            if via_address:
+                cmd += " via " + via_address
+            if via_device:
+                cmd += " dev " + via_device
+            cmds.append(cmd)
+        return cmds
+
+    def __start_batch(self, node_id, cmds):
+        cmd_list = ["ip"]
+        if not self.isNodeLocal(node_id):
+            cmd_list += ["-n", self.uniquePrefix(node_id)]
+        cmd_list = self.getRunAsRootPrefixList() + cmd_list + ["-force", "-batch", "-"]
+
+        self.logger.debug("[%s] HappyNetworkRoute: %s" % (node_id, cmds))
+        batch = subprocess.Popen(cmd_list, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL,
+                                 stderr=subprocess.PIPE, universal_newlines=True)
+        batch.stdin.write("\n".join(cmds) + "\n")
+        batch.stdin.close()
+        return batch
+
+    def __configure_nodes_routes(self):
+        batches = {}
+        for node_id in self.getNetworkNodesIds(self.network_id):
+            if self.via_node is not None and node_id == self.via_node:
+                continue
+
+            try:
+                via_address, via_device = self.getNodeGateway(node_id, self.via, self.prefix)
+            except ValueError as e:
+                self.results[node_id] = {"routes": [], "error": str(e)}
+                continue
+
+            cmds = self.__node_commands(via_address, via_device)
+            self.results[node_id] = {"routes": cmds, "error": None}
+
+            # For TAP device, happy will not configure address/routing
+            if not self.IsTapDevice(node_id):
+                batches[node_id] = self.__start_batch(node_id, cmds)
+
+        # all members at once, then the result of each
+        for node_id, batch in batches.items():
+            err = batch.stderr.read()
+            batch.stderr.close()
+            batch.wait()
+
+            for line, error in sorted(BatchErrors(err).items()):
+                # deleted already, as a route via a link that went down
+                if self.delete and "No such process" in error:
+                    continue
+
+                self.results[node_id]["error"] = "%s: %s" % (self.results[node_id]["routes"][line - 1], error)
+                break
+
+            if batch.returncode != 0 and self.results[node_id]["error"] is None and not self.delete:
+                self.results[node_id]["error"] = (err or "").strip() or "ip exited with %d" % (batch.returncode)
+
+        for node_id, result in self.results.items():
+            if result["error"] is None:
+                self.logger.info("[%s] HappyNetworkRoute: %s" % (node_id, "; ".join(result["routes"])))
+
     def __configure_gateway_routing(self):
         if self.via_node is None:
             return
@@ -210,20 +306,58 @@ class HappyNetworkRoute(HappyNetwork, HappyNode):
         if node_type != self.node_type_ap:
             return
 
-        for interface_id in self.getNodeInterfaceIds(self.via_node):
+        # the rules of every wan interface in one transaction
+        rules = []
+        interface_ids = self.getNodeInterfaceIds(self.via_node)
+        for interface_id in interface_ids:
             interface_type = self.getNodeInterfaceType(interface_id, self.via_node)
             if interface_type != self.network_type["wan"]:
                 continue
 
-            self.setNATonInterface(interface_id, self.via_node)
+            rules += MasqueradeRules(interface_id, interface_ids)
+
+        self.addNodeIptablesRules(rules, self.via_node)
 
     def __post_check(self):
-        pass
+        failed = [node_id for node_id in sorted(self.results) if self.results[node_id]["error"] is not None]
+        for node_id in failed:
+            emsg = "Failed to %s route to %s via %s at virtual node %s: %s" % \
+                ("add" if self.add else "remove", self.to, self.via, node_id, self.results[node_id]["error"])
+            self.logger.error("[%s] HappyNetworkRoute: %s" % (node_id, emsg))
+
+        if len(failed) > 0:
+            self.exit()
+
+    def __route_key(self):
+        # the key setNodeRoute and setNetworkRoute record a route with
+        if IP.isIpv6(self.via) or (self.prefix is not None and IP.isIpv6(self.prefix)):
+            return self.to + "_v6"
+        return self.to + "_v4"
+
+    def __update_nodes_state(self):
+        for node_id, result in self.results.items():
+            if result["error"] is not None:
+                continue
+
+            new_route = {}
+            new_route["to"] = self.to
+            new_route["via"] = self.via
+            new_route["prefix"] = self.prefix
+
+            if self.add:
+                self.setNodeRoute(node_id, self.to, new_route)
+            else:
+                self.removeNodeRoute(node_id, self.__route_key())
 
     def __update_state(self):
         if not self.record:
             return
 
+        self.__update_nodes_state()
+
+        if any([result["error"] is not None for result in self.results.values()]):
+            return
+
         if self.add:
             new_route = {}
             new_route["to"] = self.to
@@ -232,26 +366,33 @@ class HappyNetworkRoute(HappyNetwork, HappyNode):
 
             self.setNetworkRoute(self.network_id, self.to, new_route)
         else:
-            self.removeNetworkRoute(self.network_id, self.to)
+            self.removeNetworkRoute(self.network_id, self.__route_key())
 
     def run(self):
         with self.getStateLockManager():
             self.__pre_check()
 
-        self.__configure_nodes_routes()
+        if self.isp:
+            self.__configure_nodes_table_routes()
+        else:
+            self.__configure_nodes_routes()
         # For TAP device, happy will not configure address/routing
         # And it will be configured by LwIP stack in whatever process LwIP is running
         if not self.IsTapDevice(self.node_id):
-            self.__configure_gateway_routing()
+            # the iptables rules of the gateway are kept in the state
+            with self.getStateLockManager():
+                self.readState()
+                self.__configure_gateway_routing()
+                self.writeState()
 
         with self.getStateLockManager():
 
-            self.__post_check()
-
             self.readState()
 
             self.__update_state()
 
             self.writeState()
 
-        return ReturnMsg(0)
+        self.__post_check()
+
+        return ReturnMsg(0, self.results)
@@ -89,11 +89,17 @@ class HappyNetworkState(HappyNetwork):
             self.exit()
 
     def __network_up(self):
+        if self.getNetworkMode() == "p2p":
+            return
+
         cmd = "ifconfig " + self.uniquePrefix(self.network_id) + " up"
         cmd = self.runAsRoot(cmd)
         r = self.CallAtNetwork(self.network_id, cmd)
 
     def __network_down(self):
+        if self.getNetworkMode() == "p2p":
+            return
+
         cmd = "ifconfig " + self.uniquePrefix(self.network_id) + " down"
         cmd = self.runAsRoot(cmd)
         r = self.CallAtNetwork(self.network_id, cmd)
@@ -27,11 +27,13 @@
 from __future__ import absolute_import
 from __future__ import print_function
 import os
+import subprocess
 import sys
 
 from happy.Utils import *
 from happy.utils.IP import IP
 from happy.HappyHost import HappyHost
+from happy.HappyIptables import MasqueradeRules, RestoreInput
 import happy.HappyLinkDelete
 from six.moves import range
 
@@ -205,6 +207,62 @@ class HappyNode(HappyHost):
         else:
             return self.__getNodeIPv4AddressOnPrefix(prefix, id)
 
+    def getNodeGateway(self, node_id, via, prefix=None):
+        """
+        Returns the (address, device) a route of node_id goes via, where via
+        is an IP address, a gateway node or an interface of node_id. The
+        address of a gateway node is its one address on the network it
+        shares with node_id, on prefix if given. Raises ValueError if there
+        is no such address or device.
+        """
+        if IP.isIpAddress(via):
+            return via, None
+
+        # looking for the interface forks, and via names a gateway node
+        # more often than not
+        if not self._nodeExists(via):
+            if self._nodeInterfaceExists(via, node_id):
+                return None, via
+            raise ValueError("Don't know what %s via-address is. If it is a node, it can't be found." % (via))
+
+        common_networks = list(set(self.getNodeNetworkIds(node_id)).intersection(self.getNodeNetworkIds(via)))
+
+        if len(common_networks) == 0:
+            raise ValueError("Node %s and gateway node %s are not on the same network." % (node_id, via))
+
+        if len(common_networks) > 1 and not prefix:
+            raise ValueError("Node %s and gateway %s share more than one network. Need gateway prefix to "
+                             "disambiguate." % (node_id, via))
+
+        if not prefix:
+            gateway_addresses = self.getNodeAddressesOnNetwork(common_networks[0], via)
+
+            if len(gateway_addresses) == 0:
+                raise ValueError("Gateway node (via) %s does not have any IP addresses." % (via))
+
+            if len(gateway_addresses) > 1:
+                raise ValueError("Node %s has more than one IP address. Need gateway prefix to disambiguate." %
+                                 (via))
+
+            return gateway_addresses[0], None
+
+        if not IP.isIpAddress(prefix):
+            raise ValueError("Prefix %s is not a valid IP address." % (prefix))
+
+        ip_prefix, ip_mask = IP.splitAddressMask(prefix)
+        prefix = IP.getPrefix(ip_prefix, ip_mask)
+
+        gateway_addresses = self.getNodeAddressesOnNetworkOnPrefix(common_networks[0], prefix, via)
+
+        if len(gateway_addresses) == 0:
+            raise ValueError("Cannot find any IP address on %s with prefix %s." % (via, prefix))
+
+        if len(gateway_addresses) > 1:
+            raise ValueError("Found more than one IP address on %s with prefix %s. (%s)" %
+                             (via, prefix, ",".join(gateway_addresses)))
+
+        return gateway_addresses[0], None
+
     def __getNodeIPv6AddressOnPrefix(self, prefix, id):
         prefix_addr, prefix_mask = IP.splitAddressMask(prefix)
 
@@ -271,19 +329,72 @@ class HappyNode(HappyHost):
         if node_id is None:
             node_id = self.node_id
 
-        cmd = "iptables -t nat -A POSTROUTING -o " + interface_id + " -j MASQUERADE"
-        ret = self.CallAtNode(node_id, cmd)
+        rules = MasqueradeRules(interface_id, self.getNodeInterfaceIds(node_id))
+        self.addNodeIptablesRules(rules, node_id)
+
+    def iptablesRestore(self, rules, node_id=None, delete=False):
+        """
+        Appends rules to the iptables of virtual node node_id, or of the host
+        where node_id is None, or deletes them, with one iptables-restore
+        transaction per table. Returns the error of iptables-restore, or None.
+        """
+        cmd_list = ["iptables-restore", "--noflush"]
+        if node_id is not None and not self.isNodeLocal(node_id):
+            cmd_list = ["ip", "netns", "exec", self.uniquePrefix(node_id)] + cmd_list
+        cmd_list = self.getRunAsRootPrefixList() + cmd_list
+
+        ruleset = RestoreInput(rules, delete)
+        self.logger.debug("[%s] HappyNode: %s" % (node_id or "localhost", ruleset.strip().replace("\n", "; ")))
+
+        try:
+            proc = subprocess.Popen(cmd_list, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL,
+                                    stderr=subprocess.PIPE, universal_newlines=True)
+        except OSError as e:
+            return str(e)
+
+        out, err = proc.communicate(ruleset)
+        if proc.returncode != 0:
+            return (err or "").strip() or "iptables-restore exited with %d" % (proc.returncode)
+        return None
 
-        for other_interface in self.getNodeInterfaceIds(node_id):
-            if other_interface == interface_id:
-                continue
+    def addNodeIptablesRules(self, rules, node_id=None):
+        """
+        Appends the rules node_id does not have yet, as recorded in the state.
+        """
+        if node_id is None:
+            node_id = self.node_id
+
+        recorded = self.getNodeIptablesRules(node_id)
+        rules = [list(rule) for rule in rules if list(rule) not in recorded]
+        if len(rules) == 0:
+            return
+
+        err = self.iptablesRestore(rules, node_id)
+        if err is not None:
+            emsg = "Failed to apply iptables rules: %s" % (err)
+            self.logger.warning("[%s] HappyNode: %s" % (node_id, emsg))
+            return
+
+        self.setNodeIptablesRules(recorded + rules, node_id)
+
+    def removeNodeIptablesRules(self, rules=None, node_id=None):
+        """
+        Deletes the rules recorded in the state for node_id, or all of them.
+        """
+        if node_id is None:
+            node_id = self.node_id
+
+        recorded = self.getNodeIptablesRules(node_id)
+        if rules is None:
+            rules = recorded
+        rules = [list(rule) for rule in rules if list(rule) in recorded]
+        if len(rules) == 0:
+            return
 
-            cmd = "iptables -A FORWARD -i " + interface_id + " -o " + other_interface + \
-                  " -m state --state RELATED,ESTABLISHED -j ACCEPT"
-            cmd = self.runAsRoot(cmd)
-            ret = self.CallAtNode(node_id, cmd)
+        err = self.iptablesRestore(rules, node_id, delete=True)
+        if err is not None:
+            # e.g. rules flushed by hand, which are gone either way
+            emsg = "Failed to delete iptables rules: %s" % (err)
+            self.logger.warning("[%s] HappyNode: %s" % (node_id, emsg))
 
-            cmd = "iptables -A FORWARD -i " + other_interface + " -o " + interface_id + \
-                  " -j ACCEPT"
-            cmd = self.runAsRoot(cmd)
-            ret = self.CallAtNode(node_id, cmd)
+        self.setNodeIptablesRules([rule for rule in recorded if rule not in rules], node_id)
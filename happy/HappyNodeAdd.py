@@ -33,6 +33,7 @@ from happy.ReturnMsg import ReturnMsg
 from happy.Utils import *
 from happy.utils.IP import IP
 from happy.HappyNode import HappyNode
+from happy.HappyCGroup import HappyCGroup
 import happy.HappyNodeDelete
 import happy.HappyDNS
 
@@ -40,23 +41,34 @@ options = {}
 options["quiet"] = False
 options["node_id"] = None
 options["type"] = None
+options["cgroup"] = None
+options["cpu_limit"] = None
+options["memory_limit"] = None
+options["cpuset"] = None
 
 
 def option():
     return options.copy()
 
 
-class HappyNodeAdd(HappyNode):
+class HappyNodeAdd(HappyNode, HappyCGroup):
     """
     Creates a new network namespace that represents one virtual node.
 
     happy-node-add [-h --help] [-q --quiet] [-a --ap] [-s --service]
-                   [-l --local] [-i --id <NODE_NAME>]
+                   [-l --local] [-i --id <NODE_NAME>] [-g --cgroup]
+                   [--cpu <CPUS>] [--memory <BYTES>] [--cpuset <CPU_LIST>]
 
         -a --ap         The node is considered an access point.
         -s --service    The node is considered a cloud service.
         -l --local      Default node type. The node is considered a local node.
         -i --id         Required. Name of the node to create.
+        -g --cgroup     Optional. Create a cgroup v2 for the node that accounts
+                        for all processes started on it. Enabled by default
+                        when the node_cgroup configuration key is true.
+        --cpu           Optional. Limit the node to a number of CPUs, e.g. 0.5.
+        --memory        Optional. Limit the node memory, e.g. 256M.
+        --cpuset        Optional. Pin the node to a list of CPUs, e.g. 0-3.
 
     Note: A node cannot be more than one type. It is either ap, service,
           or local.
@@ -68,6 +80,10 @@ class HappyNodeAdd(HappyNode):
     $ happy-node-add --ap --id onhub
         Creates a node called onhub that serves as an access point.
 
+    $ happy-node-add --cpu 0.25 --memory 128M --cpuset 2 onhub
+        Creates a node called onhub whose processes share a quarter of
+        CPU 2 and 128 MB of memory.
+
     return:
         0    success
         1    fail
@@ -75,10 +91,18 @@ class HappyNodeAdd(HappyNode):
 
     def __init__(self, opts=options):
         HappyNode.__init__(self)
+        HappyCGroup.__init__(self)
 
         self.quiet = opts["quiet"]
         self.node_id = opts["node_id"]
         self.type = opts["type"]
+        self.cgroup = opts["cgroup"]
+        self.cpu_limit = opts["cpu_limit"]
+        self.memory_limit = opts["memory_limit"]
+        self.cpuset = opts["cpuset"]
+
+        if self.cpu_limit is not None or self.memory_limit is not None or self.cpuset is not None:
+            self.cgroup = True
 
     def __deleteExistingNode(self):
         options = happy.HappyNodeDelete.option()
@@ -108,6 +132,12 @@ class HappyNodeAdd(HappyNode):
             self.logger.error("[localhost] HappyNodeAdd: %s" % (emsg))
             self.exit()
 
+        # Check if the cgroup limits are valid
+        emsg = self.getCGroupLimitsError(self.cpu_limit, self.memory_limit, self.cpuset)
+        if emsg is not None:
+            self.logger.error("[localhost] HappyNodeAdd: %s" % (emsg))
+            self.exit()
+
         # Check if the name of new node is not a duplicate (that it does not already exists).
         if self._nodeExists():
             emsg = "virtual node %s already exists." % (self.node_id)
@@ -167,6 +197,13 @@ class HappyNodeAdd(HappyNode):
             nodeDNS = happy.HappyDNS.HappyDNS(options)
             nodeDNS.run()
 
+    def __create_node_cgroup(self):
+        if not self.isCGroupEnabled(self.cgroup):
+            return
+
+        self.createNodeCGroup(self.node_id, self.cpu_limit, self.memory_limit, self.cpuset)
+        self.writeState()
+
     def run(self):
         with self.getStateLockManager():
 
@@ -188,6 +225,8 @@ class HappyNodeAdd(HappyNode):
 
             self.__check_node_type()
 
+            self.__create_node_cgroup()
+
             self.__check_for_dns()
 
         return ReturnMsg(0)
@@ -33,6 +33,7 @@ import pprint
 from happy.ReturnMsg import ReturnMsg
 from happy.Utils import *
 from happy.HappyNode import HappyNode
+from happy.HappyCGroup import HappyCGroup
 import happy.HappyProcessStop
 import happy.HappyNodeTmux
 
@@ -45,7 +46,7 @@ def option():
     return options.copy()
 
 
-class HappyNodeDelete(HappyNode):
+class HappyNodeDelete(HappyNode, HappyCGroup):
     """
     Deletes a virtual node. All network interfaces associated with the node
     are also deleted.
@@ -65,6 +66,7 @@ class HappyNodeDelete(HappyNode):
 
     def __init__(self, opts=options):
         HappyNode.__init__(self)
+        HappyCGroup.__init__(self)
 
         self.quiet = opts["quiet"]
         self.node_id = opts["node_id"]
@@ -160,6 +162,8 @@ class HappyNodeDelete(HappyNode):
 
                 self.__delete_node()
 
+                self.deleteNodeCGroup(self.node_id)
+
             self.__post_check()
 
             self.__delete_node_state()
@@ -33,6 +33,7 @@ from happy.ReturnMsg import ReturnMsg
 from happy.Utils import *
 from happy.utils.IP import IP
 from happy.HappyNode import HappyNode
+from happy.HappyCGroup import HappyCGroup
 import happy.HappyDNS
 
 options = {}
@@ -40,21 +41,29 @@ options["quiet"] = False
 options["node_id"] = None
 options["new_node_id"] = None
 options["type"] = None
+options["cpu_limit"] = None
+options["memory_limit"] = None
+options["cpuset"] = None
 
 
 def option():
     return options.copy()
 
 
-class HappyNodeEdit(HappyNode):
+class HappyNodeEdit(HappyNode, HappyCGroup):
     """
-    Edit the state of an existing virtual node.  Example operations are rename.
+    Edit the state of an existing virtual node.  Example operations are rename
+    and changing the cgroup limits of a node.
 
     happy-node-edit [-h --help] [-q --quiet]
                     [-i --id <NODE_NAME>] [-n --new <NEW_NODE_NAME>]
+                    [--cpu <CPUS>] [--memory <BYTES>] [--cpuset <CPU_LIST>]
 
         -i --id         Required. Name of the node to edit.
         -n --new        New name of the node for rename.
+        --cpu           Limit the node to a number of CPUs, or max.
+        --memory        Limit the node memory, e.g. 256M, or max.
+        --cpuset        Pin the node to a list of CPUs, e.g. 0-3.
 
     Note: A node cannot be more than one type. It is either ap, service,
           or local.
@@ -63,6 +72,10 @@ class HappyNodeEdit(HappyNode):
     $ happy-node-edit -i node1 -n onhub 
         Renames node1 to now be called onhub.
 
+    $ happy-node-edit -i onhub --cpu 2 --memory max
+        Lets the onhub node use two CPUs and removes its memory limit.
+        The node must have been created with a cgroup.
+
     return:
         0    success
         1    fail
@@ -70,11 +83,15 @@ class HappyNodeEdit(HappyNode):
 
     def __init__(self, opts=options):
         HappyNode.__init__(self)
+        HappyCGroup.__init__(self)
 
         self.quiet = opts["quiet"]
         self.node_id = opts["node_id"]
         self.new_node_id = opts["new_node_id"]
         self.type = opts["type"]
+        self.cpu_limit = opts["cpu_limit"]
+        self.memory_limit = opts["memory_limit"]
+        self.cpuset = opts["cpuset"]
 
     def __pre_check(self):
         # Check if the name of the node is given
@@ -89,12 +106,21 @@ class HappyNodeEdit(HappyNode):
             self.logger.warning("[%s] HappyNodeEdit: %s" % (self.node_id, emsg))
 
         # Check if dot is in the name
-        if IP.isDomainName(self.new_node_id):
+        if self.new_node_id is not None and IP.isDomainName(self.new_node_id):
             emsg = "Using . (dot) in the name is not allowed."
             self.logger.error("[localhost] HappyNodeEdit: %s" % (emsg))
             self.exit()
 
+        # Check if the cgroup limits are valid
+        emsg = self.getCGroupLimitsError(self.cpu_limit, self.memory_limit, self.cpuset)
+        if emsg is not None:
+            self.logger.error("[localhost] HappyNodeEdit: %s" % (emsg))
+            self.exit()
+
     def __post_check(self):
+        if self.new_node_id is None:
+            return
+
         if not self._nodeExists(self.new_node_id):
             emsg = "Virtual node does not exist"
             self.logger.error("[%s] HappyNodeEdit: %s" % (self.node_id, emsg))
@@ -122,11 +148,24 @@ class HappyNodeEdit(HappyNode):
             netns_map[self.new_node_id] = netns_map[self.node_id]
             del netns_map[self.node_id]
 
+    def __edit_node_cgroup(self):
+        if self.cpu_limit is None and self.memory_limit is None and self.cpuset is None:
+            return
+
+        if self.getNodeCGroupPath(self.node_id) is None:
+            emsg = "virtual node %s has no cgroup." % (self.node_id)
+            self.logger.error("[%s] HappyNodeEdit: %s" % (self.node_id, emsg))
+            self.exit()
+
+        self.setNodeCGroupLimits(self.node_id, self.cpu_limit, self.memory_limit, self.cpuset)
+
     def run(self):
         with self.getStateLockManager():
 
             self.__pre_check()
 
+            self.__edit_node_cgroup()
+
             self.__edit_node_state()
 
             self.writeState()
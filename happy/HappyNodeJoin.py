@@ -36,6 +36,7 @@ from happy.HappyLink import HappyLink
 from happy.HappyNetwork import HappyNetwork
 from happy.HappyNode import HappyNode
 import happy.HappyLinkAdd
+import happy.HappyLinkShape
 import happy.HappyNodeAddress
 import happy.HappyNodeRoute
 
@@ -46,6 +47,7 @@ options["tap"] = False
 options["network_id"] = None
 options["fix_hw_addr"] = None
 options["customized_eui64"] = None
+options["shape"] = None
 
 
 def option():
@@ -59,6 +61,7 @@ class HappyNodeJoin(HappyLink, HappyNode, HappyNetwork):
     happy-node-join [-h --help] [-q --quiet] [-i --id <NODE_NAME>]
                     [-n --network <NETWORK_NAME>] [-m --mac <HW_ADDR>]
                     [-c --customizedeui64 <CUST_EUI64>] [-p --tap]
+                    [-s --shape <PROFILE>]
 
         -i --id              Required. Node to be added to a network. Find using
                              happy-node-list or happy-state.
@@ -69,6 +72,8 @@ class HappyNodeJoin(HappyLink, HappyNode, HappyNetwork):
         -p --tap             Configure the link between the node and the network as an
                              L2 TAP device with a virtual bridge. Omit this parameter to
                              default to an L3 TUN configuration for normal IP routing.
+        -s --shape           Link profile to shape the link with, see happy-link-shape.
+                             The profile of the network, if any, by default.
 
     Example:
     $ happy-node-join ThreadNode HomeThread
@@ -98,6 +103,7 @@ class HappyNodeJoin(HappyLink, HappyNode, HappyNetwork):
         self.network_id = opts["network_id"]
         self.fix_hw_addr = opts["fix_hw_addr"]
         self.customized_eui64 = opts["customized_eui64"]
+        self.shape = opts["shape"]
         if not self.fix_hw_addr and opts["customized_eui64"]:
             self.fix_hw_addr = self.customized_eui64[6:]
             self.customized_eui64 = self.customized_eui64.replace(':', '-')
@@ -133,6 +139,17 @@ class HappyNodeJoin(HappyLink, HappyNode, HappyNetwork):
             self.logger.error("[%s] HappyNodeJoin: %s" % (self.node_id, emsg))
             self.exit()
 
+        if self.getNetworkMode() == "p2p":
+            if len(self.getNetworkLinkIds()) >= 2:
+                emsg = "point-to-point network %s already has two members." % (self.network_id)
+                self.logger.error("[%s] HappyNodeJoin: %s" % (self.node_id, emsg))
+                self.exit()
+
+            if self.tap:
+                emsg = "point-to-point network %s takes no TAP links." % (self.network_id)
+                self.logger.error("[%s] HappyNodeJoin: %s" % (self.node_id, emsg))
+                self.exit()
+
         self.fix_hw_addr = self.fixHwAddr(self.fix_hw_addr)
         # Check if HW MAC address is valid
         if self.fix_hw_addr is not None and self.fix_hw_addr.count(":") != 5:
@@ -147,6 +164,13 @@ class HappyNodeJoin(HappyLink, HappyNode, HappyNetwork):
         options["type"] = self.getNetworkType()
         options["tap"] = self.tap
 
+        # the second member of a point-to-point network takes the far end
+        # of the link of the first one
+        self.peer = None
+        if self.getNetworkMode() == "p2p" and len(self.getNetworkLinkIds()) == 1:
+            self.peer = self.getNetworkLinkIds()[0]
+        options["peer"] = self.peer
+
         link = happy.HappyLinkAdd.HappyLinkAdd(options)
         ret = link.run()
         self.link_id = ret.Data()
@@ -164,18 +188,33 @@ class HappyNodeJoin(HappyLink, HappyNode, HappyNetwork):
         self.link_type = self.getLinkType(self.link_id)
         self.link_network_end = self.getLinkNetworkEnd(self.link_id)
         self.link_node_end = self.getLinkNodeEnd(self.link_id)
+        if self.peer is not None:
+            self.link_node_end = self.getLinkNetworkEnd(self.peer)
         self.node_interface_name = self.getNodeInterfaceName(self.node_id, self.link_type)
 
     def __connect_to_network(self):
+        if self.peer is not None:
+            # straight from the network namespace, where it waited
+            namespace_id = "1" if self.isNodeLocal(self.node_id) else self.uniquePrefix(self.node_id)
+            cmd = "ip link set " + self.link_node_end + " netns " + namespace_id
+            cmd = self.runAsRoot(cmd)
+            ret = self.CallAtNetwork(self.network_id, cmd)
+            return
+
         self.moveInterfaceToNamespace(self.link_network_end, self.network_id)
 
+        # the first member of a point-to-point network waits for the second
+        # one in the network namespace, unbridged
+        if self.getNetworkMode() == "p2p":
+            return
+
         # Attach to bridge
         cmd = "brctl addif " + self.uniquePrefix(self.network_id) + " " + self.link_network_end
         cmd = self.runAsRoot(cmd)
         ret = self.CallAtNetwork(self.network_id, cmd)
 
     def __connect_to_node(self):
-        if not self.isNodeLocal(self.node_id):
+        if not self.isNodeLocal(self.node_id) and self.peer is None:
             if self.getLinkTap(self.link_id):
                 self.moveLwipInterfaceToNamespace(self.link_id, self.node_id)
             else:
@@ -223,6 +262,9 @@ class HappyNodeJoin(HappyLink, HappyNode, HappyNetwork):
         new_network_interface = {}
         self.setNetworkLink(self.network_id, self.link_id, new_network_interface)
 
+        if self.peer is not None:
+            self.setLinkPeer(self.peer, self.link_id)
+
         new_node_interface = {}
         new_node_interface["link"] = self.link_id
         new_node_interface["type"] = self.link_type
@@ -231,6 +273,21 @@ class HappyNodeJoin(HappyLink, HappyNode, HappyNetwork):
             new_node_interface["customized_eui64"] = self.customized_eui64
         self.setNodeInterface(self.node_id, self.node_interface_name, new_node_interface)
 
+    def __shape_link(self):
+        shape = self.shape
+        if shape is None:
+            shape = self.getNetworkShape(self.network_id)
+        if not shape:
+            return
+
+        options = happy.HappyLinkShape.option()
+        options["quiet"] = self.quiet
+        options["link_id"] = self.link_id
+        options["profile"] = shape
+
+        shaper = happy.HappyLinkShape.HappyLinkShape(options)
+        ret = shaper.run()
+
     def __assign_network_addresses(self):
         network_prefixes = self.getNetworkPrefixes(self.network_id)
 
@@ -297,7 +354,8 @@ class HappyNodeJoin(HappyLink, HappyNode, HappyNetwork):
 
             self.writeState()
 
-        
+        self.__shape_link()
+
         self.__assign_network_addresses()
 
         self.__load_network_routes()
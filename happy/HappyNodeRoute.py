@@ -23,11 +23,16 @@
 #
 #       This is a wrapper around Linux ip-address command.
 #
+#       The routes of a node are read once per command, with a netlink
+#       dump, and kept up to date with the routes the command adds and
+#       deletes, so its checks need no ip route.
+#
 
 from __future__ import absolute_import
 from __future__ import print_function
 import os
 import re
+import socket
 import sys
 
 from happy.ReturnMsg import ReturnMsg
@@ -35,7 +40,9 @@ from happy.Utils import *
 from happy.utils.IP import IP
 from happy.HappyNode import HappyNode
 from happy.HappyNetwork import HappyNetwork
+from happy.HappyProcess import HappyProcess
 import happy.HappyNodeDelete
+import happy.HappyRouteTable
 
 options = {}
 options["quiet"] = False
@@ -55,7 +62,7 @@ def option():
     return options.copy()
 
 
-class HappyNodeRoute(HappyNode, HappyNetwork):
+class HappyNodeRoute(HappyNode, HappyNetwork, HappyProcess):
     """
     Manages virtual node IP routes.
 
@@ -77,7 +84,8 @@ class HappyNodeRoute(HappyNode, HappyNetwork):
         -p --prefix Gateway route prefix. Required if the gateway has more than one IP
                     address.
         -s --isp    Optional. The name of the routing table.
-        -e --seed   Optional. Route priority in the routing table. Range: 0-255
+        -e --seed   Optional. Number of the routing table, if it is free. Happy
+                    numbers the table otherwise.
         -y --type   Optional. Ip type of the node's route IP address, one of: v4, v6
 
     Examples:
@@ -102,6 +110,7 @@ class HappyNodeRoute(HappyNode, HappyNetwork):
     def __init__(self, opts=options):
         HappyNode.__init__(self)
         HappyNetwork.__init__(self)
+        HappyProcess.__init__(self)
 
         self.quiet = opts["quiet"]
         self.node_id = opts["node_id"]
@@ -120,6 +129,7 @@ class HappyNodeRoute(HappyNode, HappyNetwork):
         self.via_device = None
         self.via_address = None
         self.route_type = opts["route_type"]
+        self.route_tables = {}
 
     def __pre_check(self):
         # Check if the name of the new node is given
@@ -170,104 +180,111 @@ class HappyNodeRoute(HappyNode, HappyNetwork):
             self.to = IP.paddingZeros(self.to)
 
         # Check if gateway is a node
-        if IP.isIpAddress(self.via):
-            self.via_address = self.via
-            self.via_address = IP.paddingZeros(self.via_address)
-            return
-
-        if self._nodeInterfaceExists(self.via):
-            self.via_device = self.via
-            return
-
-        if not self._nodeExists(self.via):
-            emsg = "Don't know what %s via-address is. If it is a node, it can't be found." % (self.to)
-            self.logger.error("[localhost] HappyNodeRoute: %s" % (emsg))
+        try:
+            self.via_address, self.via_device = self.getNodeGateway(self.node_id, self.via, self.prefix)
+        except ValueError as e:
+            self.logger.error("[localhost] HappyNodeRoute: %s" % (e))
             self.exit()
 
-        this_node_networks = self.getNodeNetworkIds(self.node_id)
-        gateway_networks = self.getNodeNetworkIds(self.via)
-        common_networks = list(set(this_node_networks).intersection(gateway_networks))
-
-        if len(common_networks) == 0:
-            emsg = "Node %s and gateway node %s are not on the same network." % \
-                (self.node_id, self.via)
-            self.logger.error("[localhost] HappyNodeRoute: %s" % (emsg))
-            self.exit()
-
-        if len(common_networks) > 1 and not self.prefix:
-            emsg = "Node %s and gateway %s share more than one network. Need gateway prefix to disambiguate." % \
-                (self.node_id, self.via)
-            self.logger.error("[localhost] HappyNodeRoute: %s" % (emsg))
-            self.exit()
-
-        if not self.prefix:
-
-            gateway_addresses = self.getNodeAddressesOnNetwork(common_networks[0], self.via)
-
-            if len(gateway_addresses) == 0:
-                emsg = "Gateway node (via) %s does not have any IP addresses." % \
-                    (self.via)
-                self.logger.error("[localhost] HappyNodeRoute: %s" % (emsg))
-                self.exit()
-
-            if len(gateway_addresses) > 1 and self.prefix is None:
-                emsg = "Node %s has more than one IP address. Need gateway prefix to disambiguate." % \
-                    (self.via)
-                self.logger.error("[localhost] HappyNodeRoute: %s" % (emsg))
-                self.exit()
-
-            # We find gateway address without using prefix.
-            self.via_address = gateway_addresses[0]
-            return
-
-        else:
-            if not IP.isIpAddress(self.prefix):
-                emsg = "Prefix %s is not a valid IP address."
-                self.logger.error("[localhost] HappyNodeRoute: %s" % (emsg))
-                self.exit()
+        if IP.isIpAddress(self.via):
+            self.via_address = IP.paddingZeros(self.via_address)
 
+        elif self.via_address is not None and self.prefix:
             self.ip_prefix, self.ip_mask = IP.splitAddressMask(self.prefix)
             self.prefix = IP.getPrefix(self.ip_prefix, self.ip_mask)
 
-            gateway_addresses = self.getNodeAddressesOnNetworkOnPrefix(common_networks[0], self.prefix, self.via)
+    def rt_table_update(self, priority, table_id, node):
+        """
+        Returns the number of routing table table_id at node, allocated in
+        the Happy state, priority if it is free. ip rule and ip route get the
+        number, so rt_tables is left alone.
+        """
+        return self.allocateRouteTableId(table_id, node, priority)
 
-            if len(gateway_addresses) == 0:
-                emsg = "Cannot find any IP address on %s with prefix %s." % (self.via, self.prefix)
-                self.logger.error("[localhost] HappyNodeRoute: %s" % (emsg))
-                self.exit()
+    def getNodeRouteTable(self, node_id):
+        """
+        Returns the routes of every table of a node, read once with a netlink
+        dump where Happy can create sockets in the node, from ip route
+        otherwise.
+        """
+        if node_id in self.route_tables:
+            return self.route_tables[node_id]
+
+        routes = None
+        if self.isNodeLocal(node_id) or os.geteuid() == 0:
+            create = socket.socket
+            if not self.isNodeLocal(node_id):
+                netns_path = self.getNetNSPath(node_id)
+
+                def create(family, type, proto):
+                    return self.SocketInNamespace(netns_path, family, type, proto)
+
+            try:
+                routes = happy.HappyRouteTable.Read(create)
+            except OSError as e:
+                emsg = "Failed to dump the routes of node %s: %s" % (node_id, str(e))
+                self.logger.debug("[%s] HappyNodeRoute: %s" % (node_id, emsg))
+
+        if routes is None:
+            routes = []
+            for family in [4, 6]:
+                cmd = "ip -%d route show table all" % (family)
+                cmd = self.runAsRoot(cmd)
+                out, err = self.CallAtNodeForOutput(node_id, cmd)
+                routes += happy.HappyRouteTable.ParseText(out, family)
+
+        self.route_tables[node_id] = routes
+        return routes
+
+    def updateNodeRouteTable(self, node_id, family, ret, add, to, via=None, dev=None):
+        """
+        Adds a route Happy added to the routes of a node, or removes one it
+        deleted. Read again, from the node, after an ip route that failed.
+        """
+        if node_id not in self.route_tables:
+            return
 
-            if len(gateway_addresses) > 1:
-                emsg = "Found more than one IP address on %s with prefix %s. (%s)" % \
-                  (self.via, self.prefix, ",".join(gateway_addresses))
-                self.logger.error("[localhost] HappyNodeRoute: %s" % (emsg))
-                self.exit()
+        if ret != 0:
+            del self.route_tables[node_id]
+            return
 
-            self.via_address = gateway_addresses[0]
+        routes = self.route_tables[node_id]
+        if add:
+            routes.append({"family": family, "type": "unicast", "table": "main", "to": to, "via": via,
+                           "dev": dev, "protocol": "boot"})
+            return
 
-    def rt_table_update(self, priority, table_id, node):
-        need_overrite = False
-        f = open('/etc/iproute2/rt_tables', 'rt')
-        rt_content = f.read()
-        if table_id not in rt_content:
-            rt_content = rt_content + '\n' + '%d\t%s\n' % (priority, table_id)
-            with open('/tmp/rt_tables.tmp', 'wt') as tmpf:
-                tmpf.write(rt_content)
-            need_overrite = True
-        f.close()
-        if need_overrite is True:
-            cmd = 'mv /tmp/rt_tables.tmp /etc/iproute2/rt_tables'
-            cmd = self.runAsRoot(cmd)
-            r = self.CallAtNode(node, cmd)
+        for route in routes:
+            if happy.HappyRouteTable.Matches(route, to, via, dev, family):
+                routes.remove(route)
+                return
 
     def add_route_rule(self, addr, table, via_address, interface, node):
+        if self.getRouteTableId(table) is not None:
+            table = self.getRouteTableId(table)
+
         cmd = 'ip rule add from %s lookup %s' % (addr, table)
         cmd = self.runAsRoot(cmd)
         r = self.CallAtNode(node, cmd)
         cmd = 'ip route add default via %s dev %s table %s' % (via_address, interface, table)
         cmd = self.runAsRoot(cmd)
         r = self.CallAtNode(node, cmd)
+        self.route_tables.pop(node, None)
 
     def remove_route_rule(self, table, node):
+        table_id = self.getRouteTableId(table)
+        if table_id is not None:
+            cmd = 'ip rule delete lookup %d' % table_id
+            cmd = self.runAsRoot(cmd)
+            r = self.CallAtNode(node, cmd, quiet=True)
+            cmd = 'ip route delete default table %d' % table_id
+            cmd = self.runAsRoot(cmd)
+            r = self.CallAtNode(node, cmd, quiet=True)
+            self.route_tables.pop(node, None)
+            self.releaseRouteTableId(table, node)
+            return
+
+        # a table named in rt_tables by an older Happy
         cmd = 'ip rule'
         cmd = self.runAsRoot(cmd)
         output = self.CallAtNodeForOutput(node, cmd)
@@ -279,6 +296,7 @@ class HappyNodeRoute(HappyNode, HappyNetwork):
             cmd = 'ip route delete default table %s' % table
             cmd = self.runAsRoot(cmd)
             r = self.CallAtNode(node, cmd)
+            self.route_tables.pop(node, None)
 
     def __add_route(self):
         if self.to == "default" and self.via_device:
@@ -307,6 +325,7 @@ class HappyNodeRoute(HappyNode, HappyNetwork):
             cmd += " dev " + self.via_device
 
         ret = self.CallAtNode(self.node_id, cmd)
+        self.updateNodeRouteTable(self.node_id, family, ret, True, self.to, self.via_address, self.via_device)
 
     def __delete_route(self):
         if self.to == "default" and self.via_device:
@@ -333,120 +352,39 @@ class HappyNodeRoute(HappyNode, HappyNetwork):
             cmd += " dev " + self.via_device
 
         ret = self.CallAtNode(self.node_id, cmd)
+        self.updateNodeRouteTable(self.node_id, family, ret, False, self.to, self.via_address, self.via_device)
 
     def nodeIpv4TableExist(self, node_id):
         # IPv4 table
-        cmd = "ip route"
-        cmd = self.runAsRoot(cmd)
-        out, err = self.CallAtNodeForOutput(node_id, cmd)
-        if out is not None:
-            for line in out.split("\n"):
-                if "proto kernel" in line:
-                    num_dot = line.split()[-1].count('.')
-                    if num_dot == 3:
-                        return True
+        for route in self.getNodeRouteTable(node_id):
+            if happy.HappyRouteTable.Matches(route, family=4) and route["protocol"] == "kernel":
+                return True
         return False
 
     def nodeIpv4DefaultExist(self, node_id):
         # IPv4 Default
-        cmd = "ip route"
-        cmd = self.runAsRoot(cmd)
-        out, err = self.CallAtNodeForOutput(node_id, cmd)
-        if out is not None:
-            for line in out.split("\n"):
-                if "default" in line:
-                    return True
+        for route in self.getNodeRouteTable(node_id):
+            if happy.HappyRouteTable.Matches(route, "default", family=4):
+                return True
         return False
 
     def __nodeRouteExistsViaAddress(self, to, via):
-        via = IP.paddingZeros(via)
-        if to != 'default':
-            to = IP.paddingZeros(to)
+        for route in self.getNodeRouteTable(self.node_id):
+            if not happy.HappyRouteTable.Matches(route, to, via):
+                continue
 
-        # IPv4
-        cmd = "ip route"
-        cmd = self.runAsRoot(cmd)
-        out, err = self.CallAtNodeForOutput(self.node_id, cmd)
-
-        if out is not None:
-            for line in out.split("\n"):
-                l = line.split()
-                if len(l) < 3:
-                    continue
-
-                if to == 'default':
-                    if l[0] == to and l[1] == "via" and IP.paddingZeros(l[2]) == via:
-                        if self.route_table is not None:
-                            if self.nodeIpv4TableExist(self.node_id) is True:
-                                return True
-                        else:
-                            return True
-
-                else:
-                    if IP.paddingZeros(l[0]) == to and l[1] == "via" and IP.paddingZeros(l[2]) == via:
-                        if self.route_table is not None:
-                            if self.nodeIpv4TableExist(self.node_id) is True:
-                                return True
-                        return True
-
-        # IPv6
-        cmd = "ip -6 route"
-        cmd = self.runAsRoot(cmd)
-        out, err = self.CallAtNodeForOutput(self.node_id, cmd)
-
-        if out is not None:
-            for line in out.split("\n"):
-                l = line.split()
-                if len(l) < 3:
-                    continue
-
-                if IP.paddingZeros(l[0]) == to and l[1] == "via" and IP.paddingZeros(l[2]) == via:
+            if route["family"] == 4 and to == 'default' and self.route_table is not None:
+                if self.nodeIpv4TableExist(self.node_id) is True:
                     return True
+            else:
+                return True
 
         return False
 
     def __nodeRouteExistsViaDevice(self, to, dev):
-        if to != 'default':
-            to = IP.paddingZeros(to)
-
-        # IPv4
-        cmd = "ip route"
-        cmd = self.runAsRoot(cmd)
-        out, err = self.CallAtNodeForOutput(self.node_id, cmd)
-
-        if out is not None:
-            for line in out.split("\n"):
-                l = line.split()
-                if len(l) < 3:
-                    continue
-
-                if to == 'default':
-                    if l[0] == to and l[1] == "dev" and l[2] == dev:
-                        if self.route_table is not None:
-                            if self.nodeIpv4TableExist(self.node_id) is True:
-                                return True
-                        return True
-
-                else:
-                    if IP.paddingZeros(l[0]) == to and l[1] == "dev" and l[2] == dev:
-                        if self.route_table is not None:
-                            if self.nodeIpv4TableExist(self.node_id) is True:
-                                return True
-                        return True
-
-        # IPv6
-        cmd = "ip -6 route"
-        cmd = self.runAsRoot(cmd)
-        out, err = self.CallAtNodeForOutput(self.node_id, cmd)
-
-        if out is not None:
-            for line in out.split("\n"):
-                l = line.split()
-                if len(l) < 3:
-                    continue
-
-                if IP.paddingZeros(l[0]) == to and l[1] == "dev" and l[2] == dev:
-                    return True
+        for route in self.getNodeRouteTable(self.node_id):
+            if happy.HappyRouteTable.Matches(route, to, dev=dev):
+                return True
 
         return False
 
@@ -523,11 +461,14 @@ class HappyNodeRoute(HappyNode, HappyNetwork):
             # for TAP device, route will be configured in lwip stack in weave.
             if not self.IsTapDevice(self.node_id):
                 if self.route_table is not None:
-                    with self.getStateLockManager(lock_id="rt"):
+                    # the numbers of the tables are kept in the state
+                    with self.getStateLockManager():
+                        self.readState()
                         if self.add:
                             self.__add_route()
                         else:
                             self.__delete_route()
+                        self.writeState()
                 else:
                     if self.add:
                         self.__add_route()
@@ -31,6 +31,7 @@ import sys
 from happy.ReturnMsg import ReturnMsg
 from happy.Utils import *
 from happy.HappyNode import HappyNode
+from happy.HappyCGroup import HappyCGroup
 from six.moves import range
 
 options = {}
@@ -42,7 +43,7 @@ def option():
     return options.copy()
 
 
-class HappyNodeStatus(HappyNode):
+class HappyNodeStatus(HappyNode, HappyCGroup):
     """
     Displays virtual node information.
 
@@ -57,6 +58,8 @@ class HappyNodeStatus(HappyNode):
 
     $ happy-node-status ThreadNode
         Displays information for the ThreadNode node in JSON format.
+        If the node has a cgroup, its CPU time, memory and I/O usage
+        are reported as well.
 
     return:
         0    success
@@ -65,6 +68,7 @@ class HappyNodeStatus(HappyNode):
 
     def __init__(self, opts=options):
         HappyNode.__init__(self)
+        HappyCGroup.__init__(self)
 
         self.quiet = opts["quiet"]
         self.node_id = opts["node_id"]
@@ -120,7 +124,13 @@ class HappyNodeStatus(HappyNode):
             self.__print_all_nodes()
             return 0
 
-        data_state = json.dumps(self.getNode(self.node_id), sort_keys=True, indent=4)
+        node_info = dict(self.getNode(self.node_id))
+
+        cgroup_stats = self.getNodeCGroupStats(self.node_id)
+        if cgroup_stats != {}:
+            node_info["cgroup_stats"] = cgroup_stats
+
+        data_state = json.dumps(node_info, sort_keys=True, indent=4)
         emsg = "virtual node state: " + self.node_id
 
         print(emsg)
@@ -137,4 +147,4 @@ class HappyNodeStatus(HappyNode):
 
         self.__post_check()
 
-        return ReturnMsg(0)
+        return ReturnMsg(0, node_info)
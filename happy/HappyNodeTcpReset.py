@@ -41,6 +41,7 @@ options["start"] = None
 options["duration"] = None
 options["ips"] = None
 options["dstPort"] = None
+options["rules"] = None
 
 
 def option():
@@ -54,7 +55,7 @@ class HappyNodeTcpReset(HappyNode):
 
     happy-node-tcp-reset [-h --help] [-q --quiet] [-i --id <NODE_NAME>] [--interface <IFACE>]
                          [-s --start <START_TIME>] [-d --duration <DURATION>] [--ips <SOURCE_IP,DEST_IP>]
-                         [--dstPort <DEST_PORT>]
+                         [--dstPort <DEST_PORT>] [--rules <RULES_FILE>]
 
         -i --id         Required. Target node to block connections for. Find using
                         happy-node-list or happy-state.
@@ -63,11 +64,20 @@ class HappyNodeTcpReset(HappyNode):
         -d --duration   Time to maintain TCP block, in seconds from <START_TIME>
            --ips        Source and destination IPs to block connections for.
            --dstPort    Destination port to block connections for.
+           --rules      JSON file of match->action rules to apply instead: reset,
+                        drop, delay or duplicate IPv4 and IPv6 TCP and UDP flows
+                        matched on their 5-tuple, with a probability and, for
+                        reset, a rate. Without --duration they apply until the
+                        TcpReset process is stopped.
 
     Example:
     $ happy-node-tcp-reset --id BorderRouter --interface wlan0 --start 2 --duration 20 --dstPort 11095
         Kills the TCP connection for the BorderRouter node's wlan0 interface for 18 seconds.
 
+    $ happy-node-tcp-reset --id BorderRouter --interface wlan0 --rules rules.json
+        Applies the rules of rules.json, e.g.
+        [{"match": {"proto": "udp", "dst": "fd00::3", "dport": 53}, "action": "drop", "probability": 0.5}]
+
     return:
         0    success
         1    fail
@@ -85,6 +95,7 @@ class HappyNodeTcpReset(HappyNode):
         self.duration = opts["duration"]
         self.ips = opts["ips"]
         self.dstPort = opts["dstPort"]
+        self.rules = opts["rules"]
 
     def __pre_check(self):
         # Check if the name of the node is given
@@ -99,6 +110,11 @@ class HappyNodeTcpReset(HappyNode):
             self.logger.error("[%s] HappyNodeJoin: %s" % (self.node_id, emsg))
             self.exit()
 
+        if self.rules is not None and not os.path.isfile(self.rules):
+            emsg = "rules file %s does not exist." % (self.rules)
+            self.logger.error("[%s] HappyNodeTcpReset: %s" % (self.node_id, emsg))
+            self.exit()
+
     def start_process(self, node_id, cmd, tag, quiet=None, strace=True):
         emsg = "start_weave_process %s at %s node." % (tag, node_id)
         self.logger.debug("[%s] process: %s" % (node_id, emsg))
@@ -114,8 +130,15 @@ class HappyNodeTcpReset(HappyNode):
 
     def __TcpResetConnection(self):
         path = os.path.dirname(os.path.abspath(__file__))
-        cmd = "python " + path + "/HappyPacketProcess.py --interface %s --start %d --duration %d --action RESET " % \
-              (self.interface, self.begin, self.duration)
+        cmd = "python " + path + "/HappyPacketProcess.py --interface %s" % (self.interface)
+        if self.begin is not None:
+            cmd += " --start %d" % self.begin
+        if self.duration is not None:
+            cmd += " --duration %d" % self.duration
+        if self.rules is not None:
+            cmd += " --rules %s" % os.path.abspath(self.rules)
+        else:
+            cmd += " --action RESET"
         if self.ips is not None:
             cmd += " --ips %s" % self.ips
         if self.dstPort is not None:
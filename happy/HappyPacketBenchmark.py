@@ -0,0 +1,318 @@
+#!/usr/bin/env python3
+
+#
+#    Copyright (c) 2021 Google LLC.
+#    All rights reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+#
+
+##
+#    @file
+#       Implements HappyPacketBenchmark class that measures how many packets
+#       HappyPacketProcess processes, how many the kernel drops for it and
+#       how fast it answers them with RSTs, between two virtual nodes.
+#
+
+from __future__ import absolute_import
+from __future__ import print_function
+import json
+import os
+import subprocess
+import sys
+
+from happy.ReturnMsg import ReturnMsg
+from happy.Utils import *
+from happy.utils.IP import IP
+from happy.HappyNetwork import HappyNetwork
+from happy.HappyNode import HappyNode
+from happy.HappyProcess import HappyProcess
+from happy.HappyProcessStats import percentile
+import happy.HappyNetworkAdd
+import happy.HappyNetworkAddress
+import happy.HappyNetworkDelete
+import happy.HappyNodeAdd
+import happy.HappyNodeDelete
+import happy.HappyNodeJoin
+
+options = {}
+options["quiet"] = False
+options["rate"] = 0
+options["count"] = None
+options["flows"] = 16
+options["pcap"] = None
+options["ipv6"] = False
+options["ring"] = False
+options["bpf"] = True
+options["rules"] = None
+options["keep"] = False
+options["output"] = None
+
+network_id = "PacketBench"
+network_type = "wifi"
+sender_id = "PacketBenchSender"
+target_id = "PacketBenchTarget"
+prefixes = ["10.0.250.0/24", "fd00:0:250:1::/64"]
+port = 11095
+percentiles = [50, 90, 99, 100]
+
+
+def option():
+    return options.copy()
+
+
+class HappyPacketBenchmark(HappyNetwork, HappyNode, HappyProcess):
+    """
+    Measures HappyPacketProcess: creates the PacketBench network with a
+    sending and a target node, runs HappyPacketProcess on the target and
+    replays synthetic TCP flows, or a capture, from the sender at a given
+    rate. Reports the packets per second sent and processed, the packets
+    the kernel dropped before HappyPacketProcess could read them and the
+    latency of the RSTs it answers with.
+
+    happy-packet-benchmark [-h --help] [-q --quiet] [-r --rate <PPS>] [-c --count <PACKETS>]
+                           [-f --flows <FLOWS>] [-p --pcap <FILE>] [-6 --ipv6] [--ring] [--no-bpf]
+                           [--rules <RULES_FILE>] [-k --keep] [-o --output <FILE>]
+
+        -r --rate       Optional. Packets per second to send, as fast as
+                        possible by default.
+        -c --count      Optional. Packets to send, 10000 or the packets of
+                        the capture by default.
+        -f --flows      Optional. Synthetic TCP flows, 16 by default.
+        -p --pcap       Optional. pcap or pcapng file to replay instead,
+                        rewritten to the addresses of the nodes.
+        -6 --ipv6       Optional. Send IPv6 instead of IPv4.
+           --ring       Optional. Run HappyPacketProcess with --ring.
+           --no-bpf     Optional. Run HappyPacketProcess with --no-bpf.
+           --rules      Optional. Run HappyPacketProcess with --rules
+                        instead of resetting the flows to port 11095,
+                        which takes an equivalent rules file for IPv6.
+        -k --keep       Optional. Keep the PacketBench network and nodes
+                        for the next run.
+        -o --output     Optional. File to write the results to as JSON.
+
+    Example:
+    $ happy-packet-benchmark --rate 20000 --count 100000
+        Sends 100000 packets at 20000 pps and reports what became of them.
+
+    $ happy-packet-benchmark --ring --pcap /tmp/happy_capture.pcapng --keep
+        Replays a capture to HappyPacketProcess reading a TPACKET_V3 ring.
+
+    return:
+        0    success
+        1    fail
+    """
+
+    def __init__(self, opts=options):
+        HappyNetwork.__init__(self)
+        HappyNode.__init__(self)
+        HappyProcess.__init__(self)
+
+        self.quiet = opts["quiet"]
+        self.rate = opts["rate"]
+        self.count = opts["count"]
+        self.flows = opts["flows"]
+        self.pcap = opts["pcap"]
+        self.ipv6 = opts["ipv6"]
+        self.ring = opts["ring"]
+        self.bpf = opts["bpf"]
+        self.rules = opts["rules"]
+        self.keep = opts["keep"]
+        self.output = opts["output"]
+
+    def __pre_check(self):
+        if self.rate < 0 or (self.count is not None and self.count <= 0) or self.flows <= 0:
+            emsg = "rate, count and flows must be positive."
+            self.logger.error("[localhost] HappyPacketBenchmark: %s" % (emsg))
+            self.exit()
+
+        for path in [self.pcap, self.rules]:
+            if path is not None and not os.path.isfile(path):
+                emsg = "file %s does not exist." % (path)
+                self.logger.error("[localhost] HappyPacketBenchmark: %s" % (emsg))
+                self.exit()
+
+    def __setup(self):
+        for node_id in [sender_id, target_id]:
+            if not self._nodeExists(node_id):
+                options = happy.HappyNodeAdd.option()
+                options["quiet"] = True
+                options["node_id"] = node_id
+                happy.HappyNodeAdd.HappyNodeAdd(options).run()
+                self.readState()
+
+        if not self._networkExists(network_id):
+            options = happy.HappyNetworkAdd.option()
+            options["quiet"] = True
+            options["network_id"] = network_id
+            options["type"] = network_type
+            happy.HappyNetworkAdd.HappyNetworkAdd(options).run()
+            self.readState()
+
+        for node_id in [sender_id, target_id]:
+            if network_id not in self.getNodeNetworkIds(node_id):
+                options = happy.HappyNodeJoin.option()
+                options["quiet"] = True
+                options["node_id"] = node_id
+                options["network_id"] = network_id
+                happy.HappyNodeJoin.HappyNodeJoin(options).run()
+                self.readState()
+
+        for prefix in prefixes:
+            addr, mask = IP.splitAddressMask(prefix)
+            if IP.getPrefix(addr, mask) not in self.getNetworkPrefixes(network_id):
+                options = happy.HappyNetworkAddress.option()
+                options["quiet"] = True
+                options["network_id"] = network_id
+                options["add"] = True
+                options["address"] = prefix
+                happy.HappyNetworkAddress.HappyNetworkAddress(options).run()
+                self.readState()
+
+    def __teardown(self):
+        for node_id in [sender_id, target_id]:
+            options = happy.HappyNodeDelete.option()
+            options["quiet"] = True
+            options["node_id"] = node_id
+            happy.HappyNodeDelete.HappyNodeDelete(options).run()
+
+        options = happy.HappyNetworkDelete.option()
+        options["quiet"] = True
+        options["network_id"] = network_id
+        happy.HappyNetworkDelete.HappyNetworkDelete(options).run()
+
+    def __endpoint(self, node_id):
+        """
+        Returns the interface of node_id on the network and its address of
+        the family benchmarked.
+        """
+        interface_id = self.getNodeInterfacesOnNetwork(network_id, node_id)[0]
+        for addr in self.getNodeInterfaceAddresses(interface_id, node_id):
+            if IP.isIpv6(addr) == self.ipv6 and not addr.lower().startswith("fe80"):
+                return interface_id, addr
+
+        emsg = "node %s has no address to benchmark on." % (node_id)
+        self.logger.error("[%s] HappyPacketBenchmark: %s" % (node_id, emsg))
+        self.exit()
+
+    def __benchmark(self):
+        path = os.path.dirname(os.path.abspath(__file__))
+        sender_interface, sender_addr = self.__endpoint(sender_id)
+        target_interface, target_addr = self.__endpoint(target_id)
+
+        stats = self.process_log_prefix + "packet_benchmark.json"
+        if os.path.exists(stats):
+            os.unlink(stats)
+
+        cmd_list = [sys.executable, path + "/HappyPacketProcess.py", "--quiet", "--interface", target_interface,
+                    "--stats", stats]
+        if self.rules is not None:
+            cmd_list += ["--rules", os.path.abspath(self.rules)]
+        elif self.ipv6:
+            # --dstPort only resets IPv4 flows
+            rules = self.process_log_prefix + "packet_benchmark_rules.json"
+            with open(rules, "w") as f:
+                json.dump([{"match": {"dport": port}, "action": "reset"}], f)
+            cmd_list += ["--rules", rules]
+        else:
+            cmd_list += ["--action", "RESET", "--dstPort", str(port)]
+        if self.ring:
+            cmd_list += ["--ring"]
+        if not self.bpf:
+            cmd_list += ["--no-bpf"]
+        attacker = self.SpawnAtNode(target_id, cmd_list, stdout=subprocess.DEVNULL)
+
+        try:
+            cmd_list = [sys.executable, path + "/HappyPacketReplay.py", "--interface", sender_interface,
+                        "--src", sender_addr, "--dst", target_addr, "--dport", str(port),
+                        "--flows", str(self.flows), "--rate", str(self.rate)]
+            if self.count is not None:
+                cmd_list += ["--count", str(self.count)]
+            if self.pcap is not None:
+                cmd_list += ["--pcap", os.path.abspath(self.pcap)]
+            sender = self.SpawnAtNode(sender_id, cmd_list, stdout=subprocess.PIPE)
+            out, err = sender.communicate()
+        finally:
+            attacker.terminate()
+            attacker.wait()
+
+        try:
+            replay = json.loads(out)
+            with open(stats) as f:
+                sniffer = json.load(f)
+        except (IOError, ValueError):
+            emsg = "no results from HappyPacketReplay or HappyPacketProcess."
+            self.logger.error("[localhost] HappyPacketBenchmark: %s" % (emsg))
+            self.exit()
+
+        if not replay["ready"]:
+            emsg = "HappyPacketProcess did not answer the warm-up probes."
+            self.logger.warning("[localhost] HappyPacketBenchmark: %s" % (emsg))
+
+        results = {}
+        results["sent"] = replay["sent"]
+        results["send_errors"] = replay["send_errors"]
+        results["send_rate"] = replay["rate"]
+        results["received"] = sniffer["received"]
+        # from the first packet sent after the warm-up to the last one processed
+        results["processed_rate"] = 0
+        if sniffer["last"] is not None and sniffer["last"] > replay["begin"]:
+            results["processed_rate"] = sniffer["received"] / (sniffer["last"] - replay["begin"])
+        results["drops"] = sniffer["drops"]
+        results["reset"] = sniffer["reset"]
+        results["answered"] = replay["answered"]
+        results["latency_us"] = {}
+        for p in percentiles:
+            value = percentile(replay["latencies"], p)
+            results["latency_us"]["p%d" % (p)] = None if value is None else value / 1000.0
+        return results
+
+    def __report(self, results):
+        if self.output is not None:
+            with open(self.output, "w") as f:
+                json.dump(results, f, indent=4, sort_keys=True)
+
+        if self.quiet:
+            return
+
+        print("{0: <12} {1: >10} packets, {2: >10.0f} pps, {3} send errors".format(
+              "sent", results["sent"], results["send_rate"], results["send_errors"]))
+        print("{0: <12} {1: >10} packets, {2: >10.0f} pps, {3} dropped by the kernel".format(
+              "processed", results["received"], results["processed_rate"], results["drops"]))
+        print("{0: <12} {1: >10} packets, {2: >10} answered in time".format(
+              "reset", results["reset"], results["answered"]))
+        latency = results["latency_us"]
+        if latency["p50"] is not None:
+            print("{0: <12} ".format("RST latency") +
+                  ", ".join(["p%d %.1f us" % (p, latency["p%d" % (p)]) for p in percentiles[:-1]]) +
+                  ", max %.1f us" % (latency["p100"]))
+
+    def run(self):
+        with self.getStateLockManager():
+
+            self.readState()
+
+            self.__pre_check()
+
+            self.__setup()
+
+        try:
+            results = self.__benchmark()
+        finally:
+            if not self.keep:
+                with self.getStateLockManager():
+                    self.__teardown()
+
+        self.__report(results)
+
+        return ReturnMsg(0, results)
@@ -24,19 +24,39 @@
 #       python HappyPacketProcess.py  --interface "wlan0" --action "RESET" --ips "107.22.61.55,10.0.1.2" --start "2" --duration 6
 #       python HappyPacketProcess.py  --interface "wlan0" --action "RESET" --dstPort "11095" --start "2" --duration "20"
 #
+#       The filter is compiled into a classic BPF program attached to the sniffer socket, so only
+#       candidate packets are copied to userspace; --no-bpf filters in userspace only.
+#       --ring receives through a TPACKET_V3 mmap ring of --ring-blocks blocks of --ring-block-size
+#       bytes, handed over at the latest --ring-timeout milliseconds after their first frame.
+#       Packets are answered from the same loop that receives them.
+#
+#       --rules reads match->action rules from a JSON file instead, see LoadRules:
+#       python HappyPacketProcess.py  --interface "wlan0" --rules "rules.json" --duration "20"
+#       Reset rules are matched against sniffed IPv4 and IPv6 TCP packets with hashed lookups;
+#       drop, delay and duplicate rules are applied by tc to the packets leaving the interface.
+#       --action also takes DROP, DELAY and DUPLICATE, with --probability and --delay in ms.
+#
+#       --stats writes the packets received, reset and dropped by the kernel, and the times the
+#       first and the last packet were received, as JSON to a file on exit, see HappyPacketBenchmark.
 #
 
 from __future__ import absolute_import
 from __future__ import print_function
 from datetime import datetime
+import ctypes
+import errno
 import getopt
+import json
 import logging
+import mmap
 import multiprocessing
 import os
 import socket
 import random
-from struct import *
+import select
 import signal
+from struct import *
+import subprocess
 import sys
 import time
 from six.moves import range
@@ -49,6 +69,46 @@ options['ips'] = None
 options['dstPort'] = None
 options['start'] = None
 options['duration'] = None
+options['rules'] = None
+options['probability'] = 1.0
+options['delay'] = None
+options['bpf'] = True
+options['ring'] = False
+options['ringBlockSize'] = 1 << 20
+options['ringBlocks'] = 8
+options['ringTimeout'] = 1
+options['stats'] = None
+
+ETH_P_ALL = 0x0003
+ETH_P_IP = 0x0800
+ETH_P_IPV6 = 0x86DD
+SO_ATTACH_FILTER = 26
+
+SOL_PACKET = 263
+PACKET_RX_RING = 5
+PACKET_STATISTICS = 6
+PACKET_VERSION = 10
+TPACKET_V3 = 2
+TP_STATUS_KERNEL = 0
+TP_STATUS_USER = 1
+
+# Classic BPF opcodes used by CompileFilter
+BPF_LD_W_ABS = 0x20
+BPF_LD_H_ABS = 0x28
+BPF_LD_B_ABS = 0x30
+BPF_LDX_B_MSH = 0xb1
+BPF_LD_H_IND = 0x48
+BPF_LD_B_IND = 0x50
+BPF_JEQ_K = 0x15
+BPF_JSET_K = 0x45
+BPF_RET_K = 0x06
+
+TCP_FIN = 0x01
+TCP_SYN = 0x02
+TCP_RST = 0x04
+
+# Headers are all the sniffer looks at: Ethernet + IPv4 and TCP with options.
+snapLength = 14 + 60 + 60
 
 
 def MergeDicts(*dictArguments):
@@ -58,11 +118,321 @@ def MergeDicts(*dictArguments):
     return merged
 
 
+def OnesComplementSum(value):
+    """
+    Returns the 16-bit ones' complement sum of the big-endian words of
+    value. As 0x10000 is 1 modulo 0xffff, the sum is the whole buffer read
+    as one integer modulo 0xffff, which runs in C instead of a word loop.
+    """
+    if len(value) % 2:
+        value = bytes(value) + b'\x00'
+    total = int.from_bytes(value, 'big')
+    if total == 0:
+        return 0
+    # a non-zero sum is never the negative zero 0x0000
+    return total % 0xffff or 0xffff
+
+
 def CheckSumCalculation(value):
-    checkSum = 0
-    for i in range(0, len(value), 2):
-        checkSum += (ord(value[i]) << 8) + (ord(value[i + 1]))
-    return ~((checkSum >> 16) + (checkSum & 0xffff)) & 0xffff
+    """
+    Returns the Internet checksum (RFC 1071) of value.
+    """
+    return ~OnesComplementSum(value) & 0xffff
+
+
+def ChecksumUpdate(checkSum, old, new):
+    """
+    Returns checkSum updated for a change of some of the covered bytes from
+    old to new, both of the same even length and at an even offset, as
+    HC' = ~(~HC + ~m + m') of RFC 1624 (eqn. 3).
+    """
+    total = ((~checkSum & 0xffff) - OnesComplementSum(old) + OnesComplementSum(new)) % 0xffff
+    if total == 0:
+        return 0
+    return ~total & 0xffff
+
+
+def AssembleFilter(program):
+    """
+    Resolves the labels of program, a list of (code, k, jt, jf) instructions
+    and label strings, where jt and jf name a label or are None to fall
+    through to the next instruction. Returns a list of (code, jt, jf, k)
+    instructions.
+    """
+    labels = {}
+    index = 0
+    for ins in program:
+        if isinstance(ins, str):
+            labels[ins] = index
+        else:
+            index += 1
+
+    compiled = []
+    for ins in program:
+        if isinstance(ins, str):
+            continue
+        code, k, jt, jf = ins
+        here = len(compiled)
+        offsets = []
+        for label in [jt, jf]:
+            if label is None:
+                offsets.append(0)
+                continue
+            offset = labels[label] - here - 1
+            if offset > 255:
+                raise ValueError("BPF jump to %s out of range" % (label))
+            offsets.append(offset)
+        compiled.append((code, offsets[0], offsets[1], k))
+
+    return compiled
+
+
+def CompileFilter(options, snaplen=snapLength):
+    """
+    Compiles the Filter rules into a classic BPF program that accepts only
+    IPv4 TCP segments without SYN, FIN or RST, to options['dstPort'] if
+    set, between two of options['ips'] if set. Accepted frames are cut to
+    snaplen bytes. Returns a list of (code, jt, jf, k) instructions.
+    """
+    program = []
+
+    def emit(code, k=0, jt=None, jf=None):
+        program.append((code, k, jt, jf))
+
+    emit(BPF_LD_H_ABS, 12)
+    emit(BPF_JEQ_K, ETH_P_IP, jf="drop")
+    emit(BPF_LD_B_ABS, 23)
+    emit(BPF_JEQ_K, socket.IPPROTO_TCP, jf="drop")
+    # the TCP header is only in the first fragment
+    emit(BPF_LD_H_ABS, 20)
+    emit(BPF_JSET_K, 0x1fff, jt="drop")
+
+    if options['ips'] is not None:
+        addresses = [unpack('!I', socket.inet_aton(ip))[0] for ip in options['ips']]
+        for offset, label in [(26, "src"), (30, "dst")]:
+            emit(BPF_LD_W_ABS, offset)
+            for i, address in enumerate(addresses):
+                last = i == len(addresses) - 1
+                emit(BPF_JEQ_K, address, jt=label, jf="drop" if last else None)
+            program.append(label)
+
+    emit(BPF_LDX_B_MSH, 14)
+
+    if options['dstPort'] is not None:
+        emit(BPF_LD_H_IND, 14 + 2)
+        emit(BPF_JEQ_K, options['dstPort'], jf="drop")
+
+    emit(BPF_LD_B_IND, 14 + 13)
+    emit(BPF_JSET_K, TCP_FIN | TCP_SYN | TCP_RST, jt="drop")
+    emit(BPF_RET_K, snaplen)
+    program.append("drop")
+    emit(BPF_RET_K, 0)
+
+    return AssembleFilter(program)
+
+
+def CompileResetFilter(snaplen=snapLength):
+    """
+    Compiles a classic BPF program that accepts IPv4 and IPv6 TCP segments
+    without SYN, FIN or RST, the packets reset rules can apply to; which
+    flows they are is left to the RuleTable. IPv6 packets with extension
+    headers are not accepted.
+    """
+    flags = TCP_FIN | TCP_SYN | TCP_RST
+    return AssembleFilter([
+        (BPF_LD_H_ABS, 12, None, None),
+        (BPF_JEQ_K, ETH_P_IP, None, "ipv6"),
+        (BPF_LD_B_ABS, 23, None, None),
+        (BPF_JEQ_K, socket.IPPROTO_TCP, None, "drop"),
+        (BPF_LD_H_ABS, 20, None, None),
+        (BPF_JSET_K, 0x1fff, "drop", None),
+        (BPF_LDX_B_MSH, 14, None, None),
+        (BPF_LD_B_IND, 14 + 13, None, None),
+        (BPF_JSET_K, flags, "drop", None),
+        (BPF_RET_K, snaplen, None, None),
+        "ipv6",
+        (BPF_JEQ_K, ETH_P_IPV6, None, "drop"),
+        (BPF_LD_B_ABS, 14 + 6, None, None),
+        (BPF_JEQ_K, socket.IPPROTO_TCP, None, "drop"),
+        (BPF_LD_B_ABS, 14 + 40 + 13, None, None),
+        (BPF_JSET_K, flags, "drop", None),
+        (BPF_RET_K, snaplen, None, None),
+        "drop",
+        (BPF_RET_K, 0, None, None)])
+
+
+def AttachFilter(sock, program):
+    """
+    Attaches a classic BPF program from CompileFilter to sock with
+    SO_ATTACH_FILTER.
+    """
+    code = b"".join([pack('HBBI', *ins) for ins in program])
+    buf = ctypes.create_string_buffer(code, len(code))
+    # struct sock_fprog; the kernel copies the program before returning
+    fprog = pack('HP', len(program), ctypes.addressof(buf))
+    sock.setsockopt(socket.SOL_SOCKET, SO_ATTACH_FILTER, fprog)
+
+
+class PacketRing(object):
+    """
+    A PACKET_MMAP TPACKET_V3 receive ring on an AF_PACKET socket. The kernel
+    fills blocks of blockSize bytes with frames and hands a block over once
+    it is full or blockTimeout milliseconds after its first frame; frames
+    are then read in place from the shared mapping, without a syscall per
+    frame. Must be set up before the socket is bound.
+    """
+
+    def __init__(self, sock, blockSize, blocks, blockTimeout, frameSize=2048):
+        if blockSize % mmap.PAGESIZE != 0:
+            raise ValueError("ring block size must be a multiple of %d" % (mmap.PAGESIZE))
+
+        self.sock = sock
+        self.blockSize = blockSize
+        self.blocks = blocks
+        self.block = 0
+
+        sock.setsockopt(SOL_PACKET, PACKET_VERSION, TPACKET_V3)
+        # struct tpacket_req3
+        req = pack('7I', blockSize, blocks, frameSize, (blockSize // frameSize) * blocks,
+                   blockTimeout, 0, 0)
+        sock.setsockopt(SOL_PACKET, PACKET_RX_RING, req)
+
+        self.map = mmap.mmap(sock.fileno(), blockSize * blocks, mmap.MAP_SHARED,
+                             mmap.PROT_READ | mmap.PROT_WRITE)
+        self.poller = select.poll()
+        self.poller.register(sock.fileno(), select.POLLIN | select.POLLERR)
+
+    def Frames(self, timeout=None):
+        """
+        Yields (buffer, offset, length) for every frame. A frame is only
+        valid until the next one is requested. Yields (None, 0, 0) when
+        nothing arrived within timeout seconds.
+        """
+        for buf, offset, snaplen, length, sec, nsec in self.Packets(timeout):
+            yield buf, offset, snaplen
+
+    def Packets(self, timeout=None):
+        """
+        Like Frames, but yields (buffer, offset, snaplen, length, sec, nsec)
+        with the length of the frame on the wire and the time it was
+        received, or (None, 0, 0, 0, 0, 0) when nothing arrived. Raises
+        OSError once the frames received are read and the socket reports
+        an error, e.g. ENETDOWN when its interface is deleted.
+        """
+        ringMap = self.map
+        blockStatus = Struct('I')
+        blockHeader = Struct('II')
+        # tp_next_offset, tp_sec, tp_nsec, tp_snaplen, tp_len and tp_mac of
+        # struct tpacket3_hdr
+        frameHeader = Struct('IIIII4xH')
+        pollTimeout = None if timeout is None else int(timeout * 1000)
+
+        while True:
+            base = self.block * self.blockSize
+
+            if not blockStatus.unpack_from(ringMap, base + 8)[0] & TP_STATUS_USER:
+                for fd, event in self.poller.poll(pollTimeout):
+                    if event & (select.POLLERR | select.POLLHUP | select.POLLNVAL):
+                        # reading the error clears it, the next poll would
+                        # otherwise return at once, forever
+                        error = self.sock.getsockopt(socket.SOL_SOCKET, socket.SO_ERROR) or errno.ENETDOWN
+                        raise OSError(error, os.strerror(error))
+                # the block may still not be ready after a wakeup
+                if not blockStatus.unpack_from(ringMap, base + 8)[0] & TP_STATUS_USER:
+                    yield None, 0, 0, 0, 0, 0
+                continue
+
+            frames, offset = blockHeader.unpack_from(ringMap, base + 12)
+            offset += base
+            for i in range(frames):
+                nextOffset, sec, nsec, snaplen, length, mac = frameHeader.unpack_from(ringMap, offset)
+                yield ringMap, offset + mac, snaplen, length, sec, nsec
+                offset += nextOffset
+
+            # hand the block back to the kernel
+            blockStatus.pack_into(ringMap, base + 8, TP_STATUS_KERNEL)
+            self.block = (self.block + 1) % self.blocks
+
+    def Close(self):
+        self.poller.unregister(self.sock.fileno())
+        self.map.close()
+
+
+class FrameReceiver(object):
+    """
+    Receives frames from an AF_PACKET socket on interface. Unless
+    options['bpf'] is False, program, by default the CompileFilter one, is
+    attached before the socket is bound, so no unfiltered frame is ever
+    queued on it. With
+    options['ring'] frames are read from a PacketRing, falling back to one
+    recv_into() per frame when the ring cannot be set up.
+    """
+
+    def __init__(self, interface, options, program=None):
+        self.ring = None
+        self.program = program
+        self.sock = self.__open(options)
+
+        if options['ring']:
+            try:
+                self.ring = PacketRing(self.sock, options['ringBlockSize'], options['ringBlocks'],
+                                       options['ringTimeout'])
+            except (OSError, ValueError) as e:
+                logger = multiprocessing.get_logger()
+                logger.warning("TPACKET_V3 ring not available, receiving with recv: %s" % (str(e)))
+                # a half configured ring would still swallow the frames
+                self.sock.close()
+                self.sock = self.__open(options)
+
+        self.sock.bind((interface, ETH_P_ALL))
+
+    def __open(self, options):
+        sock = socket.socket(socket.AF_PACKET, socket.SOCK_RAW, 0)
+
+        if options['bpf']:
+            try:
+                program = self.program
+                if program is None:
+                    program = CompileFilter(options)
+                AttachFilter(sock, program)
+            except (OSError, ValueError) as e:
+                logger = multiprocessing.get_logger()
+                logger.warning("BPF filter not attached, filtering in userspace only: %s" % (str(e)))
+
+        return sock
+
+    def Frames(self, timeout=None):
+        """
+        Yields (buffer, offset, length) for every frame. A frame is only
+        valid until the next one is requested. Yields (None, 0, 0) when
+        nothing arrived within timeout seconds.
+        """
+        if self.ring is not None:
+            for frame in self.ring.Frames(timeout):
+                yield frame
+            return
+
+        buf = bytearray(65535)
+        self.sock.settimeout(timeout)
+        while True:
+            try:
+                length = self.sock.recv_into(buf)
+            except socket.timeout:
+                yield None, 0, 0
+                continue
+            yield buf, 0, length
+
+    def Statistics(self):
+        """
+        Returns the number of frames the kernel queued and dropped on the
+        socket since the last call.
+        """
+        return unpack('II', self.sock.getsockopt(SOL_PACKET, PACKET_STATISTICS, 8))
+
+    def Close(self):
+        if self.ring is not None:
+            self.ring.Close()
+        self.sock.close()
 
 
 class EthernetFrame(object):
@@ -88,8 +458,7 @@ class EthernetFrame(object):
         return eth
 
     def GetEthernetAddr(self, addr):
-        return "%.2x:%.2x:%.2x:%.2x:%.2x:%.2x" % \
-               (ord(addr[0]), ord(addr[1]), ord(addr[2]), ord(addr[3]), ord(addr[4]), ord(addr[5]))
+        return "%.2x:%.2x:%.2x:%.2x:%.2x:%.2x" % tuple(bytearray(addr[0:6]))
 
     def GetEthernetHeaderDic(self):
         return {'ethProto': self.ethProto, 'ethDest': self.ethDest, 'ethSource': self.ethSource}
@@ -359,129 +728,648 @@ class Filter(object):
             return False
 
 
-class TimeoutControl():
-    class TimeoutControl(Exception):
-        pass
+_ethTypeStruct = Struct('!H')
+_ipv4FlowStruct = Struct('!B5xHxB2xII')
+_ipv6FlowStruct = Struct('!6xBxQQQQ')
+_tcpFlowStruct = Struct('!HHLLxB')
+_udpFlowStruct = Struct('!HH')
 
-    def __init__(self, second):
-        self.second = second
 
-    def __enter__(self):
-        signal.signal(signal.SIGALRM, self.RaiseException)
-        signal.alarm(self.second)
+def ParseAddr(addr):
+    """
+    Returns the family, 4 or 6, and the integer value of an IPv4 or IPv6
+    address string. Raises ValueError if addr is neither.
+    """
+    try:
+        if ':' in addr:
+            return 6, int.from_bytes(socket.inet_pton(socket.AF_INET6, addr), 'big')
+        return 4, unpack('!I', socket.inet_pton(socket.AF_INET, addr))[0]
+    except (OSError, TypeError):
+        raise ValueError("invalid address %s" % (addr))
 
-    def __exit__(self, *args):
-        signal.alarm(0)
 
-    def RaiseException(self, *args):
-        raise TimeoutControl.TimeoutControl()
+def FormatAddr(family, value):
+    if family == 6:
+        return socket.inet_ntop(socket.AF_INET6, value.to_bytes(16, 'big'))
+    return socket.inet_ntoa(pack('!I', value))
 
 
-def Sniffer(packetList, e):
-    logger = multiprocessing.get_logger()
-    snifferSocket = socket.socket(
-        socket.AF_PACKET,
-        socket.SOCK_RAW,
-        socket.ntohs(0x0003)
-    )
-    snifferSocket.bind((options['interface'], 0))
+class FlowRecord(object):
+    """
+    The flow of one IPv4 or IPv6 TCP or UDP packet, decoded in place by
+    FlowDecoder: the family (4 or 6), the protocol, the addresses as
+    integers, the ports and, for TCP, the flags, sequence and
+    acknowledgement numbers.
+    """
+    __slots__ = ('family', 'proto', 'src', 'dst', 'sport', 'dport', 'flags', 'seq', 'ack')
 
-    logger.info("Sniffer and process packets, Press Ctrl-C to stop.")
+    def Flow(self):
+        return (self.family, self.proto, self.src, self.dst, self.sport, self.dport)
 
-    while True:
-        packets = snifferSocket.recvfrom(65535)
-        packet = packets[0]
-        ethernetFrame = EthernetFrame()
-        ethernetFrame.Decode(packet)
 
-        if ethernetFrame.ethProto == 8:
-            ipPacket = IPv4Packet()
-            ipPacket.Decode(ethernetFrame.payload)
+class FlowDecoder(object):
+    """
+    Decodes the flow of IPv4 and IPv6 TCP and UDP frames straight from a
+    receive buffer into one reusable FlowRecord. Non-first IPv4 fragments
+    and IPv6 packets with extension headers are skipped.
+    """
+    __slots__ = ('record',)
 
-            if ipPacket.ipProtocol == 6:
-                tcpPacket = TCPPacket()
-                tcpPacket.Decode(ipPacket.payload)
-            else:
+    def __init__(self):
+        self.record = FlowRecord()
+
+    def Process(self, buf, length, offset=0):
+        """
+        Returns the FlowRecord of the frame of length bytes at offset in
+        buf, or None if it is not a TCP or UDP packet. The record is
+        overwritten by the next call.
+        """
+        end = offset + length
+        if end < offset + 14 + 20:
+            return None
+
+        record = self.record
+        ethProto, = _ethTypeStruct.unpack_from(buf, offset + 12)
+        if ethProto == ETH_P_IP:
+            versionIhl, fragment, proto, record.src, record.dst = _ipv4FlowStruct.unpack_from(buf, offset + 14)
+            if fragment & 0x1fff:
+                return None
+            record.family = 4
+            l4Offset = offset + 14 + (versionIhl & 0xF) * 4
+        elif ethProto == ETH_P_IPV6:
+            if end < offset + 14 + 40:
+                return None
+            proto, srcHigh, srcLow, dstHigh, dstLow = _ipv6FlowStruct.unpack_from(buf, offset + 14)
+            record.src = (srcHigh << 64) | srcLow
+            record.dst = (dstHigh << 64) | dstLow
+            record.family = 6
+            l4Offset = offset + 14 + 40
+        else:
+            return None
+
+        if proto == socket.IPPROTO_TCP:
+            if end < l4Offset + 14:
+                return None
+            record.sport, record.dport, record.seq, record.ack, record.flags = \
+                _tcpFlowStruct.unpack_from(buf, l4Offset)
+        elif proto == socket.IPPROTO_UDP:
+            if end < l4Offset + 8:
+                return None
+            record.sport, record.dport = _udpFlowStruct.unpack_from(buf, l4Offset)
+            record.seq = record.ack = record.flags = 0
+        else:
+            return None
+        record.proto = proto
+
+        return record
+
+
+class ResetTemplate(object):
+    """
+    A TCP RST over IPv4 or, with family AF_INET6, IPv6, built once. Per
+    flow only the IP id, the addresses, the ports and the sequence number
+    are patched in, and the checksums are updated per RFC 1624 from the
+    ones of the template instead of being computed again.
+    """
+
+    def __init__(self, family=socket.AF_INET):
+        self.family = family
+
+        tcpPacket = TCPPacket()
+        tcpPacket.SetTcpDoffReserved((5 << 4) + 0)
+        tcpPacket.SetTcpRstBit(1)
+        tcpPacket.SetTcpFlags()
+        tcpHeader = tcpPacket.Encode()
+
+        if family == socket.AF_INET6:
+            # version, payload length, next header and hop limit
+            ipHeader = pack('!IHBB16s16s', 6 << 28, len(tcpHeader), socket.IPPROTO_TCP, 255,
+                            bytes(16), bytes(16))
+            psudoHeader = pack('!16s16sI3xB', bytes(16), bytes(16), len(tcpHeader), socket.IPPROTO_TCP)
+            tcpPacket.SetTcpCheck(psudoHeader + tcpHeader)
+
+            self.packet = bytearray(ipHeader + tcpPacket.Encode())
+            self.tcpCheck = tcpPacket.tcpCheck
+            # addresses, ports and sequence number are contiguous
+            self.tcpFields = bytes(40)
+            return
+
+        ipPacket = IPv4Packet()
+        ihl = 5
+        version = 4
+        ipPacket.SetIpVersionIhl((version << 4) + ihl)
+        ipPacket.SetIpLen(40)
+        ipPacket.SetIpTTL(255)
+        ipPacket.SetIpProtocol(socket.IPPROTO_TCP)
+        ipPacket.SetIpSrc("0.0.0.0")
+        ipPacket.SetIpDst("0.0.0.0")
+        ipPacket.SetIpSum(ipPacket.Encode())
+        ipHeader = ipPacket.Encode()
+
+        psudoHeader = pack('!4s4sBBH', ipHeader[12:16], ipHeader[16:20], 0, socket.IPPROTO_TCP, len(tcpHeader))
+        tcpPacket.SetTcpCheck(psudoHeader + tcpHeader)
+        tcpHeader = tcpPacket.Encode()
+
+        self.packet = bytearray(ipHeader + tcpHeader)
+        self.ipSum = ipPacket.ipSum
+        self.tcpCheck = tcpPacket.tcpCheck
+        # every patched field is zero in the template
+        self.ipFields = bytes(10)
+        self.tcpFields = bytes(16)
+
+    def Build(self, srcAddr, dstAddr, srcPort, dstPort, seq, ipId=0):
+        """
+        Returns the RST from srcAddr:srcPort to dstAddr:dstPort, addresses
+        as integers. The returned buffer is reused by the next call.
+        """
+        packet = self.packet
+
+        if self.family == socket.AF_INET6:
+            pack_into('!QQQQ', packet, 8, srcAddr >> 64, srcAddr & 0xffffffffffffffff,
+                      dstAddr >> 64, dstAddr & 0xffffffffffffffff)
+            pack_into('!HHL', packet, 40, srcPort, dstPort, seq)
+            pack_into('!H', packet, 56, ChecksumUpdate(self.tcpCheck, self.tcpFields, packet[8:48]))
+            return packet
+
+        pack_into('!H', packet, 4, ipId)
+        pack_into('!II', packet, 12, srcAddr, dstAddr)
+        pack_into('!HHL', packet, 20, srcPort, dstPort, seq)
+
+        # the TCP pseudo header covers the addresses too
+        pack_into('!H', packet, 10, ChecksumUpdate(self.ipSum, self.ipFields, packet[4:6] + packet[12:20]))
+        pack_into('!H', packet, 36, ChecksumUpdate(self.tcpCheck, self.tcpFields, packet[12:28]))
+
+        return packet
+
+
+ruleActions = ["reset", "drop", "delay", "duplicate"]
+# Carried out by TrafficControl in the kernel; resets are sent by the Attacker.
+tcActions = ["drop", "delay", "duplicate"]
+ruleMatchFields = ['family', 'proto', 'src', 'dst', 'sport', 'dport']
+ruleProtocols = {"tcp": socket.IPPROTO_TCP, "udp": socket.IPPROTO_UDP}
+
+
+class Rule(object):
+    """
+    One match→action rule. match may hold family (4 or 6), proto ("tcp" or
+    "udp"), src and dst addresses and sport and dport; a missing field
+    matches anything. action is one of ruleActions. The action is applied
+    to a matching packet with the given probability and, for reset, at
+    most rate times per second. delay is in milliseconds. Rules earlier in
+    a table, with a lower priority, win. Raises ValueError on a bad rule.
+    """
+    __slots__ = ('family', 'proto', 'src', 'dst', 'sport', 'dport', 'action', 'probability', 'rate',
+                 'delay', 'priority', 'tokens', 'stamp', 'hits', 'applied')
+
+    def __init__(self, action, match=None, probability=1.0, rate=None, delay=None, priority=0):
+        match = match or {}
+        for field in match:
+            if field not in ruleMatchFields:
+                raise ValueError("unknown match field %s" % (field))
+
+        self.action = str(action).lower()
+        if self.action not in ruleActions:
+            raise ValueError("unknown action %s" % (action))
+
+        self.family = match.get('family')
+        if self.family not in (None, 4, 6):
+            raise ValueError("family must be 4 or 6")
+
+        self.src = self.dst = None
+        for field in ['src', 'dst']:
+            if match.get(field) is None:
                 continue
-
+            family, value = ParseAddr(match[field])
+            if self.family not in (None, family):
+                raise ValueError("%s %s is not an IPv%d address" % (field, match[field], self.family))
+            self.family = family
+            setattr(self, field, value)
+
+        self.proto = match.get('proto')
+        if self.proto is None and self.action == "reset":
+            self.proto = "tcp"
+        if self.proto is not None:
+            if self.proto not in ruleProtocols:
+                raise ValueError("proto must be one of %s" % (", ".join(ruleProtocols)))
+            self.proto = ruleProtocols[self.proto]
+        if self.action == "reset" and self.proto != socket.IPPROTO_TCP:
+            raise ValueError("only TCP connections can be reset")
+
+        self.sport = match.get('sport')
+        self.dport = match.get('dport')
+        for port in [self.sport, self.dport]:
+            if port is None:
+                continue
+            if self.proto is None:
+                raise ValueError("matching on ports needs a proto")
+            if not 0 <= port <= 0xffff:
+                raise ValueError("invalid port %s" % (port))
+
+        self.probability = float(probability)
+        if not 0.0 <= self.probability <= 1.0:
+            raise ValueError("probability must be between 0 and 1")
+
+        self.rate = rate
+        if rate is not None:
+            if self.action != "reset":
+                raise ValueError("rate only applies to reset")
+            if rate <= 0:
+                raise ValueError("rate must be positive")
+
+        self.delay = delay
+        if self.action == "delay" and (delay is None or delay <= 0):
+            raise ValueError("delay needs a positive delay in milliseconds")
+
+        self.priority = priority
+        self.tokens = rate
+        self.stamp = time.monotonic()
+        self.hits = 0
+        self.applied = 0
+
+    def Mask(self):
+        return tuple([getattr(self, field) is not None for field in ruleMatchFields])
+
+    def Key(self):
+        return tuple([getattr(self, field) for field in ruleMatchFields])
+
+    def Allow(self, now):
+        """
+        Counts a matching packet and returns whether the action applies to
+        it, given the probability and the rate.
+        """
+        self.hits += 1
+        if self.probability < 1.0 and random.random() >= self.probability:
+            return False
+        if self.rate is not None:
+            self.tokens = min(self.rate, self.tokens + (now - self.stamp) * self.rate)
+            self.stamp = now
+            if self.tokens < 1:
+                return False
+            self.tokens -= 1
+        self.applied += 1
+        return True
+
+    def FlowerMatches(self):
+        """
+        Returns (protocol, flower match) pairs for tc, one per family the
+        rule covers.
+        """
+        if self.family is None and self.proto is None:
+            return [("all", "")]
+
+        families = [self.family] if self.family is not None else [4, 6]
+        matches = []
+        for family in families:
+            words = []
+            if self.proto is not None:
+                words.append("ip_proto %s" % ("tcp" if self.proto == socket.IPPROTO_TCP else "udp"))
+            for field, value in [("src_ip", self.src), ("dst_ip", self.dst)]:
+                if value is not None:
+                    words.append("%s %s" % (field, FormatAddr(family, value)))
+            for field, value in [("src_port", self.sport), ("dst_port", self.dport)]:
+                if value is not None:
+                    words.append("%s %d" % (field, value))
+            matches.append(("ip" if family == 4 else "ipv6", " ".join(words)))
+        return matches
+
+    def __str__(self):
+        words = [self.action]
+        for field in ruleMatchFields:
+            value = getattr(self, field)
+            if value is None:
+                continue
+            if field in ['src', 'dst']:
+                value = FormatAddr(self.family, value)
+            words.append("%s %s" % (field, value))
+        return " ".join(words)
+
+
+def LoadRules(path):
+    """
+    Reads rules from a JSON file holding a list of objects with the
+    arguments of Rule, e.g.
+    [{"match": {"proto": "tcp", "dst": "10.0.1.3", "dport": 11095}, "action": "reset", "rate": 10},
+     {"match": {"proto": "udp", "dst": "fd00::3"}, "action": "delay", "delay": 100, "probability": 0.5}]
+    """
+    with open(path) as f:
+        entries = json.load(f)
+
+    rules = []
+    for entry in entries:
+        rules.append(Rule(entry.get('action'), entry.get('match'), entry.get('probability', 1.0),
+                          entry.get('rate'), entry.get('delay'), len(rules)))
+    return rules
+
+
+def Rules(options):
+    """
+    Returns the rules of options['rules'] if set, or else the ones of the
+    --action, --ips and --dstPort options: TCP packets between two of the
+    ips, to dstPort.
+    """
+    if options['rules'] is not None:
+        return LoadRules(options['rules'])
+
+    match = {"proto": "tcp"}
+    if options['dstPort'] is not None:
+        match['dport'] = options['dstPort']
+
+    matches = [match]
+    if options['ips'] is not None:
+        matches = [dict(match, src=src, dst=dst) for src in options['ips'] for dst in options['ips']]
+
+    return [Rule(options['action'], m, options['probability'], None, options['delay'], i)
+            for i, m in enumerate(matches)]
+
+
+class RuleTable(object):
+    """
+    Looks rules up by tuple space search: rules are grouped by which match
+    fields they leave as wildcards, and each group is a dictionary keyed by
+    the fields it matches on. A packet costs one dictionary lookup per
+    group, however many rules there are, and the result is cached per flow
+    so later packets of a flow cost a single lookup.
+    """
+
+    def __init__(self, cacheSize=65536):
+        self.groups = []
+        self.rules = []
+        self.cache = {}
+        self.cacheSize = cacheSize
+
+    def __len__(self):
+        return len(self.rules)
+
+    def Add(self, rule):
+        mask = rule.Mask()
+        for groupMask, group in self.groups:
+            if groupMask == mask:
+                break
         else:
-            continue
-
-        packetDic = MergeDicts(ethernetFrame.GetEthernetHeaderDic(), ipPacket.GetIpv4HeaderDic(),
-                               tcpPacket.GetTcpHeaderDic())
-        logger.debug(packetDic)
-        snifferFilter = Filter(packetDic, options)
-        if snifferFilter.run() is True:
-            continue
-        print(packetDic)
-        packetList.append(packetDic)
-        e.set()
-
-    snifferSocket.close()
+            group = {}
+            self.groups.append((mask, group))
+
+        # as in a linear scan, the first rule for the same match wins
+        group.setdefault(rule.Key(), rule)
+        self.rules.append(rule)
+        self.cache.clear()
+
+    def Lookup(self, record):
+        """
+        Returns the rule with the lowest priority matching the flow of the
+        FlowRecord, or None.
+        """
+        flow = record.Flow()
+        try:
+            return self.cache[flow]
+        except KeyError:
+            pass
+
+        match = None
+        for mask, group in self.groups:
+            rule = group.get(tuple([value if used else None for value, used in zip(flow, mask)]))
+            if rule is not None and (match is None or rule.priority < match.priority):
+                match = rule
+
+        if len(self.cache) >= self.cacheSize:
+            self.cache.clear()
+        self.cache[flow] = match
+        return match
+
+
+class TrafficControl(object):
+    """
+    Applies drop, delay and duplicate rules to the packets leaving an
+    interface with tc: a prio root qdisc gets one netem band per distinct
+    action, probability and delay, and matching packets are steered into
+    their band by one flower classifier per protocol. Like RuleTable,
+    flower hashes a packet once per distinct mask, so the cost per packet
+    does not grow with the number of rules.
+    """
+    # prio has at most 16 bands and the first one is for other traffic
+    maxProfiles = 15
+    filterPriorities = {"ip": 1, "ipv6": 2, "all": 3}
+
+    def __init__(self, interface, rules):
+        self.interface = interface
+        self.rules = rules
+        self.installed = False
+
+    def __netem(self, action, probability, delay):
+        percent = probability * 100
+        if action == "drop":
+            return "loss %g%%" % (percent)
+        if action == "duplicate":
+            return "duplicate %g%%" % (percent)
+        # netem sends the reorder share of the packets without the delay
+        netem = "delay %dms" % (delay)
+        if probability < 1.0:
+            netem += " reorder %g%%" % (100 - percent)
+        return netem
+
+    def Commands(self):
+        """
+        Returns the tc commands, without the tc, that install the rules.
+        """
+        profiles = []
+        filters = []
+        seen = set()
+
+        for rule in self.rules:
+            profile = (rule.action, rule.probability, rule.delay)
+            if profile not in profiles:
+                profiles.append(profile)
+            classId = profiles.index(profile) + 2
+
+            for protocol, match in rule.FlowerMatches():
+                # flower refuses a second filter with the same match
+                if (protocol, match) in seen:
+                    continue
+                seen.add((protocol, match))
+                filters.append("filter add dev %s parent 1: protocol %s prio %d %s classid 1:%x" %
+                               (self.interface, protocol, self.filterPriorities[protocol],
+                                ("flower " + match).strip(), classId))
+
+        if len(profiles) > self.maxProfiles:
+            raise ValueError("at most %d distinct drop, delay and duplicate settings" % (self.maxProfiles))
+
+        commands = ["qdisc add dev %s root handle 1: prio bands %d priomap %s" %
+                    (self.interface, len(profiles) + 1, " ".join(["0"] * 16))]
+        for i, profile in enumerate(profiles):
+            commands.append("qdisc add dev %s parent 1:%x handle %x: netem %s" %
+                            (self.interface, i + 2, i + 16, self.__netem(*profile)))
+
+        return commands + filters
+
+    def __tc(self, args, batch=None):
+        proc = subprocess.Popen(["tc"] + args, stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+                                stderr=subprocess.PIPE, universal_newlines=True)
+        out, err = proc.communicate(batch)
+        if proc.returncode != 0:
+            raise OSError("tc %s failed: %s" % (" ".join(args), err.strip()))
+
+    def Install(self):
+        commands = self.Commands()
+
+        # a root qdisc someone else installed is left alone
+        self.__tc(commands[0].split())
+        self.installed = True
+
+        try:
+            self.__tc(["-batch", "-"], "\n".join(commands[1:]) + "\n")
+        except OSError:
+            self.Remove()
+            raise
+
+    def Remove(self):
+        if not self.installed:
+            return
+        self.installed = False
+        self.__tc(["qdisc", "del", "dev", self.interface, "root"])
+
+
+class Attacker(object):
+    """
+    Answers the packets matched by reset rules with a RST right away, from
+    the same process and thread that received them.
+    """
 
-
-def Attack(packetList, e):
+    def __init__(self):
+        self.logger = multiprocessing.get_logger()
+        self.templates = {4: ResetTemplate(socket.AF_INET), 6: ResetTemplate(socket.AF_INET6)}
+        self.sockets = {}
+
+    def __socket(self, family):
+        if family not in self.sockets:
+            if family == 6:
+                # IPPROTO_RAW sockets send the IPv6 header they are given
+                sock = socket.socket(socket.AF_INET6, socket.SOCK_RAW, socket.IPPROTO_RAW)
+            else:
+                sock = socket.socket(socket.AF_INET, socket.SOCK_RAW, socket.IPPROTO_TCP)
+                sock.setsockopt(socket.IPPROTO_IP, socket.IP_HDRINCL, 1)
+            self.sockets[family] = sock
+        return self.sockets[family]
+
+    def React(self, record):
+        """
+        record is the FlowRecord of the TCP segment to answer.
+        """
+        result = self.templates[record.family].Build(record.dst, record.src, record.dport, record.sport,
+                                                     record.ack, random.randint(0, 32767))
+
+        ipSrc = FormatAddr(record.family, record.src)
+        self.__socket(record.family).sendto(result, (ipSrc, 0))
+
+        # logged once the packet is out, to keep it off the reaction time
+        self.logger.info("Attacking {}:{} and {}:{} with RESET.".format(
+            ipSrc, record.sport, FormatAddr(record.family, record.dst), record.dport))
+
+    def Close(self):
+        for sock in self.sockets.values():
+            sock.close()
+        self.sockets = {}
+
+
+def WriteStatistics(path, statistics):
+    """
+    Writes statistics as JSON to path, replacing it at once.
+    """
+    with open(path + ".tmp", "w") as f:
+        json.dump(statistics, f, sort_keys=True)
+    os.rename(path + ".tmp", path)
+
+
+def SniffAndAttack(options, duration=None, rules=None):
+    """
+    Applies rules, by default Rules(options), for duration seconds if
+    given. Drop, delay and duplicate rules are handed to TrafficControl.
+    Reset rules are matched in a single loop that receives, decodes and
+    answers packets, so a packet is answered as soon as it is seen,
+    without handing it over to another process.
+    """
     logger = multiprocessing.get_logger()
-    attackSocket = socket.socket(
-        socket.AF_INET,
-        socket.SOCK_RAW,
-        socket.IPPROTO_TCP
-    )
-
-    attackSocket.setsockopt(socket.IPPROTO_IP, socket.IP_HDRINCL, 1)
-
-    while True:
-        e.wait()
-
-        while packetList:
-            packet = packetList.pop(0)
-            ipPacket = IPv4Packet()
-            ihl = 5
-            version = 4
-            ipPacket.SetIpVersionIhl((version << 4) + ihl)
-            ipPacket.SetIpLen(40)
-            ipPacket.SetIpId(random.randint(0, 32767))
-            ipPacket.SetIpTTL(255)
-            ipPacket.SetIpProtocol(socket.IPPROTO_TCP)
-            ipPacket.SetIpSrc(packet["ipDst"])
-            ipPacket.SetIpDst(packet["ipSrc"])
-            ipHeader = ipPacket.Encode()
-            ipPacket.SetIpSum(ipHeader)
-
-            tcpPacket = TCPPacket()
-
-            if options["action"] == "RESET":
-                tcpPacket.SetTcpDestPort(packet["tcpSrcPort"])
-                tcpPacket.SetTcpSrcPort(packet["tcpDestPort"])
-                tcpPacket.SetTcpSeq(packet["tcpAckSeq"])
-                tcpPacket.SetTcpDoffReserved((5 << 4) + 0)
-                tcpPacket.SetTcpRstBit(1)
-                tcpPacket.SetTcpFlags()
-
-            logger.info("Attacking {}:{} and {}:{} with {}.".format(
-                packet["ipSrc"], packet['tcpSrcPort'],
-                packet["ipDst"], packet['tcpDestPort'], options["action"]))
-            tcpHeader = tcpPacket.Encode()
-            ipSrc = socket.inet_aton(str(packet["ipDst"]))
-            ipDst = socket.inet_aton(str(packet["ipSrc"]))
-            placeholder = 0
-            protocol = socket.IPPROTO_TCP
-            tcpLength = len(tcpHeader)
+    if rules is None:
+        rules = Rules(options)
+
+    table = RuleTable()
+    tcRules = []
+    for rule in rules:
+        if rule.action in tcActions:
+            tcRules.append(rule)
+        else:
+            table.Add(rule)
 
-            psudoHeader = pack('!4s4sBBH', ipSrc, ipDst, placeholder, protocol, tcpLength)
-            psudoHeader += tcpHeader
+    deadline = None
+    if duration is not None:
+        deadline = time.monotonic() + duration
 
-            tcpPacket.SetTcpCheck(psudoHeader)
+    trafficControl = TrafficControl(options['interface'], tcRules)
+    receiver = None
+    attacker = None
+    received = 0
+    reset = 0
+    first = last = None
 
-            tcpHeader = tcpPacket.Encode()
+    try:
+        if len(tcRules) > 0:
+            trafficControl.Install()
+            logger.info("%d drop, delay and duplicate rules applied with tc." % (len(tcRules)))
+
+        if len(table) == 0:
+            while deadline is None or time.monotonic() < deadline:
+                time.sleep(0.1)
+            return
+
+        # Without a rules file the options describe exactly the packets to
+        # reset, and the default CompileFilter program is as narrow.
+        program = None
+        if options['rules'] is not None:
+            program = CompileResetFilter()
+        receiver = FrameReceiver(options['interface'], options, program)
+        decoder = FlowDecoder()
+        attacker = Attacker()
+
+        logger.info("Sniffer and process packets, Press Ctrl-C to stop.")
+
+        # Wake up at least every 100ms to check the deadline.
+        for buf, offset, length in receiver.Frames(0.1):
+            now = time.monotonic()
+            if deadline is not None and now >= deadline:
+                break
+            if buf is None:
+                continue
+            received += 1
+            last = time.time()
+            if first is None:
+                first = last
 
-            result = ipHeader + tcpHeader
+            record = decoder.Process(buf, length, offset)
+            if record is None or record.proto != socket.IPPROTO_TCP:
+                continue
+            # same as the BPF filter, for sockets it could not be attached to
+            if record.flags & (TCP_FIN | TCP_SYN | TCP_RST):
+                continue
 
-            attackSocket.sendto(result, (str(packet["ipSrc"]), 0))
+            rule = table.Lookup(record)
+            if rule is None or not rule.Allow(now):
+                continue
 
-        e.clear()
+            attacker.React(record)
+            reset += 1
+    finally:
+        if attacker is not None:
+            attacker.Close()
+        if receiver is not None:
+            if options['stats'] is not None:
+                queued, drops = receiver.Statistics()
+                WriteStatistics(options['stats'], {"received": received, "reset": reset, "queued": queued,
+                                                   "drops": drops, "first": first, "last": last})
+            receiver.Close()
+        trafficControl.Remove()
 
-    attackSocket.close()
+        for rule in table.rules:
+            if rule.hits > 0:
+                logger.info("%s: %d packets matched, %d reset." % (str(rule), rule.hits, rule.applied))
 
 
 if __name__ == "__main__":
@@ -489,7 +1377,8 @@ if __name__ == "__main__":
     try:
         opts, args = getopt.getopt(sys.argv[1:], "hqi:a:s:d:P:",
                                    ["help", "quiet", "interface=", "action=", "ips=", "start=", "duration=",
-                                    "dstPort="])
+                                    "dstPort=", "no-bpf", "ring", "ring-block-size=", "ring-blocks=",
+                                    "ring-timeout=", "rules=", "probability=", "delay=", "stats="])
 
     except getopt.GetoptError as err:
         sys.exit("%s: Failed to parse arguments." % (__file__))
@@ -501,7 +1390,8 @@ if __name__ == "__main__":
                   'python HappyPacketProcess.py  --interface "wlan0" --action "RESET" --ips "107.22.61.55,10.0.1.2" ' \
                   '--start "2" --duration 6 ' \
                   'python HappyPacketProcess.py  --interface "wlan0" --action "RESET" --dstPort "11095" ' \
-                  '--start "2" --duration "20"')
+                  '--start "2" --duration "20" ' \
+                  'python HappyPacketProcess.py  --interface "wlan0" --rules "rules.json" --duration "20"')
             sys.exit(0)
 
         elif o in ("-q", "--quiet"):
@@ -525,6 +1415,33 @@ if __name__ == "__main__":
         elif o in ("-d", "--duration"):
             options["duration"] = int(a)
 
+        elif o == "--no-bpf":
+            options["bpf"] = False
+
+        elif o == "--ring":
+            options["ring"] = True
+
+        elif o == "--ring-block-size":
+            options["ringBlockSize"] = int(a)
+
+        elif o == "--ring-blocks":
+            options["ringBlocks"] = int(a)
+
+        elif o == "--ring-timeout":
+            options["ringTimeout"] = int(a)
+
+        elif o == "--rules":
+            options["rules"] = a
+
+        elif o == "--probability":
+            options["probability"] = float(a)
+
+        elif o == "--delay":
+            options["delay"] = int(a)
+
+        elif o == "--stats":
+            options["stats"] = a
+
         else:
             assert False, "unhandled option"
 
@@ -545,34 +1462,30 @@ if __name__ == "__main__":
     formatter = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
     stdout_handler.setFormatter(formatter)
     logger.addHandler(stdout_handler)
-    logger.info("start at %d seconds, the duration is %d seconds" % (options["start"], options["duration"]))
+    if options["rules"] is None and options["action"] is None:
+        print("Please give an --action or --rules")
+        sys.exit(1)
 
-    time.sleep(options["start"])
+    try:
+        rules = Rules(options)
+    except (IOError, ValueError) as e:
+        print("Invalid rules: %s" % (str(e)))
+        sys.exit(1)
 
-    e = multiprocessing.Event()
-    manager = multiprocessing.Manager()
-    packetList = manager.list()
+    logger.info("start at %s seconds, the duration is %s seconds" % (options["start"], options["duration"]))
 
-    sniffer = multiprocessing.Process(
-        target=Sniffer,
-        args=(packetList, e),
-        name='sniffer',
-    )
-    sniffer.start()
+    # stopping the process must still remove the tc rules
+    signal.signal(signal.SIGTERM, lambda signum, frame: sys.exit(0))
 
-    attack = multiprocessing.Process(
-        target=Attack,
-        args=(packetList, e),
-        name='attack',
-    )
-    attack.start()
+    if options["start"]:
+        time.sleep(options["start"])
 
     print(str(datetime.now()))
     try:
-        with TimeoutControl(options["duration"]):
-            manager.join()
-    except Exception:
-        sniffer.terminate()
-        attack.terminate()
-        print(str(datetime.now()))
+        SniffAndAttack(options, options["duration"], rules)
+    except KeyboardInterrupt:
         pass
+    except OSError as e:
+        logger.error(str(e))
+        sys.exit(1)
+    print(str(datetime.now()))
@@ -0,0 +1,488 @@
+#!/usr/bin/env python3
+
+#
+#    Copyright (c) 2021 Google LLC.
+#    All rights reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+#
+
+##
+#    @file
+#       Implements the traffic generator HappyPacketBenchmark runs in the
+#       sending node: replays synthetic TCP flows, or the frames of a pcap
+#       or pcapng file, out of --interface at --rate packets per second,
+#       and times the RST HappyPacketProcess answers every segment with.
+#
+#       Segments are sent to --dst-mac, an address no node has, so the
+#       receiving kernel drops them instead of answering with RSTs of its
+#       own; the bridge floods them to every member, sniffers included.
+#       Replayed TCP frames are rewritten to --src and --dst, those of the
+#       other address family are left out.
+#
+#       A RST is matched to the segment it answers by its destination port
+#       and sequence number, the source port and acknowledgement number of
+#       the segment, and timed with the kernel receive timestamp. The
+#       results are printed as JSON, with the latency of every answer in ns.
+#
+#       python HappyPacketReplay.py --interface wlan0 --src 10.0.1.2 --dst 10.0.1.3 --count 100000 --rate 20000
+#       python HappyPacketReplay.py --interface wlan0 --src fd00::2 --dst fd00::3 --pcap failure.pcapng
+#
+
+from __future__ import absolute_import
+from __future__ import print_function
+import collections
+import errno
+import getopt
+import json
+import socket
+from struct import *
+import sys
+import threading
+import time
+
+try:
+    from happy.HappyPacketProcess import AssembleFilter, AttachFilter, CheckSumCalculation, ChecksumUpdate, \
+        BPF_LD_W_ABS, BPF_LD_H_ABS, BPF_LD_B_ABS, BPF_LDX_B_MSH, BPF_LD_B_IND, BPF_JEQ_K, BPF_JSET_K, \
+        BPF_RET_K, ETH_P_ALL, ETH_P_IP, ETH_P_IPV6, TCP_RST
+    from happy.HappyCaptureRing import ReadPackets, PCAPNG_SHB
+except ImportError:
+    # started as a script, next to HappyPacketProcess.py
+    from HappyPacketProcess import AssembleFilter, AttachFilter, CheckSumCalculation, ChecksumUpdate, \
+        BPF_LD_W_ABS, BPF_LD_H_ABS, BPF_LD_B_ABS, BPF_LDX_B_MSH, BPF_LD_B_IND, BPF_JEQ_K, BPF_JSET_K, \
+        BPF_RET_K, ETH_P_ALL, ETH_P_IP, ETH_P_IPV6, TCP_RST
+    from HappyCaptureRing import ReadPackets, PCAPNG_SHB
+
+options = {}
+options["interface"] = None
+options["src"] = None
+options["dst"] = None
+options["dst_mac"] = "02:00:00:00:00:99"
+options["dport"] = 11095
+options["flows"] = 16
+options["count"] = None
+options["rate"] = 0
+options["pcap"] = None
+options["warmup"] = 10.0
+options["linger"] = 0.5
+
+TCP_PSH = 0x08
+TCP_ACK = 0x10
+
+# SO_TIMESTAMPNS and its control message, both 35 on Linux
+SO_TIMESTAMPNS = 35
+# the packet type ancillary field of classic BPF, SKF_AD_OFF + SKF_AD_PKTTYPE
+SKF_AD_PKTTYPE = 0xfffff004
+PACKET_OUTGOING = 4
+
+PCAP_MAGIC = 0xa1b2c3d4
+PCAP_MAGIC_NS = 0xa1b23c4d
+LINKTYPE_ETHERNET = 1
+
+# sent until HappyPacketProcess answers, from a port no flow uses
+warmupPort = 1
+defaultCount = 10000
+
+
+def ParseMac(mac):
+    return bytes(bytearray([int(b, 16) for b in mac.split(":")]))
+
+
+def CompileAnswerFilter():
+    """
+    Compiles a classic BPF program that accepts the IPv4 and IPv6 TCP RSTs
+    received on a socket, but not the frames it sends.
+    """
+    return AssembleFilter([
+        (BPF_LD_W_ABS, SKF_AD_PKTTYPE, None, None),
+        (BPF_JEQ_K, PACKET_OUTGOING, "drop", None),
+        (BPF_LD_H_ABS, 12, None, None),
+        (BPF_JEQ_K, ETH_P_IP, None, "ipv6"),
+        (BPF_LD_B_ABS, 23, None, None),
+        (BPF_JEQ_K, socket.IPPROTO_TCP, None, "drop"),
+        (BPF_LDX_B_MSH, 14, None, None),
+        (BPF_LD_B_IND, 14 + 13, None, None),
+        (BPF_JSET_K, TCP_RST, "accept", "drop"),
+        "ipv6",
+        (BPF_JEQ_K, ETH_P_IPV6, None, "drop"),
+        (BPF_LD_B_ABS, 14 + 6, None, None),
+        (BPF_JEQ_K, socket.IPPROTO_TCP, None, "drop"),
+        (BPF_LD_B_ABS, 14 + 40 + 13, None, None),
+        (BPF_JSET_K, TCP_RST, None, "drop"),
+        "accept",
+        (BPF_RET_K, 128, None, None),
+        "drop",
+        (BPF_RET_K, 0, None, None)])
+
+
+def TcpFrame(srcMac, dstMac, src, dst, sport, dport, seq, ack, flags=TCP_PSH | TCP_ACK):
+    """
+    Returns an Ethernet frame of a TCP segment without payload from src to
+    dst, both IPv4 or both IPv6 addresses, with valid checksums.
+    """
+    family = socket.AF_INET6 if ":" in src else socket.AF_INET
+    srcAddr = socket.inet_pton(family, src)
+    dstAddr = socket.inet_pton(family, dst)
+
+    tcp = pack('!HHLLBBHHH', sport, dport, seq, ack, 5 << 4, flags, 1024, 0, 0)
+    if family == socket.AF_INET6:
+        psudoHeader = pack('!16s16sI3xB', srcAddr, dstAddr, len(tcp), socket.IPPROTO_TCP)
+        ip = pack('!IHBB16s16s', 6 << 28, len(tcp), socket.IPPROTO_TCP, 64, srcAddr, dstAddr)
+        ethertype = ETH_P_IPV6
+    else:
+        psudoHeader = pack('!4s4sBBH', srcAddr, dstAddr, 0, socket.IPPROTO_TCP, len(tcp))
+        ip = pack('!BBHHHBBH4s4s', 0x45, 0, 20 + len(tcp), 1, 0, 64, socket.IPPROTO_TCP, 0, srcAddr, dstAddr)
+        ip = ip[:10] + pack('!H', CheckSumCalculation(ip)) + ip[12:]
+        ethertype = ETH_P_IP
+
+    tcp = tcp[:16] + pack('!H', CheckSumCalculation(psudoHeader + tcp)) + tcp[18:]
+    return pack('!6s6sH', dstMac, srcMac, ethertype) + ip + tcp
+
+
+def SyntheticFrames(srcMac, dstMac, src, dst, dport, flows, count):
+    """
+    Returns count segments of flows TCP flows to dport, round robin. Every
+    segment acknowledges a different number, so each RST names the one
+    segment it answers.
+    """
+    return [TcpFrame(srcMac, dstMac, src, dst, 20000 + (i % flows), dport, 1000 + i, i)
+            for i in range(count)]
+
+
+def ReadPcap(path):
+    """
+    Returns the frames of a pcap file, in microsecond or nanosecond
+    resolution and either byte order, or of a pcapng file as written by
+    happy-capture. Only Ethernet captures can be replayed.
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+
+    if len(data) >= 4 and unpack_from('=I', data)[0] == PCAPNG_SHB:
+        return [frame for timestamp, frame, length in ReadPackets(path)]
+
+    for order in ['<', '>']:
+        if len(data) >= 24 and unpack_from(order + 'I', data)[0] in [PCAP_MAGIC, PCAP_MAGIC_NS]:
+            break
+    else:
+        raise ValueError("%s is not a pcap or pcapng file" % (path))
+
+    linktype = unpack_from(order + 'I', data, 20)[0]
+    if linktype != LINKTYPE_ETHERNET:
+        raise ValueError("%s is not an Ethernet capture, link type %d" % (path, linktype))
+
+    frames = []
+    record = Struct(order + 'IIII')
+    offset = 24
+    while offset + 16 <= len(data):
+        sec, frac, caplen, length = record.unpack_from(data, offset)
+        offset += 16
+        frames.append(data[offset:offset + caplen])
+        offset += caplen
+
+    return frames
+
+
+def RewriteFrame(frame, srcMac, dstMac, src, dst):
+    """
+    Returns frame sent from srcMac to dstMac and, if it is an IP packet of
+    the family of src and dst, from src to dst, with its checksums updated
+    incrementally. Returns None for TCP segments of the other family, whose
+    RSTs could not be routed back.
+    """
+    frame = bytearray(frame)
+    frame[0:12] = dstMac + srcMac
+    if len(frame) < 14:
+        return bytes(frame)
+
+    ethertype, = unpack_from('!H', frame, 12)
+    if ethertype == ETH_P_IP and len(frame) >= 34:
+        proto = frame[23]
+        addrs = (26, 34)
+        newAddrs = socket.inet_aton(src) + socket.inet_aton(dst) if ":" not in src else None
+        l4 = 14 + (frame[14] & 0x0f) * 4
+    elif ethertype == ETH_P_IPV6 and len(frame) >= 54:
+        proto = frame[20]
+        addrs = (22, 54)
+        newAddrs = socket.inet_pton(socket.AF_INET6, src) + socket.inet_pton(socket.AF_INET6, dst) \
+            if ":" in src else None
+        l4 = 54
+    else:
+        return bytes(frame)
+
+    if newAddrs is None:
+        return None if proto == socket.IPPROTO_TCP else bytes(frame)
+
+    oldAddrs = bytes(frame[addrs[0]:addrs[1]])
+    frame[addrs[0]:addrs[1]] = newAddrs
+
+    if ethertype == ETH_P_IP:
+        checkSum, = unpack_from('!H', frame, 24)
+        pack_into('!H', frame, 24, ChecksumUpdate(checkSum, oldAddrs, newAddrs))
+
+    # the addresses are part of the TCP and UDP pseudo header
+    checkSumOffset = {socket.IPPROTO_TCP: 16, socket.IPPROTO_UDP: 6}.get(proto)
+    if checkSumOffset is not None and len(frame) >= l4 + checkSumOffset + 2:
+        checkSum, = unpack_from('!H', frame, l4 + checkSumOffset)
+        if proto != socket.IPPROTO_UDP or checkSum != 0:
+            pack_into('!H', frame, l4 + checkSumOffset, ChecksumUpdate(checkSum, oldAddrs, newAddrs))
+
+    return bytes(frame)
+
+
+def SegmentKey(frame):
+    """
+    Returns (source port, acknowledgement number) of a TCP frame, the
+    (destination port, sequence number) of the RST answering it, or None.
+    """
+    if len(frame) < 14:
+        return None
+    ethertype, = unpack_from('!H', frame, 12)
+    if ethertype == ETH_P_IP and len(frame) >= 34 and frame[23] == socket.IPPROTO_TCP:
+        l4 = 14 + (frame[14] & 0x0f) * 4
+    elif ethertype == ETH_P_IPV6 and len(frame) >= 54 and frame[20] == socket.IPPROTO_TCP:
+        l4 = 54
+    else:
+        return None
+    if len(frame) < l4 + 12:
+        return None
+    sport, ack = unpack_from('!H6xL', frame, l4)
+    return sport, ack
+
+
+class AnswerCollector(threading.Thread):
+    """
+    Collects the RSTs received on interface, as (dport, seq, ns) with the
+    time the kernel received them, from a thread of its own.
+    """
+
+    def __init__(self, interface):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.answers = []
+        self.stopped = False
+
+        self.sock = socket.socket(socket.AF_PACKET, socket.SOCK_RAW, 0)
+        AttachFilter(self.sock, CompileAnswerFilter())
+        self.sock.setsockopt(socket.SOL_SOCKET, SO_TIMESTAMPNS, 1)
+        self.sock.bind((interface, ETH_P_ALL))
+        self.sock.settimeout(0.05)
+
+    def run(self):
+        timespec = Struct('qq')
+        while not self.stopped:
+            try:
+                packet, ancdata, flags, address = self.sock.recvmsg(128, socket.CMSG_SPACE(timespec.size))
+            except socket.timeout:
+                continue
+
+            received = None
+            for level, kind, data in ancdata:
+                if level == socket.SOL_SOCKET and kind == SO_TIMESTAMPNS:
+                    sec, nsec = timespec.unpack(data[:timespec.size])
+                    received = sec * 1000000000 + nsec
+            if received is None:
+                received = time.time_ns()
+
+            ethertype, = unpack_from('!H', packet, 12)
+            if ethertype == ETH_P_IP:
+                # only HappyPacketProcess sends with a TTL of 255
+                if packet[22] != 255:
+                    continue
+                l4 = 14 + (packet[14] & 0x0f) * 4
+            else:
+                if packet[21] != 255:
+                    continue
+                l4 = 54
+            dport, seq = unpack_from('!2xHL', packet, l4)
+            self.answers.append((dport, seq, received))
+
+    def Take(self):
+        answers = self.answers
+        self.answers = []
+        return answers
+
+    def Stop(self):
+        self.stopped = True
+        self.join()
+        self.sock.close()
+
+
+def MatchAnswers(sent, answers):
+    """
+    Returns the latency in ns of every answer in answers, (dport, seq, ns),
+    to the earliest unanswered segment of sent, (key, ns), it can answer.
+    """
+    pending = collections.defaultdict(collections.deque)
+    for key, when in sent:
+        pending[key].append(when)
+
+    latencies = []
+    for dport, seq, received in sorted(answers, key=lambda answer: answer[2]):
+        queue = pending.get((dport, seq))
+        if not queue or queue[0] > received:
+            continue
+        latencies.append(received - queue.popleft())
+
+    return latencies
+
+
+def Replay(options):
+    """
+    Sends the frames, waits options["linger"] seconds for late answers and
+    returns the results as a dictionary.
+    """
+    sock = socket.socket(socket.AF_PACKET, socket.SOCK_RAW, 0)
+    sock.bind((options["interface"], 0))
+    srcMac = sock.getsockname()[4]
+    dstMac = ParseMac(options["dst_mac"])
+
+    if options["pcap"] is not None:
+        frames = []
+        for frame in ReadPcap(options["pcap"]):
+            frame = RewriteFrame(frame, srcMac, dstMac, options["src"], options["dst"])
+            if frame is not None:
+                frames.append(frame)
+        if len(frames) == 0:
+            raise ValueError("nothing to replay in %s" % (options["pcap"]))
+        count = options["count"] or len(frames)
+        frames = [frames[i % len(frames)] for i in range(count)]
+    else:
+        frames = SyntheticFrames(srcMac, dstMac, options["src"], options["dst"], options["dport"],
+                                 options["flows"], options["count"] or defaultCount)
+    keys = [SegmentKey(frame) for frame in frames]
+
+    collector = AnswerCollector(options["interface"])
+    collector.start()
+
+    try:
+        # until the sniffer answers, or for at most options["warmup"] seconds
+        probe = TcpFrame(srcMac, dstMac, options["src"], options["dst"], warmupPort, options["dport"], 0, 0)
+        ready = False
+        deadline = time.monotonic() + options["warmup"]
+        while not ready and time.monotonic() < deadline:
+            sock.send(probe)
+            time.sleep(0.1)
+            ready = any([dport == warmupPort for dport, seq, received in collector.Take()])
+        time.sleep(0.1)
+        collector.Take()
+
+        interval = 0
+        if options["rate"] > 0:
+            interval = 1000000000 // options["rate"]
+
+        sendTimes = []
+        errors = 0
+        begin = time.time_ns()
+        for i, frame in enumerate(frames):
+            if interval:
+                # paced over a millisecond, sleeping is not any finer
+                ahead = begin + i * interval - time.time_ns()
+                if ahead > 1000000:
+                    time.sleep(ahead / 1e9)
+            when = time.time_ns()
+            try:
+                sock.send(frame)
+            except OSError as e:
+                if e.errno != errno.ENOBUFS:
+                    raise
+                errors += 1
+                continue
+            sendTimes.append((keys[i], when))
+        end = time.time_ns()
+
+        time.sleep(options["linger"])
+    finally:
+        collector.Stop()
+        sock.close()
+
+    answers = collector.Take()
+    latencies = MatchAnswers(sendTimes, answers)
+    seconds = (end - begin) / 1e9
+
+    results = {}
+    results["ready"] = ready
+    results["sent"] = len(sendTimes)
+    results["send_errors"] = errors
+    results["begin"] = begin / 1e9
+    results["end"] = end / 1e9
+    results["seconds"] = seconds
+    results["rate"] = len(sendTimes) / seconds if seconds > 0 else 0
+    results["answers"] = len(answers)
+    results["answered"] = len(latencies)
+    results["latencies"] = latencies
+    return results
+
+
+if __name__ == "__main__":
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], "h",
+                                   ["help", "interface=", "src=", "dst=", "dst-mac=", "dport=", "flows=",
+                                    "count=", "rate=", "pcap=", "warmup=", "linger="])
+
+    except getopt.GetoptError as err:
+        sys.exit("%s: Failed to parse arguments." % (__file__))
+
+    for o, a in opts:
+        if o in ("-h", "--help"):
+            print("python HappyPacketReplay.py --interface <IFACE> --src <ADDR> --dst <ADDR> [--dst-mac <MAC>] "
+                  "[--dport <PORT>] [--flows <FLOWS>] [--count <PACKETS>] [--rate <PPS>] [--pcap <FILE>] "
+                  "[--warmup <SECONDS>] [--linger <SECONDS>]")
+            sys.exit(0)
+
+        elif o == "--interface":
+            options["interface"] = a
+
+        elif o == "--src":
+            options["src"] = a
+
+        elif o == "--dst":
+            options["dst"] = a
+
+        elif o == "--dst-mac":
+            options["dst_mac"] = a
+
+        elif o == "--dport":
+            options["dport"] = int(a)
+
+        elif o == "--flows":
+            options["flows"] = int(a)
+
+        elif o == "--count":
+            options["count"] = int(a)
+
+        elif o == "--rate":
+            options["rate"] = int(a)
+
+        elif o == "--pcap":
+            options["pcap"] = a
+
+        elif o == "--warmup":
+            options["warmup"] = float(a)
+
+        elif o == "--linger":
+            options["linger"] = float(a)
+
+        else:
+            assert False, "unhandled option"
+
+    if options["interface"] is None or options["src"] is None or options["dst"] is None:
+        sys.exit("%s: Missing interface, source or destination address." % (__file__))
+
+    try:
+        results = Replay(options)
+    except (IOError, ValueError) as e:
+        sys.exit("%s: %s" % (__file__, str(e)))
+
+    json.dump(results, sys.stdout)
+    print()
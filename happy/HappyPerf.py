@@ -0,0 +1,330 @@
+#!/usr/bin/env python3
+
+#
+#    Copyright (c) 2021 Google LLC.
+#    All rights reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+#
+
+##
+#    @file
+#       Implements HappyPerf class that measures the throughput and latency
+#       between virtual nodes.
+#
+
+from __future__ import absolute_import
+from __future__ import print_function
+import json
+import os
+import sys
+
+from happy.ReturnMsg import ReturnMsg
+from happy.Utils import *
+from happy.utils.IP import IP
+from happy.HappyNode import HappyNode
+from happy.HappyProcess import HappyProcess
+from happy.HappyProcessStats import percentile
+import happy.HappyPerfProbe
+import happy.HappyProcessOutput
+import happy.HappyProcessStart
+import happy.HappyProcessStop
+import happy.HappyProcessWait
+
+options = {}
+options["quiet"] = False
+options["source"] = None
+options["destination"] = None
+options["pairs"] = None
+options["protocol"] = "tcp"
+options["test"] = "all"
+options["duration"] = 5.0
+options["size"] = None
+options["rate"] = 0
+options["port"] = 5201
+options["ipv6"] = False
+options["output"] = None
+
+SERVER_TAG = "happy-perf-server"
+CLIENT_TAG = "happy-perf-%s-%s"
+
+
+def option():
+    return options.copy()
+
+
+def Summary(result):
+    """
+    Replaces the latency of every request of a request/response result by
+    its percentiles, in us.
+    """
+    rr = result.get("rr")
+    if rr is None or "latencies" not in rr:
+        return result
+
+    latencies = [latency / 1000.0 for latency in rr.pop("latencies")]
+    rr["latency_us"] = {"p50": percentile(latencies, 50), "p90": percentile(latencies, 90),
+                        "p99": percentile(latencies, 99),
+                        "max": max(latencies) if len(latencies) > 0 else None}
+    return result
+
+
+class HappyPerf(HappyNode, HappyProcess):
+    """
+    Measures the bulk throughput and the request/response latency from a
+    virtual node to another, or between many pairs of nodes at once. A
+    receiver runs on every destination node and a sender on every source
+    node, both started as happy processes, so no iperf is needed.
+
+    happy-perf [-h --help] [-q --quiet] [-s --source <NODE_NAME>]
+               [-d --destination <NODE_NAME>] [--pairs <SOURCE>:<DESTINATION>,...]
+               [-P --protocol tcp|udp] [-t --test bulk|rr|all]
+               [--duration <SECONDS>] [--size <BYTES>] [--rate <PPS>]
+               [-p --port <PORT>] [-6 --ipv6] [-o --output <FILE>]
+
+        -s --source         Source node of a single pair.
+        -d --destination    Destination node of a single pair.
+           --pairs          Comma separated source:destination pairs, all
+                            measured at the same time.
+        -P --protocol       Optional. tcp (default) or udp.
+        -t --test           Optional. bulk transfer, rr request/response or
+                            all (default), one after the other.
+           --duration       Optional. Seconds of each test, 5 by default.
+           --size           Optional. Bytes of a bulk write or datagram, or
+                            of a request of an rr test.
+           --rate           Optional. Datagrams per second of a udp bulk
+                            test, unlimited by default.
+        -p --port           Optional. Port of the receivers, 5201 by default.
+        -6 --ipv6           Optional. Measure over IPv6 instead of IPv4.
+        -o --output         Optional. Writes the results to this JSON file.
+
+    Examples:
+    $ happy-perf ThreadNode BorderRouter
+        Measures the TCP throughput, retransmits and latency from ThreadNode
+        to BorderRouter.
+
+    $ happy-perf --protocol udp --rate 1000 --pairs A:B,C:D
+        Measures the loss of 1000 datagrams per second from A to B and from
+        C to D at once.
+
+    return:
+        0    success
+        1    fail
+    """
+
+    def __init__(self, opts=options):
+        HappyNode.__init__(self)
+        HappyProcess.__init__(self)
+
+        self.quiet = opts["quiet"]
+        self.source = opts["source"]
+        self.destination = opts["destination"]
+        self.pairs = opts["pairs"]
+        self.protocol = opts["protocol"]
+        self.test = opts["test"]
+        self.duration = opts["duration"]
+        self.size = opts["size"]
+        self.rate = opts["rate"]
+        self.port = opts["port"]
+        self.ipv6 = opts["ipv6"]
+        self.output = opts["output"]
+
+    def __pre_check(self):
+        pairs = []
+        if self.source is not None or self.destination is not None:
+            pairs.append((self.source, self.destination))
+        if isinstance(self.pairs, str):
+            for pair in self.pairs.split(","):
+                if pair:
+                    pairs.append(tuple(pair.split(":", 1)) if ":" in pair else (pair, None))
+        elif self.pairs is not None:
+            pairs += [tuple(pair) for pair in self.pairs]
+
+        if len(pairs) == 0:
+            emsg = "Missing source and destination nodes."
+            self.logger.error("[localhost] HappyPerf: %s" % (emsg))
+            self.exit()
+
+        self.pairs = []
+        for source, destination in pairs:
+            for node_id in [source, destination]:
+                if not node_id or not self._nodeExists(node_id):
+                    emsg = "virtual node %s does not exist." % (node_id)
+                    self.logger.error("[%s] HappyPerf: %s" % (node_id, emsg))
+                    self.exit()
+
+            if source == destination:
+                emsg = "source and destination are both %s." % (source)
+                self.logger.error("[%s] HappyPerf: %s" % (source, emsg))
+                self.exit()
+
+            if (source, destination) not in self.pairs:
+                self.pairs.append((source, destination))
+
+        if self.protocol not in ["tcp", "udp"]:
+            emsg = "Unknown protocol %s, expected tcp or udp." % (self.protocol)
+            self.logger.error("[localhost] HappyPerf: %s" % (emsg))
+            self.exit()
+
+        if self.test not in ["bulk", "rr", "all"]:
+            emsg = "Unknown test %s, expected bulk, rr or all." % (self.test)
+            self.logger.error("[localhost] HappyPerf: %s" % (emsg))
+            self.exit()
+
+        self.duration = float(self.duration)
+        self.port = int(self.port)
+
+    def __get_address(self, source, destination):
+        """
+        An address of the destination of the chosen family, on a network the
+        source shares with it if there is one.
+        """
+        shared = set(self.getNodeNetworkIds(source)) & set(self.getNodeNetworkIds(destination))
+
+        addresses = []
+        for network_id in sorted(shared):
+            addresses += self.getNodeAddressesOnNetwork(network_id, destination)
+        addresses += self.getNodeAddresses(destination)
+
+        for addr in addresses:
+            if IP.isIpv6(addr) != bool(self.ipv6):
+                continue
+            if IP.isIpv6(addr) and IP.prefixMatchAddress("fe80::/64", addr):
+                continue
+            return addr
+
+        return None
+
+    def __probe_command(self, args):
+        path = os.path.dirname(os.path.abspath(happy.HappyPerfProbe.__file__))
+        return "%s %s/HappyPerfProbe.py %s" % (sys.executable, path, args)
+
+    def __start_process(self, node_id, tag, cmd, sync_on_output=None):
+        options = happy.HappyProcessStart.option()
+        options["quiet"] = True
+        options["node_id"] = node_id
+        options["tag"] = tag
+        options["command"] = cmd
+        options["sync_on_output"] = sync_on_output
+        happy.HappyProcessStart.HappyProcessStart(options).run()
+
+    def __stop_process(self, node_id, tag):
+        options = happy.HappyProcessStop.option()
+        options["quiet"] = True
+        options["node_id"] = node_id
+        options["tag"] = tag
+        happy.HappyProcessStop.HappyProcessStop(options).run()
+
+    def __client_result(self, source, destination):
+        tag = CLIENT_TAG % (source, destination)
+
+        options = happy.HappyProcessWait.option()
+        options["quiet"] = True
+        options["node_id"] = source
+        options["tag"] = tag
+        # both tests, and the wait of a udp bulk test for the receiver
+        options["timeout"] = 2 * self.duration + 10
+        happy.HappyProcessWait.HappyProcessWait(options).run()
+
+        options = happy.HappyProcessOutput.option()
+        options["quiet"] = True
+        options["node_id"] = source
+        options["tag"] = tag
+        out = happy.HappyProcessOutput.HappyProcessOutput(options).run().Data()
+
+        lines = [line for line in (out or "").split("\n") if line.strip()]
+        try:
+            return json.loads(lines[-1])
+        except (IndexError, ValueError):
+            return {"error": "no results from the sender"}
+
+    def __measure(self):
+        self.results = {}
+
+        clients = []
+        for source, destination in self.pairs:
+            addr = self.__get_address(source, destination)
+            if addr is None:
+                emsg = "node %s has no IPv%d address." % (destination, 6 if self.ipv6 else 4)
+                self.logger.warning("[%s] HappyPerf: %s" % (source, emsg))
+                self.results["%s:%s" % (source, destination)] = {"error": emsg}
+                continue
+            clients.append((source, destination, addr))
+
+        servers = sorted(set([destination for source, destination, addr in clients]))
+
+        try:
+            for node_id in servers:
+                cmd = self.__probe_command("--server --port %d" % (self.port))
+                self.__start_process(node_id, SERVER_TAG, cmd, sync_on_output="ready")
+
+            # all senders at once, then the results of each
+            for source, destination, addr in clients:
+                args = "--client %s --port %d --protocol %s --test %s --duration %s --rate %d" % \
+                    (addr, self.port, self.protocol, self.test, self.duration, int(self.rate))
+                if self.size is not None:
+                    args += " --size %d" % (int(self.size))
+                self.__start_process(source, CLIENT_TAG % (source, destination), self.__probe_command(args))
+
+            for source, destination, addr in clients:
+                result = Summary(self.__client_result(source, destination))
+                result["address"] = addr
+                self.results["%s:%s" % (source, destination)] = result
+        finally:
+            # senders still running once their wait timed out
+            for source, destination, addr in clients:
+                self.__stop_process(source, CLIENT_TAG % (source, destination))
+            for node_id in servers:
+                self.__stop_process(node_id, SERVER_TAG)
+
+    def __print_results(self):
+        header = ["pair", "bulk Mbit/s", "retrans", "lost", "rr tps", "p50 us", "p99 us"]
+        rows = []
+        for source, destination in self.pairs:
+            result = self.results["%s:%s" % (source, destination)]
+            row = ["%s -> %s" % (source, destination)]
+            if "error" in result:
+                rows.append(row + [hred(result["error"])])
+                continue
+
+            bulk = result.get("bulk", {})
+            rr = result.get("rr", {})
+            latency = rr.get("latency_us", {})
+            row.append("%.1f" % (bulk["bits_per_second"] / 1e6) if bulk.get("bits_per_second") is not None else "-")
+            row.append(str(bulk["retransmits"]) if bulk.get("retransmits") is not None else "-")
+            row.append(str(bulk["lost"]) if bulk.get("lost") is not None else "-")
+            row.append("%.0f" % (rr["transactions_per_second"]) if "transactions_per_second" in rr else "-")
+            for p in ["p50", "p99"]:
+                row.append("%.1f" % (latency[p]) if latency.get(p) is not None else "-")
+            rows.append(row)
+
+        width = max([len(header[0])] + [len(row[0]) for row in rows])
+        print("%s, %s" % (self.protocol, self.test))
+        print(" ".join(["{0: <{1}}".format(header[0], width)] + ["{0: >12}".format(h) for h in header[1:]]))
+        for row in rows:
+            print(" ".join(["{0: <{1}}".format(row[0], width)] + ["{0: >12}".format(r) for r in row[1:]]))
+
+    def run(self):
+        self.__pre_check()
+
+        self.__measure()
+
+        if not self.quiet:
+            self.__print_results()
+
+        if self.output is not None:
+            with open(self.output, "w") as f:
+                json.dump(self.results, f, indent=4, sort_keys=True)
+
+        failed = [result for result in self.results.values() if "error" in result]
+        return ReturnMsg(0 if len(failed) == 0 else 1, self.results)
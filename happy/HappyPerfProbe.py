@@ -0,0 +1,432 @@
+#!/usr/bin/env python3
+
+#
+#    Copyright (c) 2021 Google LLC.
+#    All rights reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+#
+
+##
+#    @file
+#       Implements the sender and receiver of happy-perf: a bulk transfer
+#       and a request/response test over TCP or UDP.
+#
+#       The receiver answers both protocols on one port until it is
+#       stopped, and prints "ready" once it listens:
+#
+#       python HappyPerfProbe.py --server --port 5201
+#
+#       The sender runs the tests against it and prints the results as
+#       JSON, with the latency of every request in ns:
+#
+#       python HappyPerfProbe.py --client 10.0.1.3 --port 5201 --protocol tcp --test all --duration 5
+#
+
+from __future__ import absolute_import
+from __future__ import print_function
+import getopt
+import json
+import random
+import socket
+from struct import *
+import sys
+import threading
+import time
+
+options = {}
+options["server"] = False
+options["client"] = None
+options["port"] = 5201
+options["protocol"] = "tcp"
+options["test"] = "all"
+options["duration"] = 5.0
+options["size"] = None
+options["rate"] = 0
+
+# default sizes of a bulk write, a UDP datagram and a request
+TCP_BULK_SIZE = 128 * 1024
+UDP_BULK_SIZE = 1400
+REQUEST_SIZE = 64
+
+BULK = b'B'
+END = b'E'
+REQUEST = b'R'
+
+# linux/tcp.h, struct tcp_info
+TCP_INFO_RTT = 68
+TCP_INFO_SND_CWND = 80
+TCP_INFO_TOTAL_RETRANS = 100
+TCP_INFO_SIZE = 104
+
+UDP_ANSWER_TIMEOUT = 1.0
+
+
+def TcpInfo(sock):
+    """
+    Returns the retransmits, smoothed rtt in us and congestion window of a
+    TCP socket.
+    """
+    info = sock.getsockopt(socket.IPPROTO_TCP, socket.TCP_INFO, TCP_INFO_SIZE)
+    if len(info) < TCP_INFO_SIZE:
+        return {"retransmits": None, "rtt_us": None, "cwnd": None}
+    return {"retransmits": unpack_from('=I', info, TCP_INFO_TOTAL_RETRANS)[0],
+            "rtt_us": unpack_from('=I', info, TCP_INFO_RTT)[0],
+            "cwnd": unpack_from('=I', info, TCP_INFO_SND_CWND)[0]}
+
+
+def ReceiveExactly(sock, size):
+    data = b''
+    while len(data) < size:
+        chunk = sock.recv(size - len(data))
+        if not chunk:
+            return None
+        data += chunk
+    return data
+
+
+def Listen(family, kind, port):
+    sock = socket.socket(family, kind)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if family == socket.AF_INET6:
+        # and IPv4, mapped
+        sock.setsockopt(socket.IPPROTO_IPV6, socket.IPV6_V6ONLY, 0)
+        sock.bind(("::", port))
+    else:
+        sock.bind(("0.0.0.0", port))
+    return sock
+
+
+def Address(host, port):
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    if family == socket.AF_INET6:
+        return family, (host, port, 0, 0)
+    return family, (host, port)
+
+
+class Server(object):
+    """
+    Counts the bytes of bulk TCP connections and echoes the requests of
+    request/response ones, one thread per connection, and counts the
+    datagrams of UDP flows and echoes UDP requests.
+    """
+
+    def __init__(self, port):
+        try:
+            family = socket.AF_INET6
+            self.tcp = Listen(family, socket.SOCK_STREAM, port)
+        except OSError:
+            family = socket.AF_INET
+            self.tcp = Listen(family, socket.SOCK_STREAM, port)
+        self.tcp.listen(128)
+        self.udp = Listen(family, socket.SOCK_DGRAM, port)
+        self.flows = {}
+
+    def __serve_connection(self, conn):
+        try:
+            kind = ReceiveExactly(conn, 1)
+            if kind == BULK:
+                received = 0
+                buf = bytearray(TCP_BULK_SIZE)
+                while True:
+                    n = conn.recv_into(buf)
+                    if n == 0:
+                        break
+                    received += n
+                conn.sendall(pack('!Q', received))
+
+            elif kind == REQUEST:
+                conn.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+                size = unpack('!I', ReceiveExactly(conn, 4))[0]
+                while True:
+                    request = ReceiveExactly(conn, size)
+                    if request is None:
+                        break
+                    conn.sendall(request)
+        except (OSError, TypeError):
+            pass
+        finally:
+            conn.close()
+
+    def __serve_tcp(self):
+        while True:
+            conn, address = self.tcp.accept()
+            thread = threading.Thread(target=self.__serve_connection, args=(conn,))
+            thread.daemon = True
+            thread.start()
+
+    def __serve_udp(self):
+        while True:
+            data, address = self.udp.recvfrom(65535)
+            if len(data) < 5:
+                continue
+
+            kind, flow = data[:1], data[1:5]
+            if kind == BULK:
+                count, size = self.flows.get(flow, (0, 0))
+                self.flows[flow] = (count + 1, size + len(data))
+
+            elif kind == END:
+                count, size = self.flows.get(flow, (0, 0))
+                self.udp.sendto(END + flow + pack('!QQ', count, size), address)
+
+            elif kind == REQUEST:
+                self.udp.sendto(data, address)
+
+    def Serve(self):
+        thread = threading.Thread(target=self.__serve_tcp)
+        thread.daemon = True
+        thread.start()
+
+        print("ready")
+        sys.stdout.flush()
+
+        self.__serve_udp()
+
+
+def TcpBulk(host, port, duration, size):
+    family, address = Address(host, port)
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    try:
+        sock.connect(address)
+        buf = b'\0' * size
+        sent = 0
+
+        begin = time.monotonic()
+        sock.sendall(BULK)
+        end = begin + duration
+        while time.monotonic() < end:
+            sock.sendall(buf)
+            sent += size
+        sock.shutdown(socket.SHUT_WR)
+
+        # the receiver answers once it has read everything
+        received = unpack('!Q', ReceiveExactly(sock, 8))[0]
+        seconds = time.monotonic() - begin
+
+        results = {"sent": sent, "received": received, "seconds": seconds,
+                   "bits_per_second": received * 8 / seconds}
+        results.update(TcpInfo(sock))
+        return results
+    finally:
+        sock.close()
+
+
+def TcpRequestResponse(host, port, duration, size):
+    family, address = Address(host, port)
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    try:
+        sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        sock.connect(address)
+        sock.sendall(REQUEST + pack('!I', size))
+
+        request = b'\0' * size
+        latencies = []
+        begin = time.monotonic()
+        end = begin + duration
+        while True:
+            sent = time.perf_counter_ns()
+            sock.sendall(request)
+            if ReceiveExactly(sock, size) is None:
+                break
+            latencies.append(time.perf_counter_ns() - sent)
+            if time.monotonic() >= end:
+                break
+        seconds = time.monotonic() - begin
+
+        results = {"transactions": len(latencies), "lost": 0, "seconds": seconds,
+                   "transactions_per_second": len(latencies) / seconds, "latencies": latencies}
+        results.update(TcpInfo(sock))
+        return results
+    finally:
+        sock.close()
+
+
+def UdpBulk(host, port, duration, size, rate):
+    family, address = Address(host, port)
+    sock = socket.socket(family, socket.SOCK_DGRAM)
+    try:
+        flow = pack('!I', random.randint(0, 0xffffffff))
+        datagram = bytearray(max(size, 9))
+        datagram[:5] = BULK + flow
+        sent = 0
+        errors = 0
+
+        begin = time.monotonic()
+        end = begin + duration
+        while True:
+            now = time.monotonic()
+            if now >= end:
+                break
+            if rate > 0:
+                due = begin + sent / float(rate)
+                if due > now:
+                    time.sleep(due - now)
+            datagram[5:9] = pack('!I', sent & 0xffffffff)
+            try:
+                sock.sendto(datagram, address)
+                sent += 1
+            except OSError:
+                # ENOBUFS when the queue of the interface is full
+                errors += 1
+        seconds = time.monotonic() - begin
+
+        # the datagrams still on their way
+        time.sleep(0.2)
+        sock.settimeout(UDP_ANSWER_TIMEOUT)
+        received, received_bytes = None, None
+        for attempt in range(5):
+            sock.sendto(END + flow, address)
+            try:
+                data = sock.recv(64)
+            except socket.timeout:
+                continue
+            if data[:5] == END + flow:
+                received, received_bytes = unpack('!QQ', data[5:21])
+                break
+
+        results = {"sent": sent * len(datagram), "datagrams": sent, "send_errors": errors, "seconds": seconds}
+        if received is None:
+            results.update({"received": None, "lost": None, "bits_per_second": None})
+        else:
+            results.update({"received": received_bytes, "lost": sent - received,
+                            "bits_per_second": received_bytes * 8 / seconds})
+        return results
+    finally:
+        sock.close()
+
+
+def UdpRequestResponse(host, port, duration, size):
+    family, address = Address(host, port)
+    sock = socket.socket(family, socket.SOCK_DGRAM)
+    try:
+        sock.settimeout(UDP_ANSWER_TIMEOUT)
+        flow = pack('!I', random.randint(0, 0xffffffff))
+        request = bytearray(max(size, 9))
+        request[:5] = REQUEST + flow
+
+        latencies = []
+        lost = 0
+        seq = 0
+        begin = time.monotonic()
+        end = begin + duration
+        while time.monotonic() < end:
+            seq = (seq + 1) & 0xffffffff
+            request[5:9] = pack('!I', seq)
+            sent = time.perf_counter_ns()
+            sock.sendto(request, address)
+            try:
+                while True:
+                    answer = sock.recv(len(request))
+                    # a late answer to an earlier request is skipped
+                    if answer[:9] == request[:9]:
+                        break
+            except socket.timeout:
+                lost += 1
+                continue
+            latencies.append(time.perf_counter_ns() - sent)
+        seconds = time.monotonic() - begin
+
+        return {"transactions": len(latencies), "lost": lost, "seconds": seconds,
+                "transactions_per_second": len(latencies) / seconds, "latencies": latencies}
+    finally:
+        sock.close()
+
+
+def Run(host, port, protocol="tcp", test="all", duration=5.0, size=None, rate=0):
+    """
+    Runs the bulk test, the request/response test or both, each for
+    duration seconds, against the receiver at host and port. size is that
+    of a bulk write or datagram, or of a request; rate limits the datagrams
+    per second of a UDP bulk test.
+    """
+    results = {"protocol": protocol}
+
+    if test in ["bulk", "all"]:
+        if protocol == "udp":
+            results["bulk"] = UdpBulk(host, port, duration, size or UDP_BULK_SIZE, rate)
+        else:
+            results["bulk"] = TcpBulk(host, port, duration, size or TCP_BULK_SIZE)
+
+    if test in ["rr", "all"]:
+        # a bulk size is too large a request
+        request = size if test == "rr" and size is not None else REQUEST_SIZE
+        if protocol == "udp":
+            results["rr"] = UdpRequestResponse(host, port, duration, request)
+        else:
+            results["rr"] = TcpRequestResponse(host, port, duration, request)
+
+    return results
+
+
+if __name__ == "__main__":
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], "hsc:p:P:t:d:l:r:",
+                                   ["help", "server", "client=", "port=", "protocol=", "test=", "duration=",
+                                    "size=", "rate="])
+
+    except getopt.GetoptError as err:
+        sys.exit("%s: Failed to parse arguments." % (__file__))
+
+    for o, a in opts:
+        if o in ("-h", "--help"):
+            print("python HappyPerfProbe.py (--server | --client <ADDRESS>) [--port <PORT>] "
+                  "[--protocol tcp|udp] [--test bulk|rr|all] [--duration <SECONDS>] "
+                  "[--size <BYTES>] [--rate <PPS>]")
+            sys.exit(0)
+
+        elif o in ("-s", "--server"):
+            options["server"] = True
+
+        elif o in ("-c", "--client"):
+            options["client"] = a
+
+        elif o in ("-p", "--port"):
+            options["port"] = int(a)
+
+        elif o in ("-P", "--protocol"):
+            options["protocol"] = a
+
+        elif o in ("-t", "--test"):
+            options["test"] = a
+
+        elif o in ("-d", "--duration"):
+            options["duration"] = float(a)
+
+        elif o in ("-l", "--size"):
+            options["size"] = int(a)
+
+        elif o in ("-r", "--rate"):
+            options["rate"] = int(a)
+
+        else:
+            assert False, "unhandled option"
+
+    if options["server"]:
+        try:
+            Server(options["port"]).Serve()
+        except KeyboardInterrupt:
+            pass
+        sys.exit(0)
+
+    if options["client"] is None:
+        sys.exit("%s: Missing --server or --client." % (__file__))
+
+    try:
+        results = Run(options["client"], options["port"], options["protocol"], options["test"],
+                      options["duration"], options["size"], options["rate"])
+    except (OSError, TypeError) as e:
+        results = {"error": str(e)}
+
+    json.dump(results, sys.stdout)
+    print()
@@ -23,8 +23,11 @@
 #
 
 from __future__ import absolute_import
+import ctypes
 import os
 import psutil
+import socket
+import subprocess
 import sys
 import time
 import math
@@ -34,10 +37,103 @@ from happy.HappyHost import HappyHost
 import happy.HappyLinkDelete
 
 
+CLONE_NEWNET = 0x40000000
+
+
+_setns = None
+
+
+def _libc_setns():
+    global _setns
+
+    if _setns is not None:
+        return _setns
+
+    # os.setns() only exists since Python 3.12
+    if hasattr(os, "setns"):
+        _setns = os.setns
+        return _setns
+
+    # libc is already mapped into the interpreter; looking it up by name
+    # would run ldconfig.
+    libc = ctypes.CDLL(None, use_errno=True)
+
+    def setns(fd, nstype):
+        if libc.setns(fd, nstype) != 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+
+    _setns = setns
+    return _setns
+
+
 class HappyProcess(HappyHost):
     def __init__(self, node_id=None):
         HappyHost.__init__(self)
 
+    def SpawnInNamespace(self, netns_path, cmd_list, **popen_args):
+        """
+        Starts cmd_list directly in the network namespace at netns_path,
+        without sudo or ip netns exec in between, and returns the Popen
+        object. Requires root.
+
+        The calling thread joins the namespace just for the fork, so the
+        child inherits it and subprocess can keep using vfork.
+        """
+        setns = _libc_setns()
+
+        orig_fd = os.open("/proc/self/ns/net", os.O_RDONLY | os.O_CLOEXEC)
+        ns_fd = os.open(netns_path, os.O_RDONLY | os.O_CLOEXEC)
+        try:
+            setns(ns_fd, CLONE_NEWNET)
+            try:
+                return subprocess.Popen(cmd_list, **popen_args)
+            finally:
+                setns(orig_fd, CLONE_NEWNET)
+        finally:
+            os.close(ns_fd)
+            os.close(orig_fd)
+
+    def SpawnAtNode(self, node_id, cmd_list, **popen_args):
+        """
+        Starts cmd_list in the namespace of the node, or network, node_id
+        and returns the Popen object: with SpawnInNamespace when Happy runs
+        as root, through sudo and ip netns exec otherwise.
+        """
+        self.logger.debug("[%s] HappyProcess: %s" % (node_id, cmd_list))
+        if os.geteuid() == 0:
+            return self.SpawnInNamespace(self.getNetNSPath(node_id), cmd_list, **popen_args)
+
+        cmd_list = self.getRunAsRootPrefixList() + ["ip", "netns", "exec", self.uniquePrefix(node_id)] + cmd_list
+        return subprocess.Popen(cmd_list, **popen_args)
+
+    def SocketInNamespace(self, netns_path, family, type, proto=0):
+        """
+        Returns a socket created in the network namespace at netns_path. A
+        socket stays in the namespace it was created in, so it can be used
+        from this one. Requires root.
+        """
+        setns = _libc_setns()
+
+        orig_fd = os.open("/proc/self/ns/net", os.O_RDONLY | os.O_CLOEXEC)
+        ns_fd = os.open(netns_path, os.O_RDONLY | os.O_CLOEXEC)
+        try:
+            setns(ns_fd, CLONE_NEWNET)
+            try:
+                return socket.socket(family, type, proto)
+            finally:
+                setns(orig_fd, CLONE_NEWNET)
+        finally:
+            os.close(ns_fd)
+            os.close(orig_fd)
+
+    def getProcessStatsLog(self):
+        """
+        HappyProcessStart appends the phase timings of every start to this
+        file, one JSON object per line.
+        """
+        return self.process_log_prefix + "process_stats.log"
+
     def GetProcessByPID(self, pid, create_time):
         """A helper method for finding the process by PID and creation time.  Returns a
         psutils.Process object if there is a process matching the PID, creation
@@ -170,6 +266,8 @@ class HappyProcess(HappyHost):
         # root     142652  0.0  0.0   6500   628 pts/43   S    19:41   0:00 ping 127.0.0.1
         #
         # Note that HappyProcessStart stores the pid of the oldest parent.
+        # When HappyProcessStart spawns the process directly into the namespace
+        # (--direct), there is no sudo chain and the stored pid is the process itself.
         #
         # The goal is to send a SIGUSR1 to the actual process (in the example above, 'watch ls')
         # If the process has not registered a handler for SIGUSR1, it will be terminated.
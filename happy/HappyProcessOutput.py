@@ -33,11 +33,13 @@ import sys
 from happy.ReturnMsg import ReturnMsg
 from happy.Utils import *
 from happy.HappyNode import HappyNode
+import happy.HappyProcessOutputCollector
 
 options = {}
 options["quiet"] = False
 options["node_id"] = None
 options["tag"] = None
+options["stream"] = None
 
 
 def option():
@@ -60,6 +62,11 @@ class HappyProcessOutput(HappyNode):
         Displays the output of the ContinuousPing process running on
         the BorderRouter node.
 
+    When the process was started with output rotation, the rotated (and
+    possibly compressed) segments are read back in order, followed by the
+    current output file. The command line utility writes the output to
+    stdout as it reads it.
+
     return:
         0    success
         1    fail
@@ -71,6 +78,7 @@ class HappyProcessOutput(HappyNode):
         self.quiet = opts["quiet"]
         self.node_id = opts["node_id"]
         self.tag = opts["tag"]
+        self.stream = opts.get("stream")
         self.process_output = None
 
     def __pre_check(self):
@@ -80,6 +88,22 @@ class HappyProcessOutput(HappyNode):
             self.logger.error("[localhost] HappyProcessOutput: %s" % (emsg))
             self.RaiseError(emsg)
 
+    def readOutput(self, fout=None):
+        """
+        Yields the process output in chunks, streaming across the rotated
+        output segments without loading them all in memory.
+        """
+        if fout is None:
+            fout = self.getNodeProcessOutputFile(self.tag, self.node_id)
+
+        if len(self.getNodeProcessOutputRotation(self.tag, self.node_id)) == 0:
+            segments = [fout]
+        else:
+            segments = happy.HappyProcessOutputCollector.GetOutputSegments(fout)
+
+        for chunk in happy.HappyProcessOutputCollector.ReadOutput(segments):
+            yield chunk
+
     def __process_output(self):
         fout = self.getNodeProcessOutputFile(self.tag, self.node_id)
 
@@ -93,8 +117,14 @@ class HappyProcessOutput(HappyNode):
             delayExecution(0.5)
 
         try:
-            with open(fout, 'r') as pout:
-                self.process_output = pout.read()
+            if self.stream is not None:
+                # written as it is read, however large the output is
+                for chunk in self.readOutput(fout):
+                    self.stream.write(chunk)
+                self.stream.flush()
+                return
+
+            self.process_output = "".join(self.readOutput(fout))
 
         except IOError as e:
             emsg = "Problem with %s: " % (fout)
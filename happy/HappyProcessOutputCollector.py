@@ -0,0 +1,316 @@
+#!/usr/bin/env python3
+
+#
+#    Copyright (c) 2021 Google LLC.
+#    All rights reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+#
+
+##
+#    @file
+#       Implements the output collector HappyProcessStart puts between a
+#       process and its output file when output rotation is enabled.
+#
+#       The collector owns the read end of the process stdout pipe and
+#       writes it to <out>. When <out> grows past --max-bytes or gets older
+#       than --max-age seconds it is renamed to <out>.<seq>, optionally
+#       compressed in the background with gzip or zstd, and recorded in
+#       <out>.index, one JSON object per line. Only the newest --keep
+#       segments are kept. The collector exits when the process (and all
+#       its children) have closed the pipe.
+#
+#       python HappyProcessOutputCollector.py --file /tmp/happy_..._TAG.out --max-bytes 104857600 --compress zstd
+#
+
+from __future__ import absolute_import
+from __future__ import print_function
+import codecs
+import getopt
+import gzip
+import json
+import os
+import signal
+import subprocess
+import sys
+import time
+
+options = {}
+options["file"] = None
+options["max_bytes"] = None
+options["max_age"] = None
+options["compress"] = None
+options["keep"] = None
+
+compress_suffix = {"gzip": ".gz", "zstd": ".zst"}
+compress_cmd = {"gzip": ["gzip", "-q", "-f"], "zstd": ["zstd", "-q", "-f", "--rm"]}
+
+read_size = 65536
+
+
+def GetIndexFile(out_file):
+    return out_file + ".index"
+
+
+def GetOutputSegments(out_file):
+    """
+    Returns the files holding the output written to out_file, oldest first:
+    every rotated segment that still exists followed by out_file itself.
+    A segment whose background compression has not finished yet is returned
+    under its uncompressed name.
+    """
+    segments = []
+
+    try:
+        with open(GetIndexFile(out_file), "r") as index:
+            for line in index:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+
+                path = record["file"]
+                if not os.path.exists(path) and record.get("compress") is not None:
+                    raw = path[:-len(compress_suffix[record["compress"]])]
+                    if os.path.exists(raw):
+                        path = raw
+
+                if os.path.exists(path):
+                    segments.append(path)
+    except (IOError, OSError):
+        pass
+
+    if os.path.exists(out_file):
+        segments.append(out_file)
+
+    return segments
+
+
+def ReadOutputSegment(path, size=read_size):
+    """
+    Yields the content of one output segment as byte chunks of about size
+    bytes, decompressing gzip and zstd segments on the fly.
+    """
+    proc = None
+
+    if path.endswith(compress_suffix["gzip"]):
+        segment = gzip.open(path, "rb")
+    elif path.endswith(compress_suffix["zstd"]):
+        proc = subprocess.Popen(["zstd", "-q", "-d", "-c", path], stdout=subprocess.PIPE)
+        segment = proc.stdout
+    else:
+        segment = open(path, "rb")
+
+    try:
+        while True:
+            chunk = segment.read(size)
+            if not chunk:
+                break
+            yield chunk
+    finally:
+        segment.close()
+        if proc is not None:
+            proc.wait()
+
+
+def ReadOutput(segments, size=read_size):
+    """
+    Yields the content of the output segments, in order, as text chunks.
+    The segments are decoded as one stream, so a character split across two
+    reads or two segments is decoded whole.
+    """
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+
+    for path in segments:
+        for chunk in ReadOutputSegment(path, size):
+            text = decoder.decode(chunk)
+            if text:
+                yield text
+
+    text = decoder.decode(b"", final=True)
+    if text:
+        yield text
+
+
+class OutputCollector(object):
+    def __init__(self, opts=options):
+        self.out_file = opts["file"]
+        self.max_bytes = opts["max_bytes"]
+        self.max_age = opts["max_age"]
+        self.compress = opts["compress"]
+        self.keep = opts["keep"]
+
+        self.seq = 0
+        self.segments = []
+        self.compressors = []
+        self.fout = None
+        self.written = 0
+        self.opened = None
+
+    def __open(self):
+        self.fout = open(self.out_file, "wb", 0)
+        self.written = 0
+        self.opened = time.time()
+
+    def __reap(self, wait=False):
+        alive = []
+        for proc in self.compressors:
+            if wait:
+                proc.wait()
+            elif proc.poll() is None:
+                alive.append(proc)
+        self.compressors = alive
+
+    def __expire(self):
+        if self.keep is None:
+            return
+
+        while len(self.segments) > self.keep:
+            path = self.segments.pop(0)
+            names = [path]
+            if self.compress is not None and path.endswith(compress_suffix[self.compress]):
+                # the segment may still be waiting for its compressor
+                names.append(path[:-len(compress_suffix[self.compress])])
+            for name in names:
+                try:
+                    os.unlink(name)
+                except OSError:
+                    pass
+
+    def __rotate(self):
+        self.fout.close()
+
+        self.seq += 1
+        segment = "%s.%d" % (self.out_file, self.seq)
+        os.rename(self.out_file, segment)
+
+        record = {}
+        record["seq"] = self.seq
+        record["bytes"] = self.written
+        record["start"] = self.opened
+        record["end"] = time.time()
+        record["compress"] = self.compress
+
+        if self.compress is not None:
+            try:
+                self.compressors.append(subprocess.Popen(compress_cmd[self.compress] + [segment]))
+                segment += compress_suffix[self.compress]
+            except OSError as e:
+                # Keep the output rather than lose it when the compressor
+                # is not installed.
+                print("%s: %s, keeping %s uncompressed" % (__file__, str(e), segment), file=sys.stderr)
+                record["compress"] = None
+
+        record["file"] = segment
+        self.segments.append(segment)
+
+        with open(GetIndexFile(self.out_file), "a") as index:
+            index.write(json.dumps(record, sort_keys=True) + "\n")
+
+        self.__reap()
+        self.__expire()
+        self.__open()
+
+    def __needs_rotation(self):
+        if self.written == 0:
+            return False
+        if self.max_bytes is not None and self.written >= self.max_bytes:
+            return True
+        if self.max_age is not None and time.time() - self.opened > self.max_age:
+            return True
+        return False
+
+    def __write(self, data):
+        while len(data) > 0:
+            if self.__needs_rotation():
+                self.__rotate()
+
+            chunk = data
+            if self.max_bytes is not None:
+                chunk = data[:self.max_bytes - self.written]
+
+            self.fout.write(chunk)
+            self.written += len(chunk)
+            data = data[len(chunk):]
+
+    def run(self, fd=0):
+        self.__open()
+
+        while True:
+            try:
+                data = os.read(fd, read_size)
+            except InterruptedError:
+                continue
+
+            if not data:
+                break
+
+            self.__write(memoryview(data))
+
+        self.fout.close()
+        self.__reap(wait=True)
+
+
+if __name__ == "__main__":
+
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], "hf:b:a:c:k:",
+                                   ["help", "file=", "max-bytes=", "max-age=", "compress=", "keep="])
+
+    except getopt.GetoptError as err:
+        sys.exit("%s: Failed to parse arguments." % (__file__))
+
+    for o, a in opts:
+        if o in ("-h", "--help"):
+            print("Copies stdin to --file, rotating it by size (--max-bytes) or age (--max-age seconds), " \
+                  "compressing rotated segments with --compress gzip|zstd and keeping the newest --keep of them.")
+            sys.exit(0)
+
+        elif o in ("-f", "--file"):
+            options["file"] = a
+
+        elif o in ("-b", "--max-bytes"):
+            options["max_bytes"] = a
+
+        elif o in ("-a", "--max-age"):
+            options["max_age"] = a
+
+        elif o in ("-c", "--compress"):
+            options["compress"] = a
+
+        elif o in ("-k", "--keep"):
+            options["keep"] = a
+
+        else:
+            assert False, "unhandled option"
+
+    if options["file"] is None:
+        sys.exit("%s: Missing output file." % (__file__))
+
+    try:
+        for key, parse in [("max_bytes", int), ("max_age", float), ("keep", int)]:
+            if options[key] is not None:
+                options[key] = parse(options[key])
+                if not options[key] > 0:
+                    raise ValueError
+    except ValueError:
+        sys.exit("%s: Invalid --%s %s." % (__file__, key.replace("_", "-"), options[key]))
+
+    if options["compress"] is not None and options["compress"] not in compress_cmd:
+        sys.exit("%s: Unknown compression %s." % (__file__, options["compress"]))
+
+    # The collector must outlive a Ctrl-C aimed at the process it serves;
+    # it stops when the pipe is closed.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+
+    OutputCollector(options).run()
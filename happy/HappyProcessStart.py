@@ -26,6 +26,7 @@
 #
 
 from __future__ import absolute_import
+import json
 import os
 import subprocess
 import sys
@@ -37,7 +38,9 @@ from happy.ReturnMsg import ReturnMsg
 from happy.Utils import *
 from happy.HappyNode import HappyNode
 from happy.HappyProcess import HappyProcess
+from happy.HappyCGroup import HappyCGroup
 import happy.HappyProcessStop
+import happy.HappyProcessOutputCollector
 
 options = {}
 options["quiet"] = False
@@ -45,35 +48,69 @@ options["node_id"] = None
 options["tag"] = None
 options["command"] = None
 options["strace"] = False
+options["strace_mode"] = "trace"
 options["env"] = {}
 options["sync_on_output"] = None
 options["rootMode"] = False
+options["direct_spawn"] = None
+options["rotate_size"] = None
+options["rotate_age"] = None
+options["rotate_compress"] = None
+options["rotate_keep"] = None
 
 def option():
     return options.copy()
 
 
-class HappyProcessStart(HappyNode, HappyProcess):
+class HappyProcessStart(HappyNode, HappyProcess, HappyCGroup):
     """
     Starts a happy process.
 
     happy-process-start [-h --help] [-q --quiet] [-i --id <NODE_NAME>]
                         [-t --tag <DAEMON_NAME>] [-s --strace]
-                        [-e --env <ENVIRONMENT>] <COMMAND>
+                        [--strace-mode <trace|timed|count>] [-e --env <ENVIRONMENT>] [-d --direct]
+                        [--rotate-size <BYTES>] [--rotate-age <SECONDS>]
+                        [--compress <gzip|zstd>] [--keep <SEGMENTS>] <COMMAND>
 
         -i --id     Optional. Node on which to run the process. Find using
                     happy-node-list or happy-state.
         -t --tag    Required. Name of the process.
         -s --strace Optional. Enable strace output for the process.
+        --strace-mode
+                    Optional. "trace" (default) records every call with
+                    "strace -tt", "timed" adds the time spent in each call
+                    ("-T") and "count" only writes the per-syscall summary
+                    table at exit ("-c"), which has the lowest overhead.
+                    Implies --strace.
         -e --env    Optional. An environment variable to pass to the node
                     for use by the process.
+        -d --direct Optional. When Happy runs as root, fork once and join
+                    the node namespace with setns() instead of going
+                    through sudo and ip netns exec. The process runs as
+                    root, as it would through ip netns exec, and the
+                    recorded PID is the process itself. Enabled by
+                    default when the process_direct_spawn configuration
+                    key is true.
+        --rotate-size
+                    Optional. Rotate the process output once it reaches
+                    the given size, e.g. 100M.
+        --rotate-age
+                    Optional. Rotate the process output once it is older
+                    than the given number of seconds.
+        --compress  Optional. Compress rotated output with gzip or zstd.
+        --keep      Optional. Only keep the newest <SEGMENTS> rotated
+                    output segments.
         <COMMAND>   Required. The command to run as process <DAEMON_NAME>.
 
-    Example:
+    Examples:
     $ happy-process-start BorderRouter ContinuousPing ping 127.0.0.1
         Starts a process within the BorderRouter node called ContinuousPing
         that runs "ping 127.0.0.1" continuously.
 
+    $ happy-process-start --rotate-size 100M --compress zstd --keep 20 BorderRouter ContinuousPing ping 127.0.0.1
+        Same as above, but keeps at most 20 zstd compressed 100 MB segments
+        of output besides the current one.
+
     return:
         0    success
         1    fail
@@ -82,6 +119,7 @@ class HappyProcessStart(HappyNode, HappyProcess):
     def __init__(self, opts=options):
         HappyNode.__init__(self)
         HappyProcess.__init__(self)
+        HappyCGroup.__init__(self)
 
         self.quiet = opts["quiet"]
         self.node_id = opts["node_id"]
@@ -92,7 +130,55 @@ class HappyProcessStart(HappyNode, HappyProcess):
         self.sync_on_output = opts["sync_on_output"]
         self.output_fileput_suffix = ".out"
         self.strace_suffix = ".strace"
+        self.strace_mode = opts["strace_mode"]
+        self.strace_modes = {"trace": ["-tt"], "timed": ["-tt", "-T"], "count": ["-c"]}
         self.rootMode = opts["rootMode"]
+        self.direct_spawn = opts["direct_spawn"]
+        self.rotate_size = opts["rotate_size"]
+        self.rotate_age = opts["rotate_age"]
+        self.rotate_compress = opts["rotate_compress"]
+        self.rotate_keep = opts["rotate_keep"]
+        self.rotate = self.rotate_size is not None or self.rotate_age is not None
+        self.collector = None
+        self.timings = {}
+
+        if self.direct_spawn is None:
+            self.direct_spawn = str(self.configuration.get("process_direct_spawn", "false")).lower() in ["1", "true", "yes"]
+
+    def __check_rotation(self):
+        try:
+            self.rotate_size = parseSize(self.rotate_size)
+            if self.rotate_size is not None and self.rotate_size <= 0:
+                raise ValueError
+        except ValueError:
+            emsg = "Invalid output rotation size %s." % (self.rotate_size)
+            self.logger.error("[localhost] HappyProcessStart: %s" % (emsg))
+            self.exit()
+
+        try:
+            if self.rotate_age is not None:
+                self.rotate_age = float(self.rotate_age)
+                if not self.rotate_age > 0:
+                    raise ValueError
+        except ValueError:
+            emsg = "Invalid output rotation age %s, expected seconds." % (self.rotate_age)
+            self.logger.error("[localhost] HappyProcessStart: %s" % (emsg))
+            self.exit()
+
+        try:
+            if self.rotate_keep is not None:
+                self.rotate_keep = int(self.rotate_keep)
+                if self.rotate_keep < 1:
+                    raise ValueError
+        except ValueError:
+            emsg = "Invalid number of output segments to keep %s." % (self.rotate_keep)
+            self.logger.error("[localhost] HappyProcessStart: %s" % (emsg))
+            self.exit()
+
+        if self.rotate_keep is not None and not self.rotate:
+            emsg = "--keep needs --rotate-size or --rotate-age."
+            self.logger.error("[localhost] HappyProcessStart: %s" % (emsg))
+            self.exit()
 
     def __stopProcess(self):
         emsg = "Process %s stops itself." % (self.tag)
@@ -115,10 +201,12 @@ class HappyProcessStart(HappyNode, HappyProcess):
             self.exit()
 
         # Check if the name of new process is not a duplicate (that it does not already exists).
+        start = time.monotonic()
         if self.processExists(self.tag):
             emsg = "virtual process %s already exist." % (self.tag)
             self.logger.info("[%s] HappyProcessStart: %s" % (self.node_id, emsg))
             self.__stopProcess()
+        self.__timed("process_exists", start)
 
         # Check if the process command is given
         if not self.command:
@@ -126,6 +214,19 @@ class HappyProcessStart(HappyNode, HappyProcess):
             self.logger.error("[localhost] HappyProcessStart: %s" % (emsg))
             self.exit()
 
+        if self.strace_mode not in self.strace_modes:
+            emsg = "Unknown strace mode %s." % (self.strace_mode)
+            self.logger.error("[localhost] HappyProcessStart: %s" % (emsg))
+            self.exit()
+
+        if self.rotate_compress is not None and \
+           self.rotate_compress not in happy.HappyProcessOutputCollector.compress_cmd:
+            emsg = "Unknown output compression %s." % (self.rotate_compress)
+            self.logger.error("[localhost] HappyProcessStart: %s" % (emsg))
+            self.exit()
+
+        self.__check_rotation()
+
         timeStamp = "%010.6f" % time.time()
         pid = "%06d" % os.getpid()
         emsg = "Tag: %s PID: %s timeStamp : %s" % (self.tag, pid, timeStamp)
@@ -136,6 +237,9 @@ class HappyProcessStart(HappyNode, HappyProcess):
         self.strace_file = self.process_log_prefix + pid + \
             "_" + timeStamp + "_" + self.tag + self.strace_suffix
 
+    def __timed(self, phase, start):
+        self.timings[phase] = time.monotonic() - start
+
     def __poll_for_output(self):
         poll_interval_sec = 0.01
         max_poll_time_sec = 180
@@ -163,7 +267,7 @@ class HappyProcessStart(HappyNode, HappyProcess):
         tail.close()
         return
 
-    def __start_daemon(self):
+    def __build_command(self):
         cmd = self.command
 
         # We need to support 8 combinations:
@@ -284,7 +388,7 @@ class HappyProcessStart(HappyNode, HappyProcess):
         self.logger.debug("HappyProcessStart with env: > %s" % (env_vars_list))
 
         if self.strace:
-            cmd_list_prefix = ["strace", "-tt", "-o", self.strace_file] + cmd_list_prefix
+            cmd_list_prefix = self.__strace_prefix() + cmd_list_prefix
             tmp = []
             for i in env_vars_list:
                 tmp.append("-E")
@@ -306,8 +410,107 @@ class HappyProcessStart(HappyNode, HappyProcess):
         if self.node_id:
             cmd_list_prefix = ["ip", "netns", "exec", self.uniquePrefix(self.node_id)] + cmd_list_prefix
 
+            # Join the node cgroup, if any, while still root and before anything
+            # forks, so every descendant of the process is accounted to the node.
+            cmd_list_prefix = self.getCGroupExecPrefixList(self.node_id) + cmd_list_prefix
+
         cmd_list_prefix = self.getRunAsRootPrefixList() + cmd_list_prefix
 
+        cmd_list = []
+        if need_bash:
+            env_vars_list = []
+            for key, value in self.env.items():
+              tmp = ""
+              try:
+                  tmp = "" + key + '="' + value.replace('\\','\\\\').replace('"','\\"') +'"'
+                  env_vars_list.append(tmp)
+              except:
+                  self.logger.error("Failed to serialize environment variable %s" % (key));
+            cmd = " ".join(env_vars_list) + ' ' + cmd
+            cmd_list = cmd_list_prefix + ["bash", "-c", cmd]
+        else:
+            cmd_list = cmd_list_prefix + env_vars_list + cmd.split()
+
+        return cmd_list
+
+    def __use_direct_spawn(self):
+        # The direct path joins the node namespace with setns() around a single
+        # fork, so it needs Happy to run as root. It does not
+        # set up the private mount namespace "ip netns exec" creates, so nodes
+        # with /etc/netns overrides (e.g. a per-node resolv.conf) keep using the
+        # sudo/ip-netns-exec chain.
+        if not self.direct_spawn:
+            return False
+
+        reason = None
+        cmd = self.command.split()
+
+        if os.geteuid() != 0:
+            reason = "Happy is not running as root"
+        elif not self.node_id or self.isNodeLocal(self.node_id):
+            reason = "the process does not run in a node namespace"
+        elif not os.path.exists(self.getNetNSPath(self.node_id)):
+            reason = "namespace %s does not exist" % (self.uniquePrefix(self.node_id))
+        elif os.path.isdir(self.nsroot + "/" + self.uniquePrefix(self.node_id)):
+            reason = "the node has %s overrides" % (self.nsroot)
+        elif "sudo" in cmd or "bash -c" in self.command:
+            reason = "the command manages its own shell or privileges"
+        elif self.__uses_node_cgroup() and self.getOwnCGroupPath() is None:
+            # Happy could not step back out of the node cgroup
+            reason = "the cgroup of Happy itself is unknown"
+
+        if reason is not None:
+            emsg = "Not spawning %s directly: %s." % (self.tag, reason)
+            self.logger.debug("[%s] HappyProcessStart: %s" % (self.node_id, emsg))
+            return False
+
+        return True
+
+    def __strace_prefix(self):
+        return ["strace"] + self.strace_modes[self.strace_mode] + ["-o", self.strace_file]
+
+    def __build_direct_command(self):
+        cmd_list = self.command.split()
+
+        if self.strace:
+            cmd_list = self.__strace_prefix() + cmd_list
+
+        # The environment ip netns exec would pass on, without the SUDO_*
+        # variables that describe how Happy itself was started.
+        env = dict([(key, value) for key, value in os.environ.items() if not key.startswith("SUDO_")])
+        env.update(self.env)
+
+        return cmd_list, env
+
+    def __uses_node_cgroup(self):
+        cgroup_path = self.getNodeCGroupPath(self.node_id)
+        return cgroup_path is not None and os.path.isdir(cgroup_path)
+
+    def __spawn_direct(self, cmd_list, env):
+        netns_path = self.getNetNSPath(self.node_id)
+        if not self.__uses_node_cgroup():
+            return self.SpawnInNamespace(netns_path, cmd_list, stdin=subprocess.PIPE, stdout=self.fout, env=env)
+
+        # Happy steps into the node cgroup for the fork, so the process is
+        # born there and subprocess can keep using vfork. __use_direct_spawn
+        # made sure Happy knows its own cgroup to step back into.
+        own_cgroup = self.getOwnCGroupPath()
+        self.joinCGroup(self.getNodeCGroupPath(self.node_id))
+        try:
+            return self.SpawnInNamespace(netns_path, cmd_list, stdin=subprocess.PIPE, stdout=self.fout, env=env)
+        finally:
+            self.joinCGroup(own_cgroup)
+
+    def __start_daemon(self):
+        start = time.monotonic()
+        direct = self.__use_direct_spawn()
+
+        if direct:
+            cmd_list, env = self.__build_direct_command()
+        else:
+            cmd_list = self.__build_command()
+        self.__timed("build_command", start)
+
         try:
             self.fout = open(self.output_file, "wb", 0)
         except Exception:
@@ -315,28 +518,29 @@ class HappyProcessStart(HappyNode, HappyProcess):
             self.logger.error("[%s] HappyProcessStart: %s." % (self.node_id, emsg))
             self.exit()
 
-        self.logger.debug("HappyProcessStart: > %s" % (cmd))
+        if self.rotate:
+            start = time.monotonic()
+            self.__start_collector()
+            self.__timed("collector", start)
+
+        self.logger.debug("HappyProcessStart: > %s" % (self.command))
 
         popen = None
 
         try:
-            cmd_list = []
-            if need_bash:
-                env_vars_list = []
-                for key, value in self.env.items():
-                  tmp = ""
-                  try:
-                      tmp = "" + key + '="' + value.replace('\\','\\\\').replace('"','\\"') +'"'
-                      env_vars_list.append(tmp)
-                  except:
-                      self.logger.error("Failed to serialize environment variable %s" % (key));
-                cmd = " ".join(env_vars_list) + ' ' + cmd
-                cmd_list = cmd_list_prefix + ["bash", "-c", cmd]
+            self.logger.debug("[%s] HappyProcessStart: executing command list %s" % (self.node_id, cmd_list))
+            start = time.monotonic()
+            if direct:
+                popen = self.__spawn_direct(cmd_list, env)
             else:
-                cmd_list = cmd_list_prefix + env_vars_list + cmd.split()
+                popen = subprocess.Popen(cmd_list, stdin=subprocess.PIPE, stdout=self.fout)
+            self.__timed("popen", start)
+
+            if self.collector is not None:
+                # The process, and whatever it forks, now hold the only
+                # write ends of the pipe; the collector stops when they exit.
+                self.fout.close()
 
-            self.logger.debug("[%s] HappyProcessStart: executing command list %s" % (self.node_id, cmd_list))
-            popen = subprocess.Popen(cmd_list, stdin=subprocess.PIPE, stdout=self.fout)
             self.child_pid = popen.pid
             emsg = "running daemon %s (PID %d)" % (self.tag, self.child_pid)
             self.logger.debug("[%s] HappyProcessStart: %s" % (self.node_id, emsg))
@@ -345,6 +549,7 @@ class HappyProcessStart(HappyNode, HappyProcess):
             # no chance of being reused) because even if the child process terminates right away, it'll stay
             # around in <defunct> until the popen object has been destroyed or popen.poll() has
             # been called.
+            start = time.monotonic()
             p = psutil.Process(self.child_pid)
 
             # At python.psutil 2.0.0, create_time changed from a data
@@ -356,11 +561,15 @@ class HappyProcessStart(HappyNode, HappyProcess):
             except Exception:
                 self.create_time = p.create_time
 
+            self.__timed("create_time", start)
+
             emsg = "Create time: " + str(self.create_time)
             self.logger.debug("[%s] HappyProcessStart: %s." % (self.node_id, emsg))
 
             if self.sync_on_output:
+                start = time.monotonic()
                 self.__poll_for_output()
+                self.__timed("sync_wait", start)
 
         except Exception as e:
             if popen:
@@ -368,13 +577,57 @@ class HappyProcessStart(HappyNode, HappyProcess):
                 # we assume we were also able to get the create_time
                 self.TerminateProcessTree(popen.pid, self.create_time)
 
-            emsg = "Starting process with command %s FAILED with %s." % (cmd, str(e))
+            emsg = "Starting process with command %s FAILED with %s." % (self.command, str(e))
             self.logger.error("[%s] HappyProcessStart: %s." % (self.node_id, emsg))
             self.exit()
 
+    def __start_collector(self):
+        # The collector owns the process output file from now on; keep the
+        # empty file created above so that sync_on_output can open it.
+        self.fout.close()
+
+        path = os.path.dirname(os.path.abspath(__file__))
+        cmd_list = [sys.executable, path + "/HappyProcessOutputCollector.py", "--file", self.output_file]
+        if self.rotate_size is not None:
+            cmd_list += ["--max-bytes", str(self.rotate_size)]
+        if self.rotate_age is not None:
+            cmd_list += ["--max-age", str(self.rotate_age)]
+        if self.rotate_compress is not None:
+            cmd_list += ["--compress", self.rotate_compress]
+        if self.rotate_keep is not None:
+            cmd_list += ["--keep", str(self.rotate_keep)]
+
+        self.logger.debug("[%s] HappyProcessStart: output collector %s" % (self.node_id, cmd_list))
+
+        try:
+            self.collector = subprocess.Popen(cmd_list, stdin=subprocess.PIPE, start_new_session=True)
+        except Exception as e:
+            emsg = "Failed to start output collector: %s" % (str(e))
+            self.logger.error("[%s] HappyProcessStart: %s." % (self.node_id, emsg))
+            self.exit()
+
+        self.fout = self.collector.stdin
+
     def __post_check(self):
         pass
 
+    def __record_stats(self):
+        # The state write cannot time itself in the state it writes, so the
+        # complete set of phase timings goes to the process stats log.
+        record = {}
+        record["node"] = self.node_id
+        record["tag"] = self.tag
+        record["pid"] = self.child_pid
+        record["create_time"] = self.create_time
+        record["timings"] = self.timings
+
+        try:
+            with open(self.getProcessStatsLog(), "a") as log:
+                log.write(json.dumps(record, sort_keys=True) + "\n")
+        except (IOError, OSError) as e:
+            emsg = "Failed to record process stats: %s" % (str(e))
+            self.logger.warning("[%s] HappyProcessStart: %s." % (self.node_id, emsg))
+
     def __update_state(self):
         emsg = "Update State with tag %s running command: %s" % \
             (self.tag, self.command)
@@ -384,19 +637,39 @@ class HappyProcessStart(HappyNode, HappyProcess):
         new_process["pid"] = self.child_pid
         new_process["out"] = self.output_file
         new_process["strace"] = self.strace_file
+        if self.strace:
+            new_process["strace_mode"] = self.strace_mode
         new_process["command"] = self.command
         new_process["create_time"] = self.create_time
+        new_process["timings"] = dict(self.timings)
+
+        if self.collector is not None:
+            rotation = {}
+            rotation["index"] = happy.HappyProcessOutputCollector.GetIndexFile(self.output_file)
+            rotation["max_bytes"] = self.rotate_size
+            rotation["max_age"] = self.rotate_age
+            rotation["compress"] = self.rotate_compress
+            rotation["keep"] = self.rotate_keep
+            rotation["collector_pid"] = self.collector.pid
+            new_process["out_rotation"] = rotation
 
         self.setNodeProcess(new_process, self.tag, self.node_id)
 
+        start = time.monotonic()
         self.writeState()
+        self.__timed("state_write", start)
 
     def run(self):
+        begin = time.monotonic()
+
         with self.getStateLockManager():
 
             self.readState()
 
+            start = time.monotonic()
             self.__pre_check()
+            self.__timed("pre_check", start)
+            self.timings["pre_check"] -= self.timings["process_exists"]
 
             self.__start_daemon()
 
@@ -404,4 +677,7 @@ class HappyProcessStart(HappyNode, HappyProcess):
 
             self.__post_check()
 
-        return ReturnMsg(0)
+        self.__timed("total", begin)
+        self.__record_stats()
+
+        return ReturnMsg(0, self.timings)
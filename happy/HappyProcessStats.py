@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+
+#
+#    Copyright (c) 2021 Google LLC.
+#    All rights reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+#
+
+##
+#    @file
+#       Implements HappyProcessStats class that reports how long
+#       HappyProcessStart spent in each phase of starting processes.
+#
+
+from __future__ import absolute_import
+from __future__ import print_function
+import json
+
+from happy.ReturnMsg import ReturnMsg
+from happy.Utils import *
+from happy.HappyNode import HappyNode
+from happy.HappyProcess import HappyProcess
+
+options = {}
+options["quiet"] = False
+options["node_id"] = None
+options["tag"] = None
+options["summary"] = False
+
+phases = ["pre_check", "process_exists", "build_command", "collector", "popen",
+          "create_time", "sync_wait", "state_write", "total"]
+
+
+def option():
+    return options.copy()
+
+
+def percentile(samples, p):
+    """
+    Nearest-rank percentile of a list of samples, None if it is empty.
+    """
+    if len(samples) == 0:
+        return None
+    samples = sorted(samples)
+    rank = int(round(p / 100.0 * len(samples) + 0.5)) - 1
+    return samples[max(0, min(rank, len(samples) - 1))]
+
+
+class HappyProcessStats(HappyNode, HappyProcess):
+    """
+    Displays how long happy-process-start spent in each phase of starting
+    processes: pre-check, processExists, command building, output
+    collector, Popen, create_time lookup, sync wait and state write.
+    Times are in milliseconds.
+
+    happy-process-stats [-h --help] [-q --quiet] [-i --id <NODE_NAME>]
+                        [-t --tag <DAEMON_NAME>] [-s --summary]
+
+        -i --id     Optional. Only report processes of this node.
+        -t --tag    Optional. Only report this process.
+        -s --summary
+                    Optional. Report p50, p99 and max of every phase over
+                    all the starts recorded in the process stats log,
+                    including processes that have exited since. The log
+                    is deleted with the state by happy-state-delete.
+
+    Examples:
+    $ happy-process-stats
+        Displays the start phase timings of all running processes.
+
+    $ happy-process-stats --summary BorderRouter
+        Displays start latency percentiles of the processes started on the
+        BorderRouter node.
+
+    return:
+        0    success
+        1    fail
+    """
+
+    def __init__(self, opts=options):
+        HappyNode.__init__(self)
+        HappyProcess.__init__(self)
+
+        self.quiet = opts["quiet"]
+        self.node_id = opts["node_id"]
+        self.tag = opts["tag"]
+        self.summary = opts["summary"]
+        self.stats = None
+
+    def __pre_check(self):
+        if self.node_id is not None and not self._nodeExists(self.node_id):
+            emsg = "virtual node %s does not exist." % (self.node_id)
+            self.logger.error("[%s] HappyProcessStats: %s" % (self.node_id, emsg))
+            self.RaiseError(emsg)
+
+    def __read_log(self):
+        records = []
+
+        try:
+            with open(self.getProcessStatsLog(), "r") as log:
+                for line in log:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        continue
+                    if self.node_id is not None and record["node"] != self.node_id:
+                        continue
+                    if self.tag is not None and record["tag"] != self.tag:
+                        continue
+                    records.append(record)
+        except (IOError, OSError):
+            pass
+
+        return records
+
+    def __process_stats(self):
+        # Only the log knows how long the state write of a start took.
+        logged = {}
+        for record in self.__read_log():
+            logged[(record["node"], record["tag"], record["pid"])] = record["timings"]
+
+        self.stats = {}
+
+        node_ids = self.getNodeIds() if self.node_id is None else [self.node_id]
+        for node_id in node_ids:
+            for tag in self.getNodeProcessIds(node_id):
+                if self.tag is not None and tag != self.tag:
+                    continue
+
+                timings = dict(self.getNodeProcessTimings(tag, node_id))
+                pid = self.getNodeProcessPID(tag, node_id)
+                timings.update(logged.get((node_id, tag, pid), {}))
+
+                if node_id not in self.stats:
+                    self.stats[node_id] = {}
+                self.stats[node_id][tag] = timings
+
+    def __process_summary(self):
+        records = self.__read_log()
+
+        self.stats = {}
+        self.stats["starts"] = len(records)
+        for phase in phases:
+            samples = [r["timings"][phase] for r in records if phase in r["timings"]]
+            if len(samples) == 0:
+                continue
+            self.stats[phase] = {"count": len(samples),
+                                 "p50": percentile(samples, 50),
+                                 "p99": percentile(samples, 99),
+                                 "max": max(samples)}
+
+    def __ms(self, value):
+        if value is None:
+            return "-"
+        return "%.2f" % (value * 1000)
+
+    def __print_stats(self):
+        header = ["node", "tag"] + phases
+        print(" ".join(["{0: >14}".format(h) for h in header]))
+
+        for node_id in sorted(self.stats.keys()):
+            for tag in sorted(self.stats[node_id].keys()):
+                timings = self.stats[node_id][tag]
+                row = [node_id, tag] + [self.__ms(timings.get(phase)) for phase in phases]
+                print(" ".join(["{0: >14}".format(r) for r in row]))
+
+    def __print_summary(self):
+        print("%d process starts" % (self.stats["starts"]))
+        print("{0: >14} {1: >7} {2: >10} {3: >10} {4: >10}".format("phase", "count", "p50", "p99", "max"))
+
+        for phase in phases:
+            if phase not in self.stats:
+                continue
+            record = self.stats[phase]
+            print("{0: >14} {1: >7} {2: >10} {3: >10} {4: >10}".format(
+                  phase, record["count"], self.__ms(record["p50"]),
+                  self.__ms(record["p99"]), self.__ms(record["max"])))
+
+    def run(self):
+        self.__pre_check()
+
+        if self.summary:
+            self.__process_summary()
+            if not self.quiet:
+                self.__print_summary()
+        else:
+            self.__process_stats()
+            if not self.quiet:
+                self.__print_stats()
+
+        return ReturnMsg(0, self.stats)
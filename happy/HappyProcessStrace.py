@@ -27,17 +27,21 @@
 #
 
 from __future__ import absolute_import
+from __future__ import print_function
 import os
 import sys
 
 from happy.ReturnMsg import ReturnMsg
 from happy.Utils import *
 from happy.HappyNode import HappyNode
+from happy.HappyStraceParser import ParseStraceFile
 
 options = {}
 options["quiet"] = False
 options["node_id"] = None
 options["tag"] = None
+options["summary"] = False
+options["slowest"] = 10
 
 
 def option():
@@ -49,17 +53,28 @@ class HappyProcessStrace(HappyNode):
     Displays the output of a process strace.
 
     happy-process-strace [-h --help] [-q --quiet] [-i --id <NODE_NAME>]
-                         [-t --tag <DAEMON_NAME>]
+                         [-t --tag <DAEMON_NAME>] [-s --summary]
+                         [--slowest <COUNT>]
 
         -i --id     Optional. Node on which the process is running. Find using
                     happy-node-list or happy-state.
         -t --tag    Required. Name of the process.
+        -s --summary
+                    Optional. Instead of the raw strace, return per-syscall
+                    counts, errors, latency histograms and the slowest
+                    calls. The strace file is parsed as a stream.
+        --slowest   Optional. Number of slowest calls to report in the
+                    summary. Default is 10.
 
     Example:
     $ happy-process-strace ThreadNode ContinuousPing
         Displays the output of the strace for the ContinuousPing process
         on the ThreadNode node.
 
+    $ happy-process-strace --summary ThreadNode ContinuousPing
+        Displays a per-syscall summary of the same strace. Latencies are
+        only known for processes started with --strace-mode timed or count.
+
     return:
         0    success
         1    fail
@@ -71,6 +86,8 @@ class HappyProcessStrace(HappyNode):
         self.quiet = opts["quiet"]
         self.node_id = opts["node_id"]
         self.tag = opts["tag"]
+        self.summary = opts["summary"]
+        self.slowest = opts["slowest"]
         self.process_strace = None
 
     def __pre_check(self):
@@ -88,8 +105,12 @@ class HappyProcessStrace(HappyNode):
             delayExecution(0.5)
 
         try:
-            with open(fout, 'r') as pout:
-                self.process_strace = pout.read()
+            if self.summary:
+                self.process_strace = ParseStraceFile(fout, self.slowest)
+                self.process_strace["strace_mode"] = self.getNodeProcessStraceMode(self.tag, self.node_id)
+            else:
+                with open(fout, 'r') as pout:
+                    self.process_strace = pout.read()
 
         except IOError as e:
             emsg = "Problem with %s: " % (fout)
@@ -102,9 +123,38 @@ class HappyProcessStrace(HappyNode):
             self.logger.error("[localhost] HappyProcessStrace: %s" % emsg)
             self.RaiseError(emsg)
 
+    def __print_summary(self):
+        summary = self.process_strace
+
+        print("{0: >20} {1: >9} {2: >7} {3: >12} {4: >12} {5: >12}".format(
+              "syscall", "calls", "errors", "avg usec", "max usec", "total usec"))
+
+        syscalls = sorted(summary["syscalls"].items(), key=lambda s: (-s[1]["total_usec"], -s[1]["calls"]))
+        for name, record in syscalls:
+            print("{0: >20} {1: >9} {2: >7} {3: >12} {4: >12} {5: >12.1f}".format(
+                  name, record["calls"], record["errors"],
+                  "-" if record["avg_usec"] is None else "%.1f" % (record["avg_usec"]),
+                  "-" if record["max_usec"] is None else "%.1f" % (record["max_usec"]),
+                  record["total_usec"]))
+
+        total = summary["total"]
+        print("{0: >20} {1: >9} {2: >7} {3: >12} {4: >12} {5: >12.1f}".format(
+              "total", total["calls"], total["errors"], "", "", total["total_usec"]))
+
+        if len(summary["slowest"]) > 0:
+            print()
+            print("slowest calls:")
+            for call in summary["slowest"]:
+                print("{0: >12.1f} usec  {1} {2} pid {3} = {4} {5}".format(
+                      call["usec"], call["time"], call["syscall"], call["pid"] or "-",
+                      call["result"], call["error"] or ""))
+
     def run(self):
         self.__pre_check()
 
         self.__process_strace()
 
+        if self.summary and not self.quiet:
+            self.__print_summary()
+
         return ReturnMsg(0, self.process_strace)
@@ -0,0 +1,236 @@
+#!/usr/bin/env python3
+
+#
+#    Copyright (c) 2021 Google LLC.
+#    All rights reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+#
+
+##
+#    @file
+#       Implements the routing table snapshots of happy-node-route: every
+#       route of every table of a namespace, read with one netlink
+#       RTM_GETROUTE dump from a socket created in the namespace, or parsed
+#       from the output of ip route where the socket cannot be created.
+#
+#       A route is a dict such as:
+#
+#       {"family": 4, "type": "unicast", "table": "main", "to": "default",
+#        "via": "10.0.1.1", "dev": "wlan0", "protocol": "boot"}
+#
+#       with "to" written as ip route writes it: default, an address for a
+#       host route, or a prefix.
+#
+
+from __future__ import absolute_import
+import os
+import socket
+from struct import *
+
+from happy.utils.IP import IP
+
+NETLINK_ROUTE = 0
+
+NLMSG_ERROR = 2
+NLMSG_DONE = 3
+RTM_NEWLINK = 16
+RTM_GETLINK = 18
+RTM_NEWROUTE = 24
+RTM_GETROUTE = 26
+
+NLM_F_REQUEST = 0x1
+NLM_F_DUMP = 0x300
+
+IFLA_IFNAME = 3
+
+RTA_DST = 1
+RTA_OIF = 4
+RTA_GATEWAY = 5
+RTA_TABLE = 15
+
+_nlmsghdr = Struct('=IHHII')
+_ifinfomsg = Struct('=BxHiII')
+_rtmsg = Struct('=BBBBBBBBI')
+_rtattr = Struct('=HH')
+
+RECEIVE_BUFFER = 65536
+
+# the names ip route gives to the numbers of the kernel
+tables = {253: "default", 254: "main", 255: "local"}
+types = {1: "unicast", 2: "local", 3: "broadcast", 4: "anycast", 5: "multicast",
+         6: "blackhole", 7: "unreachable", 8: "prohibit", 9: "throw", 10: "nat"}
+protocols = {0: "unspec", 1: "redirect", 2: "kernel", 3: "boot", 4: "static", 16: "dhcp", 18: "ra"}
+
+
+def _align(length):
+    return (length + 3) & ~3
+
+
+def Attributes(data):
+    """
+    Returns the netlink attributes packed in data, by type.
+    """
+    attrs = {}
+    offset = 0
+    while offset + _rtattr.size <= len(data):
+        length, attr_type = _rtattr.unpack_from(data, offset)
+        if length < _rtattr.size:
+            break
+        attrs[attr_type] = data[offset + _rtattr.size:offset + length]
+        offset += _align(length)
+    return attrs
+
+
+def Messages(data):
+    """
+    Yields the (type, body) of every netlink message in data.
+    """
+    offset = 0
+    while offset + _nlmsghdr.size <= len(data):
+        length, msg_type, flags, seq, pid = _nlmsghdr.unpack_from(data, offset)
+        if length < _nlmsghdr.size:
+            break
+        yield msg_type, data[offset + _nlmsghdr.size:offset + length]
+        offset += _align(length)
+
+
+def Dump(sock, msg_type, payload, seq=1):
+    """
+    Returns the bodies of the messages answering a dump request.
+    """
+    sock.send(_nlmsghdr.pack(_nlmsghdr.size + len(payload), msg_type, NLM_F_REQUEST | NLM_F_DUMP, seq, 0) +
+              payload)
+
+    bodies = []
+    while True:
+        data = sock.recv(RECEIVE_BUFFER)
+        if len(data) == 0:
+            return bodies
+
+        for reply_type, body in Messages(data):
+            if reply_type == NLMSG_DONE:
+                return bodies
+            if reply_type == NLMSG_ERROR:
+                error = -unpack_from('=i', body)[0]
+                raise OSError(error, os.strerror(error))
+            bodies.append(body)
+
+
+def ParseLink(body):
+    """
+    Returns (index, name) of an RTM_NEWLINK body.
+    """
+    family, link_type, index, flags, change = _ifinfomsg.unpack_from(body)
+    name = Attributes(body[_ifinfomsg.size:]).get(IFLA_IFNAME, b"")
+    return index, name.split(b"\0")[0].decode()
+
+
+def ParseRoute(body, links):
+    """
+    Returns the route of an RTM_NEWROUTE body, with the names of links by
+    index for its device.
+    """
+    family, dst_len, src_len, tos, table, protocol, scope, route_type, flags = _rtmsg.unpack_from(body)
+    attrs = Attributes(body[_rtmsg.size:])
+
+    if RTA_TABLE in attrs:
+        table = unpack('=I', attrs[RTA_TABLE][:4])[0]
+
+    to = "default"
+    if RTA_DST in attrs:
+        to = socket.inet_ntop(family, attrs[RTA_DST])
+        if dst_len != 8 * len(attrs[RTA_DST]):
+            to += "/%d" % (dst_len)
+    elif dst_len > 0:
+        to = "%s/%d" % ("0.0.0.0" if family == socket.AF_INET else "::", dst_len)
+
+    via = None
+    if RTA_GATEWAY in attrs:
+        via = socket.inet_ntop(family, attrs[RTA_GATEWAY])
+
+    dev = None
+    if RTA_OIF in attrs:
+        index = unpack('=i', attrs[RTA_OIF][:4])[0]
+        dev = links.get(index, str(index))
+
+    return {"family": 6 if family == socket.AF_INET6 else 4, "type": types.get(route_type, str(route_type)),
+            "table": tables.get(table, str(table)), "to": to, "via": via, "dev": dev,
+            "protocol": protocols.get(protocol, str(protocol))}
+
+
+def Read(create=socket.socket):
+    """
+    Returns every IPv4 and IPv6 route of every table, read from a netlink
+    socket created with create(family, type, proto).
+    """
+    sock = create(socket.AF_NETLINK, socket.SOCK_RAW, NETLINK_ROUTE)
+    try:
+        sock.bind((0, 0))
+
+        links = {}
+        for body in Dump(sock, RTM_GETLINK, _ifinfomsg.pack(socket.AF_UNSPEC, 0, 0, 0, 0), seq=1):
+            index, name = ParseLink(body)
+            links[index] = name
+
+        routes = []
+        for body in Dump(sock, RTM_GETROUTE, _rtmsg.pack(socket.AF_UNSPEC, 0, 0, 0, 0, 0, 0, 0, 0), seq=2):
+            route = ParseRoute(body, links)
+            if route["family"] in [4, 6]:
+                routes.append(route)
+        return routes
+    finally:
+        sock.close()
+
+
+def ParseText(out, family):
+    """
+    Returns the routes of the output of ip route show table all.
+    """
+    routes = []
+    for line in (out or "").split("\n"):
+        words = line.split()
+        if len(words) == 0:
+            continue
+
+        route = {"family": family, "type": "unicast", "table": "main", "to": None, "via": None, "dev": None,
+                 "protocol": "boot"}
+        if words[0] in types.values():
+            route["type"] = words.pop(0)
+        if len(words) == 0:
+            continue
+        route["to"] = words.pop(0)
+
+        for key, field in [("via", "via"), ("dev", "dev"), ("table", "table"), ("proto", "protocol")]:
+            if key in words[:-1]:
+                route[field] = words[words.index(key) + 1]
+        routes.append(route)
+    return routes
+
+
+def Matches(route, to=None, via=None, dev=None, family=None, table="main"):
+    """
+    True if the route is the one to "to", via the gateway via or the device
+    dev where given, in the table.
+    """
+    if table is not None and route["table"] != table:
+        return False
+    if family is not None and route["family"] != family:
+        return False
+    if to is not None and IP.paddingZeros(route["to"]) != IP.paddingZeros(to):
+        return False
+    if via is not None and (route["via"] is None or IP.paddingZeros(route["via"]) != IP.paddingZeros(via)):
+        return False
+    if dev is not None and route["dev"] != dev:
+        return False
+    return True
@@ -36,7 +36,7 @@ import happy.HappyNetworkDelete
 import happy.HappyLinkDelete
 import happy.HappyNode
 import happy.HappyInternet
-from happy.HappyHost import HappyHost
+from happy.HappyProcess import HappyProcess
 from six.moves import input
 
 options = {}
@@ -49,7 +49,7 @@ def option():
     return options.copy()
 
 
-class HappyStateDelete(HappyHost):
+class HappyStateDelete(HappyProcess):
     """
     Deletes the current network topology state. This only delete nodes, networks, and
     links found in the current state file.
@@ -77,7 +77,7 @@ class HappyStateDelete(HappyHost):
     """
 
     def __init__(self, opts=options):
-        HappyHost.__init__(self)
+        HappyProcess.__init__(self)
 
         self.quiet = opts["quiet"]
         self.force = opts["force"]
@@ -123,6 +123,11 @@ class HappyStateDelete(HappyHost):
         if os.path.isfile(self.state_file):
             os.remove(self.state_file)
 
+    def __delete_process_stats_log(self):
+        # the start timings of the processes of the deleted state
+        if os.path.isfile(self.getProcessStatsLog()):
+            os.remove(self.getProcessStatsLog())
+
     def __delete_host_netns(self):
         for node_id in self.getHostNamespaces():
             delete_it = False
@@ -211,7 +216,8 @@ class HappyStateDelete(HappyHost):
                 options["delete"] = True
                 options["iface"] = internet_value["iface"]
                 options["isp"] = internet_value["isp"]
-                options["seed"] = internet_value["isp_addr"].split(".")[2]
+                options["seed"] = str(internet_value.get("seed", internet_value["isp_addr"].split(".")[2]))
+                options["mask"] = internet_value.get("mask", options["mask"])
                 options["node_id"] = internet_value["node_id"]
                 hi = happy.HappyInternet.HappyInternet(options)
                 hi.start()
@@ -225,6 +231,8 @@ class HappyStateDelete(HappyHost):
 
         self.__delete_state_file()
 
+        self.__delete_process_stats_log()
+
         if self.all:
             self.__cleanup_host()
 
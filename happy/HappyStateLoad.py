@@ -32,6 +32,7 @@ import sys
 from happy.ReturnMsg import ReturnMsg
 from happy.Utils import *
 from happy.State import State
+import happy.HappyLinkShape
 import happy.HappyNodeAdd
 import happy.HappyNodeJoin
 import happy.HappyNodeRoute
@@ -119,6 +120,13 @@ class HappyStateLoad(State):
             options["node_id"] = node_id
             options["type"] = node_type
 
+            cgroup = self.getNodeCGroup(node_id, self.network_topology)
+            if cgroup != {}:
+                options["cgroup"] = True
+                options["cpu_limit"] = cgroup.get("cpu_limit")
+                options["memory_limit"] = cgroup.get("memory_limit")
+                options["cpuset"] = cgroup.get("cpuset")
+
             obj = happy.HappyNodeAdd.HappyNodeAdd(options)
             ret = obj.run()
 
@@ -135,12 +143,26 @@ class HappyStateLoad(State):
             options["quiet"] = self.quiet
             options["network_id"] = network_id
             options["type"] = network["type"]
+            options["mode"] = network.get("mode", "hub")
 
             obj = happy.HappyNetworkAdd.HappyNetworkAdd(options)
             ret = obj.run()
 
             self.readState()
 
+            # the links that join the network later are shaped alike
+            shape = self.getNetworkShape(network_id, self.network_topology)
+            if shape:
+                options = happy.HappyLinkShape.option()
+                options["quiet"] = self.quiet
+                options["network_id"] = network_id
+                options["profile"] = shape
+
+                obj = happy.HappyLinkShape.HappyLinkShape(options)
+                ret = obj.run()
+
+                self.readState()
+
     def __nodes_join_networks(self):
         emsg = "Nodes join networks."
         self.logger.debug("[localhost] HappyStateLoad: %s" % (emsg))
@@ -159,6 +181,9 @@ class HappyStateLoad(State):
             else:
                 options["fix_hw_addr"] = None
 
+            if "shape" in list(link.keys()):
+                options["shape"] = link["shape"]
+
             obj = happy.HappyNodeJoin.HappyNodeJoin(options)
             ret = obj.run()
 
@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+
+#
+#    Copyright (c) 2021 Google LLC.
+#    All rights reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+#
+
+##
+#    @file
+#       Implements StraceSummary, a streaming parser that turns strace
+#       output into per-syscall counts, latency histograms and the slowest
+#       calls, one line at a time.
+#
+#       It understands the "-tt" and "-tt -T" traces HappyProcessStart
+#       writes, with or without "-f" PID prefixes and split
+#       "<unfinished ...>" / "<... resumed>" calls, as well as the "-c"
+#       summary table.
+#
+
+from __future__ import absolute_import
+import heapq
+import re
+
+# [pid] [hh:mm:ss.usec] name(args...) = result [<duration>]
+_call_re = re.compile(r"^\s*(?:\[pid\s+(?P<bpid>\d+)\]\s+|(?P<pid>\d+)\s+)?"
+                      r"(?:(?P<ts>\d+:\d+:\d+(?:\.\d+)?)\s+)?"
+                      r"(?P<rest>.*)$")
+_start_re = re.compile(r"^(?P<name>[a-z_0-9]+)\((?P<args>.*)$")
+_resumed_re = re.compile(r"^<\.\.\. (?P<name>[a-z_0-9]+) resumed>(?P<args>.*)$")
+_result_re = re.compile(r"^.*\)\s+=\s+(?P<result>-?\d+|0x[0-9a-f]+|\?)(?P<error>\s+E[A-Z0-9]+)?"
+                        r"(?:[^<]*)(?:<(?P<duration>\d+\.\d+)>)?\s*$")
+_count_re = re.compile(r"^\s*(?P<percent>\d+\.\d+)\s+(?P<seconds>\d+\.\d+)\s+"
+                       r"(?P<usecs>\d+)?\s+(?P<calls>\d+)\s+(?P<errors>\d+)?\s*(?P<name>\S+)\s*$")
+
+# Upper bounds of the latency histogram buckets, in microseconds.
+histogram_buckets = [1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000,
+                     10000, 20000, 50000, 100000, 200000, 500000, 1000000]
+
+
+def _seconds(ts):
+    h, m, s = ts.split(":")
+    return int(h) * 3600 + int(m) * 60 + float(s)
+
+
+class StraceSummary(object):
+    """
+    Accumulates strace output fed with feed() and returns the summary with
+    result(). Memory use does not depend on the length of the trace.
+
+    Latencies come from the "<...>" durations "-T" adds; without "-T" only
+    calls split by "<unfinished ...>" get one, from their timestamps.
+    """
+
+    def __init__(self, slowest=10):
+        self.slowest = slowest
+        self.syscalls = {}
+        self.slowest_calls = []
+        self.pending = {}
+        self.lines = 0
+        self.signals = 0
+        self.exits = 0
+        self.counted = False
+
+    def __syscall(self, name):
+        if name not in self.syscalls:
+            record = {}
+            record["calls"] = 0
+            record["errors"] = 0
+            record["timed"] = 0
+            record["total_usec"] = 0.0
+            record["min_usec"] = None
+            record["max_usec"] = None
+            record["histogram"] = [0] * (len(histogram_buckets) + 1)
+            self.syscalls[name] = record
+        return self.syscalls[name]
+
+    def __record(self, pid, ts, name, result, error, duration):
+        record = self.__syscall(name)
+        record["calls"] += 1
+        if error is not None:
+            record["errors"] += 1
+
+        if duration is None:
+            return
+
+        usec = duration * 1000000.0
+        record["timed"] += 1
+        record["total_usec"] += usec
+        if record["min_usec"] is None or usec < record["min_usec"]:
+            record["min_usec"] = usec
+        if record["max_usec"] is None or usec > record["max_usec"]:
+            record["max_usec"] = usec
+
+        bucket = len(histogram_buckets)
+        for i, bound in enumerate(histogram_buckets):
+            if usec < bound:
+                bucket = i
+                break
+        record["histogram"][bucket] += 1
+
+        if self.slowest > 0:
+            call = (usec, self.lines, {"pid": pid, "time": ts, "syscall": name,
+                                       "usec": usec, "result": result, "error": error})
+            if len(self.slowest_calls) < self.slowest:
+                heapq.heappush(self.slowest_calls, call)
+            elif usec > self.slowest_calls[0][0]:
+                heapq.heapreplace(self.slowest_calls, call)
+
+    def __feed_count(self, line):
+        # "-c" table rows; the "total" row is derived again in result().
+        m = _count_re.match(line)
+        if m is None or m.group("name") == "total":
+            return
+
+        self.counted = True
+        record = self.__syscall(m.group("name"))
+        record["calls"] += int(m.group("calls"))
+        record["errors"] += int(m.group("errors") or 0)
+        usec = float(m.group("seconds")) * 1000000.0
+        record["timed"] += int(m.group("calls"))
+        record["total_usec"] += usec
+
+    def feed(self, line):
+        self.lines += 1
+        line = line.rstrip("\n")
+
+        m = _call_re.match(line)
+        if m is None:
+            return
+        pid = m.group("pid") or m.group("bpid")
+        ts = m.group("ts")
+        rest = m.group("rest")
+
+        if rest.startswith("---"):
+            self.signals += 1
+            return
+        if rest.startswith("+++"):
+            self.exits += 1
+            return
+
+        resumed = _resumed_re.match(rest)
+        if resumed is not None:
+            name = resumed.group("name")
+            start = self.pending.pop((pid, name), None)
+        else:
+            call = _start_re.match(rest)
+            if call is None:
+                self.__feed_count(line)
+                return
+            name = call.group("name")
+            start = None
+
+            if rest.endswith("<unfinished ...>"):
+                self.pending[(pid, name)] = ts
+                return
+
+        r = _result_re.match(rest)
+        if r is None:
+            return
+
+        duration = r.group("duration")
+        if duration is not None:
+            duration = float(duration)
+        elif start is not None and ts is not None:
+            duration = max(_seconds(ts) - _seconds(start), 0.0)
+
+        error = r.group("error")
+        if error is not None:
+            error = error.strip()
+
+        self.__record(pid, start or ts, name, r.group("result"), error, duration)
+
+    def feedLines(self, lines):
+        for line in lines:
+            self.feed(line)
+        return self
+
+    def result(self):
+        summary = {}
+        total = {"calls": 0, "errors": 0, "total_usec": 0.0}
+
+        syscalls = {}
+        for name, record in self.syscalls.items():
+            record = dict(record)
+            if record["timed"] > 0:
+                record["avg_usec"] = record["total_usec"] / record["timed"]
+            else:
+                record["avg_usec"] = None
+            syscalls[name] = record
+            for key in total.keys():
+                total[key] += record[key]
+
+        summary["syscalls"] = syscalls
+        summary["total"] = total
+        summary["histogram_buckets_usec"] = histogram_buckets
+        summary["slowest"] = [c[2] for c in sorted(self.slowest_calls, key=lambda c: (-c[0], c[1]))]
+        summary["unfinished"] = len(self.pending)
+        summary["signals"] = self.signals
+        summary["exits"] = self.exits
+        summary["lines"] = self.lines
+        summary["count_mode"] = self.counted
+
+        return summary
+
+
+def ParseStraceFile(path, slowest=10):
+    """
+    Streams the strace output in path through a StraceSummary and returns
+    its result.
+    """
+    with open(path, "r", errors="replace") as trace:
+        return StraceSummary(slowest).feedLines(trace).result()
@@ -37,6 +37,7 @@ import happy.HappyNetworkAddress
 import happy.HappyNetworkDelete
 import happy.HappyNetworkList
 import happy.HappyNetworkRoute
+import happy.HappyLinkShape
 import happy.HappyNetworkState
 import happy.HappyNetworkStatus
 import happy.HappyNodeAdd
@@ -48,6 +49,7 @@ import happy.HappyNodeRoute
 import happy.HappyNodeStatus
 import happy.HappyNodeTmux
 import happy.Ping
+import happy.HappyPerf
 import happy.HappyProcessOutput
 import happy.HappyProcessStart
 import happy.HappyProcessStop
@@ -72,7 +74,7 @@ class HappyTopologyMgr(object):
         cmd = happy.HappyConfiguration.HappyConfiguration(options)
         cmd.start()
 
-    def HappyDNS(self, dns=None, node_id=None, add=False, delete=False, quiet=False):
+    def HappyDNS(self, dns=None, node_id=None, add=False, delete=False, quiet=False, stub=None):
         options = happy.HappyDNS.option()
 
         options["quiet"] = quiet
@@ -80,11 +82,13 @@ class HappyTopologyMgr(object):
         options["delete"] = delete
         options["dns"] = dns
         options["node_id"] = node_id
+        options["stub"] = stub
 
         cmd = happy.HappyDNS.HappyDNS(options)
         cmd.start()
 
-    def HappyInternet(self, node_id=None, iface=None, add=False, delete=False, quiet=False, isp=None, seed=None):
+    def HappyInternet(self, node_id=None, iface=None, add=False, delete=False, quiet=False, isp=None, seed=None,
+                      mask=24):
         options = happy.HappyInternet.option()
 
         options["quiet"] = quiet
@@ -93,6 +97,7 @@ class HappyTopologyMgr(object):
         options["add"] = add
         options["isp"] = isp
         options["seed"] = seed
+        options["mask"] = mask
         options["delete"] = delete
 
         cmd = happy.HappyInternet.HappyInternet(options)
@@ -121,11 +126,12 @@ class HappyTopologyMgr(object):
         cmd = happy.HappyLinkList.HappyLinkList(options)
         cmd.start()
 
-    def HappyNetworkAdd(self, network_id=None, type=None, quiet=False):
+    def HappyNetworkAdd(self, network_id=None, type=None, quiet=False, mode="hub"):
         options = happy.HappyNetworkAdd.option()
         options["quiet"] = quiet
         options["network_id"] = network_id
         options["type"] = type
+        options["mode"] = mode
 
         cmd = happy.HappyNetworkAdd.HappyNetworkAdd(options)
         cmd.start()
@@ -216,7 +222,7 @@ class HappyTopologyMgr(object):
         cmd.start()
 
     def HappyNodeJoin(self, node_id=None, tap=False, network_id=None, fix_hw_addr=None, customized_eui64=None,
-                      quiet=False):
+                      quiet=False, shape=None):
         options = happy.HappyNodeJoin.option()
         options["quiet"] = quiet
         options["node_id"] = node_id
@@ -224,9 +230,25 @@ class HappyTopologyMgr(object):
         options["network_id"] = network_id
         options["fix_hw_addr"] = fix_hw_addr
         options["customized_eui64"] = customized_eui64
+        options["shape"] = shape
         cmd = happy.HappyNodeJoin.HappyNodeJoin(options)
         cmd.start()
 
+    def HappyLinkShape(self, link_id=None, network_id=None, profile=None, rate=None, delay=None, jitter=None,
+                       loss=None, clear=False, quiet=False):
+        options = happy.HappyLinkShape.option()
+        options["quiet"] = quiet
+        options["link_id"] = link_id
+        options["network_id"] = network_id
+        options["profile"] = profile
+        options["rate"] = rate
+        options["delay"] = delay
+        options["jitter"] = jitter
+        options["loss"] = loss
+        options["clear"] = clear
+        cmd = happy.HappyLinkShape.HappyLinkShape(options)
+        cmd.start()
+
     def HappyNodeLeave(self, node_id=None, network_id=None, quiet=False):
         options = happy.HappyNodeLeave.option()
         options["quiet"] = quiet
@@ -373,6 +395,24 @@ class HappyTopologyMgr(object):
         cmd = happy.Traceroute.Traceroute(options)
         cmd.start()
 
+    def HappyPerf(self, source=None, destination=None, pairs=None, protocol="tcp", test="all",
+                  duration=5.0, size=None, rate=0, port=5201, ipv6=False, output=None, quiet=False):
+        options = happy.HappyPerf.option()
+        options["quiet"] = quiet
+        options["source"] = source
+        options["destination"] = destination
+        options["pairs"] = pairs
+        options["protocol"] = protocol
+        options["test"] = test
+        options["duration"] = duration
+        options["size"] = size
+        options["rate"] = rate
+        options["port"] = port
+        options["ipv6"] = ipv6
+        options["output"] = output
+        cmd = happy.HappyPerf.HappyPerf(options)
+        cmd.start()
+
     def HappyNodeTcpReset(self, node_id=None, quiet=False, action=None, interface="wlan0", ips=None,
                           dstPort=None, start=0, duration=10):
         options = happy.HappyNodeTcpReset.option()
@@ -0,0 +1,305 @@
+#!/usr/bin/env python3
+
+#
+#    Copyright (c) 2021 Google LLC.
+#    All rights reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+#
+
+##
+#    @file
+#       Implements the TTL sweep prober of happy-traceroute: sends the UDP
+#       probes of every hop to every address at once, and returns the
+#       address and round trip time of every hop that answered.
+#
+#       The ICMP time exceeded and port unreachable errors come back on the
+#       error queue of the probing sockets, so no raw socket, and no root
+#       within the namespace, is needed. Traceroute creates the sockets in
+#       the namespace of the source node; started as a script, the prober
+#       traces from the namespace it runs in and prints its results as JSON:
+#
+#       python HappyTraceProbe.py --max-hops 16 10.0.1.3 fd00:0:1:1::3
+#
+
+from __future__ import absolute_import
+from __future__ import print_function
+import getopt
+import json
+import os
+import select
+import socket
+from struct import *
+import sys
+import time
+
+options = {}
+options["max_hops"] = 30
+options["queries"] = 1
+options["timeout"] = 1.0
+
+BASE_PORT = 33434
+
+# linux/in.h, linux/in6.h and linux/errqueue.h
+IP_RECVERR = 11
+IPV6_RECVERR = 25
+SO_EE_ORIGIN_ICMP = 2
+SO_EE_ORIGIN_ICMP6 = 3
+
+ICMP_DEST_UNREACH = 3
+ICMP_PORT_UNREACH = 3
+ICMPV6_DEST_UNREACH = 1
+ICMPV6_PORT_UNREACH = 4
+
+_extendedErr = Struct('=IBBBBII')
+
+
+def ParseError(ancdata):
+    """
+    Returns (offender address, kind) of the ICMP error of a message of the
+    error queue, or None if the message is no ICMP error. kind is "reached"
+    if the port of the destination itself is unreachable, "unreachable" if
+    a hop could not forward the probe, and "hop" if its hop limit expired.
+    """
+    for level, kind, data in ancdata:
+        if (level, kind) not in [(socket.IPPROTO_IP, IP_RECVERR), (socket.IPPROTO_IPV6, IPV6_RECVERR)]:
+            continue
+        if len(data) < _extendedErr.size + 8:
+            continue
+
+        errno, origin, icmpType, icmpCode, pad, info, unused = _extendedErr.unpack_from(data)
+        if origin not in [SO_EE_ORIGIN_ICMP, SO_EE_ORIGIN_ICMP6]:
+            continue
+
+        # SO_EE_OFFENDER, the sockaddr of the node that sent the error
+        offender = data[_extendedErr.size:]
+        if unpack_from('=H', offender)[0] == socket.AF_INET6:
+            address = socket.inet_ntop(socket.AF_INET6, offender[8:24])
+        else:
+            address = socket.inet_ntop(socket.AF_INET, offender[4:8])
+
+        if origin == SO_EE_ORIGIN_ICMP6:
+            unreach = (ICMPV6_DEST_UNREACH, ICMPV6_PORT_UNREACH)
+        else:
+            unreach = (ICMP_DEST_UNREACH, ICMP_PORT_UNREACH)
+
+        if (icmpType, icmpCode) == unreach:
+            return address, "reached"
+        if icmpType == unreach[0]:
+            return address, "unreachable"
+        return address, "hop"
+
+    return None
+
+
+class TraceSocket(object):
+    """
+    Sends the UDP probes of one address family, with the hop limit of each
+    probe, and receives the ICMP errors they cause.
+    """
+
+    def __init__(self, family, create=socket.socket):
+        self.family = family
+        self.sock = create(family, socket.SOCK_DGRAM, socket.IPPROTO_UDP)
+        self.sock.setblocking(False)
+        if family == socket.AF_INET6:
+            self.sock.setsockopt(socket.IPPROTO_IPV6, IPV6_RECVERR, 1)
+        else:
+            self.sock.setsockopt(socket.IPPROTO_IP, IP_RECVERR, 1)
+
+    def fileno(self):
+        return self.sock.fileno()
+
+    def Send(self, addr, port, ttl, payload):
+        if self.family == socket.AF_INET6:
+            self.sock.setsockopt(socket.IPPROTO_IPV6, socket.IPV6_UNICAST_HOPS, ttl)
+            destination = (addr, port, 0, 0)
+        else:
+            self.sock.setsockopt(socket.IPPROTO_IP, socket.IP_TTL, ttl)
+            destination = (addr, port)
+
+        try:
+            self.sock.sendto(payload, destination)
+        except OSError:
+            # the first send after an ICMP error fails with that error,
+            # which is then cleared
+            self.sock.sendto(payload, destination)
+
+    def Receive(self):
+        """
+        Yields the (destination port, offender address, kind) of every ICMP
+        error queued on the socket.
+        """
+        while True:
+            try:
+                data, ancdata, flags, address = self.sock.recvmsg(512, 512, socket.MSG_ERRQUEUE)
+            except (BlockingIOError, InterruptedError):
+                return
+
+            error = ParseError(ancdata)
+            if error is not None:
+                yield (address[1],) + error
+
+    def Close(self):
+        self.sock.close()
+
+
+def LastHop(probes, maxHops):
+    """
+    Returns the hop limit of the first of probes, answered probes as
+    (ttl, offender address, kind, rtt), that went no further.
+    """
+    last = maxHops
+    for ttl, address, kind, rtt in probes:
+        if kind != "hop":
+            last = min(last, ttl)
+    return last
+
+
+def Hops(probes, maxHops):
+    """
+    Returns the hops to an address from its answered probes, every hop up
+    to the one the probes went no further, or all of maxHops, with the
+    address and the rtts of its answers, the address None if none came, and
+    whether the address was reached.
+    """
+    last = LastHop(probes, maxHops)
+
+    hops = []
+    for ttl in range(1, last + 1):
+        hop = {"ttl": ttl, "address": None, "rtts": []}
+        for probeTtl, address, kind, rtt in probes:
+            if probeTtl == ttl:
+                hop["address"] = address
+                hop["rtts"].append(rtt)
+        hops.append(hop)
+
+    reached = any([kind == "reached" and ttl == last for ttl, address, kind, rtt in probes])
+    return hops, reached
+
+
+def Trace(addresses, maxHops=30, queries=1, timeout=1.0, create=socket.socket):
+    """
+    Sends queries UDP probes of every hop limit from 1 to maxHops to every
+    address of addresses at once, from sockets created with create, so they
+    can be created in another namespace, and waits up to timeout seconds
+    for the answers. The destination port tells the probes apart. Returns
+    {"hops": [{"ttl", "address", "rtts"}], "reached"} of every address,
+    rtts in ms, with an "error" if the probes could not be sent.
+    """
+    sockets = {}
+    sent = {}
+    answers = dict([(addr, []) for addr in addresses])
+    errors = {}
+    payload = b'happy' * 4
+
+    try:
+        for addr in addresses:
+            family = socket.AF_INET6 if ":" in addr else socket.AF_INET
+            if family not in sockets:
+                sockets[family] = TraceSocket(family, create)
+
+        poller = select.poll()
+        for trace in sockets.values():
+            poller.register(trace.fileno(), select.POLLERR)
+        owners = dict([(trace.fileno(), trace) for trace in sockets.values()])
+
+        def receive(wait):
+            for fd, event in poller.poll(wait):
+                received = time.monotonic()
+                for port, address, kind in owners[fd].Receive():
+                    if port not in sent:
+                        continue
+                    addr, ttl, when = sent.pop(port)
+                    answers[addr].append((ttl, address, kind, (received - when) * 1000.0))
+
+        def pending():
+            # the answers to probes past the last hop do not matter
+            last = dict([(addr, LastHop(answers[addr], maxHops)) for addr in addresses])
+            return len([ttl for addr, ttl, when in sent.values() if ttl < last[addr]]) > 0
+
+        port = BASE_PORT
+        # nearest hops first, so the rate limit on the ICMP errors of the
+        # destination spares the answers that matter
+        for ttl in range(1, maxHops + 1):
+            for query in range(queries):
+                for addr in addresses:
+                    if addr in errors:
+                        continue
+                    family = socket.AF_INET6 if ":" in addr else socket.AF_INET
+                    try:
+                        sockets[family].Send(addr, port, ttl, payload)
+                    except OSError as e:
+                        errors[addr] = os.strerror(e.errno)
+                        continue
+                    sent[port] = (addr, ttl, time.monotonic())
+                    port += 1
+            receive(0)
+
+        deadline = time.monotonic() + timeout
+        while pending():
+            wait = deadline - time.monotonic()
+            if wait <= 0:
+                break
+            receive(int(wait * 1000) + 1)
+    finally:
+        for trace in sockets.values():
+            trace.Close()
+
+    results = {}
+    for addr in addresses:
+        hops, reached = Hops(answers[addr], maxHops)
+        results[addr] = {"hops": hops, "reached": reached}
+        if addr in errors:
+            results[addr]["error"] = errors[addr]
+            if len(answers[addr]) == 0:
+                results[addr]["hops"] = []
+    return results
+
+
+if __name__ == "__main__":
+    try:
+        opts, args = getopt.getopt(sys.argv[1:], "hm:q:w:",
+                                   ["help", "max-hops=", "queries=", "timeout="])
+
+    except getopt.GetoptError as err:
+        sys.exit("%s: Failed to parse arguments." % (__file__))
+
+    for o, a in opts:
+        if o in ("-h", "--help"):
+            print("python HappyTraceProbe.py [--max-hops <HOPS>] [--queries <PROBES>] "
+                  "[--timeout <SECONDS>] <ADDRESS> [<ADDRESS> ...]")
+            sys.exit(0)
+
+        elif o in ("-m", "--max-hops"):
+            options["max_hops"] = int(a)
+
+        elif o in ("-q", "--queries"):
+            options["queries"] = int(a)
+
+        elif o in ("-w", "--timeout"):
+            options["timeout"] = float(a)
+
+        else:
+            assert False, "unhandled option"
+
+    if len(args) == 0:
+        sys.exit("%s: Missing addresses to trace." % (__file__))
+
+    try:
+        results = Trace(args, options["max_hops"], options["queries"], options["timeout"])
+    except OSError as e:
+        sys.exit("%s: %s" % (__file__, str(e)))
+
+    json.dump(results, sys.stdout)
+    print()
@@ -24,13 +24,17 @@
 
 from __future__ import absolute_import
 from __future__ import print_function
+import json
 import os
+import socket
 import sys
 
 from happy.ReturnMsg import ReturnMsg
 from happy.Utils import *
 from happy.utils.IP import IP
 from happy.HappyNode import HappyNode
+from happy.HappyProcess import HappyProcess
+import happy.HappyICMPProbe
 
 options = {}
 options["quiet"] = False
@@ -38,42 +42,56 @@ options["source"] = None
 options["destination"] = None
 options["size"] = None
 options["count"] = None
+options["interval"] = None
+options["timeout"] = None
 
 
 def option():
     return options.copy()
 
 
-class Ping(HappyNode):
+class Ping(HappyNode, HappyProcess):
     """
-    Sends pings between virtual nodes. Uses ping for IPv4 and ping6 for IPv6.
+    Sends pings between virtual nodes. Pings every address of the destination
+    at the same time, from ICMP and ICMPv6 sockets in the source node.
 
     happy-ping [-h --help] [-q --quiet] [-i --id <NODE_NAME>]
                [-d --destination (<IP_ADDR>|<NODE_NAME>)]
                [-s --size <PING_SIZE>] [-c --count <PING_COUNT>]
+               [--interval <SECONDS>] [--timeout <SECONDS>]
 
         -i --id           Source node.
         -d --destination  Destination node, can be either the IP address or the
                           node name.
         -s --size         Size of the ping in bytes.
         -c --count        Number of pings to send.
+           --interval     Seconds between pings, 1 by default.
+           --timeout      Seconds to wait for replies after the last ping, 1 by
+                          default.
 
     Example:
     $ happy-ping ThreadNode BorderRouter
         Sends a ping between the ThreadNode and BorderRouter nodes.
 
     return:
-        0-100   percentage of the lost packets
+        0-100   percentage of the lost packets, of the best address. The data
+                holds the percentage of every address. The transmitted and
+                received pings, loss and min, avg, max and stddev round trip
+                time in ms of every address are in the stats of the Ping.
     """
 
     def __init__(self, opts=options):
         HappyNode.__init__(self)
+        HappyProcess.__init__(self)
 
         self.quiet = opts["quiet"]
         self.source = opts["source"]
         self.destination = opts["destination"]
         self.count = opts["count"]
         self.size = opts["size"]
+        self.interval = opts["interval"]
+        self.timeout = opts["timeout"]
+        self.stats = {}
 
     def __pre_check(self):
         # Check if the name of the new node is given
@@ -100,11 +118,25 @@ class Ping(HappyNode):
             self.logger.error("[%s] Ping: %s" % (self.source, emsg))
             self.exit()
 
-        if self.count is not None and self.count.isdigit():
+        if self.count is not None and str(self.count).isdigit():
             self.count = int(float(self.count))
+            if self.count < 1:
+                emsg = "Need to send at least one ping, not %d." % (self.count)
+                self.logger.error("[localhost] Ping: %s" % (emsg))
+                self.exit()
         else:
             self.count = 1
 
+        if self.size is not None:
+            self.size = int(self.size)
+        else:
+            self.size = happy.HappyICMPProbe.options["size"]
+
+        if self.interval is None:
+            self.interval = happy.HappyICMPProbe.options["interval"]
+        if self.timeout is None:
+            self.timeout = happy.HappyICMPProbe.options["timeout"]
+
     def __get_addresses(self):
         self.addresses = {}
 
@@ -118,58 +150,37 @@ class Ping(HappyNode):
             for addr in node_addresses:
                 self.addresses[addr] = 100
 
-    def __ping_on_address(self, addr):
-        cmd = ""
-
-        if IP.isIpv6(addr):
-            cmd += "ping6"
-        else:
-            cmd += "ping"
-
-        cmd += " -c " + str(self.count)
-
-        if self.size is not None:
-            cmd += " -s " + str(self.size)
-
-        if IP.isMulticast(addr):
-            cmd += ""
-
-        cmd += " " + addr
-
+    def __probe(self):
+        addresses = list(self.addresses.keys())
+
+        if self.isNodeLocal(self.source) or os.geteuid() == 0:
+            create = socket.socket
+            if not self.isNodeLocal(self.source):
+                netns_path = self.getNetNSPath(self.source)
+
+                def create(family, type, proto):
+                    return self.SocketInNamespace(netns_path, family, type, proto)
+
+            try:
+                return happy.HappyICMPProbe.Probe(addresses, self.count, self.interval, self.size,
+                                                  self.timeout, create)
+            except OSError as e:
+                emsg = "Failed to ping from node %s: %s" % (self.source, str(e))
+                self.logger.warning("[%s] Ping: %s" % (self.source, emsg))
+                return {}
+
+        # the sockets need root, which the prober gets as a script
+        path = os.path.dirname(os.path.abspath(happy.HappyICMPProbe.__file__))
+        cmd = "%s %s/HappyICMPProbe.py --count %d --interval %s --size %d --timeout %s %s" % \
+            (sys.executable, path, self.count, self.interval, self.size, self.timeout, " ".join(addresses))
         out, err = self.CallAtNodeForOutput(self.source, cmd)
 
-        return (out, err)
-
-    def __parse_output(self, addr, out, err):
-        if out is None:
-            emsg = "Failed to call ping at node " + self.source + " to " + addr + "."
+        try:
+            return json.loads(out)
+        except (TypeError, ValueError):
+            emsg = "Failed to ping from node %s: %s" % (self.source, err)
             self.logger.warning("[%s] Ping: %s" % (self.source, emsg))
-
-            if err is not None:
-                self.logger.warning("[%s] Ping: %s" % (self.source, err))
-
-            return
-
-        for line in out.split("\n"):
-            if "packet loss" not in line:
-                continue
-
-            l = line.split()
-
-            perc_loss = -1
-
-            if len(l) > 10 and l[8] == "packet" and l[9] == "loss,":
-                perc_loss = l[7]
-                perc_loss = l[7][:-1]  # drop % char
-                perc_loss = int(float(perc_loss))
-
-            if len(l) > 8 and l[6] == "packet" and l[7] == "loss,":
-                perc_loss = l[5]
-                perc_loss = l[5][:-1]  # drop % char
-                perc_loss = int(float(perc_loss))
-
-            self.addresses[addr] = perc_loss
-            break
+            return {}
 
     def __post_check(self):
         # pick the best result
@@ -194,20 +205,27 @@ class Ping(HappyNode):
             print(hyellow(emsg))
             return ReturnMsg(100, self.addresses)
 
+        results = self.__probe()
         for addr in self.addresses.keys():
-            out, err = self.__ping_on_address(addr)
-            self.__parse_output(addr, out, err)
+            self.stats[addr] = results.get(addr, happy.HappyICMPProbe.Statistics(0, []))
+            self.addresses[addr] = self.stats[addr]["loss"]
 
         self.__post_check()
 
         for addr in self.addresses.keys():
+            stats = self.stats[addr]
+            rtt = ""
+            if stats["avg"] is not None:
+                rtt = ", rtt min/avg/max/stddev %.3f/%.3f/%.3f/%.3f ms" % \
+                    (stats["min"], stats["avg"], stats["max"], stats["stddev"])
+
             if IP.isIpAddress(self.destination):
                 self.logger.info("ping from " + self.source + " to address " +
-                                 addr + " -> " + str(self.addresses[addr]) +
-                                 "% packet loss")
+                                 addr + " -> " + str(stats["loss"]) +
+                                 "% packet loss" + rtt)
             else:
                 self.logger.info("ping from " + self.source + " to " + self.destination +
-                                 " on address " + addr + " -> " + str(self.addresses[addr]) +
-                                 "% packet loss")
+                                 " on address " + addr + " -> " + str(stats["loss"]) +
+                                 "% packet loss" + rtt)
 
         return ReturnMsg(self.ret, self.addresses)
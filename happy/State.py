@@ -30,6 +30,12 @@ from happy.utils.IP import IP
 from happy.Driver import Driver
 import six
 
+# routing tables Happy numbers itself, clear of the reserved 253-255 and of
+# the tables numbered by hand in rt_tables
+FIRST_ROUTE_TABLE_ID = 1000
+MAX_ROUTE_TABLE_ID = 2 ** 32 - 1
+RESERVED_ROUTE_TABLE_IDS = [0, 253, 254, 255]
+
 
 class State(Driver):
     def __init__(self):
@@ -229,6 +235,17 @@ class State(Driver):
             addrs += addr
         return addrs
 
+    def getAddressIndex(self, state=None):
+        """
+        Returns the node of every address of the nodes, by the canonical
+        form of the address.
+        """
+        index = {}
+        for node_id in self.getNodeIds(state):
+            for addr in self.getNodeAddresses(node_id, state):
+                index[IP.canonicalize(addr)] = node_id
+        return index
+
     def getNodePublicIPv4Address(self, node_id=None, state=None):
         node_public_interfaces = self.getNodePublicInterfaces(node_id, state)
         for interface_id in node_public_interfaces:
@@ -380,6 +397,12 @@ class State(Driver):
             return {}
         return node_processes[tag]
 
+    def getNodeIptablesRules(self, node_id=None, state=None):
+        node_record = self.getNode(node_id, state)
+        if "iptables" not in list(node_record.keys()):
+            return []
+        return node_record["iptables"]
+
     def getNodeType(self, node_id=None, state=None):
         node_record = self.getNode(node_id, state)
         if "type" not in list(node_record.keys()):
@@ -404,12 +427,30 @@ class State(Driver):
             return None
         return process_record["out"]
 
+    def getNodeProcessTimings(self, tag=None, node_id=None, state=None):
+        process_record = self.getNodeProcess(tag, node_id, state)
+        if "timings" not in list(process_record.keys()):
+            return {}
+        return process_record["timings"]
+
+    def getNodeProcessOutputRotation(self, tag=None, node_id=None, state=None):
+        process_record = self.getNodeProcess(tag, node_id, state)
+        if "out_rotation" not in list(process_record.keys()):
+            return {}
+        return process_record["out_rotation"]
+
     def getNodeProcessStraceFile(self, tag=None, node_id=None, state=None):
         process_record = self.getNodeProcess(tag, node_id, state)
         if "strace" not in list(process_record.keys()):
             return None
         return process_record["strace"]
 
+    def getNodeProcessStraceMode(self, tag=None, node_id=None, state=None):
+        process_record = self.getNodeProcess(tag, node_id, state)
+        if "strace_mode" not in list(process_record.keys()):
+            return None
+        return process_record["strace_mode"]
+
     def getNodeProcessCommand(self, tag=None, node_id=None, state=None):
         process_record = self.getNodeProcess(tag, node_id, state)
         if "command" not in list(process_record.keys()):
@@ -422,6 +463,18 @@ class State(Driver):
             return None
         return node_record["netns"]
 
+    def getNodeCGroup(self, node_id=None, state=None):
+        node_record = self.getNode(node_id, state)
+        if "cgroup" not in list(node_record.keys()):
+            return {}
+        return node_record["cgroup"]
+
+    def getNodeCGroupPath(self, node_id=None, state=None):
+        cgroup_record = self.getNodeCGroup(node_id, state)
+        if "path" not in list(cgroup_record.keys()):
+            return None
+        return cgroup_record["path"]
+
 # Retrieve Node network information
 
     def getNetwork(self, network_id=None, state=None):
@@ -561,6 +614,24 @@ class State(Driver):
             return {}
         return network_routes[route_to]
 
+    def getNetworkCapture(self, network_id=None, state=None):
+        network_record = self.getNetwork(network_id, state)
+        if "capture" not in list(network_record.keys()):
+            return {}
+        return network_record["capture"]
+
+    def getNetworkShape(self, network_id=None, state=None):
+        network_record = self.getNetwork(network_id, state)
+        if "shape" not in list(network_record.keys()):
+            return {}
+        return network_record["shape"]
+
+    def getNetworkMode(self, network_id=None, state=None):
+        network_record = self.getNetwork(network_id, state)
+        if "mode" not in list(network_record.keys()):
+            return "hub"
+        return network_record["mode"]
+
 # Retrieve Link information
 
     def getLink(self, link_id=None, state=None):
@@ -613,6 +684,18 @@ class State(Driver):
             return None
         return link["network_end"]
 
+    def getLinkShape(self, link_id=None, state=None):
+        link = self.getLink(link_id, state)
+        if "shape" not in list(link.keys()):
+            return {}
+        return link["shape"]
+
+    def getLinkPeer(self, link_id=None, state=None):
+        link = self.getLink(link_id, state)
+        if "peer" not in list(link.keys()):
+            return None
+        return link["peer"]
+
     def getInternet(self, state=None):
         global_record = self.getGlobal(state)
         if "internet" not in list(global_record.keys()):
@@ -625,12 +708,33 @@ class State(Driver):
             return {}
         return global_isp_record["isp"]
 
+    def getRouteTables(self, state=None):
+        global_record = self.getGlobal(state)
+        if "route_tables" not in list(global_record.keys()):
+            global_record["route_tables"] = {"tables": {}, "ids": {}, "free": [], "next": FIRST_ROUTE_TABLE_ID}
+        return global_record["route_tables"]
+
+    def getRouteTableId(self, table, state=None):
+        global_record = self.getGlobal(state)
+        if "route_tables" not in list(global_record.keys()):
+            return None
+        record = global_record["route_tables"]["tables"].get(table)
+        if record is None:
+            return None
+        return record["id"]
+
     def getDNS(self, state=None):
         global_record = self.getGlobal(state)
         if "DNS" not in list(global_record.keys()):
             return None
         return global_record["DNS"]
 
+    def getDNSStub(self, state=None):
+        global_record = self.getGlobal(state)
+        if "DNS_stub" not in list(global_record.keys()):
+            return None
+        return global_record["DNS_stub"]
+
     def getInternetHostLinkId(self, isp_id, state=None):
         internet_record = self.getInternet(state)
         if isp_id in list(internet_record.keys()) and "host_link" not in internet_record[isp_id]:
@@ -661,47 +765,11 @@ class State(Driver):
             return None
         return internet_record[isp_id]["isp_index"]
 
-    def getIspAvailable(self, state=None):
-        isp_record = self.getIsp(state)
-        available_ip_pool = [s for s in isp_record if not s["occupy"]]
-        return available_ip_pool
-
-    def getIspAvailableIndex(self, state=None):
-        isp_record = self.getIsp(state)
-        available_ip_pool = [s for s in isp_record if not s["occupy"]]
-        return int(available_ip_pool[0]['isp_index']) - 1
-
-    def getIspAddr(self, index, state=None):
-        isp_record = self.getIsp(state)
-        if index >= len(isp_record) or index < 0:
-            return None
-        if "isp_addr" not in list(isp_record[index].keys()):
-            return None
-        return isp_record[index]["isp_addr"]
-
-    def getIspHostLinkId(self, index, state=None):
-        isp_record = self.getIsp(state)
-        if index > len(isp_record) or index < 0:
-            return None
-        if "isp_host_end" not in list(isp_record[index].keys()):
-            return None
-        return isp_record[index]["isp_host_end"]
-
-    def getIspNodeLinkId(self, index, state=None):
-        isp_record = self.getIsp(state)
-        if index >= len(isp_record) or index < 0:
-            return None
-        if "isp_node_end" not in list(isp_record[index].keys()):
-            return None
-        return isp_record[index]["isp_node_end"]
-
-    def getIspIndex(self, index, state=None):
+    def getIspUsed(self, state=None):
         isp_record = self.getIsp(state)
-        if index >= len(isp_record) or index < 0:
-            return None
-        if "isp_index" not in list(isp_record[index].keys()):
-            return None
-        return isp_record[index]["isp_index"]
+        if "used" not in list(isp_record.keys()):
+            return 0
+        return isp_record["used"]
 
     def setNodeProcess(self, process, tag, node_id=None, state=None):
         node_record = self.getNode(node_id, state)
@@ -709,6 +777,11 @@ class State(Driver):
             node_record["process"] = {}
         node_record["process"][tag] = process
 
+    def setNodeCGroup(self, node_id, record, state=None):
+        node_record = self.getNode(node_id, state)
+        if node_record is not None:
+            node_record["cgroup"] = record
+
     def setLink(self, link_id, link, state=None):
         links = self.getLinks(state)
         if links is not None:
@@ -751,6 +824,14 @@ class State(Driver):
         if node_record is not None:
             node_record["interface"][interface_id] = record
 
+    def setNodeIptablesRules(self, rules, node_id=None, state=None):
+        node_record = self.getNode(node_id, state)
+        if node_record is not None:
+            if len(rules) > 0:
+                node_record["iptables"] = rules
+            elif "iptables" in list(node_record.keys()):
+                del node_record["iptables"]
+
     def setNodeRoute(self, node_id, to, record, state=None):
         node_record = self.getNode(node_id, state)
         if node_record is not None:
@@ -796,6 +877,26 @@ class State(Driver):
                 network_record["prefix"] = {}
             network_record["prefix"][prefix] = record
 
+    def setNetworkCapture(self, network_id, record, state=None):
+        network_record = self.getNetwork(network_id, state)
+        if network_record is not None:
+            network_record["capture"] = record
+
+    def setNetworkShape(self, network_id, record, state=None):
+        network_record = self.getNetwork(network_id, state)
+        if network_record is not None:
+            network_record["shape"] = record
+
+    def setLinkShape(self, link_id, record, state=None):
+        link = self.getLink(link_id, state)
+        if link != {}:
+            link["shape"] = record
+
+    def setLinkPeer(self, link_id, peer, state=None):
+        link = self.getLink(link_id, state)
+        if link != {}:
+            link["peer"] = peer
+
     def setGlobalInternet(self, record, state=None):
         global_record = self.getGlobal(state)
         global_record["internet"] = record
@@ -804,16 +905,72 @@ class State(Driver):
         global_isp_record = self.getGlobalIsp(state)
         global_isp_record["isp"] = record
 
-    def setIspOccupancy(self, index, value, state=None):
+    def allocateIspIndex(self, state=None):
+        """
+        Returns the index of a free address of the virtual ISP, the last one
+        released, else the next one never used, or None once every address
+        of its prefix is taken.
+        """
         isp_record = self.getIsp(state)
-        if index >= len(isp_record) or index < 0:
+        if not bool(isp_record):
+            return None
+
+        if len(isp_record["free"]) > 0:
+            index = isp_record["free"].pop()
+        elif isp_record["next"] < isp_record["size"] - 1:
+            # the last address is the broadcast one
+            index = isp_record["next"]
+            isp_record["next"] += 1
+        else:
             return None
-        isp_record[index]["occupy"] = value
+
+        isp_record["used"] += 1
+        return index
+
+    def allocateRouteTableId(self, table, node_id, preferred=None, state=None):
+        """
+        Returns the number of routing table table at node_id, the same at
+        every node. A new table gets preferred if it is free, else the last
+        number released, else the next one never used.
+        """
+        route_tables = self.getRouteTables(state)
+        record = route_tables["tables"].get(table)
+
+        if record is None:
+            table_id = None
+            if preferred is not None and int(preferred) not in RESERVED_ROUTE_TABLE_IDS and \
+               0 < int(preferred) <= MAX_ROUTE_TABLE_ID and str(int(preferred)) not in route_tables["ids"]:
+                table_id = int(preferred)
+
+            # numbers given as preferred ones stay in the free list and past
+            # next until they come up
+            while table_id is None and len(route_tables["free"]) > 0:
+                table_id = route_tables["free"].pop()
+                if str(table_id) in route_tables["ids"]:
+                    table_id = None
+
+            while table_id is None:
+                table_id = route_tables["next"]
+                route_tables["next"] += 1
+                if str(table_id) in route_tables["ids"]:
+                    table_id = None
+
+            record = {"id": table_id, "nodes": []}
+            route_tables["tables"][table] = record
+            route_tables["ids"][str(table_id)] = table
+
+        if node_id not in record["nodes"]:
+            record["nodes"].append(node_id)
+        return record["id"]
 
     def setGlobalDNS(self, record, state=None):
         global_record = self.getGlobal(state)
         global_record["DNS"] = record
 
+    def setGlobalDNSStub(self, record, state=None):
+        global_record = self.getGlobal(state)
+        global_record["DNS_stub"] = record
+
     def renameNode(self, node_id, new_node_id, state=None):
         nodes = self.getNodes(state)
         if nodes is not None:
@@ -865,6 +1022,11 @@ class State(Driver):
             if to in list(node_record["route"].keys()):
                 del node_record["route"][to]
 
+    def removeNodeCGroup(self, node_id, state=None):
+        node_record = self.getNode(node_id, state)
+        if "cgroup" in list(node_record.keys()):
+            del node_record["cgroup"]
+
     def removeNodeInterfaceAddress(self, node_id, interface_id, ip_address, state=None):
         node_interface = self.getNodeInterface(interface_id, node_id, state)
         if ip_address in self.getNodeInterfaceAddresses(interface_id, node_id, state):
@@ -887,6 +1049,21 @@ class State(Driver):
             if prefix in list(network_record["prefix"].keys()):
                 del network_record["prefix"][prefix]
 
+    def removeNetworkCapture(self, network_id, state=None):
+        network_record = self.getNetwork(network_id, state)
+        if "capture" in list(network_record.keys()):
+            del network_record["capture"]
+
+    def removeNetworkShape(self, network_id, state=None):
+        network_record = self.getNetwork(network_id, state)
+        if "shape" in list(network_record.keys()):
+            del network_record["shape"]
+
+    def removeLinkShape(self, link_id, state=None):
+        link = self.getLink(link_id, state)
+        if "shape" in list(link.keys()):
+            del link["shape"]
+
     def removeGlobalInternet(self, isp_id, state=None):
         global_record = self.getGlobal(state)
         if "internet" in list(global_record.keys()) and isp_id in list(global_record['internet'].keys()):
@@ -899,11 +1076,41 @@ class State(Driver):
         if "isp" in list(global_record.keys()):
             del global_record["isp"]
 
+    def releaseIspIndex(self, index, state=None):
+        isp_record = self.getIsp(state)
+        if not bool(isp_record):
+            return
+        isp_record["free"].append(int(index))
+        isp_record["used"] -= 1
+
+    def releaseRouteTableId(self, table, node_id, state=None):
+        """
+        node_id no longer uses routing table table, whose number is freed
+        once no node uses it.
+        """
+        route_tables = self.getRouteTables(state)
+        record = route_tables["tables"].get(table)
+        if record is None:
+            return
+
+        if node_id in record["nodes"]:
+            record["nodes"].remove(node_id)
+
+        if len(record["nodes"]) == 0:
+            del route_tables["tables"][table]
+            del route_tables["ids"][str(record["id"])]
+            route_tables["free"].append(record["id"])
+
     def removeGlobalDNS(self, state=None):
         global_record = self.getGlobal(state)
         if "DNS" in list(global_record.keys()):
             del global_record["DNS"]
 
+    def removeGlobalDNSStub(self, state=None):
+        global_record = self.getGlobal(state)
+        if "DNS_stub" in list(global_record.keys()):
+            del global_record["DNS_stub"]
+
     def getExtensionState(self, state=None):
         """
         return a list of states created by happy plugins,
@@ -23,53 +23,73 @@
 #
 
 from __future__ import absolute_import
+import json
 import os
+import socket
 import sys
 
 from happy.ReturnMsg import ReturnMsg
 from happy.Utils import *
 from happy.utils.IP import IP
 from happy.HappyNode import HappyNode
+from happy.HappyProcess import HappyProcess
+import happy.HappyTraceProbe
 
 options = {}
 options["quiet"] = False
 options["source"] = None
 options["destination"] = None
+options["max_hops"] = None
+options["queries"] = None
+options["timeout"] = None
 
 
 def option():
     return options.copy()
 
 
-class Traceroute(HappyNode):
+class Traceroute(HappyNode, HappyProcess):
     """
-    Calls traceroute between virtual nodes. Uses traceroute for IPv4 and traceroute6
-    for IPv6.
+    Traces the route between virtual nodes. Sends the UDP probes of every hop
+    to every address of the destination at the same time, from the source
+    node, and names the node of every hop.
 
     happy-traceroute [-h --help] [-q --quiet] [-i --id <NODE_NAME>]
                      [-d --destination (<IP_ADDR>|<NODE_NAME>)]
+                     [-m --max-hops <HOPS>] [--queries <PROBES>]
+                     [--timeout <SECONDS>]
 
         -i --id           Source node.
         -d --destination  Destination, can be either the IP address or the node name.
+        -m --max-hops     Largest hop limit to probe with, 30 by default.
+           --queries      Probes per hop, 1 by default.
+           --timeout      Seconds to wait for answers after the last probe, 1 by
+                          default.
 
     Example:
     $ happy-traceroute BorderRouter ThreadNode
-        Calls traceroute between the BorderRouter and ThreadNode nodes.
+        Traces the route between the BorderRouter and ThreadNode nodes.
 
     $ happy-traceroute BorderRouter 10.0.1.3
-        Calls traceroute between the BorderRouter node and 10.0.1.3.
+        Traces the route between the BorderRouter node and 10.0.1.3.
 
     return:
-        0    success
-        1    fail
+        0    the destination was not reached
+        N    hops to the destination, of the address with the longest route.
+             The data holds the hops of every address, as the ttl, address,
+             node and rtts in ms of the answers to the probes of each hop.
     """
 
     def __init__(self, opts=options):
         HappyNode.__init__(self)
+        HappyProcess.__init__(self)
 
         self.quiet = opts["quiet"]
         self.source = opts["source"]
         self.destination = opts["destination"]
+        self.max_hops = opts["max_hops"]
+        self.queries = opts["queries"]
+        self.timeout = opts["timeout"]
 
     def __pre_check(self):
         # Check if the name of the new node is given
@@ -96,6 +116,15 @@ class Traceroute(HappyNode):
             self.logger.error("[%s] Traceroute: %s" % (self.source, emsg))
             self.exit()
 
+        if self.max_hops is None:
+            self.max_hops = happy.HappyTraceProbe.options["max_hops"]
+        if self.queries is None:
+            self.queries = happy.HappyTraceProbe.options["queries"]
+        if self.timeout is None:
+            self.timeout = happy.HappyTraceProbe.options["timeout"]
+        self.max_hops = int(self.max_hops)
+        self.queries = int(self.queries)
+
     def __get_addresses(self):
         self.addresses = {}
 
@@ -109,54 +138,66 @@ class Traceroute(HappyNode):
             for addr in node_addresses:
                 self.addresses[addr] = {}
 
-    def __traceroute_to_address(self, addr):
-        cmd = ""
+    def __trace(self):
+        addresses = list(self.addresses.keys())
 
-        if IP.isIpv6(addr):
-            cmd += "traceroute6"
-        else:
-            cmd += "traceroute"
+        if self.isNodeLocal(self.source) or os.geteuid() == 0:
+            create = socket.socket
+            if not self.isNodeLocal(self.source):
+                netns_path = self.getNetNSPath(self.source)
 
-        if IP.isMulticast(addr):
-            cmd += ""
+                def create(family, type, proto):
+                    return self.SocketInNamespace(netns_path, family, type, proto)
 
-        cmd += " " + addr
+            try:
+                return happy.HappyTraceProbe.Trace(addresses, self.max_hops, self.queries, self.timeout, create)
+            except OSError as e:
+                emsg = "Failed to trace the route from node %s: %s" % (self.source, str(e))
+                self.logger.warning("[%s] Traceroute: %s" % (self.source, emsg))
+                return {}
 
+        # entering the namespace needs root, which the prober gets as a script
+        path = os.path.dirname(os.path.abspath(happy.HappyTraceProbe.__file__))
+        cmd = "%s %s/HappyTraceProbe.py --max-hops %d --queries %d --timeout %s %s" % \
+            (sys.executable, path, self.max_hops, self.queries, self.timeout, " ".join(addresses))
         out, err = self.CallAtNodeForOutput(self.source, cmd)
 
-        return (out, err)
-
-    def __parse_output(self, addr, out, err):
-        self.addresses[addr]["out"] = out
-        self.addresses[addr]["err"] = err
-
-        if out is not None:
-            self.addresses[addr]["value"] = 0
+        try:
+            return json.loads(out)
+        except (TypeError, ValueError):
+            emsg = "Failed to trace the route from node %s: %s" % (self.source, err)
+            self.logger.warning("[%s] Traceroute: %s" % (self.source, emsg))
+            return {}
+
+    def __parse_output(self, addr, result):
+        self.addresses[addr] = result
+        self.addresses[addr]["value"] = 0
+        self.addresses[addr]["err"] = result.get("error")
+
+        lines = []
+        for hop in result["hops"]:
+            hop["node"] = None
+            if hop["address"] is None:
+                lines.append("%2d  *" % (hop["ttl"]))
+                continue
 
-            if "* * *" in self.addresses[addr]["out"]:
-                return
+            hop["node"] = self.address_index.get(hop["address"])
+            name = hop["address"]
+            if hop["node"] is not None:
+                name = "%s (%s)" % (hop["node"], hop["address"])
+            rtts = "  ".join(["%.3f ms" % (rtt) for rtt in hop["rtts"]])
+            lines.append("%2d  %s  %s" % (hop["ttl"], name, rtts))
 
-            for line in self.addresses[addr]["out"].split("\n"):
-                l = line.split()
-                if len(l) > 1 and l[0].isdigit():
-                    self.addresses[addr]["value"] = int(float(l[0]))
+        if result["reached"]:
+            self.addresses[addr]["value"] = len(result["hops"])
 
-        else:
-            self.addresses[addr]["value"] = -1
+        self.addresses[addr]["out"] = "\n".join(lines)
 
     def __post_check(self):
         # Check if at least one got to destination
         self.rets = []
 
         for addr in self.addresses.keys():
-            if self.addresses[addr]["out"] is None:
-                self.rets.append(0)
-                continue
-
-            if self.addresses[addr]["value"] < 1:
-                self.rets.append(self.addresses[addr]["value"])
-                continue
-
             self.rets.append(self.addresses[addr]["value"])
 
         if len(self.rets) > 0:
@@ -169,19 +210,22 @@ class Traceroute(HappyNode):
 
         self.__get_addresses()
 
-        for addr in self.addresses.keys():
-            out, err = self.__traceroute_to_address(addr)
+        self.address_index = self.getAddressIndex()
 
-            self.__parse_output(addr, out, err)
+        results = self.__trace()
+        for addr in self.addresses.keys():
+            result = results.get(addr, {"hops": [], "reached": False})
+            self.__parse_output(addr, result)
 
         self.__post_check()
 
         for addr in self.addresses.keys():
             self.logger.info("traceroute to " + addr + ":")
 
-            if self.addresses[addr]["out"] is None:
-                self.logger.info("\tNone")
-            else:
+            if self.addresses[addr]["err"] is not None:
+                self.logger.info("\t" + self.addresses[addr]["err"])
+
+            if self.addresses[addr]["out"] != "":
                 for line in self.addresses[addr]["out"].split("\n"):
                     self.logger.info("\t" + line)
 
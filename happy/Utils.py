@@ -79,3 +79,29 @@ def hblue(txt):
 #
 def delayExecution(sec):
     time.sleep(sec)
+
+
+##
+#    Parses a size in bytes, with an optional K, M or G suffix.
+#
+#    @param[in]  size   A size such as 100M, a number of bytes, or None.
+#
+#    @return     the number of bytes, or None if size is None. Raises
+#                ValueError if size is not a size.
+#
+def parseSize(size):
+    if size is None:
+        return None
+
+    size = str(size).strip().upper()
+    multiplier = 1
+    for suffix, value in [("K", 1 << 10), ("M", 1 << 20), ("G", 1 << 30)]:
+        if size.endswith(suffix):
+            size = size[:-1]
+            multiplier = value
+            break
+
+    try:
+        return int(float(size) * multiplier)
+    except OverflowError:
+        raise ValueError("size %s is too large" % (size))
@@ -253,6 +253,17 @@ class IP:
             return False
         return IP.isIpv4(addr) or IP.isIpv6(addr)
 
+    @staticmethod
+    def canonicalize(addr):
+        """Returns the shortest text form of an address, as the kernel reports
+        it, for the zero padded form Happy stores, or addr if it is none.
+        """
+        family = socket.AF_INET6 if IP.isIpv6(addr) else socket.AF_INET
+        try:
+            return socket.inet_ntop(family, socket.inet_pton(family, addr))
+        except (OSError, TypeError, ValueError):
+            return addr
+
     @staticmethod
     def isMulticast(addr):
         if addr is None:
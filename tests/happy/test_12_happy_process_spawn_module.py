@@ -0,0 +1,122 @@
+#!/usr/bin/env python3
+
+#
+#    Copyright (c) 2021 Google LLC.
+#    All rights reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+#
+
+##
+#    @file
+#       Benchmarks happy process start latency through the sudo/ip-netns-exec
+#       chain and through the direct namespace spawn.
+#
+
+from __future__ import absolute_import
+from __future__ import print_function
+import os
+import time
+import unittest
+
+import psutil
+
+import happy.HappyNodeAdd
+import happy.HappyNodeDelete
+import happy.HappyProcessStart
+import happy.HappyProcessStop
+
+RUNS = 20
+
+
+class test_happy_process_spawn_module(unittest.TestCase):
+    def setUp(self):
+        options = happy.HappyNodeAdd.option()
+        options["node_id"] = "node01"
+        options["quiet"] = True
+        addNode = happy.HappyNodeAdd.HappyNodeAdd(options)
+        addNode.run()
+
+    def tearDown(self):
+        options = happy.HappyNodeDelete.option()
+        options["node_id"] = "node01"
+        options["quiet"] = True
+        delNode = happy.HappyNodeDelete.HappyNodeDelete(options)
+        delNode.run()
+
+    def __start(self, tag, direct):
+        options = happy.HappyProcessStart.option()
+        options["node_id"] = "node01"
+        options["tag"] = tag
+        options["command"] = "sleep 60"
+        options["quiet"] = True
+        options["direct_spawn"] = direct
+
+        cmd = happy.HappyProcessStart.HappyProcessStart(options)
+
+        start = time.time()
+        cmd.run()
+
+        # Startup is over once the target itself runs, not when the first
+        # process of the chain has been forked.
+        pid = cmd.getNodeProcessPID(tag, "node01")
+        create_time = cmd.getNodeProcessCreateTime(tag, "node01")
+        while True:
+            procs = cmd.GetProcessTreeAsList(pid, create_time)
+            if "sleep" in [p.name() for p in procs]:
+                break
+            time.sleep(0.0005)
+        elapsed = time.time() - start
+
+        return elapsed, pid, cmd.getNetNSPath("node01")
+
+    def __stop(self, tag):
+        options = happy.HappyProcessStop.option()
+        options["node_id"] = "node01"
+        options["tag"] = tag
+        options["quiet"] = True
+        cmd = happy.HappyProcessStop.HappyProcessStop(options)
+        cmd.run()
+
+    def __measure(self, direct):
+        samples = []
+        for i in range(RUNS):
+            tag = "SPAWN%02d" % (i)
+            elapsed, pid, netns_path = self.__start(tag, direct)
+            samples.append(elapsed)
+
+            if direct:
+                # The recorded PID is the target process, not a sudo parent,
+                # and it runs in the node namespace as root.
+                self.assertEqual(psutil.Process(pid).name(), "sleep")
+                self.assertEqual(os.stat("/proc/%d/ns/net" % (pid)).st_ino, os.stat(netns_path).st_ino)
+                self.assertEqual(psutil.Process(pid).uids().effective, os.geteuid())
+
+            self.__stop(tag)
+
+        samples.sort()
+        return samples[len(samples) // 2]
+
+    def test_process_spawn_latency(self):
+        chain = self.__measure(False)
+        print("sudo/ip-netns-exec chain start p50: %.2f ms" % (chain * 1000))
+
+        if os.geteuid() != 0:
+            print("direct spawn needs root, skipping")
+            return
+
+        direct = self.__measure(True)
+        print("direct namespace spawn start p50: %.2f ms" % (direct * 1000))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,89 @@
+#!/usr/bin/env python3
+
+#
+#    Copyright (c) 2021 Google LLC.
+#    All rights reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+#
+
+##
+#    @file
+#       Tests the streaming strace parser behind happy-process-strace --summary.
+#
+
+from __future__ import absolute_import
+import unittest
+
+from happy.HappyStraceParser import StraceSummary, histogram_buckets
+
+TIMED_TRACE = """\
+1234  10:00:00.000100 openat(AT_FDCWD, "/etc/ld.so.cache", O_RDONLY|O_CLOEXEC) = 3 <0.000012>
+1234  10:00:00.000200 openat(AT_FDCWD, "/nope", O_RDONLY) = -1 ENOENT (No such file or directory) <0.000008>
+1234  10:00:00.000300 read(3, <unfinished ...>
+1235  10:00:00.000310 write(1, "a) = 5", 6) = 6 <0.000100>
+1234  10:00:00.250300 <... read resumed>"x", 1) = 1
+1235  10:00:00.300000 --- SIGCHLD {si_signo=SIGCHLD, si_code=CLD_EXITED} ---
+1234  10:00:00.400000 exit_group(0)                = ?
+1234  10:00:00.400100 +++ exited with 0 +++
+"""
+
+COUNT_TABLE = """\
+% time     seconds  usecs/call     calls    errors syscall
+------ ----------- ----------- --------- --------- ----------------
+ 45.00    0.000045          11         4           mmap
+ 30.00    0.000030          10         3         2 openat
+ 25.00    0.000025          25         1           execve
+------ ----------- ----------- --------- --------- ----------------
+100.00    0.000100          12         8         2 total
+"""
+
+
+class test_happy_strace_parser_module(unittest.TestCase):
+    def test_timed_trace(self):
+        summary = StraceSummary(slowest=2).feedLines(TIMED_TRACE.splitlines(True)).result()
+        syscalls = summary["syscalls"]
+
+        self.assertEqual(syscalls["openat"]["calls"], 2)
+        self.assertEqual(syscalls["openat"]["errors"], 1)
+        self.assertAlmostEqual(syscalls["openat"]["avg_usec"], 10.0)
+        self.assertEqual(syscalls["write"]["calls"], 1)
+        self.assertEqual(syscalls["exit_group"]["timed"], 0)
+
+        # the split read is timed from its timestamps
+        self.assertAlmostEqual(syscalls["read"]["max_usec"], 250000.0)
+
+        self.assertEqual(summary["total"]["calls"], 5)
+        self.assertEqual(summary["signals"], 1)
+        self.assertEqual(summary["exits"], 1)
+        self.assertEqual(summary["unfinished"], 0)
+
+        self.assertEqual([c["syscall"] for c in summary["slowest"]], ["read", "write"])
+        self.assertEqual(summary["slowest"][0]["pid"], "1234")
+
+        histogram = syscalls["openat"]["histogram"]
+        self.assertEqual(len(histogram), len(histogram_buckets) + 1)
+        self.assertEqual(histogram[histogram_buckets.index(10)], 1)
+        self.assertEqual(histogram[histogram_buckets.index(20)], 1)
+
+    def test_count_table(self):
+        summary = StraceSummary().feedLines(COUNT_TABLE.splitlines(True)).result()
+
+        self.assertTrue(summary["count_mode"])
+        self.assertEqual(sorted(summary["syscalls"].keys()), ["execve", "mmap", "openat"])
+        self.assertEqual(summary["syscalls"]["openat"]["errors"], 2)
+        self.assertEqual(summary["total"]["calls"], 8)
+        self.assertAlmostEqual(summary["total"]["total_usec"], 100.0)
+
+if __name__ == "__main__":
+    unittest.main()
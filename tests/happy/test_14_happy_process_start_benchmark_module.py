@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+
+#
+#    Copyright (c) 2021 Google LLC.
+#    All rights reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+#
+
+##
+#    @file
+#       Benchmarks happy process start and stop: starts and stops
+#       HAPPY_BENCH_PROCESSES trivial processes on each of HAPPY_BENCH_NODES
+#       nodes and reports p50/p99 of every start phase and of the stop.
+#
+
+from __future__ import absolute_import
+from __future__ import print_function
+import os
+import time
+import unittest
+
+import happy.HappyNodeAdd
+import happy.HappyNodeDelete
+import happy.HappyProcessStart
+import happy.HappyProcessStop
+from happy.HappyProcessStats import percentile, phases
+
+NODES = int(os.environ.get("HAPPY_BENCH_NODES", "3"))
+PROCESSES = int(os.environ.get("HAPPY_BENCH_PROCESSES", "10"))
+
+
+class test_happy_process_start_benchmark_module(unittest.TestCase):
+    def setUp(self):
+        self.node_ids = ["node%02d" % (i) for i in range(NODES)]
+
+        for node_id in self.node_ids:
+            options = happy.HappyNodeAdd.option()
+            options["node_id"] = node_id
+            options["quiet"] = True
+            addNode = happy.HappyNodeAdd.HappyNodeAdd(options)
+            addNode.run()
+
+    def tearDown(self):
+        for node_id in self.node_ids:
+            options = happy.HappyNodeDelete.option()
+            options["node_id"] = node_id
+            options["quiet"] = True
+            delNode = happy.HappyNodeDelete.HappyNodeDelete(options)
+            delNode.run()
+
+    def __start(self, node_id, tag):
+        options = happy.HappyProcessStart.option()
+        options["node_id"] = node_id
+        options["tag"] = tag
+        options["command"] = "sleep 60"
+        options["quiet"] = True
+        cmd = happy.HappyProcessStart.HappyProcessStart(options)
+        return cmd.run().Data()
+
+    def __stop(self, node_id, tag):
+        options = happy.HappyProcessStop.option()
+        options["node_id"] = node_id
+        options["tag"] = tag
+        options["quiet"] = True
+        cmd = happy.HappyProcessStop.HappyProcessStop(options)
+
+        start = time.monotonic()
+        cmd.run()
+        return time.monotonic() - start
+
+    def test_process_start_stop_latency(self):
+        samples = {}
+        stops = []
+
+        for i in range(PROCESSES):
+            tag = "BENCH%02d" % (i)
+
+            for node_id in self.node_ids:
+                timings = self.__start(node_id, tag)
+                for phase, value in timings.items():
+                    samples.setdefault(phase, []).append(value)
+
+            for node_id in self.node_ids:
+                stops.append(self.__stop(node_id, tag))
+
+        self.assertEqual(len(samples["total"]), NODES * PROCESSES)
+
+        print("%d processes on %d nodes" % (PROCESSES, NODES))
+        print("{0: >14} {1: >10} {2: >10}".format("phase", "p50 ms", "p99 ms"))
+        for phase in phases:
+            if phase not in samples:
+                continue
+            print("{0: >14} {1: >10.2f} {2: >10.2f}".format(
+                  phase, percentile(samples[phase], 50) * 1000, percentile(samples[phase], 99) * 1000))
+        print("{0: >14} {1: >10.2f} {2: >10.2f}".format(
+              "stop", percentile(stops, 50) * 1000, percentile(stops, 99) * 1000))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+
+#
+#    Copyright (c) 2021 Google LLC.
+#    All rights reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+#
+
+##
+#    @file
+#       Benchmarks the HappyPacketProcess sniffer with and without the
+#       kernel BPF filter and the TPACKET_V3 ring: a sender blasts a traffic mix with one reset
+#       candidate in CANDIDATE_EVERY frames into one end of a veth pair
+#       and the sniffer decodes what reaches userspace on the other end.
+#
+
+from __future__ import absolute_import
+from __future__ import print_function
+import multiprocessing
+import os
+import socket
+import struct
+import time
+import unittest
+
+import happy.HappyPacketProcess as hpp
+
+VETH = ("hpbench0", "hpbench1")
+DURATION = 2.0
+CANDIDATE_EVERY = 100
+PORT = 11095
+IPS = ["10.0.1.2", "10.0.1.3"]
+
+
+def Frame(src, dst, protocol, dport, flags):
+    eth = struct.pack('!6s6sH', b'\x02\x00\x00\x00\x00\x01', b'\x02\x00\x00\x00\x00\x02', hpp.ETH_P_IP)
+    if protocol == socket.IPPROTO_TCP:
+        l4 = struct.pack('!HHLLBBHHH', 40000, dport, 1, 1, 5 << 4, flags, 1024, 0, 0)
+    else:
+        l4 = struct.pack('!HHHH', 40000, dport, 8, 0)
+    ip = struct.pack('!BBHHHBBH4s4s', 0x45, 0, 20 + len(l4), 1, 0, 64, protocol, 0,
+                     socket.inet_aton(src), socket.inet_aton(dst))
+    return eth + ip + l4
+
+
+def Send(stop):
+    sock = socket.socket(socket.AF_PACKET, socket.SOCK_RAW)
+    sock.bind((VETH[0], 0))
+
+    noise = [Frame(IPS[0], IPS[1], socket.IPPROTO_TCP, 80, 0x10),
+             Frame(IPS[0], IPS[1], socket.IPPROTO_TCP, PORT, 0x02),
+             Frame("10.0.9.9", IPS[1], socket.IPPROTO_TCP, PORT, 0x10),
+             Frame(IPS[0], IPS[1], socket.IPPROTO_UDP, PORT, 0)]
+    candidate = Frame(IPS[0], IPS[1], socket.IPPROTO_TCP, PORT, 0x18)
+    frames = [noise[i % len(noise)] for i in range(CANDIDATE_EVERY - 1)] + [candidate]
+
+    while not stop.is_set():
+        for frame in frames:
+            try:
+                sock.send(frame)
+            except OSError:
+                # the veth queue is full
+                pass
+
+    sock.close()
+
+
+class test_happy_packet_filter_module(unittest.TestCase):
+    def setUp(self):
+        if os.geteuid() != 0:
+            self.skipTest("needs root to create veth pairs")
+
+        os.system("ip link add %s type veth peer name %s" % VETH)
+        for veth in VETH:
+            os.system("ip link set %s up" % (veth))
+
+        hpp.options['dstPort'] = PORT
+        hpp.options['ips'] = IPS
+        hpp.options['action'] = "reset"
+
+    def tearDown(self):
+        os.system("ip link del %s 2>/dev/null" % (VETH[0]))
+
+    def __sniff(self, bpf, ring=False):
+        hpp.options['bpf'] = bpf
+        hpp.options['ring'] = ring
+        receiver = hpp.FrameReceiver(VETH[1], hpp.options)
+        if ring:
+            self.assertIsNotNone(receiver.ring)
+
+        stop = multiprocessing.Event()
+        sender = multiprocessing.Process(target=Send, args=(stop,))
+        sender.daemon = True
+        sender.start()
+
+        decoder = hpp.FlowDecoder()
+        table = hpp.RuleTable()
+        for rule in hpp.Rules(hpp.options):
+            table.Add(rule)
+        delivered = 0
+        candidates = 0
+        begin = time.monotonic()
+        try:
+            for buf, offset, length in receiver.Frames(0.2):
+                if time.monotonic() - begin > DURATION:
+                    break
+                if buf is None:
+                    continue
+                delivered += 1
+                record = decoder.Process(buf, length, offset)
+                if record is None or record.flags & (hpp.TCP_FIN | hpp.TCP_SYN | hpp.TCP_RST):
+                    continue
+                if table.Lookup(record) is not None:
+                    candidates += 1
+        finally:
+            elapsed = time.monotonic() - begin
+            stop.set()
+            sender.join()
+
+        packets, drops = receiver.Statistics()
+        receiver.Close()
+
+        return delivered / elapsed, candidates / elapsed, packets, drops
+
+    def test_compile_filter(self):
+        hpp.options['bpf'] = True
+        program = hpp.CompileFilter(hpp.options)
+        self.assertEqual(program[-1], (hpp.BPF_RET_K, 0, 0, 0))
+        self.assertIn((hpp.BPF_RET_K, 0, 0, hpp.snapLength), program)
+
+    def test_sniffer_throughput(self):
+        for bpf, ring in [(False, False), (False, True), (True, False), (True, True)]:
+            delivered, candidates, packets, drops = self.__sniff(bpf, ring)
+            print("bpf %-5s ring %-5s userspace %9.0f pkt/s, candidates %8.0f pkt/s, kernel queued %d dropped %d" %
+                  (bpf, ring, delivered, candidates, packets, drops))
+
+            self.assertGreater(candidates, 0)
+            if bpf:
+                # nothing but candidates crosses into userspace
+                self.assertEqual(delivered, candidates)
+
+if __name__ == "__main__":
+    unittest.main()
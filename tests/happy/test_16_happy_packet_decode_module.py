@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+
+#
+#    Copyright (c) 2021 Google LLC.
+#    All rights reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+#
+
+##
+#    @file
+#       Checks FlowDecoder against the EthernetFrame/IPv4Packet/TCPPacket
+#       decoders and compares their packets/sec on one core.
+#
+
+from __future__ import absolute_import
+from __future__ import print_function
+import socket
+import struct
+import time
+import unittest
+
+import happy.HappyPacketProcess as hpp
+
+PACKETS = 50000
+
+
+def Frame(flags=0x18, dport=11095, protocol=socket.IPPROTO_TCP, fragment=0):
+    eth = struct.pack('!6s6sH', b'\x02\x00\x00\x00\x00\x01', b'\x0a\x0b\x0c\x0d\x0e\x0f', hpp.ETH_P_IP)
+    tcp = struct.pack('!HHLLBBHHH', 40000, dport, 123456, 654321, 5 << 4, flags, 1024, 0xbeef, 0)
+    ip = struct.pack('!BBHHHBBH4s4s', 0x45, 0, 40, 7, fragment, 64, protocol, 0x1234,
+                     socket.inet_aton("10.0.1.2"), socket.inet_aton("10.0.1.3"))
+    return eth + ip + tcp + b'payload'
+
+
+def Frame6(dport=11095):
+    eth = struct.pack('!6s6sH', b'\x02\x00\x00\x00\x00\x01', b'\x0a\x0b\x0c\x0d\x0e\x0f', hpp.ETH_P_IPV6)
+    udp = struct.pack('!HHHH', 40000, dport, 8, 0)
+    ip = struct.pack('!IHBB16s16s', 6 << 28, len(udp), socket.IPPROTO_UDP, 64,
+                     socket.inet_pton(socket.AF_INET6, "fd00::2"), socket.inet_pton(socket.AF_INET6, "fd00::3"))
+    return eth + ip + udp
+
+
+def LegacyDecode(packet):
+    ethernetFrame = hpp.EthernetFrame()
+    ethernetFrame.Decode(packet)
+    if ethernetFrame.ethProto != 8:
+        return None
+    ipPacket = hpp.IPv4Packet()
+    ipPacket.Decode(ethernetFrame.payload)
+    if ipPacket.ipProtocol != 6:
+        return None
+    tcpPacket = hpp.TCPPacket()
+    tcpPacket.Decode(ipPacket.payload)
+    return ipPacket.GetIpv4HeaderDic(), tcpPacket.GetTcpHeaderDic()
+
+
+class test_happy_packet_decode_module(unittest.TestCase):
+    def setUp(self):
+        hpp.options['dstPort'] = 11095
+        hpp.options['ips'] = ["10.0.1.2", "10.0.1.3"]
+        hpp.options['action'] = "reset"
+
+    def test_decode_matches_legacy(self):
+        frame = Frame()
+        ip, tcp = LegacyDecode(frame)
+        record = hpp.FlowDecoder().Process(bytearray(frame), len(frame))
+
+        self.assertEqual((record.family, record.proto), (4, socket.IPPROTO_TCP))
+        self.assertEqual(hpp.FormatAddr(record.family, record.src), ip['ipSrc'])
+        self.assertEqual(hpp.FormatAddr(record.family, record.dst), ip['ipDst'])
+        self.assertEqual((record.sport, record.dport), (tcp['tcpSrcPort'], tcp['tcpDestPort']))
+        self.assertEqual((record.seq, record.ack), (tcp['tcpSeq'], tcp['tcpAckSeq']))
+        self.assertEqual(record.flags & hpp.TCP_RST, tcp['tcpRstBit'] << 2)
+
+    def test_decode_ipv6(self):
+        frame = Frame6()
+        record = hpp.FlowDecoder().Process(frame, len(frame))
+        self.assertEqual(record.Flow(), (6, socket.IPPROTO_UDP, hpp.ParseAddr("fd00::2")[1],
+                                         hpp.ParseAddr("fd00::3")[1], 40000, 11095))
+        self.assertEqual(record.flags, 0)
+
+    def test_decode_filters(self):
+        decoder = hpp.FlowDecoder()
+        for frame in [Frame(protocol=socket.IPPROTO_ICMP), Frame(fragment=100), Frame()[:40]]:
+            self.assertIsNone(decoder.Process(frame, len(frame)))
+
+        # the rules of the options keep what the BPF filter keeps
+        table = hpp.RuleTable()
+        for rule in hpp.Rules(hpp.options):
+            table.Add(rule)
+        frame = Frame()
+        self.assertIsNotNone(table.Lookup(decoder.Process(frame, len(frame))))
+        frame = Frame(dport=80)
+        self.assertIsNone(table.Lookup(decoder.Process(frame, len(frame))))
+        for flags in [0x02, 0x14]:
+            frame = Frame(flags=flags)
+            self.assertTrue(decoder.Process(frame, len(frame)).flags & (hpp.TCP_FIN | hpp.TCP_SYN | hpp.TCP_RST))
+
+    def test_decode_rate(self):
+        frame = Frame()
+        buf = bytearray(65535)
+        buf[:len(frame)] = frame
+        length = len(frame)
+
+        begin = time.monotonic()
+        for i in range(PACKETS):
+            LegacyDecode(frame)
+        legacy = PACKETS / (time.monotonic() - begin)
+
+        decoder = hpp.FlowDecoder()
+        begin = time.monotonic()
+        for i in range(PACKETS):
+            decoder.Process(buf, length)
+        decoded = PACKETS / (time.monotonic() - begin)
+
+        print("legacy decode %.0f pkt/s, FlowDecoder %.0f pkt/s (%.1fx)" % (legacy, decoded, decoded / legacy))
+        self.assertGreater(decoded, legacy * 2)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,135 @@
+#!/usr/bin/env python3
+
+#
+#    Copyright (c) 2021 Google LLC.
+#    All rights reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+#
+
+##
+#    @file
+#       Measures how fast HappyPacketProcess answers a packet with a RST:
+#       probes are sent into a veth pair whose other end lives in a network
+#       namespace running HappyPacketProcess, and the time until the RST
+#       comes back is recorded.
+#
+
+from __future__ import absolute_import
+from __future__ import print_function
+import os
+import socket
+import struct
+import subprocess
+import sys
+import time
+import unittest
+
+import happy.HappyPacketProcess as hpp
+
+NETNS = "hpreact"
+VETH = ("hpreact0", "hpreact1")
+ADDRS = ("10.250.1.2", "10.250.1.3")
+PORT = 11095
+PROBES = 200
+
+
+def Frame(sport):
+    # Not addressed to the peer MAC, so the peer kernel does not answer
+    # with a RST of its own.
+    eth = struct.pack('!6s6sH', b'\x02\x00\x00\x00\x00\x99', b'\x02\x00\x00\x00\x00\x01', hpp.ETH_P_IP)
+    tcp = struct.pack('!HHLLBBHHH', sport, PORT, 1000, 2000, 5 << 4, 0x18, 1024, 0, 0)
+    ip = struct.pack('!BBHHHBBH4s4s', 0x45, 0, 40, 1, 0, 64, socket.IPPROTO_TCP, 0,
+                     socket.inet_aton(ADDRS[0]), socket.inet_aton(ADDRS[1]))
+    return eth + ip + tcp
+
+
+class test_happy_packet_reaction_module(unittest.TestCase):
+    def setUp(self):
+        if os.geteuid() != 0:
+            self.skipTest("needs root to create namespaces and veth pairs")
+
+        for cmd in ["ip netns add %s" % (NETNS),
+                    "ip link add %s type veth peer name %s" % VETH,
+                    "ip link set %s netns %s" % (VETH[1], NETNS),
+                    "ip addr add %s/24 dev %s" % (ADDRS[0], VETH[0]),
+                    "ip link set %s up" % (VETH[0]),
+                    "ip netns exec %s ip addr add %s/24 dev %s" % (NETNS, ADDRS[1], VETH[1]),
+                    "ip netns exec %s ip link set %s up" % (NETNS, VETH[1])]:
+            os.system(cmd)
+
+        path = os.path.dirname(os.path.abspath(hpp.__file__))
+        self.attacker = subprocess.Popen(["ip", "netns", "exec", NETNS, sys.executable,
+                                          path + "/HappyPacketProcess.py", "--quiet",
+                                          "--interface", VETH[1], "--action", "RESET",
+                                          "--dstPort", str(PORT), "--start", "0", "--duration", "60"],
+                                         stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+        self.send = socket.socket(socket.AF_PACKET, socket.SOCK_RAW)
+        self.send.bind((VETH[0], 0))
+        self.capture = socket.socket(socket.AF_PACKET, socket.SOCK_RAW, socket.htons(hpp.ETH_P_IP))
+        self.capture.bind((VETH[0], hpp.ETH_P_IP))
+        self.capture.settimeout(0.5)
+
+    def tearDown(self):
+        self.attacker.terminate()
+        self.attacker.wait()
+        self.send.close()
+        self.capture.close()
+        os.system("ip link del %s 2>/dev/null" % (VETH[0]))
+        os.system("ip netns del %s" % (NETNS))
+
+    def __probe(self, sport):
+        """
+        Returns the time from sending a probe from sport to receiving the
+        RST for it, or None.
+        """
+        begin = time.monotonic()
+        self.send.send(Frame(sport))
+
+        while time.monotonic() - begin < 0.5:
+            try:
+                packet = self.capture.recv(2048)
+            except socket.timeout:
+                return None
+            received = time.monotonic()
+
+            ttl, = struct.unpack_from('!B', packet, 14 + 8)
+            dport, flags = struct.unpack_from('!2xH9xB', packet, 14 + 20)
+            if ttl == 255 and flags & hpp.TCP_RST and dport == sport:
+                return received - begin
+
+        return None
+
+    def test_rst_latency(self):
+        # Wait for the attacker to come up.
+        deadline = time.monotonic() + 10
+        while self.__probe(30000) is None:
+            self.assertLess(time.monotonic(), deadline, "no RST from HappyPacketProcess")
+
+        samples = []
+        for i in range(PROBES):
+            latency = self.__probe(20000 + i)
+            if latency is not None:
+                samples.append(latency)
+
+        self.assertGreater(len(samples), PROBES * 0.9)
+
+        samples.sort()
+        p50 = samples[len(samples) // 2]
+        p99 = samples[min(len(samples) - 1, int(len(samples) * 0.99))]
+        print("RST reaction latency over %d probes: p50 %.1f us, p99 %.1f us" %
+              (len(samples), p50 * 1e6, p99 * 1e6))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,85 @@
+#!/usr/bin/env python3
+
+#
+#    Copyright (c) 2021 Google LLC.
+#    All rights reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+#
+
+##
+#    @file
+#       Tests the Internet checksum helpers of HappyPacketProcess against
+#       known vectors and the RST template against full recomputation.
+#
+
+from __future__ import absolute_import
+import random
+import socket
+import struct
+import unittest
+
+import happy.HappyPacketProcess as hpp
+
+
+class test_happy_packet_checksum_module(unittest.TestCase):
+    def test_known_vectors(self):
+        # RFC 1071, section 3: the sum of these words is 0xddf2
+        self.assertEqual(hpp.OnesComplementSum(bytes.fromhex("0001f203f4f5f6f7")), 0xddf2)
+        self.assertEqual(hpp.CheckSumCalculation(bytes.fromhex("0001f203f4f5f6f7")), 0x220d)
+
+        # IPv4 header with a zeroed checksum field
+        header = bytes.fromhex("450000730000400040110000c0a80001c0a800c7")
+        self.assertEqual(hpp.CheckSumCalculation(header), 0xb861)
+        # and the header with its checksum verifies to zero
+        self.assertEqual(hpp.CheckSumCalculation(header[:10] + b"\xb8\x61" + header[12:]), 0)
+
+        # odd length is padded with a zero byte
+        self.assertEqual(hpp.CheckSumCalculation(b"\x01"), hpp.CheckSumCalculation(b"\x01\x00"))
+        self.assertEqual(hpp.CheckSumCalculation(b""), 0xffff)
+
+    def test_incremental_update(self):
+        # RFC 1624, section 4: eqn. 3 gives 0x0000 where eqn. 2 gave 0xffff
+        self.assertEqual(hpp.ChecksumUpdate(0xdd2f, b"\x55\x55", b"\x32\x85"), 0x0000)
+
+        rand = random.Random(1624)
+        for i in range(1000):
+            data = bytearray(rand.getrandbits(8) for j in range(40))
+            offset = rand.randrange(0, 32, 2)
+            new = bytes(rand.getrandbits(8) for j in range(8))
+
+            updated = hpp.ChecksumUpdate(hpp.CheckSumCalculation(data), data[offset:offset + 8], new)
+            data[offset:offset + 8] = new
+            self.assertEqual(hpp.OnesComplementSum(data) + updated, 0xffff)
+
+    def test_reset_template(self):
+        template = hpp.ResetTemplate()
+        rand = random.Random(793)
+
+        for i in range(100):
+            src = rand.getrandbits(32)
+            dst = rand.getrandbits(32)
+            packet = bytes(template.Build(src, dst, rand.getrandbits(16), rand.getrandbits(16),
+                                          rand.getrandbits(32), rand.getrandbits(15)))
+
+            self.assertEqual(len(packet), 40)
+            self.assertEqual(struct.unpack_from('!II', packet, 12), (src, dst))
+            self.assertEqual(packet[33] & hpp.TCP_RST, hpp.TCP_RST)
+
+            # both checksums verify
+            self.assertEqual(hpp.CheckSumCalculation(packet[:20]), 0)
+            psudoHeader = struct.pack('!4s4sBBH', packet[12:16], packet[16:20], 0, socket.IPPROTO_TCP, 20)
+            self.assertEqual(hpp.CheckSumCalculation(psudoHeader + packet[20:]), 0)
+
+if __name__ == "__main__":
+    unittest.main()
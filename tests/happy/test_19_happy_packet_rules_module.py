@@ -0,0 +1,216 @@
+#!/usr/bin/env python3
+
+#
+#    Copyright (c) 2021 Google LLC.
+#    All rights reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+#
+
+##
+#    @file
+#       Tests the HappyPacketProcess rule engine: RuleTable lookups and
+#       their cost as the number of rules grows, the tc commands of
+#       TrafficControl, and IPv6 resets from a rules file.
+#
+
+from __future__ import absolute_import
+from __future__ import print_function
+import json
+import os
+import socket
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+
+import happy.HappyPacketProcess as hpp
+
+NETNS = "hprules"
+VETH = ("hprules0", "hprules1")
+ADDRS = ("fd00:250::2", "fd00:250::3")
+PORT = 11095
+LOOKUPS = 20000
+
+
+def Flow(family, proto, src, dst, sport, dport):
+    record = hpp.FlowRecord()
+    record.family = family
+    record.proto = proto
+    record.src = hpp.ParseAddr(src)[1]
+    record.dst = hpp.ParseAddr(dst)[1]
+    record.sport = sport
+    record.dport = dport
+    return record
+
+
+def Frame6(sport, dport, flags=0x18):
+    eth = struct.pack('!6s6sH', b'\x02\x00\x00\x00\x00\x99', b'\x02\x00\x00\x00\x00\x01', hpp.ETH_P_IPV6)
+    tcp = struct.pack('!HHLLBBHHH', sport, dport, 1000, 2000, 5 << 4, flags, 1024, 0, 0)
+    ip = struct.pack('!IHBB16s16s', 6 << 28, len(tcp), socket.IPPROTO_TCP, 64,
+                     socket.inet_pton(socket.AF_INET6, ADDRS[0]), socket.inet_pton(socket.AF_INET6, ADDRS[1]))
+    return eth + ip + tcp
+
+
+class test_happy_packet_rules_module(unittest.TestCase):
+    def test_rule_lookup(self):
+        table = hpp.RuleTable()
+        rules = [hpp.Rule("reset", {"src": "10.0.1.2", "dst": "10.0.1.3", "dport": PORT}, priority=0),
+                 hpp.Rule("drop", {"proto": "udp", "dport": 53}, priority=1),
+                 hpp.Rule("delay", {"dst": "fd00::3"}, delay=100, priority=2),
+                 hpp.Rule("duplicate", {"proto": "tcp", "dport": PORT}, priority=3)]
+        for rule in rules:
+            table.Add(rule)
+        # the udp and tcp port rules share a group
+        self.assertEqual(len(table.groups), 3)
+
+        tcp = socket.IPPROTO_TCP
+        udp = socket.IPPROTO_UDP
+        self.assertIs(table.Lookup(Flow(4, tcp, "10.0.1.2", "10.0.1.3", 40000, PORT)), rules[0])
+        self.assertIs(table.Lookup(Flow(4, tcp, "10.0.1.9", "10.0.1.3", 40000, PORT)), rules[3])
+        self.assertIs(table.Lookup(Flow(6, udp, "fd00::2", "fd00::3", 40000, 53)), rules[1])
+        self.assertIs(table.Lookup(Flow(6, udp, "fd00::2", "fd00::3", 40000, 54)), rules[2])
+        self.assertIsNone(table.Lookup(Flow(4, udp, "10.0.1.2", "10.0.1.3", 40000, PORT)))
+        # answered from the flow cache the second time
+        self.assertIs(table.Lookup(Flow(4, tcp, "10.0.1.2", "10.0.1.3", 40000, PORT)), rules[0])
+
+    def test_rule_validation(self):
+        self.assertEqual(hpp.Rule("RESET").proto, socket.IPPROTO_TCP)
+        for args, kwargs in [(("block",), {}),
+                             (("reset", {"proto": "udp"}), {}),
+                             (("drop", {"dport": 80}), {}),
+                             (("drop", {"family": 4, "src": "fd00::1"}), {}),
+                             (("drop", {"dst": "10.0.1"}), {}),
+                             (("delay",), {}),
+                             (("drop",), {"rate": 10}),
+                             (("reset",), {"probability": 2})]:
+            with self.assertRaises(ValueError):
+                hpp.Rule(*args, **kwargs)
+
+        rule = hpp.Rule("reset", rate=5)
+        now = time.monotonic()
+        self.assertEqual(sum([rule.Allow(now) for i in range(100)]), 5)
+        self.assertEqual(rule.hits, 100)
+
+    def test_lookup_cost(self):
+        rates = {}
+        for count in [10, 10000]:
+            table = hpp.RuleTable(cacheSize=0)
+            for i in range(count):
+                table.Add(hpp.Rule("reset", {"src": "10.1.%d.%d" % (i >> 8, i & 0xff), "dst": "10.0.0.1",
+                                             "sport": 1000 + i, "dport": PORT}, priority=i))
+            table.Add(hpp.Rule("drop", {"proto": "udp", "dport": 53}, priority=count))
+            table.Add(hpp.Rule("drop", {"dst": "10.0.0.9"}, priority=count + 1))
+
+            flows = [Flow(4, socket.IPPROTO_TCP, "10.1.%d.%d" % ((i % count) >> 8, i & 0xff), "10.0.0.1",
+                          1000 + (i % count), PORT) for i in range(256)]
+
+            begin = time.monotonic()
+            for i in range(LOOKUPS):
+                table.Lookup(flows[i & 0xff])
+            rates[count] = LOOKUPS / (time.monotonic() - begin)
+
+        print("uncached lookups: %.0f/s with 10 rules, %.0f/s with 10000 rules" % (rates[10], rates[10000]))
+        self.assertGreater(rates[10000], rates[10] / 2)
+
+    def test_ipv6_reset_template(self):
+        template = hpp.ResetTemplate(socket.AF_INET6)
+        src = hpp.ParseAddr(ADDRS[0])[1]
+        dst = hpp.ParseAddr(ADDRS[1])[1]
+        packet = bytes(template.Build(src, dst, PORT, 40000, 0x12345678))
+
+        self.assertEqual(len(packet), 60)
+        self.assertEqual(packet[8:24], socket.inet_pton(socket.AF_INET6, ADDRS[0]))
+        psudoHeader = struct.pack('!16s16sI3xB', packet[8:24], packet[24:40], 20, socket.IPPROTO_TCP)
+        self.assertEqual(hpp.CheckSumCalculation(psudoHeader + packet[40:]), 0)
+
+    def test_traffic_control_commands(self):
+        rules = [hpp.Rule("drop", {"proto": "udp", "dst": "10.0.1.3", "dport": 53}, probability=0.25),
+                 hpp.Rule("delay", {"proto": "tcp", "dport": PORT}, delay=100, probability=0.5),
+                 hpp.Rule("drop", {"src": "fd00::2"}, probability=0.25),
+                 hpp.Rule("duplicate")]
+        commands = hpp.TrafficControl("wpan0", rules).Commands()
+
+        self.assertEqual(commands[:4], [
+            "qdisc add dev wpan0 root handle 1: prio bands 4 priomap 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0 0",
+            "qdisc add dev wpan0 parent 1:2 handle 10: netem loss 25%",
+            "qdisc add dev wpan0 parent 1:3 handle 11: netem delay 100ms reorder 50%",
+            "qdisc add dev wpan0 parent 1:4 handle 12: netem duplicate 100%"])
+        self.assertEqual(commands[4:], [
+            "filter add dev wpan0 parent 1: protocol ip prio 1 flower ip_proto udp dst_ip 10.0.1.3 dst_port 53 classid 1:2",
+            "filter add dev wpan0 parent 1: protocol ip prio 1 flower ip_proto tcp dst_port 11095 classid 1:3",
+            "filter add dev wpan0 parent 1: protocol ipv6 prio 2 flower ip_proto tcp dst_port 11095 classid 1:3",
+            "filter add dev wpan0 parent 1: protocol ipv6 prio 2 flower src_ip fd00::2 classid 1:2",
+            "filter add dev wpan0 parent 1: protocol all prio 3 flower classid 1:4"])
+
+    def test_ipv6_reset(self):
+        if os.geteuid() != 0:
+            self.skipTest("needs root to create namespaces and veth pairs")
+
+        for cmd in ["ip netns add %s" % (NETNS),
+                    "ip link add %s type veth peer name %s" % VETH,
+                    "ip link set %s netns %s" % (VETH[1], NETNS),
+                    "ip addr add %s/64 dev %s nodad" % (ADDRS[0], VETH[0]),
+                    "ip link set %s up" % (VETH[0]),
+                    "ip netns exec %s ip addr add %s/64 dev %s nodad" % (NETNS, ADDRS[1], VETH[1]),
+                    "ip netns exec %s ip link set %s up" % (NETNS, VETH[1])]:
+            os.system(cmd)
+
+        rules = tempfile.NamedTemporaryFile("w", suffix=".json", delete=False)
+        json.dump([{"match": {"dst": ADDRS[1], "dport": PORT}, "action": "reset"}], rules)
+        rules.close()
+
+        path = os.path.dirname(os.path.abspath(hpp.__file__))
+        attacker = subprocess.Popen(["ip", "netns", "exec", NETNS, sys.executable,
+                                     path + "/HappyPacketProcess.py", "--quiet", "--interface", VETH[1],
+                                     "--rules", rules.name, "--duration", "60"],
+                                    stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+        send = socket.socket(socket.AF_PACKET, socket.SOCK_RAW)
+        send.bind((VETH[0], 0))
+        capture = socket.socket(socket.AF_PACKET, socket.SOCK_RAW, socket.htons(hpp.ETH_P_IPV6))
+        capture.bind((VETH[0], hpp.ETH_P_IPV6))
+        capture.settimeout(0.2)
+
+        resets = set()
+        try:
+            deadline = time.monotonic() + 10
+            while len(resets) == 0 and time.monotonic() < deadline:
+                for sport in [30000, 30001]:
+                    send.send(Frame6(sport, PORT))
+                # not matched by the rule
+                send.send(Frame6(30002, PORT + 1))
+                try:
+                    while True:
+                        packet = capture.recv(2048)
+                        hopLimit, = struct.unpack_from('!B', packet, 14 + 7)
+                        dport, flags = struct.unpack_from('!2xH9xB', packet, 14 + 40)
+                        if hopLimit == 255 and flags & hpp.TCP_RST:
+                            resets.add(dport)
+                except socket.timeout:
+                    pass
+        finally:
+            attacker.terminate()
+            attacker.wait()
+            send.close()
+            capture.close()
+            os.unlink(rules.name)
+            os.system("ip link del %s 2>/dev/null" % (VETH[0]))
+            os.system("ip netns del %s" % (NETNS))
+
+        self.assertEqual(resets, set([30000, 30001]))
+
+if __name__ == "__main__":
+    unittest.main()
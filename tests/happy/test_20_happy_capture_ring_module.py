@@ -0,0 +1,177 @@
+#!/usr/bin/env python3
+
+#
+#    Copyright (c) 2021 Google LLC.
+#    All rights reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+#
+
+##
+#    @file
+#       Tests the pcapng segment rings of HappyCaptureRing, and runs the
+#       capture daemon on HAPPY_BENCH_LINKS veth pairs to check what it
+#       captures and what it costs.
+#
+
+from __future__ import absolute_import
+from __future__ import print_function
+import os
+import shutil
+import signal
+import socket
+import struct
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+
+import psutil
+
+import happy.HappyCaptureRing as hcr
+
+LINKS = int(os.environ.get("HAPPY_BENCH_LINKS", "20"))
+FRAMES = 50
+SNAPLEN = 64
+
+
+def Frame(link, i, size=200):
+    eth = struct.pack('!6s6sH', b'\xff' * 6, b'\x02\x00\x00\x00\x00\x01', 0x88b5)
+    return eth + struct.pack('!II', link, i) + b'\x00' * (size - 22)
+
+
+class test_happy_capture_ring_module(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp(prefix="happy_capture_")
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_segment_ring(self):
+        link_dir = os.path.join(self.dir, "wifi0")
+        writer = hcr.SegmentWriter(link_dir, "wifi0", SNAPLEN, 4096, 2)
+        frame = Frame(0, 0)
+        start = time.time()
+        for i in range(1000):
+            writer.Write(frame, 0, SNAPLEN, len(frame), int(start) + i, 500)
+        writer.Close()
+
+        # 1000 * 96 bytes do not fit; only the newest two segments are left
+        segments = hcr.ListSegments(link_dir)
+        self.assertEqual(len(segments), 2)
+        self.assertTrue(all([os.path.getsize(path) <= 4096 + 96 for seq, path in segments]))
+
+        packets = []
+        for seq, path in segments:
+            packets += list(hcr.ReadPackets(path))
+        self.assertEqual(packets[-1], ((int(start) + 999) * 1000000000 + 500, frame[:SNAPLEN], len(frame)))
+        times = [timestamp for timestamp, data, length in packets]
+        self.assertEqual(times, sorted(times))
+
+        output = os.path.join(self.dir, "dump.pcapng")
+        since = (int(start) + 990) * 1000000000
+        self.assertEqual(hcr.DumpCapture([("N1/wifi0", link_dir)], since, output), 10)
+        self.assertEqual(len(list(hcr.ReadPackets(output))), 10)
+
+    def test_link_deleted(self):
+        if os.geteuid() != 0:
+            self.skipTest("needs root to create veth pairs")
+
+        os.system("ip link add hpgonea type veth peer name hpgoneb")
+        os.system("ip link set hpgonea up; ip link set hpgoneb up")
+        writer = hcr.SegmentWriter(os.path.join(self.dir, "gone"), "gone", SNAPLEN, 65536, 2)
+        program = hcr.CompileCaptureFilter(None, SNAPLEN)
+        capture = hcr.LinkCapture("hpgoneb", writer, program, 1 << 16, 4, 10)
+        try:
+            os.system("ip link del hpgonea")
+            # a Drain that kept polling the error would never return
+            signal.alarm(5)
+            try:
+                with self.assertRaises(OSError):
+                    capture.Drain()
+            finally:
+                signal.alarm(0)
+        finally:
+            capture.Close()
+            os.system("ip link del hpgonea 2>/dev/null")
+
+    def test_capture_links(self):
+        if os.geteuid() != 0:
+            self.skipTest("needs root to create veth pairs")
+
+        names = ["hpcap%d" % (i) for i in range(LINKS)]
+        for name in names:
+            os.system("ip link add %sa type veth peer name %sb" % (name, name))
+            os.system("ip link set %sa up; ip link set %sb up" % (name, name))
+
+        cmd_list = [sys.executable, os.path.dirname(os.path.abspath(hcr.__file__)) + "/HappyCaptureRing.py",
+                    "--dir", self.dir, "--snaplen", str(SNAPLEN), "--segment-size", "65536"]
+        for name in names:
+            cmd_list += ["--link", "%sb=%s" % (name, name)]
+        daemon = subprocess.Popen(cmd_list)
+
+        try:
+            deadline = time.monotonic() + 10
+            while len(hcr.ReadStatus(self.dir).get("links", {})) < LINKS:
+                self.assertLess(time.monotonic(), deadline, "capture did not start")
+                time.sleep(0.1)
+
+            process = psutil.Process(daemon.pid)
+            idle = process.cpu_times()
+            time.sleep(2)
+            idle_cpu = sum(process.cpu_times()[:2]) - sum(idle[:2])
+
+            begin = process.cpu_times()
+            sock = socket.socket(socket.AF_PACKET, socket.SOCK_RAW)
+            for link, name in enumerate(names):
+                sock.bind(("%sa" % (name), 0))
+                for i in range(FRAMES):
+                    sock.send(Frame(link, i))
+            sock.close()
+            sent = time.time()
+
+            os.kill(daemon.pid, signal.SIGUSR2)
+            deadline = time.monotonic() + 5
+            while hcr.ReadStatus(self.dir).get("flushed", 0) < sent:
+                self.assertLess(time.monotonic(), deadline, "capture did not flush")
+                time.sleep(0.05)
+            busy_cpu = sum(process.cpu_times()[:2]) - sum(begin[:2])
+        finally:
+            daemon.send_signal(signal.SIGUSR1)
+            daemon.wait()
+            for name in names:
+                os.system("ip link del %sa 2>/dev/null" % (name))
+
+        status = hcr.ReadStatus(self.dir)
+        self.assertEqual(sum([link["drops"] for link in status["links"].values()]), 0)
+
+        output = os.path.join(self.dir, "dump.pcapng")
+        links = [(name, os.path.join(self.dir, name)) for name in names]
+        hcr.DumpCapture(links, 0, output)
+
+        # the links also carry the IPv6 neighbour discovery of the kernel
+        captured = set()
+        for timestamp, data, length in hcr.ReadPackets(output):
+            if struct.unpack_from('!H', data, 12)[0] != 0x88b5:
+                continue
+            self.assertEqual(len(data), SNAPLEN)
+            self.assertEqual(length, 200)
+            captured.add(struct.unpack_from('!II', data, 14))
+        self.assertEqual(len(captured), LINKS * FRAMES)
+
+        print("%d links: %.1f ms CPU idle for 2 s, %.1f ms CPU for %d frames" %
+              (LINKS, idle_cpu * 1000, busy_cpu * 1000, LINKS * FRAMES))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,174 @@
+#!/usr/bin/env python3
+
+#
+#    Copyright (c) 2021 Google LLC.
+#    All rights reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+#
+
+##
+#    @file
+#       Tests HappyPacketReplay, the traffic generator of
+#       happy-packet-benchmark: the frames it builds and rewrites, reading
+#       pcap files, and replaying one to HappyPacketProcess across a veth
+#       pair at HAPPY_BENCH_RATE packets per second.
+#
+
+from __future__ import absolute_import
+from __future__ import print_function
+import json
+import os
+import socket
+import struct
+import subprocess
+import sys
+import tempfile
+import unittest
+
+import happy.HappyPacketProcess as hpp
+import happy.HappyPacketReplay as hpr
+from happy.HappyProcessStats import percentile
+
+NETNS = "hpbench"
+VETH = ("hpbench0", "hpbench1")
+ADDRS = ("10.250.2.2", "10.250.2.3")
+PORT = 11095
+RATE = int(os.environ.get("HAPPY_BENCH_RATE", "5000"))
+PACKETS = 5000
+
+SRC_MAC = b'\x02\x00\x00\x00\x00\x01'
+DST_MAC = b'\x02\x00\x00\x00\x00\x99'
+
+
+def WritePcap(path, frames, order='<'):
+    with open(path, "wb") as f:
+        f.write(struct.pack(order + 'IHHiIII', hpr.PCAP_MAGIC, 2, 4, 0, 0, 65535, hpr.LINKTYPE_ETHERNET))
+        for i, frame in enumerate(frames):
+            f.write(struct.pack(order + 'IIII', 1600000000 + i, 0, len(frame), len(frame)))
+            f.write(frame)
+
+
+def TcpCheckSum(frame):
+    """
+    Returns the checksum over the pseudo header and TCP segment of an IPv4
+    frame, 0 if the segment checksum is valid.
+    """
+    ihl = (frame[14] & 0x0f) * 4
+    tcp = frame[14 + ihl:]
+    psudoHeader = struct.pack('!4s4sBBH', frame[26:30], frame[30:34], 0, socket.IPPROTO_TCP, len(tcp))
+    return hpp.CheckSumCalculation(psudoHeader + tcp)
+
+
+class test_happy_packet_benchmark_module(unittest.TestCase):
+    def test_frames(self):
+        frame = hpr.TcpFrame(SRC_MAC, DST_MAC, ADDRS[0], ADDRS[1], 20000, PORT, 1000, 7)
+        self.assertEqual(len(frame), 54)
+        self.assertEqual(hpp.CheckSumCalculation(frame[14:34]), 0)
+        self.assertEqual(TcpCheckSum(frame), 0)
+        self.assertEqual(hpr.SegmentKey(frame), (20000, 7))
+
+        frame6 = hpr.TcpFrame(SRC_MAC, DST_MAC, "fd00::2", "fd00::3", 20001, PORT, 1000, 8)
+        self.assertEqual(len(frame6), 74)
+        self.assertEqual(hpr.SegmentKey(frame6), (20001, 8))
+
+        frames = hpr.SyntheticFrames(SRC_MAC, DST_MAC, ADDRS[0], ADDRS[1], PORT, 4, 100)
+        keys = [hpr.SegmentKey(frame) for frame in frames]
+        self.assertEqual(len(set(keys)), 100)
+        self.assertEqual(len(set([sport for sport, ack in keys])), 4)
+
+    def test_rewrite(self):
+        frame = hpr.TcpFrame(b'\x02' * 6, b'\x04' * 6, "192.168.7.1", "172.16.0.9", 443, 51000, 5, 6)
+        rewritten = hpr.RewriteFrame(frame, SRC_MAC, DST_MAC, ADDRS[0], ADDRS[1])
+
+        self.assertEqual(rewritten[:12], DST_MAC + SRC_MAC)
+        self.assertEqual(rewritten[26:34], socket.inet_aton(ADDRS[0]) + socket.inet_aton(ADDRS[1]))
+        # updated incrementally, the checksums are those of a new frame
+        self.assertEqual(rewritten, hpr.TcpFrame(SRC_MAC, DST_MAC, ADDRS[0], ADDRS[1], 443, 51000, 5, 6))
+
+        frame6 = hpr.TcpFrame(SRC_MAC, DST_MAC, "fd00::2", "fd00::3", 443, 51000, 5, 6)
+        self.assertIsNone(hpr.RewriteFrame(frame6, SRC_MAC, DST_MAC, ADDRS[0], ADDRS[1]))
+        arp = b'\xff' * 6 + SRC_MAC + b'\x08\x06' + b'\x00' * 28
+        self.assertEqual(hpr.RewriteFrame(arp, SRC_MAC, DST_MAC, ADDRS[0], ADDRS[1])[12:], arp[12:])
+
+    def test_read_pcap(self):
+        frames = hpr.SyntheticFrames(SRC_MAC, DST_MAC, ADDRS[0], ADDRS[1], PORT, 4, 10)
+        for order in ['<', '>']:
+            path = tempfile.mktemp(suffix=".pcap")
+            WritePcap(path, frames, order)
+            try:
+                self.assertEqual(hpr.ReadPcap(path), frames)
+            finally:
+                os.unlink(path)
+
+    def test_match_answers(self):
+        sent = [((20000, 1), 1000), ((20000, 1), 5000), ((20001, 2), 2000)]
+        answers = [(20000, 1, 1500), (20000, 1, 5100), (20001, 2, 1900), (20002, 3, 3000)]
+        # an answer before the segment was sent, or to no segment, is not one
+        self.assertEqual(hpr.MatchAnswers(sent, answers), [500, 100])
+
+    def test_replay(self):
+        if os.geteuid() != 0:
+            self.skipTest("needs root to create namespaces and veth pairs")
+
+        for cmd in ["ip netns add %s" % (NETNS),
+                    "ip link add %s type veth peer name %s" % VETH,
+                    "ip link set %s netns %s" % (VETH[1], NETNS),
+                    "ip addr add %s/24 dev %s" % (ADDRS[0], VETH[0]),
+                    "ip link set %s up" % (VETH[0]),
+                    "ip netns exec %s ip addr add %s/24 dev %s" % (NETNS, ADDRS[1], VETH[1]),
+                    "ip netns exec %s ip link set %s up" % (NETNS, VETH[1])]:
+            os.system(cmd)
+
+        # a capture of other addresses, rewritten to those of the veth pair
+        pcap = tempfile.mktemp(suffix=".pcap")
+        WritePcap(pcap, hpr.SyntheticFrames(SRC_MAC, DST_MAC, "192.168.7.1", "172.16.0.9", PORT, 16, 1000))
+        stats = tempfile.mktemp(suffix=".json")
+
+        path = os.path.dirname(os.path.abspath(hpp.__file__))
+        attacker = subprocess.Popen(["ip", "netns", "exec", NETNS, sys.executable,
+                                     path + "/HappyPacketProcess.py", "--quiet", "--interface", VETH[1],
+                                     "--action", "RESET", "--dstPort", str(PORT), "--stats", stats],
+                                    stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        try:
+            out = subprocess.check_output([sys.executable, path + "/HappyPacketReplay.py",
+                                           "--interface", VETH[0], "--src", ADDRS[0], "--dst", ADDRS[1],
+                                           "--pcap", pcap, "--count", str(PACKETS), "--rate", str(RATE)])
+        finally:
+            attacker.terminate()
+            attacker.wait()
+            os.unlink(pcap)
+            os.system("ip link del %s 2>/dev/null" % (VETH[0]))
+            os.system("ip netns del %s" % (NETNS))
+
+        results = json.loads(out)
+        with open(stats) as f:
+            sniffer = json.load(f)
+        os.unlink(stats)
+
+        self.assertTrue(results["ready"])
+        self.assertEqual(results["sent"], PACKETS)
+        self.assertEqual(sniffer["drops"], 0)
+        # and the warm-up probes
+        self.assertGreater(sniffer["received"], PACKETS)
+        # the capture is sent five times over; a RST is matched to the
+        # earliest copy of its segment not answered yet
+        self.assertGreater(results["answered"], PACKETS * 0.9)
+
+        latencies = results["latencies"]
+        print("%d packets at %.0f pps: %d answered, p50 %.1f us, p99 %.1f us" %
+              (results["sent"], results["rate"], results["answered"],
+               percentile(latencies, 50) / 1000.0, percentile(latencies, 99) / 1000.0))
+
+if __name__ == "__main__":
+    unittest.main()
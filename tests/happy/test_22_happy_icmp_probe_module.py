@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+
+#
+#    Copyright (c) 2021 Google LLC.
+#    All rights reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+#
+
+##
+#    @file
+#       Tests the ICMP echo prober of happy-ping: its statistics, and
+#       pinging several addresses at once from sockets created in another
+#       network namespace.
+#
+
+from __future__ import absolute_import
+from __future__ import print_function
+import os
+import time
+import unittest
+
+import happy.HappyICMPProbe as probe
+from happy.HappyProcess import HappyProcess
+
+NETNS = "hpprobe"
+COUNT = 5
+INTERVAL = 0.1
+
+
+class test_happy_icmp_probe_module(unittest.TestCase):
+    def test_statistics(self):
+        stats = probe.Statistics(4, [1.0, 2.0, 3.0])
+        self.assertEqual(stats["loss"], 25)
+        self.assertEqual((stats["min"], stats["avg"], stats["max"]), (1.0, 2.0, 3.0))
+        self.assertAlmostEqual(stats["stddev"], (2.0 / 3) ** 0.5)
+
+        stats = probe.Statistics(0, [], "Network is unreachable")
+        self.assertEqual(stats["loss"], 100)
+        self.assertIsNone(stats["avg"])
+        self.assertEqual(stats["error"], "Network is unreachable")
+
+    def test_count(self):
+        with self.assertRaises(ValueError):
+            probe.RunProbers([], count=0)
+
+    def test_probe_in_namespace(self):
+        if os.geteuid() != 0:
+            self.skipTest("needs root to create namespaces")
+
+        os.system("ip netns add %s" % (NETNS))
+        os.system("ip netns exec %s ip link set lo up" % (NETNS))
+        os.system("ip netns exec %s ip addr add 10.250.3.1/24 dev lo" % (NETNS))
+        # 10.250.4.1 is not routed in the namespace
+        addresses = ["127.0.0.1", "127.0.0.2", "127.0.0.3", "10.250.3.1", "::1", "10.250.4.1"]
+
+        process = HappyProcess()
+        netns_path = "/var/run/netns/%s" % (NETNS)
+
+        def create(family, type, proto):
+            return process.SocketInNamespace(netns_path, family, type, proto)
+
+        try:
+            begin = time.monotonic()
+            results = probe.Probe(addresses, COUNT, INTERVAL, 56, 0.5, create)
+            elapsed = time.monotonic() - begin
+        finally:
+            os.system("ip netns del %s" % (NETNS))
+
+        for addr in addresses[:-1]:
+            self.assertEqual(results[addr]["transmitted"], COUNT)
+            self.assertEqual(results[addr]["loss"], 0)
+            self.assertGreater(results[addr]["min"], 0)
+        self.assertEqual(results["10.250.4.1"]["loss"], 100)
+        self.assertIn("error", results["10.250.4.1"])
+
+        # all addresses at once, not one after the other
+        self.assertLess(elapsed, COUNT * INTERVAL + 0.3)
+        print("%d addresses, %d pings %.1f s apart: %.2f s" % (len(addresses), COUNT, INTERVAL, elapsed))
+
+if __name__ == "__main__":
+    unittest.main()
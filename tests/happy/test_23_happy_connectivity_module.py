@@ -0,0 +1,131 @@
+#!/usr/bin/env python3
+
+#
+#    Copyright (c) 2021 Google LLC.
+#    All rights reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+#
+
+##
+#    @file
+#       Tests happy-connectivity: the expected-reachability spec, and
+#       probing every pair of namespaces on a bridge from one loop.
+#
+
+from __future__ import absolute_import
+from __future__ import print_function
+import os
+import time
+import unittest
+
+import happy.HappyConnectivity as connectivity
+import happy.HappyICMPProbe as probe
+from happy.HappyProcess import HappyProcess
+
+BRIDGE = "hpconn"
+NODES = 8
+COUNT = 3
+INTERVAL = 0.1
+
+
+def Address(index):
+    return "10.250.5.%d" % (index + 1)
+
+
+class test_happy_connectivity_module(unittest.TestCase):
+    def test_expected(self):
+        expected = {"default": False, "A": {"*": True, "C": False}, "B": {"A": True}}
+        self.assertTrue(connectivity.IsExpected(None, "A", "B"))
+        self.assertTrue(connectivity.IsExpected(expected, "A", "B"))
+        self.assertFalse(connectivity.IsExpected(expected, "A", "C"))
+        self.assertTrue(connectivity.IsExpected(expected, "B", "A"))
+        self.assertFalse(connectivity.IsExpected(expected, "B", "C"))
+        self.assertFalse(connectivity.IsExpected(expected, "C", "A"))
+
+    def test_diff(self):
+        reached = {"address": "10.0.0.2", "loss": 0, "avg": 0.1, "max": 0.1, "reachable": True}
+        lost = {"address": "10.0.0.1", "loss": 100, "avg": None, "max": None, "reachable": False}
+        matrix = {"A": {"B": reached, "C": None}, "B": {"A": lost, "C": reached}}
+
+        self.assertEqual(connectivity.Diff(matrix, None), [("B", "A", True, False)])
+        self.assertEqual(connectivity.Diff(matrix, {"default": True, "B": {"*": False}}),
+                         [("B", "C", False, True)])
+
+    def test_best(self):
+        results = {"10.0.0.1": probe.Statistics(3, []),
+                   "fd00::1": probe.Statistics(3, [2.0, 2.0]),
+                   "fd00::2": probe.Statistics(3, [1.0, 1.0])}
+        best = connectivity.Best(results, ["10.0.0.1", "fd00::1", "fd00::2"])
+        self.assertEqual(best["address"], "fd00::2")
+        self.assertEqual(best["loss"], 33)
+        self.assertTrue(best["reachable"])
+
+        best = connectivity.Best({}, ["10.0.0.9"])
+        self.assertEqual(best["loss"], 100)
+        self.assertFalse(best["reachable"])
+
+    def test_all_pairs(self):
+        if os.geteuid() != 0:
+            self.skipTest("needs root to create namespaces")
+
+        os.system("ip link add %s type bridge" % (BRIDGE))
+        os.system("ip link set %s up" % (BRIDGE))
+        for i in range(NODES):
+            netns = "%s%d" % (BRIDGE, i)
+            for cmd in ["ip netns add %s" % (netns),
+                        "ip link add %s-%d type veth peer name eth0 netns %s" % (BRIDGE, i, netns),
+                        "ip link set %s-%d master %s up" % (BRIDGE, i, BRIDGE),
+                        "ip netns exec %s ip addr add %s/24 dev eth0" % (netns, Address(i)),
+                        "ip netns exec %s ip link set eth0 up" % (netns)]:
+                os.system(cmd)
+
+        process = HappyProcess()
+        probers = []
+
+        def create(netns_path):
+            return lambda family, type, proto: process.SocketInNamespace(netns_path, family, type, proto)
+
+        try:
+            for i in range(NODES):
+                addresses = [Address(j) for j in range(NODES) if j != i]
+                probers.append(probe.Prober(addresses, create("/var/run/netns/%s%d" % (BRIDGE, i))))
+
+            # the first requests wait for ARP
+            probe.RunProbers(probers, 1, INTERVAL, 56, 1.0)
+            for prober in probers:
+                prober.Close()
+
+            probers = [probe.Prober(prober.addresses, create("/var/run/netns/%s%d" % (BRIDGE, i)))
+                       for i, prober in enumerate(probers)]
+            begin = time.monotonic()
+            probe.RunProbers(probers, COUNT, INTERVAL, 56, 1.0)
+            elapsed = time.monotonic() - begin
+        finally:
+            for prober in probers:
+                prober.Close()
+            for i in range(NODES):
+                os.system("ip netns del %s%d" % (BRIDGE, i))
+            os.system("ip link del %s" % (BRIDGE))
+
+        for prober in probers:
+            for addr, stats in prober.Results().items():
+                self.assertEqual(stats["transmitted"], COUNT)
+                self.assertEqual(stats["loss"], 0)
+
+        # every pair at once, not one after the other
+        self.assertLess(elapsed, COUNT * INTERVAL + 0.3)
+        print("%d pairs, %d pings %.1f s apart: %.2f s" % (NODES * (NODES - 1), COUNT, INTERVAL, elapsed))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+
+#
+#    Copyright (c) 2021 Google LLC.
+#    All rights reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+#
+
+##
+#    @file
+#       Tests the TTL sweep prober of happy-traceroute: reading the ICMP
+#       errors of the error queue, and tracing the route across a chain of
+#       routing namespaces to several addresses at once.
+#
+
+from __future__ import absolute_import
+from __future__ import print_function
+import os
+import socket
+import struct
+import time
+import unittest
+
+import happy.HappyTraceProbe as trace
+from happy.HappyProcess import HappyProcess
+from happy.utils.IP import IP
+
+CHAIN = "hptrace"
+# source, two routers and the destination, one /24 per link
+LINKS = 3
+TIMEOUT = 0.5
+
+
+def Namespace(index):
+    return "%s%d" % (CHAIN, index)
+
+
+def ExtendedErr(origin, icmpType, icmpCode, family, address):
+    data = struct.pack('=IBBBBII', 111, origin, icmpType, icmpCode, 0, 0, 0)
+    if family == socket.AF_INET6:
+        return data + struct.pack('=HHI16sI', family, 0, 0, socket.inet_pton(family, address), 0)
+    return data + struct.pack('=HH4s8x', family, 0, socket.inet_pton(family, address))
+
+
+class test_happy_trace_probe_module(unittest.TestCase):
+    def test_parse_error(self):
+        ancdata = [(socket.IPPROTO_IP, trace.IP_RECVERR,
+                    ExtendedErr(trace.SO_EE_ORIGIN_ICMP, 11, 0, socket.AF_INET, "10.0.1.1"))]
+        self.assertEqual(trace.ParseError(ancdata), ("10.0.1.1", "hop"))
+
+        ancdata = [(socket.IPPROTO_IP, trace.IP_RECVERR,
+                    ExtendedErr(trace.SO_EE_ORIGIN_ICMP, 3, 3, socket.AF_INET, "10.0.2.3"))]
+        self.assertEqual(trace.ParseError(ancdata), ("10.0.2.3", "reached"))
+
+        ancdata = [(socket.IPPROTO_IPV6, trace.IPV6_RECVERR,
+                    ExtendedErr(trace.SO_EE_ORIGIN_ICMP6, 1, 0, socket.AF_INET6, "fd00::1"))]
+        self.assertEqual(trace.ParseError(ancdata), ("fd00::1", "unreachable"))
+
+        # a local error, as for a too large datagram
+        ancdata = [(socket.IPPROTO_IP, trace.IP_RECVERR,
+                    ExtendedErr(1, 0, 0, socket.AF_INET, "0.0.0.0"))]
+        self.assertIsNone(trace.ParseError(ancdata))
+
+    def test_hops(self):
+        probes = [(2, "10.0.2.1", "hop", 0.2), (4, "10.0.3.3", "reached", 0.4),
+                  (3, "10.0.3.3", "reached", 0.3), (3, "10.0.3.3", "reached", 0.35)]
+        hops, reached = trace.Hops(probes, 30)
+        self.assertTrue(reached)
+        self.assertEqual([hop["address"] for hop in hops], [None, "10.0.2.1", "10.0.3.3"])
+        self.assertEqual(hops[2]["rtts"], [0.3, 0.35])
+
+        hops, reached = trace.Hops([(1, "10.0.1.1", "unreachable", 0.1)], 30)
+        self.assertFalse(reached)
+        self.assertEqual(len(hops), 1)
+
+        hops, reached = trace.Hops([], 8)
+        self.assertFalse(reached)
+        self.assertEqual(len(hops), 8)
+
+    def test_canonicalize(self):
+        self.assertEqual(IP.canonicalize("fd00:0000:0000:0001:0000:0000:0000:0003"), "fd00:0:0:1::3")
+        self.assertEqual(IP.canonicalize("10.0.1.3"), "10.0.1.3")
+
+    def test_trace_in_namespace(self):
+        if os.geteuid() != 0:
+            self.skipTest("needs root to create namespaces")
+
+        for i in range(LINKS + 1):
+            os.system("ip netns add %s" % (Namespace(i)))
+            os.system("ip netns exec %s ip link set lo up" % (Namespace(i)))
+            # a router answers neighbor solicitations only once its link
+            # local address is no longer tentative
+            os.system("ip netns exec %s sysctl -q -w net.ipv4.ip_forward=1 net.ipv6.conf.all.forwarding=1 "
+                      "net.ipv6.conf.default.accept_dad=0" % (Namespace(i)))
+
+        for link in range(LINKS):
+            left, right = Namespace(link), Namespace(link + 1)
+            for cmd in ["ip link add veth0 netns %s type veth peer name veth1 netns %s" % (left, right),
+                        "ip -n %s link set veth0 name right up" % (left),
+                        "ip -n %s link set veth1 name left up" % (right),
+                        "ip -n %s addr add 10.250.%d.1/24 dev right" % (left, 10 + link),
+                        "ip -n %s addr add 10.250.%d.2/24 dev left" % (right, 10 + link),
+                        "ip -n %s addr add fd00:250:%d::1/64 dev right" % (left, 10 + link),
+                        "ip -n %s addr add fd00:250:%d::2/64 dev left" % (right, 10 + link)]:
+                os.system(cmd)
+
+        # the links further away through the next namespace, back to the
+        # source through the previous one
+        for i in range(LINKS + 1):
+            for j in range(i + 1, LINKS):
+                os.system("ip -n %s route add 10.250.%d.0/24 via 10.250.%d.2" % (Namespace(i), 10 + j, 10 + i))
+                os.system("ip -n %s route add fd00:250:%d::/64 via fd00:250:%d::2" % (Namespace(i), 10 + j, 10 + i))
+            if i < LINKS:
+                os.system("ip -n %s route add 10.250.99.0/24 via 10.250.%d.2" % (Namespace(i), 10 + i))
+            if i > 0:
+                os.system("ip -n %s route add default via 10.250.%d.1" % (Namespace(i), 9 + i))
+                os.system("ip -n %s route add default via fd00:250:%d::1" % (Namespace(i), 9 + i))
+
+        # dropped without an answer at the destination
+        os.system("ip -n %s route add blackhole 10.250.99.0/24" % (Namespace(LINKS)))
+
+        destinations = ["10.250.%d.2" % (9 + LINKS), "fd00:250:%d::2" % (9 + LINKS), "10.250.99.1"]
+
+        process = HappyProcess()
+        netns_path = "/var/run/netns/%s" % (Namespace(0))
+
+        def create(family, type, proto):
+            return process.SocketInNamespace(netns_path, family, type, proto)
+
+        try:
+            begin = time.monotonic()
+            results = trace.Trace(destinations, 8, 1, TIMEOUT, create)
+            elapsed = time.monotonic() - begin
+        finally:
+            for i in range(LINKS + 1):
+                os.system("ip netns del %s" % (Namespace(i)))
+
+        for addr in destinations[:2]:
+            self.assertTrue(results[addr]["reached"])
+            self.assertEqual(len(results[addr]["hops"]), LINKS)
+            self.assertEqual(results[addr]["hops"][-1]["address"], addr)
+            self.assertGreater(results[addr]["hops"][-1]["rtts"][0], 0)
+        self.assertEqual([hop["address"] for hop in results[destinations[0]]["hops"]],
+                         ["10.250.10.2", "10.250.11.2", "10.250.12.2"])
+
+        # the routers answer, then nothing up to the largest hop limit
+        self.assertFalse(results["10.250.99.1"]["reached"])
+        self.assertEqual(len(results["10.250.99.1"]["hops"]), 8)
+        self.assertEqual(results["10.250.99.1"]["hops"][1]["address"], "10.250.11.2")
+
+        # all hops of all addresses at once, waiting once for the black hole
+        self.assertLess(elapsed, TIMEOUT + 0.3)
+        print("%d addresses, 8 hops: %.2f s" % (len(destinations), elapsed))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+
+#
+#    Copyright (c) 2021 Google LLC.
+#    All rights reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+#
+
+##
+#    @file
+#       Tests the sender and receiver of happy-perf on the loopback, and
+#       the latency percentiles of its results.
+#
+
+from __future__ import absolute_import
+from __future__ import print_function
+import socket
+import threading
+import unittest
+
+import happy.HappyPerf as perf
+import happy.HappyPerfProbe as probe
+
+PORT = 15201
+DURATION = 0.3
+
+
+class test_happy_perf_module(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        server = probe.Server(PORT)
+        thread = threading.Thread(target=server.Serve)
+        thread.daemon = True
+        thread.start()
+
+    def test_tcp(self):
+        results = probe.Run("127.0.0.1", PORT, "tcp", "all", DURATION)
+
+        bulk = results["bulk"]
+        self.assertGreater(bulk["received"], 0)
+        self.assertEqual(bulk["received"], bulk["sent"])
+        self.assertGreater(bulk["bits_per_second"], 0)
+        self.assertEqual(bulk["retransmits"], 0)
+
+        rr = results["rr"]
+        self.assertGreater(rr["transactions"], 0)
+        self.assertEqual(len(rr["latencies"]), rr["transactions"])
+
+    def test_udp(self):
+        results = probe.Run("::1", PORT, "udp", "all", DURATION, rate=1000)
+
+        bulk = results["bulk"]
+        self.assertGreater(bulk["datagrams"], 0)
+        self.assertEqual(bulk["lost"], 0)
+        self.assertEqual(bulk["received"], bulk["sent"])
+
+        rr = results["rr"]
+        self.assertGreater(rr["transactions"], 0)
+        self.assertEqual(rr["lost"], 0)
+
+    def test_tcp_info(self):
+        sock = socket.create_connection(("127.0.0.1", PORT))
+        try:
+            info = probe.TcpInfo(sock)
+        finally:
+            sock.close()
+        self.assertEqual(info["retransmits"], 0)
+        self.assertGreater(info["cwnd"], 0)
+
+    def test_summary(self):
+        result = {"rr": {"transactions": 1000, "latencies": [i * 1000 for i in range(1, 1001)]}}
+        result = perf.Summary(result)
+        self.assertNotIn("latencies", result["rr"])
+        self.assertEqual(result["rr"]["latency_us"],
+                         {"p50": 500.0, "p90": 900.0, "p99": 990.0, "max": 1000.0})
+
+        result = perf.Summary({"rr": {"transactions": 0, "latencies": []}})
+        self.assertIsNone(result["rr"]["latency_us"]["p50"])
+        self.assertEqual(perf.Summary({"error": "refused"}), {"error": "refused"})
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,107 @@
+#!/usr/bin/env python3
+
+#
+#    Copyright (c) 2021 Google LLC.
+#    All rights reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+#
+
+##
+#    @file
+#       Tests happy-link-shape: resolving link profiles to tc commands, and
+#       the rate a shaped veth pair gets.
+#
+
+from __future__ import absolute_import
+from __future__ import print_function
+import json
+import os
+import subprocess
+import sys
+import unittest
+
+import happy.HappyLinkShape as shape
+import happy.HappyPerfProbe
+
+NAMESPACE = "hpshape"
+RATE = 8 * 1000 * 1000
+
+
+class test_happy_link_shape_module(unittest.TestCase):
+    def test_rate_bits(self):
+        self.assertEqual(shape.RateBits("250kbit"), 250000)
+        self.assertEqual(shape.RateBits("1.5mbit"), 1500000)
+        self.assertEqual(shape.RateBits(1000), 1000)
+        self.assertRaises(ValueError, shape.RateBits, "fast")
+        self.assertRaises(ValueError, shape.RateBits, "1mbps")
+
+    def test_resolve(self):
+        self.assertEqual(shape.Resolve("thread"),
+                         {"rate": "250kbit", "delay": 10.0, "jitter": 5.0, "loss": 1.0})
+        self.assertEqual(shape.Resolve("thread", loss=5)["loss"], 5.0)
+        self.assertEqual(shape.Resolve(None, delay=20, base={"rate": "1mbit"}),
+                         {"rate": "1mbit", "delay": 20.0})
+        self.assertEqual(shape.Resolve("none"), {})
+        self.assertEqual(shape.Resolve({"loss": 0}), {})
+        self.assertRaises(ValueError, shape.Resolve, "carrier-pigeon")
+        self.assertRaises(ValueError, shape.Resolve, None, rate="fast")
+
+    def test_commands(self):
+        self.assertEqual(shape.ShapeCommands("wpan0", shape.Resolve("thread")),
+                         ["tc qdisc add dev wpan0 root handle 1: tbf rate 250000bit burst 1600 latency 200ms",
+                          "tc qdisc add dev wpan0 parent 1:1 handle 10: netem delay 10ms 5ms loss 1%"])
+        self.assertEqual(shape.ShapeCommands("wlan0", {"loss": 2.5}),
+                         ["tc qdisc add dev wlan0 root handle 1: netem loss 2.5%"])
+        self.assertEqual(shape.ShapeCommands("eth0", {"rate": "1gbit"}),
+                         ["tc qdisc add dev eth0 root handle 1: tbf rate 1000000000bit burst 1250000 latency 200ms"])
+        self.assertEqual(shape.ShapeCommands("eth0", {}), [])
+
+    def test_shaped_rate(self):
+        if os.geteuid() != 0:
+            self.skipTest("needs root to create namespaces")
+
+        left, right = NAMESPACE + "0", NAMESPACE + "1"
+        for cmd in ["ip netns add %s" % (left), "ip netns add %s" % (right),
+                    "ip link add veth0 netns %s type veth peer name veth0 netns %s" % (left, right),
+                    "ip -n %s addr add 10.250.20.1/24 dev veth0" % (left),
+                    "ip -n %s addr add 10.250.20.2/24 dev veth0" % (right),
+                    "ip -n %s link set veth0 up" % (left),
+                    "ip -n %s link set veth0 up" % (right)]:
+            os.system(cmd)
+
+        for netns in [left, right]:
+            for cmd in shape.ShapeCommands("veth0", {"rate": RATE}):
+                os.system("ip netns exec %s %s" % (netns, cmd))
+
+        probe = os.path.abspath(happy.HappyPerfProbe.__file__)
+        server = subprocess.Popen(["ip", "netns", "exec", right, sys.executable, probe, "--server"],
+                                  stdout=subprocess.PIPE, universal_newlines=True)
+        try:
+            server.stdout.readline()
+            out = subprocess.check_output(["ip", "netns", "exec", left, sys.executable, probe,
+                                           "--client", "10.250.20.2", "--test", "bulk", "--duration", "2"],
+                                          universal_newlines=True)
+        finally:
+            server.terminate()
+            server.wait()
+            os.system("ip netns del %s" % (left))
+            os.system("ip netns del %s" % (right))
+
+        bulk = json.loads(out)["bulk"]
+        print("shaped to %d Mbit/s: %.1f Mbit/s" % (RATE / 1e6, bulk["bits_per_second"] / 1e6))
+        self.assertLess(bulk["bits_per_second"], RATE * 1.1)
+        self.assertGreater(bulk["bits_per_second"], RATE * 0.5)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+
+#
+#    Copyright (c) 2021 Google LLC.
+#    All rights reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+#
+
+##
+#    @file
+#       Tests the point-to-point network mode: the link of the second member
+#       spliced to the first one, parked again when a member leaves, and
+#       taken by the next member to join.
+#
+
+from __future__ import absolute_import
+import os
+import unittest
+
+from happy.State import State
+import happy.HappyNetworkAdd
+import happy.HappyNetworkAddress
+import happy.HappyNetworkDelete
+import happy.HappyNodeAdd
+import happy.HappyNodeDelete
+import happy.HappyNodeJoin
+import happy.HappyNodeLeave
+import happy.Ping
+
+NETWORK = "p2pnet01"
+NODES = ["p2pnode01", "p2pnode02", "p2pnode03"]
+
+
+def AddNode(node_id):
+    options = happy.HappyNodeAdd.option()
+    options["quiet"] = True
+    options["node_id"] = node_id
+    happy.HappyNodeAdd.HappyNodeAdd(options).run()
+
+
+def Join(node_id):
+    options = happy.HappyNodeJoin.option()
+    options["quiet"] = True
+    options["node_id"] = node_id
+    options["network_id"] = NETWORK
+    return happy.HappyNodeJoin.HappyNodeJoin(options)
+
+
+def Leave(node_id):
+    options = happy.HappyNodeLeave.option()
+    options["quiet"] = True
+    options["node_id"] = node_id
+    options["network_id"] = NETWORK
+    happy.HappyNodeLeave.HappyNodeLeave(options).run()
+
+
+def Ping(state, source, destination):
+    options = happy.Ping.option()
+    options["quiet"] = True
+    options["source"] = source
+    options["destination"] = [a for a in state.getNodeAddressesOnNetwork(NETWORK, destination) if "." in a][0]
+    options["count"] = 1
+    # the loss, in %
+    return happy.Ping.Ping(options).run().Value()
+
+
+class test_happy_network_mode_module(unittest.TestCase):
+    def test_invalid_mode(self):
+        options = happy.HappyNetworkAdd.option()
+        options["quiet"] = True
+        options["network_id"] = NETWORK
+        options["type"] = "wifi"
+        options["mode"] = "switch"
+        self.assertRaises(SystemExit, happy.HappyNetworkAdd.HappyNetworkAdd(options).run)
+
+    def test_p2p(self):
+        if os.geteuid() != 0:
+            self.skipTest("needs root to create namespaces")
+
+        for node_id in NODES:
+            AddNode(node_id)
+
+        options = happy.HappyNetworkAdd.option()
+        options["quiet"] = True
+        options["network_id"] = NETWORK
+        options["type"] = "wifi"
+        options["mode"] = "p2p"
+        happy.HappyNetworkAdd.HappyNetworkAdd(options).run()
+
+        options = happy.HappyNetworkAddress.option()
+        options["quiet"] = True
+        options["network_id"] = NETWORK
+        options["add"] = True
+        options["address"] = "10.250.30.0/24"
+        happy.HappyNetworkAddress.HappyNetworkAddress(options).run()
+
+        try:
+            Join(NODES[0]).run()
+            Join(NODES[1]).run()
+
+            state = State()
+            state.readState()
+            self.assertEqual(state.getNetworkMode(NETWORK), "p2p")
+            first, second = sorted(state.getNetworkLinkIds(NETWORK))
+            self.assertEqual(state.getLinkPeer(first), second)
+            self.assertEqual(state.getLinkPeer(second), first)
+            self.assertEqual(Ping(state, NODES[0], NODES[1]), 0)
+
+            # a point-to-point network has two ends only
+            self.assertRaises(SystemExit, Join(NODES[2]).run)
+
+            Leave(NODES[0])
+            Join(NODES[2]).run()
+
+            state = State()
+            state.readState()
+            self.assertEqual(len(state.getNetworkLinkIds(NETWORK)), 2)
+            self.assertEqual(Ping(state, NODES[2], NODES[1]), 0)
+        finally:
+            options = happy.HappyNetworkDelete.option()
+            options["quiet"] = True
+            options["network_id"] = NETWORK
+            happy.HappyNetworkDelete.HappyNetworkDelete(options).run()
+
+            for node_id in NODES:
+                options = happy.HappyNodeDelete.option()
+                options["quiet"] = True
+                options["node_id"] = node_id
+                happy.HappyNodeDelete.HappyNodeDelete(options).run()
+
+        state = State()
+        state.readState()
+        self.assertNotIn(NETWORK, state.getNetworkIds())
+
+if __name__ == "__main__":
+    unittest.main()
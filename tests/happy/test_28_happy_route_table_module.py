@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+
+#
+#    Copyright (c) 2021 Google LLC.
+#    All rights reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+#
+
+##
+#    @file
+#       Tests the routing table snapshots of happy-node-route: parsing
+#       netlink route messages and ip route output, and reading the routes
+#       of a namespace with one netlink dump.
+#
+
+from __future__ import absolute_import
+import os
+import socket
+import subprocess
+import unittest
+
+import happy.HappyRouteTable as rt
+from happy.HappyProcess import HappyProcess
+
+NAMESPACE = "hproute"
+
+
+def Attribute(attr_type, data):
+    length = 4 + len(data)
+    return rt._rtattr.pack(length, attr_type) + data + b"\0" * ((4 - length % 4) % 4)
+
+
+def Key(route):
+    return (route["family"], route["type"], route["table"], route["to"], route["via"], route["dev"],
+            route["protocol"])
+
+
+class test_happy_route_table_module(unittest.TestCase):
+    def test_parse_route(self):
+        body = rt._rtmsg.pack(socket.AF_INET, 24, 0, 0, 254, 3, 0, 1, 0) + \
+            Attribute(rt.RTA_DST, socket.inet_aton("10.0.2.0")) + \
+            Attribute(rt.RTA_GATEWAY, socket.inet_aton("10.0.1.1")) + \
+            Attribute(rt.RTA_OIF, b"\x02\0\0\0")
+        self.assertEqual(rt.ParseRoute(body, {2: "wlan0"}),
+                         {"family": 4, "type": "unicast", "table": "main", "to": "10.0.2.0/24",
+                          "via": "10.0.1.1", "dev": "wlan0", "protocol": "boot"})
+
+        body = rt._rtmsg.pack(socket.AF_INET6, 0, 0, 0, 252, 2, 0, 7, 0) + \
+            Attribute(rt.RTA_TABLE, b"\x10\x27\0\0")
+        route = rt.ParseRoute(body, {})
+        self.assertEqual((route["to"], route["type"], route["table"], route["protocol"]),
+                         ("default", "unreachable", "10000", "kernel"))
+
+        body = rt._rtmsg.pack(socket.AF_INET6, 128, 0, 0, 255, 2, 0, 2, 0) + \
+            Attribute(rt.RTA_DST, socket.inet_pton(socket.AF_INET6, "fd00:0:1:1::3"))
+        self.assertEqual(rt.ParseRoute(body, {})["to"], "fd00:0:1:1::3")
+
+    def test_parse_text(self):
+        out = "default via 10.0.1.1 dev wlan0 proto static\n" \
+              "10.0.1.0/24 dev wlan0 proto kernel scope link src 10.0.1.2\n" \
+              "local 10.0.1.2 dev wlan0 table local proto kernel scope host src 10.0.1.2\n"
+        routes = rt.ParseText(out, 4)
+        self.assertEqual(Key(routes[0]), (4, "unicast", "main", "default", "10.0.1.1", "wlan0", "static"))
+        self.assertEqual(Key(routes[1]), (4, "unicast", "main", "10.0.1.0/24", None, "wlan0", "kernel"))
+        self.assertEqual(Key(routes[2]), (4, "local", "local", "10.0.1.2", None, "wlan0", "kernel"))
+
+    def test_matches(self):
+        route = rt.ParseText("fd00:0:1::/64 via fd00::1 dev wpan0\n", 6)[0]
+        self.assertTrue(rt.Matches(route, "fd00:0000:0001:0000:0000:0000:0000:0000/64", "fd00::0001"))
+        self.assertTrue(rt.Matches(route, dev="wpan0", family=6))
+        self.assertFalse(rt.Matches(route, "fd00:0:1::/64", dev="wlan0"))
+        self.assertFalse(rt.Matches(route, "fd00:0:1::/64", table="local"))
+
+    def test_read_namespace(self):
+        if os.geteuid() != 0:
+            self.skipTest("needs root to create namespaces")
+
+        for cmd in ["ip netns add %s" % (NAMESPACE),
+                    "ip -n %s link add wlan0 type veth peer name wlan1" % (NAMESPACE),
+                    "ip -n %s link set wlan1 up" % (NAMESPACE),
+                    "ip -n %s link set wlan0 up" % (NAMESPACE),
+                    "ip -n %s addr add 10.250.40.2/24 dev wlan0" % (NAMESPACE),
+                    "ip -n %s addr add fd00:250:40::2/64 dev wlan0 nodad" % (NAMESPACE),
+                    "ip -n %s route add default via 10.250.40.1" % (NAMESPACE),
+                    "ip -n %s route add 10.250.41.0/24 dev wlan0 table 100" % (NAMESPACE),
+                    "ip -n %s -6 route add fd00:250:41::/64 via fd00:250:40::1" % (NAMESPACE)]:
+            os.system(cmd)
+
+        try:
+            process = HappyProcess()
+            routes = rt.Read(lambda family, type, proto: process.SocketInNamespace(
+                "/var/run/netns/%s" % (NAMESPACE), family, type, proto))
+
+            text = []
+            for family in [4, 6]:
+                out = subprocess.check_output(["ip", "-n", NAMESPACE, "-%d" % (family), "route", "show", "table",
+                                               "all"], universal_newlines=True)
+                text += rt.ParseText(out, family)
+        finally:
+            os.system("ip netns del %s" % (NAMESPACE))
+
+        self.assertEqual(sorted(map(Key, routes)), sorted(map(Key, text)))
+        self.assertIn((4, "unicast", "main", "default", "10.250.40.1", "wlan0", "boot"), map(Key, routes))
+        self.assertIn((4, "unicast", "100", "10.250.41.0/24", None, "wlan0", "boot"), map(Key, routes))
+        self.assertIn((6, "unicast", "main", "fd00:250:41::/64", "fd00:250:40::1", "wlan0", "boot"),
+                      map(Key, routes))
+
+if __name__ == "__main__":
+    unittest.main()
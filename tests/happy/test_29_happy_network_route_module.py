@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+
+#
+#    Copyright (c) 2021 Google LLC.
+#    All rights reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+#
+
+##
+#    @file
+#       Tests the route batches of happy-network-route: the result of every
+#       line of an ip -force -batch.
+#
+
+from __future__ import absolute_import
+import os
+import subprocess
+import unittest
+
+from happy.HappyNetworkRoute import BatchErrors
+
+NAMESPACE = "hpbatch"
+
+
+class test_happy_network_route_module(unittest.TestCase):
+    def test_batch_errors(self):
+        err = "RTNETLINK answers: File exists\nCommand failed -:2\n" \
+              "Error: inet prefix is expected rather than \"nowhere\".\nCommand failed -:4\n"
+        self.assertEqual(BatchErrors(err), {2: "RTNETLINK answers: File exists",
+                                            4: "Error: inet prefix is expected rather than \"nowhere\"."})
+        self.assertEqual(BatchErrors(""), {})
+        self.assertEqual(BatchErrors(None), {})
+
+    def test_batch(self):
+        if os.geteuid() != 0:
+            self.skipTest("needs root to create namespaces")
+
+        for cmd in ["ip netns add %s" % (NAMESPACE),
+                    "ip -n %s link add wlan0 type veth peer name wlan1" % (NAMESPACE),
+                    "ip -n %s link set wlan0 up" % (NAMESPACE),
+                    "ip -n %s link set wlan1 up" % (NAMESPACE),
+                    "ip -n %s addr add 10.250.50.2/24 dev wlan0" % (NAMESPACE)]:
+            os.system(cmd)
+
+        cmds = ["route add default via 10.250.50.1", "route add default via 10.250.50.1",
+                "route add 10.250.51.0/24 via 10.250.50.1", "route del 10.250.52.0/24"]
+        try:
+            batch = subprocess.Popen(["ip", "-n", NAMESPACE, "-force", "-batch", "-"], stdin=subprocess.PIPE,
+                                     stderr=subprocess.PIPE, universal_newlines=True)
+            out, err = batch.communicate("\n".join(cmds) + "\n")
+            routes = subprocess.check_output(["ip", "-n", NAMESPACE, "route"], universal_newlines=True)
+        finally:
+            os.system("ip netns del %s" % (NAMESPACE))
+
+        errors = BatchErrors(err)
+        self.assertEqual(sorted(errors.keys()), [2, 4])
+        self.assertIn("File exists", errors[2])
+        self.assertIn("No such process", errors[4])
+        # the lines after a failed one still run
+        self.assertIn("10.250.51.0/24 via 10.250.50.1", routes)
+
+if __name__ == "__main__":
+    unittest.main()
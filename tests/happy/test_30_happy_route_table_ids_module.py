@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+
+#
+#    Copyright (c) 2021 Google LLC.
+#    All rights reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+#
+
+##
+#    @file
+#       Tests the routing table numbers Happy keeps in its state for the
+#       policy routes of ISPs.
+#
+
+from __future__ import absolute_import
+import time
+import unittest
+
+from happy.State import State, FIRST_ROUTE_TABLE_ID
+
+TABLES = 10000
+
+
+class test_happy_route_table_ids_module(unittest.TestCase):
+    def setUp(self):
+        self.state = State()
+        self.record = {}
+
+    def test_allocate(self):
+        state, record = self.state, self.record
+
+        first = state.allocateRouteTableId("isp1_table", "node01", state=record)
+        self.assertEqual(first, FIRST_ROUTE_TABLE_ID)
+        # the same table at every node
+        self.assertEqual(state.allocateRouteTableId("isp1_table", "node02", state=record), first)
+        self.assertEqual(state.getRouteTableId("isp1_table", state=record), first)
+
+        self.assertEqual(state.allocateRouteTableId("isp2_table", "node01", 7, state=record), 7)
+        # taken or reserved
+        self.assertEqual(state.allocateRouteTableId("isp3_table", "node01", 7, state=record), first + 1)
+        self.assertEqual(state.allocateRouteTableId("isp4_table", "node01", 254, state=record), first + 2)
+        self.assertEqual(state.allocateRouteTableId("isp5_table", "node01", 0, state=record), first + 3)
+        self.assertIsNone(state.getRouteTableId("isp6_table", state=record))
+
+    def test_release(self):
+        state, record = self.state, self.record
+
+        first = state.allocateRouteTableId("isp1_table", "node01", state=record)
+        state.allocateRouteTableId("isp1_table", "node02", state=record)
+
+        state.releaseRouteTableId("isp1_table", "node01", state=record)
+        self.assertEqual(state.getRouteTableId("isp1_table", state=record), first)
+
+        state.releaseRouteTableId("isp1_table", "node02", state=record)
+        self.assertIsNone(state.getRouteTableId("isp1_table", state=record))
+        self.assertEqual(state.allocateRouteTableId("isp2_table", "node01", state=record), first)
+
+        # a released number preferred by a new table is not given twice
+        state.releaseRouteTableId("isp2_table", "node01", state=record)
+        self.assertEqual(state.allocateRouteTableId("isp3_table", "node01", first, state=record), first)
+        self.assertEqual(state.allocateRouteTableId("isp4_table", "node01", state=record), first + 1)
+
+    def test_scale(self):
+        state, record = self.state, self.record
+
+        begin = time.monotonic()
+        ids = [state.allocateRouteTableId("isp%d_table" % (i), "node01", state=record) for i in range(TABLES)]
+        for i in range(0, TABLES, 2):
+            state.releaseRouteTableId("isp%d_table" % (i), "node01", state=record)
+        again = [state.allocateRouteTableId("new%d_table" % (i), "node01", state=record)
+                 for i in range(TABLES // 2)]
+        elapsed = time.monotonic() - begin
+
+        self.assertEqual(len(set(ids)), TABLES)
+        self.assertEqual(sorted(again), sorted(ids[0::2]))
+        print("%d tables: %.3f s" % (TABLES, elapsed))
+        self.assertLess(elapsed, 2.0)
+
+if __name__ == "__main__":
+    unittest.main()
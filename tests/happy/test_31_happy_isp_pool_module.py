@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+
+#
+#    Copyright (c) 2021 Google LLC.
+#    All rights reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+#
+
+##
+#    @file
+#       Tests the pool of addresses of the virtual ISP kept in the ISP state.
+#
+
+from __future__ import absolute_import
+import json
+import time
+import unittest
+
+from happy.State import State
+from happy.HappyInternet import IspPool, IspAddress, ISP_HOST_INDEX
+
+
+class test_happy_isp_pool_module(unittest.TestCase):
+    def setUp(self):
+        self.state = State()
+        self.record = {}
+
+    def test_prefix(self):
+        pool = IspPool(249, 24)
+        self.assertEqual(pool["network"], "172.16.249.0")
+        self.assertEqual(IspAddress(pool, ISP_HOST_INDEX), "172.16.249.1")
+
+        pool = IspPool(249, 20)
+        self.assertEqual(pool["network"], "172.16.240.0")
+        self.assertEqual(IspAddress(pool, 300), "172.16.241.44")
+
+    def test_allocate(self):
+        state, record = self.state, self.record
+        self.assertIsNone(state.allocateIspIndex(state=record))
+
+        state.setGlobalIsp(IspPool(249, 24), state=record)
+        indexes = [state.allocateIspIndex(state=record) for i in range(253)]
+        # neither the host end nor the broadcast address
+        self.assertEqual(indexes, list(range(2, 255)))
+        self.assertIsNone(state.allocateIspIndex(state=record))
+        self.assertEqual(state.getIspUsed(state=record), 253)
+
+        state.releaseIspIndex("7", state=record)
+        self.assertEqual(state.getIspUsed(state=record), 252)
+        self.assertEqual(state.allocateIspIndex(state=record), 7)
+
+        for index in indexes:
+            state.releaseIspIndex(index, state=record)
+        self.assertEqual(state.getIspUsed(state=record), 0)
+
+    def test_scale(self):
+        state, record = self.state, self.record
+        state.setGlobalIsp(IspPool(249, 16), state=record)
+
+        begin = time.monotonic()
+        indexes = [state.allocateIspIndex(state=record) for i in range(65533)]
+        for index in indexes[0::2]:
+            state.releaseIspIndex(index, state=record)
+        again = [state.allocateIspIndex(state=record) for i in range(len(indexes[0::2]))]
+        elapsed = time.monotonic() - begin
+
+        self.assertEqual(len(set(indexes)), 65533)
+        self.assertEqual(sorted(again), sorted(indexes[0::2]))
+        self.assertIsNone(state.allocateIspIndex(state=record))
+        self.assertEqual(IspAddress(state.getIsp(state=record), indexes[-1]), "172.16.255.254")
+        print("%d addresses: %.3f s" % (len(indexes), elapsed))
+        self.assertLess(elapsed, 2.0)
+
+        # a pool with no address released is a few numbers
+        state.setGlobalIsp(IspPool(249, 16), state=record)
+        for i in range(65533):
+            state.allocateIspIndex(state=record)
+        self.assertLess(len(json.dumps(record)), 200)
+
+if __name__ == "__main__":
+    unittest.main()
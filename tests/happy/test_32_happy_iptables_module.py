@@ -0,0 +1,65 @@
+#!/usr/bin/env python3
+
+#
+#    Copyright (c) 2021 Google LLC.
+#    All rights reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+#
+
+##
+#    @file
+#       Tests the iptables rulesets Happy applies with iptables-restore.
+#
+
+from __future__ import absolute_import
+import unittest
+
+from happy.HappyIptables import MasqueradeRules, RestoreInput
+
+
+class test_happy_iptables_module(unittest.TestCase):
+    def test_masquerade_rules(self):
+        rules = MasqueradeRules("wan0", ["wan0", "wlan0", "thread0"])
+        self.assertEqual(rules[0], ["nat", "POSTROUTING -o wan0 -j MASQUERADE"])
+        # replies back in, and new traffic out, from every other interface
+        self.assertEqual(rules[1:], [
+            ["filter", "FORWARD -i wan0 -o wlan0 -m state --state RELATED,ESTABLISHED -j ACCEPT"],
+            ["filter", "FORWARD -i wlan0 -o wan0 -j ACCEPT"],
+            ["filter", "FORWARD -i wan0 -o thread0 -m state --state RELATED,ESTABLISHED -j ACCEPT"],
+            ["filter", "FORWARD -i thread0 -o wan0 -j ACCEPT"]])
+
+        rules = MasqueradeRules("isp2_node")
+        self.assertEqual(rules[1:], [
+            ["filter", "FORWARD -i isp2_node -m state --state RELATED,ESTABLISHED -j ACCEPT"],
+            ["filter", "FORWARD -o isp2_node -j ACCEPT"]])
+
+    def test_restore_input(self):
+        rules = MasqueradeRules("wan0", ["wlan0"])
+
+        self.assertEqual(RestoreInput(rules),
+                         "*nat\n"
+                         "-A POSTROUTING -o wan0 -j MASQUERADE\n"
+                         "COMMIT\n"
+                         "*filter\n"
+                         "-A FORWARD -i wan0 -o wlan0 -m state --state RELATED,ESTABLISHED -j ACCEPT\n"
+                         "-A FORWARD -i wlan0 -o wan0 -j ACCEPT\n"
+                         "COMMIT\n")
+
+        ruleset = RestoreInput(list(reversed(rules)), delete=True)
+        # the nat table first, whatever the order of the rules
+        self.assertTrue(ruleset.startswith("*nat\n-D POSTROUTING -o wan0 -j MASQUERADE\nCOMMIT\n*filter\n"))
+        self.assertNotIn("-A", ruleset)
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+
+#
+#    Copyright (c) 2021 Google LLC.
+#    All rights reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+#
+
+##
+#    @file
+#       Tests the DNS stub resolver of happy-dns --stub.
+#
+
+from __future__ import absolute_import
+import asyncio
+import json
+import os
+import shutil
+import socket
+from struct import *
+import tempfile
+import threading
+import time
+import unittest
+
+from happy.HappyDNSStub import *
+
+STATE = {"node": {"BorderRouter": {"interface": {"wlan0": {"ip": {
+    "10.0.1.2": {"mask": 24},
+    "fd00:0000:fab1:0001:0000:0000:0000:0002": {"mask": 64},
+    "fe80:0000:0000:0000:0000:0000:0000:0002": {"mask": 64}}}}},
+    "ThreadNode": {"interface": {}}}}
+
+
+def Query(name, qtype, txid=0x1234):
+    question = b"".join([pack('!B', len(label)) + label.encode() for label in name.split(".")]) + b"\0"
+    return pack('!HHHHHH', txid, FLAG_RD, 1, 0, 0, 0) + question + pack('!HH', qtype, CLASS_IN)
+
+
+def Addresses(response, query):
+    txid, flags, qdcount, ancount, nscount, arcount = unpack_from('!HHHHHH', response)
+    # the answers follow the question of the query
+    offset = len(query)
+    addresses = []
+    for i in range(ancount):
+        name, qtype, qclass, ttl, length = unpack_from('!HHHIH', response, offset)
+        offset += 12
+        family = socket.AF_INET if qtype == TYPE_A else socket.AF_INET6
+        addresses.append(socket.inet_ntop(family, response[offset:offset + length]))
+        offset += length
+    return txid, flags & 0xf, addresses
+
+
+class test_happy_dns_stub_module(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.state = os.path.join(self.dir, "state.json")
+        with open(self.state, "w") as f:
+            json.dump(STATE, f)
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_query(self):
+        query = Query("BorderRouter.happy.happy", TYPE_A)
+        txid, flags, name, qtype, end = ParseQuery(query)
+        self.assertEqual((txid, name, qtype, end), (0x1234, "BorderRouter.happy.happy", TYPE_A, len(query)))
+        self.assertIsNone(ParseQuery(query[:20]))
+
+        names = Names(STATE, "happy.happy.")
+        self.assertEqual(names["borderrouter.happy.happy"], ["10.0.1.2", "fd00:0:fab1:1::2"])
+        self.assertEqual(names["threadnode.happy.happy"], [])
+
+        response = Response(query, ParseQuery(query), RCODE_NOERROR, names["borderrouter.happy.happy"], 5)
+        self.assertEqual(Addresses(response, query), (0x1234, RCODE_NOERROR, ["10.0.1.2"]))
+
+    def test_serve(self):
+        stub = Stub(Index(self.state, "happy.happy"), 5)
+        loop = asyncio.new_event_loop()
+        transport, protocol = loop.run_until_complete(
+            loop.create_datagram_endpoint(lambda: stub, local_addr=("127.0.0.1", 0)))
+        address = transport.get_extra_info("sockname")
+
+        thread = threading.Thread(target=loop.run_forever)
+        thread.daemon = True
+        thread.start()
+
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.settimeout(2.0)
+        try:
+            def Ask(name, qtype):
+                query = Query(name, qtype)
+                sock.sendto(query, address)
+                return Addresses(sock.recv(512), query)
+
+            self.assertEqual(Ask("borderrouter.happy.happy", TYPE_AAAA),
+                             (0x1234, RCODE_NOERROR, ["fd00:0:fab1:1::2"]))
+            self.assertEqual(Ask("ThreadNode.happy.happy", TYPE_A), (0x1234, RCODE_NOERROR, []))
+            self.assertEqual(Ask("Cloud.happy.happy", TYPE_A), (0x1234, RCODE_NXDOMAIN, []))
+            # nowhere to forward to
+            self.assertEqual(Ask("example.com", TYPE_A), (0x1234, RCODE_SERVFAIL, []))
+
+            # a node added later
+            state = json.loads(json.dumps(STATE))
+            state["node"]["Cloud"] = {"interface": {"eth0": {"ip": {"10.0.2.2": {"mask": 24}}}}}
+            with open(self.state, "w") as f:
+                json.dump(state, f)
+            os.utime(self.state, (time.time() + 1, time.time() + 1))
+            self.assertEqual(Ask("Cloud.happy.happy", TYPE_A), (0x1234, RCODE_NOERROR, ["10.0.2.2"]))
+        finally:
+            sock.close()
+            loop.call_soon_threadsafe(loop.stop)
+            thread.join()
+            transport.close()
+            loop.close()
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,149 @@
+#!/usr/bin/env python3
+
+#
+#    Copyright (c) 2021 Google LLC.
+#    All rights reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+#
+
+##
+#    @file
+#       Tests the output collector of happy-process-start --rotate-size.
+#
+
+from __future__ import absolute_import
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+from happy.HappyProcessOutputCollector import *
+
+
+def Collect(opts, chunks, pause=0):
+    """
+    Runs a collector over a pipe fed with chunks, pause seconds apart.
+    """
+    rfd, wfd = os.pipe()
+
+    def Feed():
+        for chunk in chunks:
+            os.write(wfd, chunk)
+            time.sleep(pause)
+        os.close(wfd)
+
+    feeder = threading.Thread(target=Feed)
+    feeder.start()
+    try:
+        OutputCollector(opts).run(rfd)
+    finally:
+        feeder.join()
+        os.close(rfd)
+
+
+def ReadBack(out_file):
+    return "".join(ReadOutput(GetOutputSegments(out_file)))
+
+
+class test_happy_process_output_collector_module(unittest.TestCase):
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.opts = {"file": os.path.join(self.dir, "process.out"), "max_bytes": None,
+                     "max_age": None, "compress": None, "keep": None}
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def index(self):
+        with open(GetIndexFile(self.opts["file"])) as f:
+            return [json.loads(line) for line in f]
+
+    def test_rotate_size(self):
+        self.opts["max_bytes"] = 1000
+        lines = ["line %04d\n" % (i) for i in range(500)]
+        Collect(self.opts, [line.encode() for line in lines])
+
+        records = self.index()
+        self.assertEqual([r["seq"] for r in records], [1, 2, 3, 4])
+        self.assertEqual([r["bytes"] for r in records], [1000] * 4)
+        for r in records:
+            self.assertEqual(os.path.getsize(r["file"]), 1000)
+        self.assertEqual(os.path.getsize(self.opts["file"]), 1000)
+
+        segments = GetOutputSegments(self.opts["file"])
+        self.assertEqual(len(segments), 5)
+        self.assertEqual(ReadBack(self.opts["file"]), "".join(lines))
+
+    def test_rotate_age(self):
+        self.opts["max_age"] = 0.1
+        Collect(self.opts, [b"first\n", b"second\n", b"third\n"], pause=0.25)
+
+        records = self.index()
+        self.assertEqual(len(records), 2)
+        for r in records:
+            self.assertGreaterEqual(r["end"] - r["start"], 0.1)
+        self.assertEqual(ReadBack(self.opts["file"]), "first\nsecond\nthird\n")
+
+    def test_keep(self):
+        self.opts["max_bytes"] = 100
+        self.opts["keep"] = 2
+        data = b"".join([b"%099d\n" % (i) for i in range(10)])
+        Collect(self.opts, [data])
+
+        # the index records every segment, only the newest two are left
+        self.assertEqual(len(self.index()), 9)
+        segments = GetOutputSegments(self.opts["file"])
+        self.assertEqual(segments, [self.opts["file"] + ".8", self.opts["file"] + ".9", self.opts["file"]])
+        self.assertFalse(os.path.exists(self.opts["file"] + ".7"))
+        self.assertEqual(ReadBack(self.opts["file"]), data[-300:].decode())
+
+    def test_compress(self):
+        for compress in ["gzip", "zstd"]:
+            if shutil.which(compress) is None:
+                continue
+            os.makedirs(os.path.join(self.dir, compress))
+            self.opts["file"] = os.path.join(self.dir, compress, "process.out")
+            self.opts["max_bytes"] = 4096
+            self.opts["compress"] = compress
+            data = b"".join([b"%09d\n" % (i) for i in range(2000)])
+            Collect(self.opts, [data])
+
+            # the collector waits for its compressors before it exits
+            for r in self.index():
+                self.assertTrue(r["file"].endswith(compress_suffix[compress]))
+                self.assertTrue(os.path.exists(r["file"]))
+                self.assertFalse(os.path.exists(r["file"][:-len(compress_suffix[compress])]))
+            self.assertEqual(ReadBack(self.opts["file"]), data.decode())
+
+    def test_read_multibyte(self):
+        # characters of 3 bytes split across segments
+        self.opts["max_bytes"] = 4
+        text = u"ab€cd€e"
+        Collect(self.opts, [text.encode("utf-8")])
+        self.assertEqual(len(self.index()), 2)
+        self.assertEqual(ReadBack(self.opts["file"]), text)
+
+        # and across reads of one segment
+        path = os.path.join(self.dir, "split.out")
+        with open(path, "wb") as f:
+            f.write(text.encode("utf-8"))
+        chunks = list(ReadOutput([path], size=3))
+        self.assertEqual("".join(chunks), text)
+        self.assertNotIn(u"\ufffd", "".join(chunks))
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+
+#
+#    Copyright (c) 2021 Google LLC.
+#    All rights reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License");
+#    you may not use this file except in compliance with the License.
+#    You may obtain a copy of the License at
+#
+#        http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS,
+#    WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#    See the License for the specific language governing permissions and
+#    limitations under the License.
+#
+
+##
+#    @file
+#       Tests the per-node cgroups of happy-node-add --cgroup.
+#
+
+from __future__ import absolute_import
+import os
+import shutil
+import tempfile
+import unittest
+
+from happy.HappyCGroup import HappyCGroup
+import happy.HappyNodeAdd
+import happy.HappyNodeDelete
+
+
+class test_happy_cgroup_module(unittest.TestCase):
+    def setUp(self):
+        self.cgroup = HappyCGroup()
+
+    def test_limits(self):
+        check = self.cgroup.getCGroupLimitsError
+
+        self.assertIsNone(check("0.5", "256M", "0-3,6"))
+        self.assertIsNone(check("2", "1073741824", "2"))
+        self.assertIsNone(check("max", "max"))
+        self.assertIsNone(check("0.01"))
+
+        for cpu_limit in ["0", "0.001", "-1", "half", "nan", "inf"]:
+            self.assertIsNotNone(check(cpu_limit=cpu_limit), cpu_limit)
+        for memory_limit in ["0", "256MB", "-1", "1.5G", ""]:
+            self.assertIsNotNone(check(memory_limit=memory_limit), memory_limit)
+        for cpuset in ["", "0-", "a", "0,,1"]:
+            self.assertIsNotNone(check(cpuset=cpuset), cpuset)
+
+    def test_limit_files(self):
+        path = tempfile.mkdtemp()
+        try:
+            for name in ["cpu.max", "memory.max", "cpuset.cpus"]:
+                open(os.path.join(path, name), "w").close()
+
+            state = {"node": {"node01": {"interface": {}}}}
+            self.cgroup.state = state
+            self.cgroup.setNodeCGroup("node01", {"path": path})
+
+            def Read(name):
+                with open(os.path.join(path, name)) as f:
+                    return f.read()
+
+            self.assertTrue(self.cgroup.setNodeCGroupLimits("node01", "0.5", "256M", "0-3"))
+            self.assertEqual(Read("cpu.max"), "50000 100000")
+            self.assertEqual(Read("memory.max"), "256M")
+            self.assertEqual(Read("cpuset.cpus"), "0-3")
+            self.assertEqual(self.cgroup.getNodeCGroup("node01")["cpu_limit"], "0.5")
+
+            self.assertTrue(self.cgroup.setNodeCGroupLimits("node01", "max", "max"))
+            self.assertEqual(Read("cpu.max"), "max 100000")
+            self.assertEqual(Read("memory.max"), "max")
+        finally:
+            shutil.rmtree(path)
+
+    def test_own_cgroup(self):
+        # without a cgroup v2 hierarchy the cgroup of Happy is unknown
+        path = tempfile.mkdtemp()
+        try:
+            self.cgroup.cgroup_fs = path
+            self.assertIsNone(self.cgroup.getOwnCGroupPath())
+        finally:
+            shutil.rmtree(path)
+
+    def test_node_cgroup(self):
+        if not self.cgroup.cgroupAvailable() or os.geteuid() != 0:
+            self.skipTest("cgroup v2 is not available")
+
+        options = happy.HappyNodeAdd.option()
+        options["node_id"] = "node01"
+        options["quiet"] = True
+        options["cpu_limit"] = "0.5"
+        options["memory_limit"] = "64M"
+        addNode = happy.HappyNodeAdd.HappyNodeAdd(options)
+        addNode.run()
+
+        addNode.readState()
+        path = addNode.getNodeCGroupPath("node01")
+        try:
+            self.assertTrue(os.path.isdir(path))
+            with open(os.path.join(path, "cpu.max")) as f:
+                self.assertEqual(f.read().strip(), "50000 100000")
+            with open(os.path.join(path, "memory.max")) as f:
+                self.assertEqual(f.read().strip(), str(64 << 20))
+        finally:
+            options = happy.HappyNodeDelete.option()
+            options["node_id"] = "node01"
+            options["quiet"] = True
+            delNode = happy.HappyNodeDelete.HappyNodeDelete(options)
+            delNode.run()
+
+        self.assertFalse(os.path.isdir(path))
+
+if __name__ == "__main__":
+    unittest.main()